@@ -32,13 +32,18 @@ download_and_install() {
     if [ ! -e ${1} ]; then
         tar -xzf ${1}.tar.gz
         cd ${1}
-        echo "Configuring "${1}"."
-        ./configure --quiet --enable-shared --enable-openmp --enable-sse2 --enable-avx --prefix=${LIBS_DIR}
-        echo "Compiling and installing "${1}"."
-        {
-            make -j2
-            make install
-        } > /dev/null
+        # The double and the single precision (--enable-float) libraries
+        # are built from the same sources
+        for PRECISION in "" "--enable-float"; do
+            echo "Configuring "${1}" "${PRECISION}"."
+            ./configure --quiet --enable-shared --enable-openmp --enable-sse2 --enable-avx ${PRECISION} --prefix=${LIBS_DIR}
+            echo "Compiling and installing "${1}" "${PRECISION}"."
+            {
+                make -j2
+                make install
+                make clean
+            } > /dev/null
+        done
         echo "Done."
         cd ${LIBS_DIR}
     fi;
@@ -57,23 +57,42 @@ class Anisotropy(Energy):
         self._axis = helper.init_vector(self.axis, self.mesh, norm=True)
 
     def compute_field(self, t=0, spin=None):
-
         if spin is not None:
             m = spin
         else:
             m = self.spin
 
+        self._compute(m, self.field, None, 0)
+
+        return self.field
+
+    def add_field(self, field, t=0):
+        self._compute(self.spin, field, None, 1)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        clib.compute_anisotropy(spin, field,
+                                self.replica_array('mu_s_inv', replicas),
+                                None,
+                                self.replica_array('_Ku', replicas),
+                                self.replica_array('_axis', replicas),
+                                replicas * self.n, 1)
+
+    def compute_field_and_energy(self, t=0):
+        self._compute(self.spin, self.field, self.energy, 0)
+
+        return self.field
+
+    def _compute(self, m, field, energy, add):
         clib.compute_anisotropy(m,
-                                self.field,
+                                field,
                                 self.mu_s_inv,
-                                self.energy,
+                                energy,
                                 self._Ku,
                                 self._axis,
-                                self.n
+                                self.n,
+                                add
                                 )
 
-        return self.field
-
 
 class CubicAnisotropy(Energy):
     """
@@ -95,11 +114,23 @@ class CubicAnisotropy(Energy):
         else:
             m = self.spin
 
+        self._compute(m, self.field, None, 0)
+
+        return self.field
+
+    def add_field(self, field, t=0):
+        self._compute(self.spin, field, None, 1)
+
+    def compute_field_and_energy(self, t=0):
+        self._compute(self.spin, self.field, self.energy, 0)
+
+        return self.field
+
+    def _compute(self, m, field, energy, add):
         clib.compute_anisotropy_cubic(m,
-                                      self.field,
+                                      field,
                                       self.mu_s_inv,
-                                      self.energy,
+                                      energy,
                                       self._Kc,
-                                      self.n)
-
-        return self.field
+                                      self.n,
+                                      add)
@@ -156,16 +156,16 @@ class AtomisticDriver(DriverBase):
         # we can not copy mp to self.spin since m and self.spin is one object.
         #self.spin[:] = mp[:]
         print('NO jac...........')
-        self.compute_effective_field_jac(t, mp)
+        field_p = self.compute_effective_field_jac(t, mp)
         clib.compute_llg_jtimes(Jmp,
-                                m, fy,
-                                mp, self.field,
+                                m, self.field,
+                                mp, field_p,
                                 self.alpha,
                                 self._pins,
                                 self.gamma,
                                 self.n,
                                 self.do_precession,
-                                self.default_c)
+                                self.norm_correction)
 
         return 0
 
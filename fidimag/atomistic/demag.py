@@ -4,6 +4,8 @@ from .energy import Energy
 import numpy as np
 import fidimag
 from fidimag.atomistic.energy import Energy
+from fidimag.common.field_extrapolation import FieldExtrapolation
+from fidimag.common.demag_replicas import DemagReplicas
 import fidimag.extensions.fmm as fmm
 import time
 import sys
@@ -40,10 +42,26 @@ class Demag(Energy):
 
     """
 
-    def __init__(self, calc_every=0, name='Demag'):
+    def __init__(self, calc_every=0, name='Demag', planning='measure',
+                 precision='double', extrapolation=None,
+                 extrapolation_tol=1e-3, extrapolation_max_dm=0.05,
+                 thin_film=False):
         self.calc_every = calc_every
         self.name = name
         self.jac = True
+        # FFTW planning effort: 'estimate', 'measure' or 'patient'
+        self.planning = planning
+        # 'single' computes the convolution in single precision, which is
+        # enough for relaxations or thermal runs and halves the demag memory
+        self.precision = precision
+        # 'linear' or 'quadratic' extrapolation of the field in time between
+        # its evaluations, see FieldExtrapolation
+        self.extrapolation = extrapolation
+        self.extrapolation_tol = extrapolation_tol
+        self.extrapolation_max_dm = extrapolation_max_dm
+        # Experimental convolution without padding in z: it needs less
+        # memory but it is slower than the 3D one (see FFTDemag)
+        self.thin_film = thin_film
 
     def setup(self, mesh, spin, mu_s, mu_s_inv):
         super(Demag, self).setup(mesh, spin, mu_s, mu_s_inv)
@@ -57,8 +75,26 @@ class Demag(Energy):
 
         self.demag = clib.FFTDemag(self.dx, self.dy, self.dz,
                                    self.nx, self.ny, self.nz,
-                                   tensor_type='dipolar')
-        if not self.calc_every:
+                                   tensor_type='dipolar',
+                                   planning=self.planning,
+                                   precision=self.precision,
+                                   thin_film=self.thin_film)
+        self.demag_replicas = None
+        if self.extrapolation is not None:
+            orders = {'linear': 1, 'quadratic': 2}
+            if self.extrapolation not in orders:
+                raise ValueError("extrapolation is {}, should be 'linear' "
+                                 "or 'quadratic'".format(self.extrapolation))
+            if self.calc_every:
+                raise ValueError("calc_every and extrapolation cannot be "
+                                 "used together")
+            self.extrapolator = FieldExtrapolation(
+                lambda m, field: self.demag.compute_field(m, self.mu_s_scale,
+                                                          field),
+                3 * self.n, orders[self.extrapolation],
+                self.extrapolation_tol, self.extrapolation_max_dm)
+            self.compute_field = self.compute_field_extrapolated
+        elif not self.calc_every:
             self.compute_field = self.compute_field_every
         else:
             self.count = 0
@@ -88,12 +124,32 @@ class Demag(Energy):
             return self.field
 
 
+    def compute_field_extrapolated(self, t=0, spin=None):
+        if spin is not None:
+            return self.compute_field_every(t, spin)
+
+        return self.extrapolator.compute(t, self.spin, self.field)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        # The field of every copy is computed at every call, also with
+        # calc_every or extrapolation, which keep the state of one system
+        if self.demag_replicas is None:
+            self.demag_replicas = DemagReplicas(self.demag, self.n)
+        self.demag_replicas.add_field(spin, self.mu_s_scale, field, replicas)
+
     def compute_exact(self):
         field = np.zeros(3 * self.n)
         self.demag.compute_exact(self.spin, self.mu_s_scale, field)
         return field
 
     def compute_energy(self):
+
+        # The energy uses the exact field, which is not stored as an
+        # evaluation for the extrapolation (the time is not known here)
+        if self.extrapolation is not None:
+            self.compute_field_every()
+        else:
+            self.compute_field()
         energy = self.demag.compute_energy(
             self.spin, self.mu_s_scale, self.field, self.energy)
 
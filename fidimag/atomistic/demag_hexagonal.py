@@ -47,9 +47,11 @@ class DemagHexagonal(object):
 
     """
 
-    def __init__(self, name='DemagHexagonal'):
+    def __init__(self, name='DemagHexagonal', planning='measure'):
         self.name = name
         self.jac = True
+        # FFTW planning effort: 'estimate', 'measure' or 'patient'
+        self.planning = planning
 
     def setup(self, mesh, spin, mu_s, mu_s_inv):
 
@@ -105,7 +107,8 @@ class DemagHexagonal(object):
         # number of x finite differences
         self.demag = clib.FFTDemag(self.dx_c, self.dy, self.dz,
                                    self.nx_c, self.ny, self.nz,
-                                   tensor_type='dipolar')
+                                   tensor_type='dipolar',
+                                   planning=self.planning)
 
     def compute_field(self, t=0, spin=None):
         if spin is not None:
@@ -117,33 +117,47 @@ class DMI(Energy):
         else:
             m = self.spin
 
+        self._dmi_field(m, self.field, None, 0)
+
+        return self.field
+
+    def add_field(self, field, t=0):
+        self._dmi_field(self.spin, field, None, 1)
+
+    def compute_field_and_energy(self, t=0):
+        self._dmi_field(self.spin, self.field, self.energy, 0)
+
+        return self.field
+
+    def _dmi_field(self, m, field, energy, add):
+
         if self.dmi_type == 'bulk':
             clib.compute_dmi_field(m,
-                                   self.field,
+                                   field,
                                    self.mu_s_inv,
-                                   self.energy,
+                                   energy,
                                    self._D,
                                    self.neighbours,
                                    self.n,
-                                   self.n_ngbs
+                                   self.n_ngbs,
+                                   add
                                    )
 
         elif self.dmi_type == 'interfacial':
 
             clib.compute_dmi_field_interfacial(m,
-                                               self.field,
+                                               field,
                                                self.mu_s_inv,
-                                               self.energy,
+                                               energy,
                                                self.D,
                                                self.neighbours,
                                                self.n,
                                                self.n_ngbs,
                                                self.n_ngbs_dmi,
-                                               self.DMI_vector
+                                               self.DMI_vector,
+                                               add
                                                )
 
-        return self.field
-
     def compute_energy_direct(self):
         """
         mainly for testing
@@ -1,4 +1,5 @@
 import numpy as np
+import fidimag.common.helper as helper
 
 #from constant import mu_0
 
@@ -12,6 +13,8 @@ class Energy(object):
 
     """
 
+    _replica_arrays = None
+
     def setup(self, mesh, spin, mu_s, mu_s_inv):
         self.mesh = mesh
         self.dx = mesh.dx * mesh.unit_length
@@ -21,6 +24,7 @@ class Energy(object):
         self.ny = mesh.ny
         self.nz = mesh.nz
         self.spin = spin
+        self._replica_arrays = None
         self.n = mesh.n
         self.n_ngbs = mesh.n_ngbs
         self.mesh_type = mesh.mesh_type
@@ -46,11 +50,63 @@ class Energy(object):
 
         return 0
 
+    def add_field(self, field, t=0):
+        """
+        Accumulate the field of this interaction into the *field* array.
+        Interactions backed by a C kernel override this method so the field
+        is summed in place, without going through self.field
+        """
+        field += self.compute_field(t)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        """
+        Accumulate into *field* the field of this interaction for
+        *replicas* copies of the system, whose spins are stored one copy
+        after the other in *spin* (see Ensemble). By default the field is
+        computed copy by copy, using self.spin as a work array; interactions
+        with a C kernel override this method to compute all the copies in
+        a single call
+        """
+        spin_saved = self.spin.copy()
+        fields = field.reshape(replicas, -1)
+        for k, m in enumerate(spin.reshape(replicas, -1)):
+            self.spin[:] = m
+            fields[k] += self.compute_field(t)
+        self.spin[:] = spin_saved
+
+    def replica_array(self, name, replicas):
+        """
+        Returns the array attribute *name* (e.g. 'mu_s_inv') repeated for
+        *replicas* copies of the system or, for 'neighbours', the
+        neighbours array of the copies (see helper.tile_neighbours). The
+        arrays are created at the first call, so the parameters of the
+        interaction should not be changed afterwards
+        """
+        if self._replica_arrays is None:
+            self._replica_arrays = {}
+
+        key = (name, replicas)
+        if key not in self._replica_arrays:
+            if name == 'neighbours':
+                array = helper.tile_neighbours(self.neighbours, replicas)
+            else:
+                array = np.tile(getattr(self, name), replicas)
+            self._replica_arrays[key] = array
+        return self._replica_arrays[key]
+
+    def compute_field_and_energy(self, t=0):
+        """
+        Compute the field together with the energy density array. The C
+        kernels skip the energy density in compute_field, since it is only
+        needed when the energy is requested
+        """
+        return self.compute_field(t)
+
     def compute_energy(self):
 
         # since we are not always calling this function, so it's okay to call
         # compute_field again
-        self.compute_field()
+        self.compute_field_and_energy()
 
         self.total_energy = np.sum(self.energy)
 
@@ -96,6 +96,9 @@ class Exchange(Energy):
             self.Jz = float(self.J)
 
             self.compute_field = self.compute_field_uniform
+            self.add_field = self.add_field_uniform
+            self.add_field_replicas = self.add_field_replicas_uniform
+            self.compute_field_and_energy = self.compute_field_and_energy_uniform
 
         # Spatially resolved exchange -----------------------------------------
         # TODO: Add option to pass numpy arrays
@@ -114,6 +117,8 @@ class Exchange(Energy):
             pass
 
             self.compute_field = self.compute_field_spatial
+            self.add_field = self.add_field_spatial
+            self.compute_field_and_energy = self.compute_field_and_energy_spatial
 
         # Full exchange calculation (beyond nearest neighbours) ---------------
         # n_shells should not be larger than 8 (checked in the mesh class)
@@ -124,59 +129,98 @@ class Exchange(Energy):
                 self._J[i] = float(self.J[i])
 
             self.compute_field = self.compute_field_full
+            self.add_field = self.add_field_full
+            self.compute_field_and_energy = self.compute_field_and_energy_full
 
     def compute_field_spatial(self, t=0, spin=None):
 
         m = spin if spin is not None else self.spin
+        self._exchange_field_spatial(m, self.field, None, 0)
 
+        return self.field
+
+    def compute_field_uniform(self, t=0, spin=None):
+
+        m = spin if spin is not None else self.spin
+        self._exchange_field_uniform(m, self.field, None, 0)
+
+        return self.field
+
+    def compute_field_full(self, t=0, spin=None):
+
+        m = spin if spin is not None else self.spin
+        self._exchange_field_full(m, self.field, None, 0)
+
+        return self.field
+
+    def add_field_spatial(self, field, t=0):
+        self._exchange_field_spatial(self.spin, field, None, 1)
+
+    def add_field_uniform(self, field, t=0):
+        self._exchange_field_uniform(self.spin, field, None, 1)
+
+    def add_field_full(self, field, t=0):
+        self._exchange_field_full(self.spin, field, None, 1)
+
+    def add_field_replicas_uniform(self, spin, field, replicas, t=0):
+        clib.compute_exchange_field(spin, field,
+                                    self.replica_array('mu_s_inv', replicas),
+                                    None, self.Jx, self.Jy, self.Jz,
+                                    self.replica_array('neighbours', replicas),
+                                    replicas * self.n, self.n_ngbs, 1)
+
+    def compute_field_and_energy_spatial(self, t=0):
+        self._exchange_field_spatial(self.spin, self.field, self.energy, 0)
+        return self.field
+
+    def compute_field_and_energy_uniform(self, t=0):
+        self._exchange_field_uniform(self.spin, self.field, self.energy, 0)
+        return self.field
+
+    def compute_field_and_energy_full(self, t=0):
+        self._exchange_field_full(self.spin, self.field, self.energy, 0)
+        return self.field
+
+    def _exchange_field_spatial(self, m, field, energy, add):
         clib.compute_exchange_field_spatial(m,
-                                            self.field,
+                                            field,
                                             self.mu_s_inv,
-                                            self.energy,
+                                            energy,
                                             self._J,
                                             self.neighbours,
                                             self.n,
-                                            self.n_ngbs
+                                            self.n_ngbs,
+                                            add
                                             )
 
-        return self.field
-
-    def compute_field_uniform(self, t=0, spin=None):
-
-        m = spin if spin is not None else self.spin
-
+    def _exchange_field_uniform(self, m, field, energy, add):
         clib.compute_exchange_field(m,
-                                    self.field,
+                                    field,
                                     self.mu_s_inv,
-                                    self.energy,
+                                    energy,
                                     self.Jx,
                                     self.Jy,
                                     self.Jz,
                                     self.neighbours,
                                     self.n,
-                                    self.n_ngbs
+                                    self.n_ngbs,
+                                    add
                                     )
 
-        return self.field
-
-    def compute_field_full(self, t=0, spin=None):
-
-        m = spin if spin is not None else self.spin
-
+    def _exchange_field_full(self, m, field, energy, add):
         clib.compute_full_exchange_field(m,
-                                         self.field,
+                                         field,
                                          self.mu_s_inv,
-                                         self.energy,
+                                         energy,
                                          self._J,
                                          self.neighbours,
                                          self.n, self.mesh.n_ngbs,
                                          self.mesh.n_shells,
                                          self.mesh._n_ngbs_shell,
-                                         self.mesh._sum_ngbs_shell
+                                         self.mesh._sum_ngbs_shell,
+                                         add
                                          )
 
-        return self.field
-
 
 class UniformExchange(Exchange):
 
@@ -43,6 +43,244 @@ from math import sqrt
 
 from six.moves import range
 
+# Offsets (di, dj) from the site (i, j) to its neighbours at every shell, in
+# the order of the columns of the neighbours array. For the square alignment
+# the offsets of the odd rows (j) are different for some of the shells
+_DIAGONAL_SHELLS = {
+    1: [(1, 0),         # east
+        (-1, 0),        # west
+        (0, 1),         # north-east
+        (0, -1),        # south-west
+        (-1, 1),        # north-west
+        (1, -1)],       # south-east
+    2: [(1, 1),         # north east
+        (-1, -1),       # south west
+        (-1, 2),        # up
+        (1, -2),        # down
+        (-2, 1),        # north west
+        (2, -1)],       # south east
+    3: [(2, 0),         # east
+        (-2, 0),        # west
+        (0, 2),         # north east
+        (0, -2),        # south west
+        (-2, 2),        # north west
+        (2, -2)],       # south east
+    4: [(2, 1),         # north east 1
+        (-2, -1),       # south west 1
+        (1, 2),         # north east 2
+        (-1, -2),       # south west 2
+        (-1, 3),        # north 1
+        (1, -3),        # south 1
+        (-2, 3),        # north 2
+        (2, -3),        # south 2
+        (-3, 2),        # north west 1
+        (3, -2),        # south east 1
+        (-3, 1),        # north west 2
+        (3, -1)],       # south east 2
+    5: [(3, 0),         # east
+        (-3, 0),        # west
+        (0, 3),         # north east
+        (0, -3),        # south west
+        (-3, 3),        # north west
+        (3, -3)],       # south east
+    6: [(2, 2),         # north east
+        (-2, -2),       # south west
+        (-2, 4),        # north
+        (2, -4),        # south
+        (-4, 2),        # north west
+        (4, -2)],       # south east
+    7: [(3, 1),         # north east 1
+        (-3, -1),       # south west 1
+        (1, 3),         # north east 2
+        (-1, -3),       # south west 2
+        (-1, 4),        # north 1
+        (1, -4),        # south 1
+        (-3, 4),        # north 2
+        (3, -4),        # south 2
+        (-4, 3),        # north west 1
+        (4, -3),        # south east 1
+        (-4, 1),        # north west 2
+        (4, -1)],       # south east 2
+    8: [(4, 0),         # east
+        (-4, 0),        # west
+        (0, 4),         # north east
+        (0, -4),        # south west
+        (-4, 4),        # north west
+        (4, -4)],       # south east
+    9: [(3, 2),         # north east 1
+        (-3, -2),       # south west 1
+        (2, 3),         # north east 2
+        (-2, -3),       # south west 2
+        (-2, 5),        # north 1
+        (2, -5),        # south 1
+        (-3, 5),        # north 2
+        (3, -5),        # south 2
+        (-5, 3),        # north west 1
+        (5, -3),        # south east 1
+        (-5, 2),        # north west 2
+        (5, -2)],       # south east 2
+}
+
+_SQUARE_SHELLS = {
+    1: [(1, 0),         # east
+        (-1, 0),        # west
+        (1, 1),         # north-east
+        (0, -1),        # south-west
+        (0, 1),         # north-west
+        (1, -1)],       # south-east
+    2: [(2, 1),         # north east
+        (-1, -1),       # south west
+        (0, 2),         # up
+        (0, -2),        # down
+        (-1, 1),        # north west
+        (2, -1)],       # south east
+    3: [(2, 0),         # east
+        (-2, 0),        # west
+        (1, 2),         # north east
+        (-1, -2),       # south west
+        (-1, 2),        # north west
+        (1, -2)],       # south east
+    4: [(3, 1),         # north east 1
+        (-2, -1),       # south west 1
+        (2, 2),         # north east 2
+        (-2, -2),       # south west 2
+        (1, 3),         # north 1
+        (0, -3),        # south 1
+        (0, 3),         # north 2
+        (1, -3),        # south 2
+        (-2, 2),        # north west 1
+        (2, -2),        # south east 1
+        (-2, 1),        # north west 2
+        (3, -1)],       # south east 2
+    5: [(3, 0),         # east
+        (-3, 0),        # west
+        (2, 3),         # north-east
+        (-1, -3),       # south-west
+        (-1, 3),        # north-west
+        (2, -3)],       # south-east
+    6: [(3, 2),         # north east
+        (-3, -2),       # south west
+        (0, 4),         # north
+        (0, -4),        # south
+        (-3, 2),        # north west
+        (3, -2)],       # south east
+    7: [(4, 1),         # north east 1
+        (-3, -1),       # south west 1
+        (3, 3),         # north east 2
+        (-2, -3),       # south west 2
+        (1, 4),         # north 1
+        (-1, -4),       # south 1
+        (-1, 4),        # north 2
+        (1, -4),        # south 2
+        (-2, 3),        # north west 1
+        (3, -3),        # south east 1
+        (-3, 1),        # north west 2
+        (4, -1)],       # south east 2
+    8: [(4, 0),         # east
+        (-4, 0),        # west
+        (2, 4),         # north east
+        (-2, -4),       # south west
+        (-2, 4),        # north west
+        (2, -4)],       # south east
+    9: [(4, 2),         # north east 1
+        (-4, -2),       # south west 1
+        (4, 3),         # north east 2
+        (-3, -3),       # south west 2
+        (1, 5),         # north 1
+        (0, -5),        # south 1
+        (0, 5),         # north 2
+        (1, -5),        # south 2
+        (-3, 3),        # north west 1
+        (4, -3),        # south east 1
+        (-4, 2),        # north west 2
+        (4, -2)],       # south east 2
+}
+
+_SQUARE_SHELLS_ODD = {
+    1: [(1, 0),         # east
+        (-1, 0),        # west
+        (0, 1),         # north-east
+        (-1, -1),       # south-west
+        (-1, 1),        # north-west
+        (0, -1)],       # south-east
+    2: [(1, 1),         # north east
+        (-2, -1),       # south west
+        (0, 2),         # up
+        (0, -2),        # down
+        (-2, 1),        # north west
+        (1, -1)],       # south east
+    4: [(2, 1),         # north east 1
+        (-3, -1),       # south west 1
+        (2, 2),         # north east 2
+        (-2, -2),       # south west 2
+        (0, 3),         # north 1
+        (-1, -3),       # south 1
+        (-1, 3),        # north 2
+        (0, -3),        # south 2
+        (-2, 2),        # north west 1
+        (2, -2),        # south east 1
+        (-3, 1),        # north west 2
+        (2, -1)],       # south east 2
+    5: [(3, 0),         # east
+        (-3, 0),        # west
+        (1, 3),         # north-east
+        (-2, -3),       # south-west
+        (-2, 3),        # north-west
+        (1, -3)],       # south-east
+    7: [(3, 1),         # north east 1
+        (-4, -1),       # south west 1
+        (2, 3),         # north east 2
+        (-3, -3),       # south west 2
+        (1, 4),         # north 1
+        (-1, -4),       # south 1
+        (-1, 4),        # north 2
+        (1, -4),        # south 2
+        (-3, 3),        # north west 1
+        (2, -3),        # south east 1
+        (-4, 1),        # north west 2
+        (3, -1)],       # south east 2
+    9: [(4, 2),         # north east 1
+        (-4, -2),       # south west 1
+        (3, 3),         # north east 2
+        (-4, -3),       # south west 2
+        (0, 5),         # north 1
+        (-1, -5),       # south 1
+        (-1, 5),        # north 2
+        (0, -5),        # south 2
+        (-4, 3),        # north west 1
+        (3, -3),        # south east 1
+        (-4, 2),        # north west 2
+        (4, -2)],       # south east 2
+}
+
+
+def _shell_offsets(alignment, shell):
+    """
+    Returns the offsets (di, dj) of the neighbours at the given shell for
+    the even and the odd rows, as two arrays of shape (n_ngbs, 2), and an
+    array telling which of the neighbours are wrapped around periodic
+    boundaries. Along the third cubic axis of the diagonal alignment (the
+    north-west and south-east neighbours of the shells with 6 neighbours)
+    there is no periodicity
+    """
+    if alignment == 'diagonal':
+        even = odd = _DIAGONAL_SHELLS[shell]
+    else:
+        even = _SQUARE_SHELLS[shell]
+        odd = _SQUARE_SHELLS_ODD.get(shell, even)
+
+    wrap = np.ones(len(even), dtype=bool)
+    if alignment == 'diagonal' and len(even) == 6:
+        wrap[4:] = False
+
+    return (np.array(even), np.array(odd)), wrap
+
+
+# Computed once for every alignment and shell
+_SHELL_OFFSETS = {(alignment, shell): _shell_offsets(alignment, shell)
+                  for alignment in ('diagonal', 'square')
+                  for shell in range(1, 10)}
+
 
 class HexagonalMesh(object):
     def __init__(self, radius, nx, ny,
@@ -104,7 +342,8 @@ class HexagonalMesh(object):
         the order:
             [ left right top_right bottom_left top_left bottom_right ]
 
-        For the other shells see the *_ngbs_Xth_shell methods from this class
+        For the other shells see the _DIAGONAL_SHELLS and _SQUARE_SHELLS
+        offsets at the beginning of this module
 
         """
 
@@ -132,19 +371,6 @@ class HexagonalMesh(object):
                                          for max_sh in range(self.n_shells + 1)],
                                         dtype=np.int32)
 
-        # Dictionary to call the methods that return the indexes of the
-        # neighbours for a specific shell (like a switch statement)
-        self._ngbs_i_shell = {1: self._ngbs_first_shell,
-                              2: self._ngbs_second_shell,
-                              3: self._ngbs_third_shell,
-                              4: self._ngbs_fourth_shell,
-                              5: self._ngbs_fifth_shell,
-                              6: self._ngbs_sixth_shell,
-                              7: self._ngbs_seventh_shell,
-                              8: self._ngbs_eigth_shell,
-                              9: self._ngbs_ninth_shell
-                              }
-
         self.nx = nx
         self.ny = ny
         self.nz = 1  # time will tell if 0 is a better value here
@@ -166,6 +392,9 @@ class HexagonalMesh(object):
 
         self.n = nx * ny  # total number of cells
 
+        if alignment not in ('diagonal', 'square'):
+            raise ValueError("alignment is '{}', should be 'diagonal' or "
+                             "'square'".format(alignment))
         self.alignment = alignment
 
         self.size = (self.nx, self.ny, 1)  # number of cells in all directions
@@ -175,35 +404,49 @@ class HexagonalMesh(object):
         self.mesh_type = 'hexagonal'
         self.unit_length = unit_length
 
-        self.vertices, self.hexagons = self.init_grid()
+        # The grid of hexagons (only used for plots and VTK files) is
+        # computed when it is first used, see the properties below
+        self._vertices = None
+        self._hexagons = None
+        self._corners = None
+
+    @property
+    def vertices(self):
+        if self._vertices is None:
+            self._vertices, self._hexagons = self.init_grid()
+        return self._vertices
+
+    @property
+    def hexagons(self):
+        if self._hexagons is None:
+            self._vertices, self._hexagons = self.init_grid()
+        return self._hexagons
+
+    @property
+    def corners(self):
+        if self._corners is None:
+            self._vertices, self._hexagons = self.init_grid()
+        return self._corners
 
     def init_coordinates(self):
         coordinates = np.zeros((self.n, 3))
-        for j in range(self.ny):
-            for i in range(self.nx):
-                index = self.index(i, j)
-                # For a diagonal alignment, the hexagons are shifted
-                # in their x-position by dx * 0.5, on every row
-                if self.alignment == 'diagonal':
-                    r = (j * self.dx / 2.0 + i * self.dx + self.dx / 2.0,
-                         j * self.dy + self.h / 2.0,
-                         0
-                         )
-                # For a square alignment, the hexagons will
-                # always be in the same x-position for even numbered rows (j)
-                # x(i=0) = dx * 0.5
-                elif self.alignment == 'square':
-                    if j % 2 == 0:
-                        sign = 1
-                    else:
-                        sign = 0
+        # View with the axes (j, i, component) of the mesh indexing
+        r = coordinates.reshape(self.ny, self.nx, 3)
+        i = np.arange(self.nx)
+        j = np.arange(self.ny)[:, np.newaxis]
 
-                    r = (sign * self.dx / 2.0 + i * self.dx + self.dx / 2.0,
-                         j * self.dy + self.h / 2.0,
-                         0
-                         )
+        # For a diagonal alignment, the hexagons are shifted
+        # in their x-position by dx * 0.5, on every row
+        if self.alignment == 'diagonal':
+            shift = j
+        # For a square alignment, the hexagons will
+        # always be in the same x-position for even numbered rows (j)
+        # x(i=0) = dx * 0.5
+        elif self.alignment == 'square':
+            shift = 1 - j % 2
 
-                coordinates[index] = r
+        r[..., 0] = shift * self.dx / 2.0 + i * self.dx + self.dx / 2.0
+        r[..., 1] = j * self.dy + self.h / 2.0
         return coordinates
 
     def init_neighbours(self):
@@ -211,43 +454,71 @@ class HexagonalMesh(object):
         # The neighbours array will be a NxM array where N (rows) will be the
         # numer of lattice sites and M is the total number of ngbs per site
         neighbours = np.zeros((self.nx * self.ny, self.n_ngbs), dtype=np.int32)
+        # View with the axes (j, i, neighbour) of the mesh indexing
+        table = neighbours.reshape(self.ny, self.nx, self.n_ngbs)
 
-        site = 0  # Counter for lattice sites so we populate array row wise
+        if self.periodicity[1] and self.alignment == 'square':
+            raise Exception('PBCs not well '
+                            'defined for a square arrangement')
 
-        # Sweep through every lattice site, thus every row of the neighbours
-        # array
-        # For every row, we will compute the neighbours indexes for the *sh*
-        # shell, calling the corresponding function from the _ngbs_i_shell
-        # dictionary.  We store the neighbours according to the shells order,
+        # We store the neighbours according to the shells order,
         # i.e. for the k-th site:
         #
         #                   1st shell ngbs  | 2nd shell ngbs  | 3rd shell ...
         # neighbours[k] = [x  x  x  x  x  x  o  o  o  o  o  o  -  -  -  -  -  - ...]
         #
-        for j in range(self.ny):
-            for i in range(self.nx):
-                cell = self._index(i, j)
+        # Every column is computed for all the even (or odd) rows at once,
+        # from the offsets of the neighbours at the *sh* shell, as the sum
+        # of the (wrapped) row and column indexes
+        i = np.arange(self.nx)
+        for sh in range(1, self.n_shells + 1):
+            offsets, wrap = _SHELL_OFFSETS[self.alignment, sh]
+            start = self._sum_ngbs_shell[sh - 1]
+            # The columns of the shell are computed in a contiguous block,
+            # which is faster than filling the strided columns of the array
+            block = np.empty((len(wrap), self.ny, self.nx), dtype=np.int32)
+
+            for parity in (0, 1):
+                j = np.arange(parity, self.ny, 2)
+
+                for col, (di, dj) in enumerate(offsets[parity]):
+                    x = self._wrap(i + di, self.nx,
+                                   wrap[col] and self.periodicity[0])
+                    y = self._wrap(j + dj, self.ny,
+                                   wrap[col] and self.periodicity[1])
+                    y = np.where(y < 0, -self.n, y * self.nx)
+
+                    # The index x + y * nx is negative for sites outside
+                    # the lattice, which are set to -1
+                    column = block[col, parity::2]
+                    np.add(y[:, np.newaxis], x, out=column, casting='unsafe')
+                    np.maximum(column, -1, out=column)
+
+                    # A site is not its own neighbour
+                    column[np.ix_(y == j * self.nx, x == i)] = -1
+
+            table[..., start:start + len(wrap)] = block.transpose(1, 2, 0)
 
-                for sh in range(1, self.n_shells + 1):
-                    # Save ngbs indexes in the corresponding range of the row
-                    ngbs_range = slice(self._sum_ngbs_shell[sh - 1],
-                                       self._sum_ngbs_shell[sh])
-                    # compute and store them in this range
-                    neighbours[site, ngbs_range] = self._ngbs_i_shell[sh](i, j)
-
-                    # Set indexes to -1 for sites outside the lattice
-                    neighbours[site, ngbs_range] = [other if other != cell
-                                                    else -1 for other in
-                                                    neighbours[site, ngbs_range]]
-
-                    # we must break to populate *neighbours* only according to
-                    # the specified number of shells
-                    if self.n_shells == sh:
-                        continue
+        return neighbours
 
-                site += 1
+    def _wrap(self, p, size, periodic):
+        """
+        Returns the positions p along an axis with *size* cells, wrapped
+        around the boundaries as in the index method if periodic is True,
+        and -n for positions outside the mesh
+        """
+        if periodic:
+            p = np.where(p == -1, size - 1, np.where(p == size, 0, p))
+        return np.where((p >= 0) & (p < size), p, -self.n)
 
-        return neighbours
+    def mask_neighbours(self, sites):
+        """
+        Set to -1 the indexes of the given sites (e.g. without material),
+        given as a boolean array, in the neighbours array
+        """
+        sites = np.asarray(sites, dtype=bool)
+        ngbs = self.neighbours
+        ngbs[(ngbs >= 0) & sites[np.maximum(ngbs, 0)]] = -1
 
     def init_grid(self):
         """
@@ -258,14 +529,14 @@ class HexagonalMesh(object):
         vertex_counter = 0
         vertices = []  # list of tuples of coordinates
         hexagons = []  # list of tuples of vertices
-        self.corners = []
+        self._corners = []
         for j in range(self.ny):
             for i in range(self.nx):
                 index = self._index(i, j)
                 x, y = self.coordinates[index][0], self.coordinates[index][1]
                 # self.radius is the inradius while self.h/2  is the circumradius
                 corners = self.hexagon_corners(x, y, self.h * 0.5)
-                self.corners.append(corners)
+                self._corners.append(corners)
                 hexagon = []
                 # We'll go through the corners in a counter-clockwise direction.
                 # For each corner, we think about if it's a "new" vertex, or
@@ -331,7 +602,7 @@ class HexagonalMesh(object):
                     vertex_counter += 1
                 hexagons.append(hexagon)
 
-        self.corners = np.array(self.corners)
+        self._corners = np.array(self._corners)
         return np.array(vertices), np.array(hexagons)
 
     def index(self, i, j):
@@ -416,298 +687,3 @@ class HexagonalMesh(object):
         return [(x + radius * np.cos(theta),
                  y + radius * np.sin(theta),
                  0) for theta in angle_rad]
-
-    # -------------------------------------------------------------------------
-    # Functions that return the number of neighbours at the n-th shell at
-    # a lattice site with position indexes (i, j). For example,
-    # the function _ngbs_first_shell returns the nearest neighbours
-
-    def _ngbs_first_shell(self, i, j):
-
-        # there can be periodicity along x and y axes, but not
-        # along the third cubic axis (would be z), hence, we use
-        # _index to disregard periodicity in the NW and SE directions.
-        if self.alignment == 'diagonal':
-            return [self.index(i + 1, j),       # right  east
-                    self.index(i - 1, j),       # left   west
-                    self.index(i, j + 1),       # up     north-east
-                    self.index(i, j - 1),       # down   south-west
-                    self._index(i - 1, j + 1),  #        north-west
-                    self._index(i + 1, j - 1),  #        south-east
-                    ]
-        # For the square alignment, the neighbours position change
-        # between odd and even rows
-        elif self.alignment == 'square':
-            if j % 2 == 0:
-                return [self.index(i + 1, j),       # right  east
-                        self.index(i - 1, j),       # left   west
-                        self.index(i + 1, j + 1),   # up     north-east
-                        self.index(i, j - 1),       # down   south-west
-                        self.index(i, j + 1),       # .      north-west
-                        self.index(i + 1, j - 1),   # .      south-east
-                        ]
-            else:
-                return [self.index(i + 1, j),       # right  east
-                        self.index(i - 1, j),       # left   west
-                        self.index(i, j + 1),       # up     north-east
-                        self.index(i - 1, j - 1),   # down   south-west
-                        self.index(i - 1, j + 1),   # .      north-west
-                        self.index(i, j - 1),       # .      south-east
-                        ]
-
-    def _ngbs_second_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 1, j + 1),       # north east
-                    self.index(i - 1, j - 1),       # south west
-                    self.index(i - 1, j + 2),       # up
-                    self.index(i + 1, j - 2),       # down
-                    self._index(i - 2, j + 1),      # north west
-                    self._index(i + 2, j - 1),      # south east
-                    ]
-        elif self.alignment == 'square':
-            if j % 2 == 0:
-                return [self.index(i + 2, j + 1),   # north east
-                        self.index(i - 1, j - 1),   # south west
-                        self.index(i, j + 2),       # up
-                        self.index(i, j - 2),       # down
-                        self.index(i - 1, j + 1),   # north west
-                        self.index(i + 2, j - 1),   # south east
-                        ]
-            else:
-                return [self.index(i + 1, j + 1),   # north east
-                        self.index(i - 2, j - 1),   # south west
-                        self.index(i, j + 2),       # up
-                        self.index(i, j - 2),       # down
-                        self.index(i - 2, j + 1),   # north west
-                        self.index(i + 1, j - 1)    # south east
-                        ]
-
-    def _ngbs_third_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 2, j),       # east
-                    self.index(i - 2, j),       # west
-                    self.index(i, j + 2),       # north east
-                    self.index(i, j - 2),       # south west
-                    self._index(i - 2, j + 2),  # north west
-                    self._index(i + 2, j - 2)   # south east
-                    ]
-        # in this case, the index does not depend on the row
-        elif self.alignment == 'square':
-            return [self.index(i + 2, j),       # east
-                    self.index(i - 2, j),       # west
-                    self.index(i + 1, j + 2),   # north east
-                    self.index(i - 1, j - 2),   # south west
-                    self.index(i - 1, j + 2),   # north west
-                    self.index(i + 1, j - 2)    # south east
-                    ]
-
-    def _ngbs_fourth_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 2, j + 1),   # north east 1
-                    self.index(i - 2, j - 1),   # south west 1
-                    self.index(i + 1, j + 2),   # north east 2
-                    self.index(i - 1, j - 2),   # south west 2
-                    self.index(i - 1, j + 3),   # north 1
-                    self.index(i + 1, j - 3),   # south 1
-                    self.index(i - 2, j + 3),   # north 2
-                    self.index(i + 2, j - 3),   # south 2
-                    self.index(i - 3, j + 2),   # north west 1
-                    self.index(i + 3, j - 2),   # south east 1
-                    self.index(i - 3, j + 1),   # north west 2
-                    self.index(i + 3, j - 1)    # south east 2
-                    ]
-        # in this case, the index does not depend on the row
-        elif self.alignment == 'square':
-            if j % 2 == 0:
-                return [self.index(i + 3, j + 1),   # north east 1
-                        self.index(i - 2, j - 1),   # south west 1
-                        self.index(i + 2, j + 2),   # north east 2
-                        self.index(i - 2, j - 2),   # south west 2
-                        self.index(i + 1, j + 3),   # north 1
-                        self.index(i, j - 3),       # south 1
-                        self.index(i, j + 3),       # north 2
-                        self.index(i + 1, j - 3),   # south 2
-                        self.index(i - 2, j + 2),   # north west 1
-                        self.index(i + 2, j - 2),   # south east 1
-                        self.index(i - 2, j + 1),   # north west 2
-                        self.index(i + 3, j - 1)    # south east 2
-                        ]
-            else:
-                return [self.index(i + 2, j + 1),   # north east 1
-                        self.index(i - 3, j - 1),   # south west 1
-                        self.index(i + 2, j + 2),   # north east 2
-                        self.index(i - 2, j - 2),   # south west 2
-                        self.index(i, j + 3),       # north 1
-                        self.index(i - 1, j - 3),   # south 1
-                        self.index(i - 1, j + 3),   # north 2
-                        self.index(i, j - 3),       # south 2
-                        self.index(i - 2, j + 2),   # north west 1
-                        self.index(i + 2, j - 2),   # south east 1
-                        self.index(i - 3, j + 1),   # north west 2
-                        self.index(i + 2, j - 1)    # south east 2
-                        ]
-
-    def _ngbs_fifth_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 3, j),           # east
-                    self.index(i - 3, j),           # west
-                    self.index(i, j + 3),           # north east
-                    self.index(i, j - 3),           # south west
-                    self._index(i - 3, j + 3),      # north west
-                    self._index(i + 3, j - 3)       # south east
-                    ]
-        elif self.alignment == 'square':
-            if j % 2 == 0:
-                return [self.index(i + 3, j),       # east
-                        self.index(i - 3, j),       # west
-                        self.index(i + 2, j + 3),   # north-east
-                        self.index(i - 1, j - 3),   # south-west
-                        self.index(i - 1, j + 3),   # north-west
-                        self.index(i + 2, j - 3)    # south-east
-                        ]
-            else:
-                return [self.index(i + 3, j),       # east
-                        self.index(i - 3, j),       # west
-                        self.index(i + 1, j + 3),   # north-east
-                        self.index(i - 2, j - 3),   # south-west
-                        self.index(i - 2, j + 3),   # north-west
-                        self.index(i + 1, j - 3)    # south-east
-                        ]
-
-    def _ngbs_sixth_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 2, j + 2),   # north east
-                    self.index(i - 2, j - 2),   # south west
-                    self.index(i - 2, j + 4),   # north
-                    self.index(i + 2, j - 4),   # south
-                    self._index(i - 4, j + 2),  # north west
-                    self._index(i + 4, j - 2)   # south east
-                    ]
-        # in this case, the index does not depend on the row
-        elif self.alignment == 'square':
-            return [self.index(i + 3, j + 2),   # north east
-                    self.index(i - 3, j - 2),   # south west
-                    self.index(i, j + 4),       # north
-                    self.index(i, j - 4),       # south
-                    self.index(i - 3, j + 2),   # north west
-                    self.index(i + 3, j - 2)    # south east
-                    ]
-
-    def _ngbs_seventh_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 3, j + 1),       # north east 1
-                    self.index(i - 3, j - 1),       # south west 1
-                    self.index(i + 1, j + 3),       # north east 2
-                    self.index(i - 1, j - 3),       # south west 2
-                    self.index(i - 1, j + 4),       # north 1
-                    self.index(i + 1, j - 4),       # south 1
-                    self.index(i - 3, j + 4),       # north 2
-                    self.index(i + 3, j - 4),       # south 2
-                    self.index(i - 4, j + 3),       # north west 1
-                    self.index(i + 4, j - 3),       # south east 1
-                    self.index(i - 4, j + 1),       # north west 2
-                    self.index(i + 4, j - 1)        # south east 2
-                    ]
-        # in this case, the index does not depend on the row
-        elif self.alignment == 'square':
-            if j % 2 == 0:
-                return [self.index(i + 4, j + 1),       # north east 1
-                        self.index(i - 3, j - 1),       # south west 1
-                        self.index(i + 3, j + 3),       # north east 2
-                        self.index(i - 2, j - 3),       # south west 2
-                        self.index(i + 1, j + 4),       # north 1
-                        self.index(i - 1, j - 4),       # south 1
-                        self.index(i - 1, j + 4),       # north 2
-                        self.index(i + 1, j - 4),       # south 2
-                        self.index(i - 2, j + 3),       # north west 1
-                        self.index(i + 3, j - 3),       # south east 1
-                        self.index(i - 3, j + 1),       # north west 2
-                        self.index(i + 4, j - 1)        # south east 2
-                        ]
-            else:
-                return [self.index(i + 3, j + 1),       # north east 1
-                        self.index(i - 4, j - 1),       # south west 1
-                        self.index(i + 2, j + 3),       # north east 2
-                        self.index(i - 3, j - 3),       # south west 2
-                        self.index(i + 1, j + 4),       # north 1
-                        self.index(i - 1, j - 4),       # south 1
-                        self.index(i - 1, j + 4),       # north 2
-                        self.index(i + 1, j - 4),       # south 2
-                        self.index(i - 3, j + 3),       # north west 1
-                        self.index(i + 2, j - 3),       # south east 1
-                        self.index(i - 4, j + 1),       # north west 2
-                        self.index(i + 3, j - 1)        # south east 2
-                        ]
-
-    def _ngbs_eigth_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 4, j),       # east
-                    self.index(i - 4, j),       # west
-                    self.index(i, j + 4),       # north east
-                    self.index(i, j - 4),       # south west
-                    self._index(i - 4, j + 4),  # north west
-                    self._index(i + 4, j - 4)   # south east
-                    ]
-        # in this case, the index does not depend on the row
-        elif self.alignment == 'square':
-            return [self.index(i + 4, j),       # east
-                    self.index(i - 4, j),       # west
-                    self.index(i + 2, j + 4),   # north east
-                    self.index(i - 2, j - 4),   # south west
-                    self.index(i - 2, j + 4),   # north west
-                    self.index(i + 2, j - 4)    # south east
-                    ]
-
-    def _ngbs_ninth_shell(self, i, j):
-
-        if self.alignment == 'diagonal':
-            return [self.index(i + 3, j + 2),       # north east 1
-                    self.index(i - 3, j - 2),       # south west 1
-                    self.index(i + 2, j + 3),       # north east 2
-                    self.index(i - 2, j - 3),       # south west 2
-                    self.index(i - 2, j + 5),       # north 1
-                    self.index(i + 2, j - 5),       # south 1
-                    self.index(i - 3, j + 5),       # north 2
-                    self.index(i + 3, j - 5),       # south 2
-                    self.index(i - 5, j + 3),       # north west 1
-                    self.index(i + 5, j - 3),       # south east 1
-                    self.index(i - 5, j + 2),       # north west 2
-                    self.index(i + 5, j - 2)        # south east 2
-                    ]
-        # in this case, the index does not depend on the row
-        elif self.alignment == 'square':
-            if j % 2 == 0:
-                return [self.index(i + 4, j + 2),       # north east 1
-                        self.index(i - 4, j - 2),       # south west 1
-                        self.index(i + 4, j + 3),       # north east 2
-                        self.index(i - 3, j - 3),       # south west 2
-                        self.index(i + 1, j + 5),       # north 1
-                        self.index(i, j - 5),           # south 1
-                        self.index(i, j + 5),           # north 2
-                        self.index(i + 1, j - 5),       # south 2
-                        self.index(i - 3, j + 3),       # north west 1
-                        self.index(i + 4, j - 3),       # south east 1
-                        self.index(i - 4, j + 2),       # north west 2
-                        self.index(i + 4, j - 2)        # south east 2
-                        ]
-            else:
-                return [self.index(i + 4, j + 2),       # north east 1
-                        self.index(i - 4, j - 2),       # south west 1
-                        self.index(i + 3, j + 3),       # north east 2
-                        self.index(i - 4, j - 3),       # south west 2
-                        self.index(i, j + 5),           # north 1
-                        self.index(i - 1, j - 5),       # south 1
-                        self.index(i - 1, j + 5),       # north 2
-                        self.index(i, j - 5),           # south 2
-                        self.index(i - 4, j + 3),       # north west 1
-                        self.index(i + 3, j - 3),       # south east 1
-                        self.index(i - 4, j + 2),       # north west 2
-                        self.index(i + 4, j - 2)        # south east 2
-                        ]
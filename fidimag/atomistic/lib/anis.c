@@ -4,7 +4,7 @@
 void compute_anis(double *restrict spin, double *restrict field,
                   double *restrict mu_s_inv,
                   double *restrict energy,
-	              double *restrict Ku, double *restrict axis, int n) {
+	              double *restrict Ku, double *restrict axis, int n, int add) {
 
     /* Remember that the magnetisation order is
      *      mx1, my1, mz1, mx2, my2, mz2, mx3,...
@@ -24,16 +24,16 @@ void compute_anis(double *restrict spin, double *restrict field,
                       spin[3 * i + 2] * axis[3 * i + 2]);
 
 
-		field[3 * i]     = 2 * Ku[i] * m_u * axis[3 * i]    ;
-		field[3 * i + 1] = 2 * Ku[i] * m_u * axis[3 * i + 1];
-		field[3 * i + 2] = 2 * Ku[i] * m_u * axis[3 * i + 2];
-
-		energy[i] = -Ku[i] * (m_u * m_u);
+		if (energy != NULL) {
+		    energy[i] = -Ku[i] * (m_u * m_u);
+		}
 
         // Scale field by 1/mu_s
-		field[3 * i]     *= mu_s_inv[i];
-		field[3 * i + 1] *= mu_s_inv[i];
-		field[3 * i + 2] *= mu_s_inv[i];
+		store_field(field, i,
+		            2 * Ku[i] * m_u * axis[3 * i]     * mu_s_inv[i],
+		            2 * Ku[i] * m_u * axis[3 * i + 1] * mu_s_inv[i],
+		            2 * Ku[i] * m_u * axis[3 * i + 2] * mu_s_inv[i],
+		            add);
 
 	}
 
@@ -43,7 +43,7 @@ void compute_anis(double *restrict spin, double *restrict field,
 void compute_anis_cubic(double *restrict spin, double *restrict field,
                         double *restrict mu_s_inv,
                         double *restrict energy,
-                        double *restrict Kc, int n) {
+                        double *restrict Kc, int n, int add) {
 
     /* Remember that the magnetisation order is
      *      mx1, my1, mz1, mx2, my2, mz2, mx3,...
@@ -54,19 +54,21 @@ void compute_anis_cubic(double *restrict spin, double *restrict field,
     #pragma omp parallel for
     for (int i = 0; i < n; i++) {
         int j = 3 * i;
-      	field[j]   = - 4 * Kc[i] * spin[j]   * spin[j]   * spin[j];
-      	field[j+1] = - 4 * Kc[i] * spin[j+1] * spin[j+1] * spin[j+1];
-      	field[j+2] = - 4 * Kc[i] * spin[j+2] * spin[j+2] * spin[j+2];
-
-	    energy[i] = -0.25 * (field[j]   * spin[j]   +
-                             field[j+1] * spin[j+1] +
-                             field[j+2] * spin[j+2]
-                             );
+      	double fx = - 4 * Kc[i] * spin[j]   * spin[j]   * spin[j];
+      	double fy = - 4 * Kc[i] * spin[j+1] * spin[j+1] * spin[j+1];
+      	double fz = - 4 * Kc[i] * spin[j+2] * spin[j+2] * spin[j+2];
+
+	    if (energy != NULL) {
+	        energy[i] = -0.25 * (fx * spin[j]   +
+                                 fy * spin[j+1] +
+                                 fz * spin[j+2]
+                                 );
+	    }
 
         // Scale field by 1/mu_s
-		field[3 * i]     *= mu_s_inv[i];
-		field[3 * i + 1] *= mu_s_inv[i];
-		field[3 * i + 2] *= mu_s_inv[i];
+		store_field(field, i,
+		            fx * mu_s_inv[i], fy * mu_s_inv[i], fz * mu_s_inv[i],
+		            add);
 
 	    }
 
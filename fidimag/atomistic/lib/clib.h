@@ -26,16 +26,32 @@ inline double cross_z(double a0, double a1, double a2, double b0, double b1,
   return a0 * b1 - a1 * b0;
 }
 
+/* Store the field vector (fx, fy, fz) of the i-th lattice site. When add is
+ * non zero the vector is accumulated into the field array instead, which
+ * lets several interactions sum directly into the effective field */
+inline void store_field(double *restrict field, int i, double fx, double fy,
+                        double fz, int add) {
+  if (add) {
+    field[3 * i] += fx;
+    field[3 * i + 1] += fy;
+    field[3 * i + 2] += fz;
+  } else {
+    field[3 * i] = fx;
+    field[3 * i + 1] = fy;
+    field[3 * i + 2] = fz;
+  }
+}
+
 // ----------------------------------------------------------------------------
 // From exch.c
 
 void compute_exch_field(double *restrict spin, double *restrict field, double *restrict mu_s_inv,
                         double *restrict energy, double Jx,
-                        double Jy, double Jz, int *restrict ngbs, int n, int n_ngbs);
+                        double Jy, double Jz, int *restrict ngbs, int n, int n_ngbs, int add);
 
 void compute_exch_field_spatial(double *restrict spin, double *restrict field, double *restrict mu_s_inv,
                                 double *restrict energy,
-                                double *restrict J, int *restrict ngbs, int n, int n_ngbs);
+                                double *restrict J, int *restrict ngbs, int n, int n_ngbs, int add);
 
 double compute_exch_energy(double *restrict spin, double Jx, double Jy, double Jz,
                            int nx, int ny, int nz, int xperiodic,
@@ -44,8 +60,8 @@ double compute_exch_energy(double *restrict spin, double Jx, double Jy, double J
 void compute_full_exch_field(double *restrict spin, double *restrict field, double *restrict mu_s_inv,
                              double *restrict energy,
 					      	 double *restrict J, int *restrict ngbs, int n, int n_ngbs,
-                             int n_shells, int *restrict n_ngbs_shell, int *restrict sum_ngbs_shell
-                             );
+                             int n_shells, int *restrict n_ngbs_shell, int *restrict sum_ngbs_shell,
+                             int add);
 
 // -----------------------------------------------------------------------------
 // From anis.c
@@ -53,12 +69,12 @@ void compute_full_exch_field(double *restrict spin, double *restrict field, doub
 void compute_anis(double *restrict spin, double *restrict field,
                   double *restrict mu_s_inv,
                   double *restrict energy, double *restrict Ku,
-                  double *restrict axis, int n);
+                  double *restrict axis, int n, int add);
 
 void compute_anis_cubic(double *restrict spin, double *restrict field,
                         double *restrict mu_s_inv,
                         double *restrict energy,
-                        double *Kc, int n);
+                        double *Kc, int n, int add);
 
 // ----------------------------------------------------------------------------
 // From dmi.c
@@ -66,12 +82,13 @@ void compute_anis_cubic(double *restrict spin, double *restrict field,
 void dmi_field_bulk(double *restrict spin, double *restrict field,
                     double *restrict mu_s_inv,
                     double *restrict energy, double *D,
-                    int *restrict ngbs, int n, int n_ngbs);
+                    int *restrict ngbs, int n, int n_ngbs, int add);
 
 void dmi_field_interfacial_atomistic(double *spin, double *field,
                                      double *mu_s_inv,
                                      double *energy, double D, int *ngbs, int n,
-                                     int n_ngbs, int n_ngbs_dmi, double *DMI_vec);
+                                     int n_ngbs, int n_ngbs_dmi, double *DMI_vec,
+                                     int add);
 
 double dmi_energy(double *restrict spin, double D, int nx, int ny, int nz, int xperiodic,
                   int yperiodic);
@@ -108,6 +125,10 @@ void llg_rhs_dw_c(double *restrict m, double *restrict h, double *restrict dm, d
                   double *restrict mu_s_inv, int *pins, double *restrict eta, int n, double gamma,
                   double dt);
 
+void thermal_field_c(double *restrict h_th, double *restrict T, double *restrict alpha,
+                     double *restrict mu_s_inv, int *restrict pins, double *restrict eta,
+                     int n, double gamma, double dt);
+
 // ----------------------------------------------------------------------------
 // From mc.c
 
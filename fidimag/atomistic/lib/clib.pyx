@@ -45,10 +45,11 @@ cdef extern from "clib.h":
     void compute_exch_field(double *spin, double *field, double *mu_s_inv,
                             double *energy,
                             double Jx, double Jy, double Jz,
-                            int *ngbs, int n, int n_ngbs)
+                            int *ngbs, int n, int n_ngbs, int add)
     void compute_exch_field_spatial(double *spin, double *field, double *mu_s_inv,
                                     double *energy,
-                                    double *J, int *ngbs, int n, int n_ngbs)
+                                    double *J, int *ngbs, int n, int n_ngbs,
+                                    int add)
 
     double compute_exch_energy(double *spin, double Jx, double Jy, double Jz,
                                int nx, int ny, int nz,
@@ -58,7 +59,7 @@ cdef extern from "clib.h":
                                  double *energy,
 				 double *J, int *ngbs, int n, int n_ngbs,
                                  int n_shells, int *n_ngbs_shell,
-                                 int *sum_ngbs_shell
+                                 int *sum_ngbs_shell, int add
                                  )
 
     # -------------------------------------------------------------------------
@@ -66,13 +67,13 @@ cdef extern from "clib.h":
     void dmi_field_bulk(double *spin, double *field,
                         double *mu_s_inv,
                         double *energy,
-                        double *D, int *ngbs, int n, int n_ngbs)
+                        double *D, int *ngbs, int n, int n_ngbs, int add)
 
     void dmi_field_interfacial_atomistic(double *spin, double *field,
                                          double *mu_s_inv,
                                          double *energy, double D, int *ngbs,
                                          int n, int n_ngbs, int n_ngbs_dmi,
-                                         double *DMI_vec)
+                                         double *DMI_vec, int add)
 
     double dmi_energy(double *spin, double D, int nx, int ny, int nz,
                       int xperiodic, int yperiodic)
@@ -88,10 +89,10 @@ cdef extern from "clib.h":
 
     void compute_anis(double *spin, double *field, double *mu_s_inv,
                       double *energy,
-                      double *Ku, double *axis, int n)
+                      double *Ku, double *axis, int n, int add)
 
     void compute_anis_cubic(double *spin, double *field, double *mu_s_inv,
-                            double *energy, double *Kc, int n)
+                            double *energy, double *Kc, int n, int add)
 
     # -------------------------------------------------------------------------
 
@@ -102,12 +103,24 @@ cdef extern from "clib.h":
                       double *mu_s_inv, int *pins, double *eta, int n,
                       double gamma, double dt)
 
+    void thermal_field_c(double *h_th, double *T, double *alpha,
+                         double *mu_s_inv, int *pins, double *eta,
+                         int n, double gamma, double dt)
+
 
 
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 
 
+cdef inline double *energy_ptr(double [:] energy):
+    # A None energy array skips the energy density computation in the
+    # kernels, which only compute the field in that case
+    if energy is None:
+        return NULL
+    return &energy[0]
+
+
 def compute_skyrmion_number(double [:] spin,
                             double [:] charge,
                             nx, ny, nz,
@@ -157,12 +170,12 @@ def compute_exchange_field(double [:] spin,
                            double [:] energy,
                            Jx, Jy, Jz,
                            int [:, :] ngbs,
-                           n, n_ngbs
+                           n, n_ngbs, add=0
                            ):
 
     compute_exch_field(&spin[0], &field[0], &mu_s_inv[0],
-                       &energy[0], Jx, Jy, Jz,
-                       &ngbs[0, 0], n, n_ngbs)
+                       energy_ptr(energy), Jx, Jy, Jz,
+                       &ngbs[0, 0], n, n_ngbs, add)
 
 def compute_exchange_field_spatial(double [:] spin,
                                    double [:] field,
@@ -170,10 +183,10 @@ def compute_exchange_field_spatial(double [:] spin,
                                    double [:] energy,
                                    double [:, :] J,
                                    int [:, :] ngbs,
-                                   n, n_ngbs):
+                                   n, n_ngbs, add=0):
 
     compute_exch_field_spatial(&spin[0], &field[0], &mu_s_inv[0],
-                               &energy[0],&J[0,0],&ngbs[0, 0], n, n_ngbs)
+                               energy_ptr(energy),&J[0,0],&ngbs[0, 0], n, n_ngbs, add)
 
 
 def compute_exchange_energy(double [:] spin,
@@ -192,30 +205,31 @@ def compute_full_exchange_field(double [:] spin,
                                 int [:, :] ngbs,
                                 n, n_ngbs, n_shells,
                                 int [:] n_ngbs_shell,
-                                int [:] sum_ngbs_shell
+                                int [:] sum_ngbs_shell,
+                                add=0
                                 ):
 
     compute_full_exch_field(&spin[0], &field[0], &mu_s_inv[0],
-                            &energy[0], &J[0],
+                            energy_ptr(energy), &J[0],
                             &ngbs[0, 0], n, n_ngbs, n_shells,
-                            &n_ngbs_shell[0], &sum_ngbs_shell[0])
+                            &n_ngbs_shell[0], &sum_ngbs_shell[0], add)
 
 # -------------------------------------------------------------------------
 
 def compute_anisotropy(double [:] spin, double [:] field,
                        double [:] mu_s_inv,
                        double [:] energy,
-                       double [:] Ku, double [:] axis, n):
+                       double [:] Ku, double [:] axis, n, add=0):
     compute_anis(&spin[0], &field[0], &mu_s_inv[0],
-                 &energy[0], &Ku[0], &axis[0], n)
+                 energy_ptr(energy), &Ku[0], &axis[0], n, add)
 
 def compute_anisotropy_cubic(double [:] spin, double [:] field,
                              double [:] mu_s_inv,
                              double [:] energy,
-                             double [:] Kc, n):
+                             double [:] Kc, n, add=0):
 
     compute_anis_cubic(&spin[0], &field[0], &mu_s_inv[0],
-                       &energy[0], &Kc[0], n)
+                       energy_ptr(energy), &Kc[0], n, add)
 
 # -----------------------------------------------------------------------------
 
@@ -225,10 +239,10 @@ def compute_dmi_field(double [:] spin,
                       double [:] energy,
                       double [:, :] D,
                       int [:, :] ngbs,
-                      n, n_ngbs):
+                      n, n_ngbs, add=0):
     dmi_field_bulk(&spin[0], &field[0],
-                   &mu_s_inv[0], &energy[0], &D[0,0],
-                   &ngbs[0, 0], n, n_ngbs)
+                   &mu_s_inv[0], energy_ptr(energy), &D[0,0],
+                   &ngbs[0, 0], n, n_ngbs, add)
 
 
 def compute_dmi_field_interfacial(double [:] spin,
@@ -239,13 +253,14 @@ def compute_dmi_field_interfacial(double [:] spin,
                                   int [:, :] ngbs,
                                   n, n_ngbs, n_ngbs_dmi,
                                   double [:] DMI_vec,
+                                  add=0
                                   ):
     dmi_field_interfacial_atomistic(&spin[0], &field[0],
                                     &mu_s_inv[0],
-                                    &energy[0],
+                                    energy_ptr(energy),
                                     D, &ngbs[0, 0], n,
                                     n_ngbs, n_ngbs_dmi,
-                                    &DMI_vec[0]
+                                    &DMI_vec[0], add
                                     )
 
 def compute_dmi_energy(np.ndarray[double, ndim=1, mode="c"] spin,
@@ -284,6 +299,16 @@ def compute_llg_rhs_dw(double [:] dm,
                  &mu_s_inv[0], &pin[0], &eta[0], n, gamma, dt)
 
 
+def compute_thermal_field(double [:] h_th,
+                          double [:] T,
+                          double [:] alpha,
+                          double [:] mu_s_inv,
+                          double [:] eta,
+                          int [:] pin, n, gamma, dt):
+    thermal_field_c(&h_th[0], &T[0], &alpha[0], &mu_s_inv[0], &pin[0],
+                    &eta[0], n, gamma, dt)
+
+
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 
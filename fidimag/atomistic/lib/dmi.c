@@ -30,7 +30,7 @@ boundaries
 void dmi_field_bulk(double *restrict spin, double *restrict field,
                     double *restrict mu_s_inv,
                     double *restrict energy, double *restrict _D,
-                    int *restrict ngbs, int nxyz, int n_ngbs) {
+                    int *restrict ngbs, int nxyz, int n_ngbs, int add) {
 
     /* Bulk DMI field and energy computation
      *
@@ -103,19 +103,17 @@ void dmi_field_bulk(double *restrict spin, double *restrict field,
             }
         }
 
-		field[3 * i]     = fx;
-        field[3 * i + 1] = fy;
-        field[3 * i + 2] = fz;
-
-        energy[i] = -0.5 * (fx * spin[3 * i] +
-                            fy * spin[3 * i + 1] +
-                            fz * spin[3 * i + 2]
-                            );
+        if (energy != NULL) {
+            energy[i] = -0.5 * (fx * spin[3 * i] +
+                                fy * spin[3 * i + 1] +
+                                fz * spin[3 * i + 2]
+                                );
+        }
 
         // Scale field by 1/mu_s
-		field[3 * i]     *= mu_s_inv[i];
-		field[3 * i + 1] *= mu_s_inv[i];
-		field[3 * i + 2] *= mu_s_inv[i];
+        store_field(field, i,
+                    fx * mu_s_inv[i], fy * mu_s_inv[i], fz * mu_s_inv[i],
+                    add);
     }
 }
 
@@ -124,7 +122,7 @@ void dmi_field_interfacial_atomistic(double *restrict spin, double *restrict fie
                                      double *restrict energy,
                                      double D, int *restrict ngbs, int n,
                                      int n_ngbs, int n_ngbs_dmi,
-                                     double *restrict DMI_vec) {
+                                     double *restrict DMI_vec, int add) {
     
     /* Interfacial DMI field and energy computation
      *
@@ -199,21 +197,19 @@ void dmi_field_interfacial_atomistic(double *restrict spin, double *restrict fie
             }
         }
 
-        field[3 * i]     = fx;
-  	    field[3 * i + 1] = fy;
-  	    field[3 * i + 2] = fz;
-
         // TODO: check whether the energy is correct or not.
         /* Avoid second counting with 1/2 */
-  	    energy[i] = -0.5 * (fx * spin[3 * i] +
-                            fy * spin[3 * i + 1] +
-                            fz * spin[3 * i + 2]
-                            );
+        if (energy != NULL) {
+            energy[i] = -0.5 * (fx * spin[3 * i] +
+                                fy * spin[3 * i + 1] +
+                                fz * spin[3 * i + 2]
+                                );
+        }
 
         // Scale field by 1/mu_s
-		field[3 * i]     *= mu_s_inv[i];
-		field[3 * i + 1] *= mu_s_inv[i];
-		field[3 * i + 2] *= mu_s_inv[i];
+        store_field(field, i,
+                    fx * mu_s_inv[i], fy * mu_s_inv[i], fz * mu_s_inv[i],
+                    add);
     }
 }
 
@@ -39,7 +39,7 @@ void compute_exch_field(double *restrict spin, double *restrict field,
                         double *restrict mu_s_inv,
                         double *restrict energy,
 						double Jx, double Jy, double Jz,
-                        int *restrict ngbs, int n, int n_ngbs) {
+                        int *restrict ngbs, int n, int n_ngbs, int add) {
 
     #pragma omp parallel for
 	for (int i = 0; i < n; i++) {
@@ -61,16 +61,15 @@ void compute_exch_field(double *restrict spin, double *restrict field,
 
         }
 
-        field[3 * i] = fx;
-        field[3 * i + 1] = fy;
-        field[3 * i + 2] = fz;
-        energy[i] = -0.5 * (fx * spin[3 * i] + fy * spin[3 * i + 1] +
-                            fz * spin[3 * i + 2]);
+        if (energy != NULL) {
+            energy[i] = -0.5 * (fx * spin[3 * i] + fy * spin[3 * i + 1] +
+                                fz * spin[3 * i + 2]);
+        }
 
         // Scale the field to 1/mu_s
-        field[3 * i]     *= mu_s_inv[i];
-        field[3 * i + 1] *= mu_s_inv[i];
-        field[3 * i + 2] *= mu_s_inv[i];
+        store_field(field, i,
+                    fx * mu_s_inv[i], fy * mu_s_inv[i], fz * mu_s_inv[i],
+                    add);
     }
 }
 
@@ -149,7 +148,7 @@ void compute_exch_field_spatial(double *restrict spin, double *restrict field,
                                 double *restrict mu_s_inv,
                                 double *restrict energy,
                                 double *restrict J, int *restrict ngbs,
-                                int n, int n_ngbs) {
+                                int n, int n_ngbs, int add) {
 
     #pragma omp parallel for
 	for (int i = 0; i < n; i++) {
@@ -173,16 +172,15 @@ void compute_exch_field_spatial(double *restrict spin, double *restrict field,
 
         }
 
-        field[3 * i] = fx;
-        field[3 * i + 1] = fy;
-        field[3 * i + 2] = fz;
-        energy[i] = -0.5 * (fx * spin[3 * i] + fy * spin[3 * i + 1] +
-                            fz * spin[3 * i + 2]);
+        if (energy != NULL) {
+            energy[i] = -0.5 * (fx * spin[3 * i] + fy * spin[3 * i + 1] +
+                                fz * spin[3 * i + 2]);
+        }
 
         // Scale the field to 1/mu_s
-        field[3 * i]     *= mu_s_inv[i];
-        field[3 * i + 1] *= mu_s_inv[i];
-        field[3 * i + 2] *= mu_s_inv[i];
+        store_field(field, i,
+                    fx * mu_s_inv[i], fy * mu_s_inv[i], fz * mu_s_inv[i],
+                    add);
     }
 }
 
@@ -208,8 +206,8 @@ void compute_full_exch_field(double *restrict spin, double *restrict field,
                              double *restrict energy,
 					      	 double J[9], int *ngbs, int n, int n_ngbs,
                              int n_shells, int *restrict n_ngbs_shell,
-                             int *restrict sum_ngbs_shell
-                             ) {
+                             int *restrict sum_ngbs_shell,
+                             int add) {
 
     #pragma omp parallel for
 	for (int i = 0; i < n; i++) {
@@ -233,15 +231,14 @@ void compute_full_exch_field(double *restrict spin, double *restrict field,
             }
         }
 
-        field[3 * i] = fx;
-        field[3 * i + 1] = fy;
-        field[3 * i + 2] = fz;
-        energy[i] = -0.5 * (fx * spin[3 * i] + fy * spin[3 * i + 1] +
-                            fz * spin[3 * i + 2]);
+        if (energy != NULL) {
+            energy[i] = -0.5 * (fx * spin[3 * i] + fy * spin[3 * i + 1] +
+                                fz * spin[3 * i + 2]);
+        }
 
         // Scale the field to 1/mu_s
-        field[3 * i]     *= mu_s_inv[i];
-        field[3 * i + 1] *= mu_s_inv[i];
-        field[3 * i + 2] *= mu_s_inv[i];
+        store_field(field, i,
+                    fx * mu_s_inv[i], fy * mu_s_inv[i], fz * mu_s_inv[i],
+                    add);
     }
 }
@@ -42,6 +42,35 @@ void llg_rhs_dw_c(double *restrict m, double *restrict h, double *restrict dm, d
 	}
 }
 
+/*
+* Thermal field of the SLLG equation, h_th = eta * q / dt, such that the
+* field integrated over the time step in llg_rhs_dw_c is h * dt + h_th * dt
+*/
+void thermal_field_c(double *restrict h_th, double *restrict T, double *restrict alpha,
+                     double *restrict mu_s_inv, int *restrict pins, double *restrict eta,
+                     int n, double gamma, double dt) {
+
+        double k_B = 1.3806505e-23;
+        double Q = 2 * k_B * dt / gamma;
+
+	for (int id = 0; id < n; id++) {
+		int i = 3*id;
+
+		if (pins[id]>0){
+			h_th[i] = 0;
+			h_th[i+1] = 0;
+			h_th[i+2] = 0;
+			continue;
+		}
+
+		double q = sqrt(Q * alpha[id] * T[id] * mu_s_inv[id]) / dt;
+
+		h_th[i] = eta[i]*q;
+		h_th[i+1] = eta[i+1]*q;
+		h_th[i+2] = eta[i+2]*q;
+	}
+}
+
 void normalise(double *restrict m, int *restrict pins, int n){
 	int i, j, k;
 	double mm;
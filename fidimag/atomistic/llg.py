@@ -61,11 +61,33 @@ class LLG(AtomisticDriver):
                              self.gamma,
                              self.n,
                              self.do_precession,
-                             self.default_c)
+                             self.norm_correction)
 
         #ydot[:] = self.dm_dt[:]
 
         return 0
 
+    def build_native_rhs(self):
+        return self.native_llg_rhs()
+
+    def cayley_axis(self, t, y, w, dt):
+        """
+        Rotation vector of the LLG equation for the Cayley integrator
+        """
+        self.spin[:] = y
+        self.t = t
+
+        self.compute_effective_field(t)
+
+        clib.compute_llg_cayley_axis(w,
+                                     self.spin,
+                                     self.field,
+                                     self._alpha,
+                                     self._pins,
+                                     self.gamma,
+                                     self.n,
+                                     self.do_precession,
+                                     dt)
+
 if __name__ == '__main__':
     pass
@@ -86,9 +86,7 @@ class MonteCarlo(object):
         # TODO: carefully checking and requires to call set_mu first
 
         self.spin.shape = (-1, 3)
-        for i in range(self.spin.shape[0]):
-            if self._mu_s[i] == 0:
-                self.spin[i, :] = 0
+        self.spin[self._mu_s == 0] = 0
         self.spin.shape = (-1,)
 
     def get_mu_s(self):
@@ -96,12 +94,7 @@ class MonteCarlo(object):
 
     def set_mu_s(self, value):
         self._mu_s[:] = helper.init_scalar(value, self.mesh)
-        nonzero = 0
-        for i in range(self.n):
-            if self._mu_s[i] > 0.0:
-                nonzero += 1
-
-        self.n_nonzero = nonzero
+        self.n_nonzero = np.count_nonzero(self._mu_s > 0.0)
 
     mu_s = property(get_mu_s, set_mu_s)
 
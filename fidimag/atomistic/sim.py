@@ -160,21 +160,18 @@ class Sim(SimBase):
         """
 
         self._mu_s[:] = helper.init_scalar(value, self.mesh)
-        nonzero = 0
-        for i in range(self.n):
-            if self._mu_s[i] > 0.0:
-                self._mu_s_inv[i] = 1.0 / self._mu_s[i]
-                nonzero += 1
+        material = self._mu_s > 0.0
+        self._mu_s_inv[material] = 1.0 / self._mu_s[material]
+        nonzero = np.count_nonzero(material)
 
         # We moved this variable to the micro_driver class
         self.n_nonzero = nonzero
 
-        for i in range(len(self._mu_s)):
-            if self._mu_s[i] == 0.0:
-                self._pins[i] = 1
+        empty = self._mu_s == 0.0
+        self._pins[empty] = 1
 
-                # Set the neighbour index to -1 for sites with mu_s = 0
-                self.mesh.neighbours[self.mesh.neighbours == i] = -1
+        # Set the neighbour index to -1 for sites with mu_s = 0
+        self.mesh.mask_neighbours(empty)
 
         # TODO: Check if this is necessary here, it is only defined
         # for the LLG STT in the drivers
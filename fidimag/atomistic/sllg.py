@@ -1,6 +1,7 @@
 from __future__ import division
 import numpy as np
 import fidimag.extensions.clib as clib
+import fidimag.extensions.common_clib as common_clib
 import fidimag.common.helper as helper
 import fidimag.common.constant as const
 
@@ -24,6 +25,11 @@ class SLLG(AtomisticDriver):
     the micro_driver.AtomisticDriver class. Arrays with the system information
     are taken as references from the main micromagnetic Simulation class
 
+    The equation is integrated with a fixed time step (see set_options) using
+    the Heun scheme, followed by the normalisation of the spins, or with
+    integrator='cayley', the Heun scheme with rotations of the spins (see
+    CayleyIntegrator), which keeps their length without normalisation.
+
     """
 
     def __init__(self, mesh, spin, mu_s, mu_s_inv, field, pins,
@@ -47,12 +53,21 @@ class SLLG(AtomisticDriver):
         self.eta = np.zeros(3*self.n, dtype=np.float)
         self.dm1 = np.zeros(3*self.n, dtype=np.float)
         self.dm2 = np.zeros(3*self.n, dtype=np.float)
+        self.field_th = np.zeros(3*self.n, dtype=np.float)
 
         self.minor_step = 0
         self.mt19937 = clib.rng_mt19937()
 
         self.set_options()
 
+    def set_integrator(self, integrator, use_jac):
+        # The stochastic equation is integrated in run_step; the CVODE
+        # integrator is only used by the common driver methods
+        self.use_cayley = integrator == 'cayley'
+        if self.use_cayley:
+            integrator = 'sundials'
+        super(SLLG, self).set_integrator(integrator, use_jac)
+
     def get_T(self):
         return self._T
 
@@ -79,6 +94,10 @@ class SLLG(AtomisticDriver):
 
         self.mt19937.fill_vector_gaussian(self.eta)
 
+        if self.use_cayley:
+            self.run_step_cayley()
+            return
+
         #step1
         self.update_effective_field(self.spin, self.t)
         clib.compute_llg_rhs_dw(self.dm1,
@@ -114,6 +133,51 @@ class SLLG(AtomisticDriver):
 
         clib.normalise_spin(self.spin, self._pins, self.n)
 
+    def run_step_cayley(self):
+        # The same thermal field is used in both stages (Stratonovich)
+        clib.compute_thermal_field(self.field_th,
+                                   self._T,
+                                   self._alpha,
+                                   self._mu_s_inv,
+                                   self.eta,
+                                   self._pins,
+                                   self.n,
+                                   self.gamma,
+                                   self.dt)
+
+        #step1
+        self.update_effective_field(self.spin, self.t)
+        self.field += self.field_th
+        common_clib.compute_llg_cayley_axis(self.dm1,
+                                            self.spin,
+                                            self.field,
+                                            self._alpha,
+                                            self._pins,
+                                            self.gamma,
+                                            self.n,
+                                            1,
+                                            self.dt)
+        common_clib.compute_cayley_update(self.next_spin, self.spin,
+                                          self.dm1, self.dm1, self.n)
+
+        self.minor_step += 1
+        self.t = self.dt*self.minor_step
+
+        #step2
+        self.update_effective_field(self.next_spin, self.t)
+        self.field += self.field_th
+        common_clib.compute_llg_cayley_axis(self.dm2,
+                                            self.next_spin,
+                                            self.field,
+                                            self._alpha,
+                                            self._pins,
+                                            self.gamma,
+                                            self.n,
+                                            1,
+                                            self.dt)
+        common_clib.compute_cayley_update(self.spin, self.spin,
+                                          self.dm1, self.dm2, self.n)
+
     def update_effective_field(self, y, t):
 
         self.field[:] = 0
@@ -1,10 +1,12 @@
 from .fileio import DataSaver
 from .fileio import DataReader
+from .fileio import SampleBuffer
 from .batch_task import BatchTasks
 from .citation import citation
 from .cuboid_mesh import CuboidMesh
 #from .neb_cartesian import NEB_Sundials
-from .helper import init_scalar, init_vector
+from .helper import init_scalar, init_vector, vectorised
+from .ensemble import Ensemble
 from .plot import plot, plot_micro, plot_atom_cub, plot_atom_hex
 
 
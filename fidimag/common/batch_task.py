@@ -1,93 +1,227 @@
 from __future__ import print_function
 import os
 import time
+import sqlite3
+import traceback
+import multiprocessing
 import numpy as np
-from multiprocessing import Process, Queue, Lock
 
-lock = Lock()
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
 
 
-class TaskState(object):
+def task_key(task):
     """
-    Each task has three states: "Done!", "Started!", "Unstarted!"
+    Key of the task (a dictionary with the parameters) in the journal,
+    e.g. 'p1_a_p2_1'
     """
+    res = []
+    for k in task:
+        res.append(k)
+        res.append(str(task[k]))
+    return '_'.join(res)
 
-    def __init__(self, taskname):
-        self.taskname = taskname
-        self.state = {}
-        self.load()
 
-    def load(self):
-        if not os.path.exists(self.taskname):
+class TaskJournal(object):
+    """
+    Append-only journal of the task states, in a SQLite database. Every
+    update adds an entry, with the wall time of the task and the peak
+    memory of its worker when it finishes, and the state of a task is given by its last
+    entry. Several processes can write to the journal concurrently, and
+    the file is never rewritten, so a sweep can be resumed after it was
+    interrupted
+    """
+
+    STARTED = 'Started'
+    DONE = 'Done'
+    FAILED = 'Failed'
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = None
+        self._pid = None
+
+        with self.connect() as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS journal (
+                          id INTEGER PRIMARY KEY AUTOINCREMENT,
+                          task TEXT, state TEXT, time REAL, pid INTEGER,
+                          wall_time REAL, worker_peak_rss INTEGER,
+                          error TEXT)""")
+
+    def __getstate__(self):
+        # The connection is not passed to the workers (it cannot be pickled
+        # with the spawn start method), they open their own
+        state = dict(self.__dict__)
+        state['_db'] = None
+        state['_pid'] = None
+        return state
+
+    def connect(self):
+        # SQLite connections cannot be shared with the forked workers, so
+        # every process opens its own
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(self.filename, timeout=60)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._pid = os.getpid()
+        return self._db
+
+    def append(self, key, state, wall_time=None, worker_peak_rss=None,
+               error=None):
+        with self.connect() as db:
+            db.execute("""INSERT INTO journal (task, state, time, pid,
+                          wall_time, worker_peak_rss, error)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                       (key, state, time.time(), os.getpid(), wall_time,
+                        worker_peak_rss, error))
+
+    def import_state_file(self, filename):
+        """
+        Add the tasks marked as done in a state file of the previous
+        versions of BatchTasks (lines 'p1_a_p2_1 : Done!'), if the journal
+        is empty, so old sweeps are resumed too
+        """
+        if not os.path.exists(filename) or self.entries():
             return
-        f = open(self.taskname, 'r')
-        data = f.read()
-        f.close()
 
-        for line in data.splitlines():
-            k, v = line.split(':')
-            self.state[k.strip()] = v.strip()
+        with open(filename, 'r') as f:
+            for line in f.read().splitlines():
+                key, _, state = line.rpartition(':')
+                if 'Done' in state:
+                    self.append(key.strip(), self.DONE)
 
-    def save_state(self):
-        f = open(self.taskname, 'w')
-        for (k, v) in self.state.items():
-            f.write(u'%s : %s\n' % (k, v))
-        f.close()
+    def entries(self):
+        """
+        Returns a dictionary with the last entry of every task, as a
+        dictionary with the state, time, pid, wall_time (in seconds),
+        worker_peak_rss (peak resident memory of the worker process since
+        it started, including the previous tasks, in kB) and error
+        """
+        rows = self.connect().execute(
+            """SELECT task, state, time, pid, wall_time, worker_peak_rss,
+                      error
+               FROM journal WHERE id IN
+               (SELECT MAX(id) FROM journal GROUP BY task)""")
+        fields = ('state', 'time', 'pid', 'wall_time', 'worker_peak_rss',
+                  'error')
+        return {row[0]: dict(zip(fields, row[1:])) for row in rows}
+
+    def states(self):
+        """
+        Returns a dictionary with the last state of every task
+        """
+        return {k: e['state'] for k, e in self.entries().items()}
+
+
+class WorkQueues(object):
+    """
+    Work stealing scheduler of n_tasks tasks over n_workers processes. Every
+    worker has a deque of task indexes (a range of a shared array, given by
+    its head and tail) from which it takes tasks in order. When it runs
+    out of tasks, it steals half of the remaining tasks of another worker.
+    The state is in shared memory, so no queue or polling is needed.
+    context is the multiprocessing context of the workers
+    """
 
-    def update_state(self, k, v, save=True):
+    def __init__(self, n_tasks, n_workers, context=multiprocessing):
+        self.n_workers = n_workers
+        # Head and tail of the range of every worker
+        self.bounds = context.Array('l', 2 * n_workers, lock=False)
+        self.locks = [context.Lock() for _ in range(n_workers)]
+
+        for i in range(n_workers):
+            self.bounds[2 * i] = i * n_tasks // n_workers
+            self.bounds[2 * i + 1] = (i + 1) * n_tasks // n_workers
+
+    def pop(self, i):
         """
-        v = 0: Done
-        v = 1: Started but Unfinished
-        v = 2: Unstarted
+        Returns the index of the next task of worker i, or None if there
+        are no tasks left
         """
-        key = self.dict2str(k)
+        with self.locks[i]:
+            head, tail = self.bounds[2 * i], self.bounds[2 * i + 1]
+            if head < tail:
+                self.bounds[2 * i] = head + 1
+                return head
+
+        return self.steal(i)
+
+    def steal(self, i):
+        for k in range(1, self.n_workers):
+            j = (i + k) % self.n_workers
+            # The locks are taken in order, to avoid deadlocks between
+            # workers stealing from each other
+            first, second = sorted((i, j))
+            with self.locks[first], self.locks[second]:
+                head, tail = self.bounds[2 * j], self.bounds[2 * j + 1]
+                if head >= tail:
+                    continue
+                # Half of the tasks from the end of the victim deque; the
+                # first is run now and the rest are kept in our deque
+                mid = tail - (tail - head + 1) // 2
+                self.bounds[2 * j + 1] = mid
+                self.bounds[2 * i] = mid + 1
+                self.bounds[2 * i + 1] = tail
+                return mid
+
+        return None
 
-        if save:
-            self.load()
 
-        if v==0:
-            self.state[key] = 'Done!'
-        elif v==1:
-            self.state[key] = 'Started!'
-        else:
-            self.state[key] = 'Unstarted!'
+class BatchTasks(object):
+    """
 
-        if save:
-            self.save_state()
+    Run a function for all the combinations of a set of parameters (tasks),
+    in parallel processes. Every task is run in its own directory, e.g.
+    p1_a/p2_1 for the parameters p1='a' and p2=1:
 
-    def get_state(self, k):
-        key = self.dict2str(k)
+        def fun(p1, p2):
+            ...
 
-        self.load()
+        tasks = BatchTasks(fun, processes=4)
+        tasks.add_parameters('p1', ['a', 'b', 'c'])
+        tasks.add_parameters('p2', range(1, 5))
+        tasks.start()
 
-        if key not in self.state:
-            return 2
+    The tasks are distributed with work stealing (see WorkQueues). Their
+    states, wall times and memory are stored in the journal {taskname}.db
+    (see TaskJournal). Tasks which finished are not run again, so a sweep
+    is resumed by calling start again. Failed tasks are recorded with the
+    error, without stopping the worker.
 
-        if key in self.state:
-            if 'Done' in self.state[key]:
-                return 0
-            if 'Started' in self.state[key]:
-                return 1
-            if 'Unstarted' in self.state[key]:
-                return 2
-        return 2
+    Large read-only inputs (e.g. a mesh or an initial magnetisation array)
+    can be placed in shared memory with add_shared, instead of being
+    recomputed or loaded in every task. The shared memory is freed with
+    release_shared, or at the end of a with block:
 
-    def dict2str(self, d):
-        res = []
-        for k in d:
-            res.append(k)
-            res.append(str(d[k]))
-        return '_'.join(res)
+        with BatchTasks(fun, processes=4) as tasks:
+            tasks.add_shared('m0', m0)
+            ...
+            tasks.start()
 
-class BatchTasks(object):
+    Demag tensors are shared between the tasks through the tensor cache
+    (see fidimag.common.cache).
+
+    waiting_time is an optional pause (in seconds) after every task
+
+    start_method is the multiprocessing start method of the workers
+    ('fork', 'spawn', ...), by default the one of multiprocessing. With
+    'spawn', fun must be defined at the top level of a module
 
-    def __init__(self, fun, processes=4, taskname='task', waiting_time=1):
+    """
+
+    def __init__(self, fun, processes=4, taskname='task', waiting_time=0,
+                 start_method=None):
         self.fun = fun
         self.tasks = [{}]
         self.parameters = []
         self.current_directory = os.getcwd()
 
-        self.ts = TaskState(taskname + '.txt')
+        self.journal = TaskJournal(taskname + '.db')
+        # Tasks done with the previous versions, which used a text file
+        self.journal.import_state_file(taskname + '.txt')
+        self.context = multiprocessing.get_context(start_method)
         self.waiting_time = waiting_time
         self.dims = []
 
@@ -95,6 +229,24 @@ class BatchTasks(object):
 
         self.process_res = []
 
+        # Arrays in shared memory: name -> (SharedMemory, shape, dtype)
+        self.shared = {}
+        self.threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release_shared()
+
+    def __getstate__(self):
+        # Passed to the workers with the spawn start method, which cannot
+        # pickle the processes
+        state = dict(self.__dict__)
+        state['threads'] = []
+        state['context'] = None
+        return state
+
     def add_parameters(self, name, values):
         new_tasks = []
         self.parameters.append(name)
@@ -108,6 +260,40 @@ class BatchTasks(object):
 
         self.tasks = list(new_tasks)
 
+    def add_shared(self, name, array):
+        """
+        Copy the numpy *array* into shared memory. It is passed (read-only,
+        without copies) to every task as the keyword argument *name*.
+        Requires Python 3.8 or newer
+        """
+        try:
+            from multiprocessing import shared_memory
+        except ImportError:
+            raise NotImplementedError(
+                "Shared arrays require Python 3.8 or newer")
+
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True,
+                                         size=max(1, array.nbytes))
+        np.ndarray(array.shape, array.dtype, buffer=shm.buf)[...] = array
+        self.shared[name] = (shm, array.shape, array.dtype)
+
+    def shared_arrays(self):
+        arrays = {}
+        for name, (shm, shape, dtype) in self.shared.items():
+            arrays[name] = np.ndarray(shape, dtype, buffer=shm.buf)
+            arrays[name].flags.writeable = False
+        return arrays
+
+    def release_shared(self):
+        """
+        Free the shared memory of the arrays added with add_shared
+        """
+        for shm, shape, dtype in self.shared.values():
+            shm.close()
+            shm.unlink()
+        self.shared = {}
+
     def generate_directory(self, task):
         base = self.current_directory
         for name in self.parameters:
@@ -115,53 +301,83 @@ class BatchTasks(object):
 
         return base
 
-    def run_single(self):
+    def run_task(self, task, shared):
+        key = task_key(task)
+
+        dirname = self.generate_directory(task)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        self.journal.append(key, TaskJournal.STARTED)
+
+        start = time.perf_counter()
+        error = None
+        os.chdir(dirname)
+        try:
+            kwargs = dict(task)
+            kwargs.update(shared)
+            self.fun(**kwargs)
+        except Exception:
+            error = traceback.format_exc()
+        finally:
+            os.chdir(self.current_directory)
+        wall_time = time.perf_counter() - start
 
-        while not self.task_q.empty():
-            task = self.task_q.get()
+        # The peak of the worker, the memory of a single task cannot be
+        # measured with getrusage
+        worker_peak_rss = None
+        if resource is not None:
+            worker_peak_rss = \
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
 
-            lock.acquire()
-            state = self.ts.get_state(task)
-            lock.release()
+        state = TaskJournal.DONE if error is None else TaskJournal.FAILED
+        self.journal.append(key, state, wall_time, worker_peak_rss, error)
 
-            if state != 2:
-                continue
+    def run_single(self, worker=0):
+        shared = self.shared_arrays()
 
-            dirname = self.generate_directory(task)
-            if not os.path.exists(dirname):
-                os.makedirs(dirname)
+        while True:
+            i = self.queues.pop(worker)
+            if i is None:
+                break
 
-            lock.acquire()
-            self.ts.update_state(task, 1)
-            lock.release()
+            self.run_task(self.pending[i], shared)
 
-            os.chdir(dirname)
-            self.fun(**task)
-            os.chdir(self.current_directory)
-
-            lock.acquire()
-            self.ts.update_state(task, 0)
-            lock.release()
-
-            time.sleep(self.waiting_time)
+            if self.waiting_time:
+                time.sleep(self.waiting_time)
 
     def start(self):
+        """
+        Run the tasks which are not done yet
+        """
+        states = self.journal.states()
+        self.pending = [task for task in self.tasks
+                        if states.get(task_key(task)) != TaskJournal.DONE]
+        if not self.pending:
+            return
 
-        self.task_q = Queue()
-        for task in self.tasks:
-            self.task_q.put(task)
-
-        self.threads = []
+        processes = min(self.processes, len(self.pending))
+        self.queues = WorkQueues(len(self.pending), processes, self.context)
 
-        for _ in range(self.processes):
-            t = Process(target=self.run_single)
+        threads = []
+        for i in range(processes):
+            t = self.context.Process(target=self.run_single, args=(i,))
             t.start()
-            self.threads.append(t)
-            time.sleep(self.waiting_time)
+            threads.append(t)
+        self.threads = threads
 
         for t in self.threads:
             t.join()
 
+    def report(self):
+        """
+        Returns a list with, for every task, a tuple with its parameters
+        and its last journal entry (a dictionary with the state, wall_time,
+        worker_peak_rss, error, ...), or None if the task was not started
+        """
+        entries = self.journal.entries()
+        return [(task, entries.get(task_key(task))) for task in self.tasks]
+
     def post_process(self, fun):
         for task in self.tasks:
             dirname = self.generate_directory(task)
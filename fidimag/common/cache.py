@@ -0,0 +1,139 @@
+"""
+Per-user cache for data which is expensive to compute and can be shared
+between simulations, such as FFTW wisdom or demag tensors. The cache is placed in the
+directory given by the FIDIMAG_CACHE_DIR environment variable or, by
+default, in ~/.cache/fidimag. Setting FIDIMAG_CACHE_DIR to an empty string
+disables the cache.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import numpy as np
+
+
+def cache_dir(*subdirs):
+    """
+    Returns the path of the cache directory (or of a subdirectory in it),
+    creating it if necessary. Returns None when the cache is disabled or
+    the directory cannot be created
+    """
+    base = os.environ.get('FIDIMAG_CACHE_DIR')
+    if base is None:
+        base = os.path.join(os.path.expanduser('~'), '.cache', 'fidimag')
+    elif not base:
+        return None
+
+    path = os.path.join(base, *subdirs)
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError:
+        return None
+
+    return path
+
+
+def atomic_write(path, data):
+    """
+    Write the bytes *data* to *path* through a temporary file in the same
+    directory, which is then renamed. Readers, even in other processes,
+    never see a partially written file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class TensorCache(object):
+    """
+    Content addressed store of numpy arrays, e.g. demag tensors. Every entry
+    is an .npz file named after a hash of the parameters that define it, so
+    only the parameters need to be passed to load or save the arrays.
+
+    The total size of the cache is bounded by max_size (in bytes). When it
+    is exceeded, the least recently used entries are removed; loading an
+    entry updates its modification time, which is used as the access time.
+
+    Entries are written atomically, so several processes (e.g. BatchTasks
+    workers) can share the cache safely.
+    """
+
+    def __init__(self, name='demag_tensors', max_size=2 * 1024 ** 3):
+        self.path = cache_dir(name)
+        self.max_size = max_size
+
+    def key(self, params):
+        """
+        Hash of the dictionary *params*
+        """
+        text = repr(sorted((k, repr(v)) for k, v in params.items()))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def filename(self, params):
+        return os.path.join(self.path, self.key(params) + '.npz')
+
+    def load(self, params):
+        """
+        Returns a dictionary with the arrays stored for *params*, or None if
+        they are not in the cache
+        """
+        if self.path is None:
+            return None
+
+        filename = self.filename(params)
+        try:
+            with np.load(filename) as data:
+                arrays = {k: data[k] for k in data.files}
+            os.utime(filename, None)
+        except (OSError, IOError, ValueError, KeyError):
+            # Missing, evicted by another process or corrupted entry
+            return None
+
+        return arrays
+
+    def save(self, params, **arrays):
+        """
+        Store the *arrays* (given as keyword arguments) for *params*
+        """
+        if self.path is None:
+            return
+
+        buf = io.BytesIO()
+        np.savez(buf, **arrays)
+        try:
+            atomic_write(self.filename(params), buf.getvalue())
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache size is
+        below max_size
+        """
+        entries = []
+        for f in os.listdir(self.path):
+            if not f.endswith('.npz'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, f))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+
+        total = sum(e[1] for e in entries)
+        for mtime, size, f in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, f))
+            except OSError:
+                pass
+            total -= size
@@ -36,7 +36,8 @@ from six.moves import range
 class CuboidMesh(object):
 
     def __init__(self, dx=1, dy=1, dz=1, nx=1, ny=1, nz=1, x0=0, y0=0, z0=0,
-                 periodicity=(False, False, False), unit_length=1.0):
+                 periodicity=(False, False, False), unit_length=1.0,
+                 implicit_stencil=False):
         """
         Create mesh with cells of size dx * dy * dz.
 
@@ -52,6 +53,13 @@ class CuboidMesh(object):
             # create a mesh of dimensions 500 x 50 x 4 nm, with cellsize
             # of 2 nm in any direction and periodic along the x-axis.
 
+        The coordinates and the neighbour arrays are only computed when
+        they are first used. With implicit_stencil=True, the interactions
+        that support it (UniformExchange) compute the indexes of the
+        neighbours of every cell from its position in the mesh, so the
+        neighbours array is not created (nor read in every field
+        evaluation), which saves memory for very large meshes.
+
         """
 
         # Total number of neighbours per lattice site
@@ -73,6 +81,7 @@ class CuboidMesh(object):
         self.y0 = y0
         self.z0 = z0
         self.periodicity = periodicity
+        self.implicit_stencil = implicit_stencil
 
         self.Lx = dx * nx  # total size of mesh
         self.Ly = dy * ny
@@ -86,10 +95,35 @@ class CuboidMesh(object):
         self.mesh_type = "cuboid"
         self.unit_length = unit_length
 
-        self.coordinates = self.init_coordinates()
-        self.neighbours, self.next_neighbours = self.init_neighbours()
+        # Computed when they are first used, see the properties below
+        self._coordinates = None
+        self._neighbours = None
+        self._next_neighbours = None
+        # Sites whose index is removed from the neighbours array
+        self._empty_sites = None
+
         self.grid = self.init_grid()  # for vtk export
 
+    @property
+    def coordinates(self):
+        if self._coordinates is None:
+            self._coordinates = self.init_coordinates()
+        return self._coordinates
+
+    @property
+    def neighbours(self):
+        if self._neighbours is None:
+            self._neighbours = self.init_neighbour_table(1)
+            if self._empty_sites is not None:
+                self._mask_neighbours(self._empty_sites)
+        return self._neighbours
+
+    @property
+    def next_neighbours(self):
+        if self._next_neighbours is None:
+            self._next_neighbours = self.init_neighbour_table(2)
+        return self._next_neighbours
+
     def __repr__(self):
         repres = dedent("""\
     Cuboid Mesh
@@ -122,14 +156,13 @@ class CuboidMesh(object):
 
     def init_coordinates(self):
         coordinates = np.zeros((self.n, 3))
-        for i in range(self.nz):
-            for j in range(self.ny):
-                for k in range(self.nx):
-                    index = self.index(k, j, i)
-                    r = (self.x0 + k * self.dx + self.dx / 2.0,
-                         self.y0 + j * self.dy + self.dy / 2.0,
-                         self.z0 + i * self.dz + self.dz / 2.0)
-                    coordinates[index] = r
+        # View with the axes (z, y, x, component) of the mesh indexing
+        r = coordinates.reshape(self.nz, self.ny, self.nx, 3)
+        r[..., 0] = self.x0 + np.arange(self.nx) * self.dx + self.dx / 2.0
+        r[..., 1] = (self.y0 + np.arange(self.ny) * self.dy
+                     + self.dy / 2.0)[:, np.newaxis]
+        r[..., 2] = (self.z0 + np.arange(self.nz) * self.dz
+                     + self.dz / 2.0)[:, np.newaxis, np.newaxis]
         return coordinates
 
     def init_grid(self, origin=(0, 0, 0)):
@@ -142,52 +175,67 @@ class CuboidMesh(object):
                 origin[2] + np.linspace(0, self.Lz, self.nz + 1))
 
     def init_neighbours(self):
-        # array will have entry set to -1 for nonexisting neighbours
-        # this way we get to use a 2d array which is convenient to use
-        # in our C code instead of a list of lists
-        connectivity = []
-        connectivity_next = []
-        for i in range(self.nz):
-            for j in range(self.ny):
-                for k in range(self.nx):
-                    # Unique index for the current lattice site
-                    cell = self._index(k, j, i)
-                    neighbours = [
-                        self.index(k - 1, j, i),  # left
-                        self.index(k + 1, j, i),  # right
-                        self.index(k, j - 1, i),  # behind
-                        self.index(k, j + 1, i),  # in front
-                        self.index(k, j, i - 1),  # under
-                        self.index(k, j, i + 1),  # over
-                    ]
-
-                    # If one of the neighbours is the cell itself, we
-                    # set its index to -1
-                    # neighbours = [other if other != cell
-                    #               else -1 for other in neighbours]
-
-                    next_neighbours = [
-                        self.index(k - 2, j, i),  # left
-                        self.index(k + 2, j, i),  # right
-                        self.index(k, j - 2, i),  # behind
-                        self.index(k, j + 2, i),  # in front
-                        self.index(k, j, i - 2),  # under
-                        self.index(k, j, i + 2),  # over
-                    ]
-
-                    # July 1st, 2016 Weiwei: I think it's okay for a cell with
-                    # its neighbour is itself if periodic boundary conditions
-                    # are used. For example, if we only have one cell and
-                    # enable periodic boundary condition in x-direction, then
-                    # we got a rod.  therefore, I commented two lines below.
-                    # no cell should be its own neighbour
-
-                    connectivity.append(neighbours)
-                    connectivity_next.append(next_neighbours)
-
-        return (np.array(connectivity, dtype=np.int32),
-                np.array(connectivity_next, dtype=np.int32)
-                )
+        """
+        Returns the arrays of nearest and next nearest neighbours
+        """
+        return self.init_neighbour_table(1), self.init_neighbour_table(2)
+
+    def init_neighbour_table(self, distance):
+        """
+        Returns an array with the indexes of the cells at the given
+        distance (in cells) of every cell, along the directions
+        -x, +x, -y, +y, -z, +z, and -1 for nonexisting neighbours.
+        This way we get to use a 2d array which is convenient to use
+        in our C code instead of a list of lists
+
+        The indexes are computed for all the cells at once, as the index
+        of the cell plus the offset of the neighbour along every axis, with
+        the same periodic wrapping as the index method
+        """
+        ngbs = np.zeros((self.n, 6), dtype=np.int32)
+        # View with the axes (z, y, x, neighbour) of the mesh indexing
+        table = ngbs.reshape(self.nz, self.ny, self.nx, 6)
+        cells = np.arange(self.n, dtype=np.int32).reshape(self.nz,
+                                                          self.ny,
+                                                          self.nx)
+
+        for axis, stride in enumerate((1, self.nx, self.nxy)):
+            size = self.size[axis]
+            shape = [1, 1, 1]
+            shape[2 - axis] = size
+            for j, d in enumerate((-distance, distance)):
+                # Positions of the neighbours along the axis
+                p = np.arange(size) + d
+                if self.periodicity[axis]:
+                    p[p < 0] += size
+                    p[p >= size] -= size
+                outside = ((p < 0) | (p >= size)).reshape(shape)
+                offset = ((p - np.arange(size)) * stride).reshape(shape)
+
+                column = table[..., 2 * axis + j]
+                np.add(cells, offset, out=column, casting='unsafe')
+                np.copyto(column, -1, where=outside)
+
+        return ngbs
+
+    def mask_neighbours(self, sites):
+        """
+        Set to -1 the indexes of the given sites (e.g. without material),
+        given as a boolean array, in the neighbours array. The neighbours
+        array is masked when it is created, if it is not yet
+        """
+        sites = np.asarray(sites, dtype=bool)
+        if self._empty_sites is None:
+            self._empty_sites = sites.copy()
+        else:
+            self._empty_sites |= sites
+
+        if self._neighbours is not None:
+            self._mask_neighbours(sites)
+
+    def _mask_neighbours(self, sites):
+        ngbs = self._neighbours
+        ngbs[(ngbs >= 0) & sites[np.maximum(ngbs, 0)]] = -1
 
     def index(self, i, j, k):
         """
@@ -278,19 +326,22 @@ class CuboidMesh(object):
 
         """
         bytes_per_float_numpy = 8
-        size_coordinates_bytes = self.nx * self.ny * \
-            self.nz * 3 * bytes_per_float_numpy
-        size_coordinates_GiB = size_coordinates_bytes / (1024. ** 3)
+        bytes_per_int_numpy = 4
+        size_bytes = self.n * 3 * bytes_per_float_numpy
+        # Neighbours and next neighbours arrays, which are not created
+        # with the implicit stencil
+        if not self.implicit_stencil:
+            size_bytes += self.n * 12 * bytes_per_int_numpy
+        size_GiB = size_bytes / (1024. ** 3)
 
         if system_memory_fake_for_testing is None:
             mem_GiB = virtual_memory().total / (1024.0 ** 3)
         else:
             mem_GiB = system_memory_fake_for_testing
 
-        if 2 * size_coordinates_GiB > mem_GiB:
+        if 2 * size_GiB > mem_GiB:
             # print because no logging yet
-            print("Warning! Size of mesh coordinates is {} GiB.".format(
-                size_coordinates_GiB))
+            print("Warning! Size of mesh arrays is {} GiB.".format(size_GiB))
             print(
                 "You have {} GiB system memory. Possible halt.".format(mem_GiB))
             return 1
@@ -0,0 +1,53 @@
+"""
+Demagnetising field of several copies of a system (the replicas of an
+Ensemble), computed in batches which share the tensors of the FFTDemag of
+the system.
+"""
+import numpy as np
+import fidimag.extensions.dipolar as clib
+
+
+class DemagReplicas(object):
+    """
+    Adds the field of an FFTDemag object *demag* (of a system with n sites)
+    for copies of the system, whose spins and fields are stored one copy
+    after the other.
+
+    The copies are transformed together in batches (see FFTDemagReplicas),
+    which run faster than the copies one by one while the padded buffers of
+    the batch are small. batch_length is the largest number of entries
+    (copies times the padded length of the FFTs) in a batch; larger systems
+    are computed copy by copy
+    """
+
+    def __init__(self, demag, n, batch_length=2 ** 14):
+        self.demag = demag
+        self.n = n
+        self.batch_length = batch_length
+        self.plan = None
+        self.buffer = None
+        self.field = np.zeros(3 * n)
+
+    def batch_size(self, replicas):
+        return max(1, min(replicas,
+                          self.batch_length // self.demag.total_length))
+
+    def add_field(self, spin, mu_s, field, replicas):
+        m = spin.reshape(replicas, -1)
+        h = field.reshape(replicas, -1)
+
+        batch = self.batch_size(replicas)
+        batched = 0
+        if batch > 1:
+            if self.plan is None or self.plan.replicas != batch:
+                self.plan = clib.FFTDemagReplicas(self.demag, batch)
+                self.buffer = np.zeros(3 * self.n * batch)
+            batched = replicas - replicas % batch
+            for k in range(0, batched, batch):
+                self.plan.compute_field(m[k:k + batch].reshape(-1), mu_s,
+                                        self.buffer)
+                h[k:k + batch] += self.buffer.reshape(batch, -1)
+
+        for k in range(batched, replicas):
+            self.demag.compute_field(m[k], mu_s, self.field)
+            h[k] += self.field
@@ -1,5 +1,6 @@
 #include <math.h>
 #include <stdlib.h>
+#include <string.h>
 #include <omp.h>
 #include "dipolar.h"
 #include "demagcoef.h"
@@ -193,12 +194,16 @@ fft_demag_plan *create_plan(void) {
 }
 
 void init_plan(fft_demag_plan *restrict plan, double dx, double dy,
-		double dz, int nx, int ny, int nz) {
+		double dz, int nx, int ny, int nz, int thin_film) {
 
 	//plan->mu_s = mu_s;
 
 	fftw_init_threads();
-	fftw_plan_with_nthreads(omp_get_max_threads());
+
+	//defaults for create_fftw_plan, which can be changed before the plans
+	//are created
+	plan->nthreads = omp_get_max_threads();
+	plan->fftw_flags = FFTW_MEASURE;
 
 	plan->dx = dx;
 	plan->dy = dy;
@@ -214,10 +219,24 @@ void init_plan(fft_demag_plan *restrict plan, double dx, double dy,
 	plan->leny = ny > critical_n ? 2 * ny : 2 * ny - 1;
 	plan->lenz = nz > critical_n ? 2 * nz : 2 * nz - 1;
 
+	plan->thin_film = thin_film;
+	plan->replicas = 1;
+	if (thin_film) {
+		plan->lenz = nz;
+	}
+
 	plan->total_length = plan->lenx * plan->leny * plan->lenz;
+	plan->fft_length = thin_film ? plan->lenx * plan->leny : plan->total_length;
+
+	plan->klenx = plan->lenx / 2 + 1;
+	plan->kleny = plan->leny / 2 + 1;
+	plan->klenz = thin_film ? nz : plan->lenz / 2 + 1;
+	plan->complex_length = plan->lenz * plan->leny * plan->klenx;
+	plan->tensor_length = plan->klenz * plan->kleny * plan->klenx;
 
-	int size1 = plan->total_length * sizeof(double);
-	int size2 = plan->total_length * sizeof(fftw_complex);
+	size_t size1 = plan->total_length * sizeof(double);
+	size_t size2 = plan->complex_length * sizeof(fftw_complex);
+	size_t size3 = plan->tensor_length * sizeof(double);
 
 	plan->tensor_xx = (double *) fftw_malloc(size1);
 	plan->tensor_yy = (double *) fftw_malloc(size1);
@@ -226,161 +245,861 @@ void init_plan(fft_demag_plan *restrict plan, double dx, double dy,
 	plan->tensor_xz = (double *) fftw_malloc(size1);
 	plan->tensor_yz = (double *) fftw_malloc(size1);
 
-	plan->mx = (double *) fftw_malloc(size1);
-	plan->my = (double *) fftw_malloc(size1);
-	plan->mz = (double *) fftw_malloc(size1);
+	//The three components are stored contiguously, so they are transformed
+	//with a single batched plan
+	plan->mx = (double *) fftw_malloc(3 * size1);
+	plan->my = plan->mx + plan->total_length;
+	plan->mz = plan->my + plan->total_length;
+
+	plan->hx = (double *) fftw_malloc(3 * size1);
+	plan->hy = plan->hx + plan->total_length;
+	plan->hz = plan->hy + plan->total_length;
+
+	plan->Nxx = (double *) fftw_malloc(size3);
+	plan->Nyy = (double *) fftw_malloc(size3);
+	plan->Nzz = (double *) fftw_malloc(size3);
+	plan->Nxy = (double *) fftw_malloc(size3);
+	plan->Nxz = (double *) fftw_malloc(size3);
+	plan->Nyz = (double *) fftw_malloc(size3);
+
+	plan->Mx = (fftw_complex *) fftw_malloc(3 * size2);
+	plan->My = plan->Mx + plan->complex_length;
+	plan->Mz = plan->My + plan->complex_length;
+
+	plan->Hx = (fftw_complex *) fftw_malloc(3 * size2);
+	plan->Hy = plan->Hx + plan->complex_length;
+	plan->Hz = plan->Hy + plan->complex_length;
+
+	for (int i = 0; i < 3; i++) {
+		plan->m_plans[i] = NULL;
+		plan->h_plans[i] = NULL;
+		plan->m_plans_f[i] = NULL;
+		plan->h_plans_f[i] = NULL;
+	}
 
-	plan->hx = (double *) fftw_malloc(size1);
-	plan->hy = (double *) fftw_malloc(size1);
-	plan->hz = (double *) fftw_malloc(size1);
+	plan->single = 0;
+	plan->N_f = NULL;
+	plan->m_f = NULL;
+	plan->h_f = NULL;
+	plan->M_f = NULL;
+	plan->H_f = NULL;
 
-	plan->Nxx = (fftw_complex *) fftw_malloc(size2);
-	plan->Nyy = (fftw_complex *) fftw_malloc(size2);
-	plan->Nzz = (fftw_complex *) fftw_malloc(size2);
-	plan->Nxy = (fftw_complex *) fftw_malloc(size2);
-	plan->Nxz = (fftw_complex *) fftw_malloc(size2);
-	plan->Nyz = (fftw_complex *) fftw_malloc(size2);
+}
 
-	plan->Mx = (fftw_complex *) fftw_malloc(size2);
-	plan->My = (fftw_complex *) fftw_malloc(size2);
-	plan->Mz = (fftw_complex *) fftw_malloc(size2);
-	plan->Hx = (fftw_complex *) fftw_malloc(size2);
-	plan->Hy = (fftw_complex *) fftw_malloc(size2);
-	plan->Hz = (fftw_complex *) fftw_malloc(size2);
 
-}
+//Plan for the transform of the tensors (r2c, or c2r if backward is 1):
+//3D, or 2D for every layer offset in the thin film mode
+fftw_plan tensor_fft_plan(fft_demag_plan *restrict plan, fftw_complex *complex_data,
+		double *real_data, int backward) {
 
+	int n[3] = {plan->lenz, plan->leny, plan->lenx};
+	int rank = plan->thin_film ? 2 : 3;
+	int howmany = plan->thin_film ? plan->lenz : 1;
+	int rdist = plan->lenx * plan->leny;
+	int cdist = plan->klenx * plan->leny;
 
-void create_fftw_plan(fft_demag_plan *restrict plan) {
+	if (backward) {
+		return fftw_plan_many_dft_c2r(rank, n + 3 - rank, howmany,
+				complex_data, NULL, 1, cdist, real_data, NULL, 1, rdist,
+				FFTW_ESTIMATE | FFTW_DESTROY_INPUT);
+	}
 
-	
-	plan->tensor_plan = fftw_plan_dft_r2c_3d(plan->lenz, plan->leny,
-			plan->lenx, plan->tensor_xx, plan->Nxx,
+	return fftw_plan_many_dft_r2c(rank, n + 3 - rank, howmany,
+			real_data, NULL, 1, rdist, complex_data, NULL, 1, cdist,
 			FFTW_ESTIMATE | FFTW_PRESERVE_INPUT);
+}
+
+//Transform a real space tensor component and keep the real part of the
+//octant kx, ky, kz >= 0 of its spectrum, using Mx as a buffer. If imag is
+//1 the imaginary part is kept instead (Nxz and Nyz for thin films)
+void transform_tensor(fft_demag_plan *restrict plan, fftw_plan tensor_plan,
+		double *restrict tensor, double *restrict N, int imag) {
+
+	int i, j, k;
+	int leny = plan->leny;
+	int klenx = plan->klenx;
+	int kleny = plan->kleny;
+	int klenz = plan->klenz;
 
-	plan->m_plan = fftw_plan_dft_r2c_3d(plan->lenz, plan->leny, plan->lenx,
-			plan->mx, plan->Mx, FFTW_MEASURE);
+	fftw_execute_dft_r2c(tensor_plan, tensor, plan->Mx);
+
+	for (k = 0; k < klenz; k++) {
+		for (j = 0; j < kleny; j++) {
+			for (i = 0; i < klenx; i++) {
+				fftw_complex v = plan->Mx[(k * leny + j) * klenx + i];
+				N[(k * kleny + j) * klenx + i] = imag ? cimag(v) : creal(v);
+			}
+		}
+	}
+}
 
-	plan->h_plan = fftw_plan_dft_c2r_3d(plan->lenz, plan->leny, plan->lenx,
-			plan->Hx, plan->hx, FFTW_MEASURE | FFTW_DESTROY_INPUT);
+//Recover a real space tensor component from its k-space octant. The
+//parities with respect to ky and kz are given by sy and sz (1 or -1). For
+//thin films the tensor is only given for the layer offsets dz >= 0, and
+//the components odd in z are the imaginary ones
+void restore_tensor(fft_demag_plan *restrict plan, double *restrict N,
+		double *restrict tensor, int sy, int sz) {
 
-	for (int i = 0; i < plan->total_length; i++) {
-		plan->Nxx[i] = 0;
-		plan->Nyy[i] = 0;
-		plan->Nzz[i] = 0;
-		plan->Nxy[i] = 0;
-		plan->Nxz[i] = 0;
-		plan->Nyz[i] = 0;
+	int i, j, k, jj, kk, s;
+	int leny = plan->leny;
+	int lenz = plan->lenz;
+	int klenx = plan->klenx;
+	int kleny = plan->kleny;
+	int klenz = plan->klenz;
+	int thin_film = plan->thin_film;
+	fftw_complex factor = (thin_film && sz < 0) ? I : 1;
 
-		plan->mx[i] = 0;
-		plan->my[i] = 0;
-		plan->mz[i] = 0;
+	//the work buffers may have been freed in single precision mode
+	fftw_complex *buffer = (fftw_complex *) fftw_malloc(plan->complex_length * sizeof(fftw_complex));
 
-		plan->hx[i] = 0;
-		plan->hy[i] = 0;
-		plan->hz[i] = 0;
+	for (k = 0; k < lenz; k++) {
+		kk = (k < klenz || thin_film) ? k : lenz - k;
+		for (j = 0; j < leny; j++) {
+			jj = j < kleny ? j : leny - j;
+			s = (k < klenz ? 1 : sz) * (j < kleny ? 1 : sy);
+			for (i = 0; i < klenx; i++) {
+				buffer[(k * leny + j) * klenx + i] = factor * s * N[(kk * kleny + jj) * klenx + i];
+			}
+		}
 	}
 
+	fftw_plan tensor_plan = tensor_fft_plan(plan, buffer, tensor, 1);
+	fftw_execute(tensor_plan);
+	fftw_destroy_plan(tensor_plan);
+	fftw_free(buffer);
 
-	fftw_execute_dft_r2c(plan->tensor_plan, plan->tensor_xx, plan->Nxx);
-	fftw_execute_dft_r2c(plan->tensor_plan, plan->tensor_yy, plan->Nyy);
-	fftw_execute_dft_r2c(plan->tensor_plan, plan->tensor_zz, plan->Nzz);
-	fftw_execute_dft_r2c(plan->tensor_plan, plan->tensor_xy, plan->Nxy);
-	fftw_execute_dft_r2c(plan->tensor_plan, plan->tensor_xz, plan->Nxz);
-	fftw_execute_dft_r2c(plan->tensor_plan, plan->tensor_yz, plan->Nyz);
-	fftw_destroy_plan(plan->tensor_plan);
+	for (i = 0; i < plan->total_length; i++) {
+		tensor[i] /= plan->fft_length;
+	}
+}
+
+void free_real_tensors(fft_demag_plan *restrict plan) {
+
+	fftw_free(plan->tensor_xx);
+	fftw_free(plan->tensor_yy);
+	fftw_free(plan->tensor_zz);
+	fftw_free(plan->tensor_xy);
+	fftw_free(plan->tensor_xz);
+	fftw_free(plan->tensor_yz);
 
+	plan->tensor_xx = NULL;
+	plan->tensor_yy = NULL;
+	plan->tensor_zz = NULL;
+	plan->tensor_xy = NULL;
+	plan->tensor_xz = NULL;
+	plan->tensor_yz = NULL;
 }
 
 
+//With open boundaries only the block i < nx, j < ny, k < nz of the padded
+//magnetisation is non zero, and only the same block of the padded field
+//is used. So instead of full 3D transforms we do batched 1D transforms
+//axis by axis and skip the rows which are zero (forward) or discarded
+//(backward):
+//
+//   x (r2c/c2r): only the rows with j < ny and k < nz
+//   y (c2c)    : only the planes with k < nz
+//   z (c2c)    : all the columns
+//
+//The three components of m and h are always transformed together. With
+//several replicas (see create_replica_plan) the replica is the fastest
+//index of the buffers, i.e. every entry of the arrays of a single system
+//is replaced by the contiguous entries of the K replicas, so the
+//transforms of the replicas are done as vectors. This function gives the
+//dimensions of the transform along axis (0, 1 or 2 for x, y or z) and
+//the batch dimensions (at most 4), and returns the number of the latter.
+//For the x axis the strides are those of the forward r2c transform; they
+//have to be swapped (is <-> os) for the backward one
+static int pruned_dims(fft_demag_plan *restrict plan, int axis,
+		fftw_iodim *dim, fftw_iodim *many) {
+
+	int K = plan->replicas;
+	int T = plan->total_length * K;
+	int C = plan->complex_length * K;
+	int Rxy = plan->lenx * plan->leny * K;
+	int Cxy = plan->klenx * plan->leny * K;
+	int klenx = plan->klenx * K;
+
+	fftw_iodim comps = {3, C, C};
+	many[0] = comps;
+
+	if (axis == 0) {
+		fftw_iodim x = {plan->lenx, K, K};
+		fftw_iodim zs = {plan->nz, Rxy, Cxy};
+		fftw_iodim ys = {plan->ny, plan->lenx * K, klenx};
+		fftw_iodim rs = {K, 1, 1};
+		*dim = x;
+		many[0].is = T;
+		many[1] = zs;
+		many[2] = ys;
+		if (K == 1) {
+			return 3;
+		}
+		many[3] = rs;
+		return 4;
+	} else if (axis == 1) {
+		fftw_iodim y = {plan->leny, klenx, klenx};
+		fftw_iodim zs = {plan->nz, Cxy, Cxy};
+		fftw_iodim xs = {klenx, 1, 1};
+		*dim = y;
+		many[1] = zs;
+		many[2] = xs;
+		return 3;
+	}
 
+	fftw_iodim z = {plan->lenz, Cxy, Cxy};
+	fftw_iodim xys = {Cxy, 1, 1};
+	*dim = z;
+	many[1] = xys;
+	return 2;
+}
+
+static void swap_strides(fftw_iodim *many, int rank) {
+	for (int i = 0; i < rank; i++) {
+		int tmp = many[i].is;
+		many[i].is = many[i].os;
+		many[i].os = tmp;
+	}
+}
 
+//Zero the entries of the transformed magnetisation M which are not
+//written by the pruned x transform, i.e. the rows j >= ny of the planes
+//k < nz and the planes k >= nz. size is the size of a complex number
+static void clear_padding(fft_demag_plan *restrict plan, void *M, size_t size) {
+
+	int ny = plan->ny;
+	int nz = plan->nz;
+	int leny = plan->leny;
+	int klenx = plan->klenx * plan->replicas;
+	size_t Cxy = (size_t) leny * klenx;
+	size_t C = (size_t) plan->complex_length * plan->replicas;
+	char *base = (char *) M;
+
+	#pragma omp parallel for
+	for (int c = 0; c < 3; c++) {
+		char *comp = base + c * C * size;
+		for (int k = 0; k < nz; k++) {
+			memset(comp + (k * Cxy + (size_t) ny * klenx) * size, 0,
+					(leny - ny) * klenx * size);
+		}
+		memset(comp + nz * Cxy * size, 0, (C - nz * Cxy) * size);
+	}
+}
+
+
+//Destroy the (non NULL) plans of an axis by axis transform
+static void destroy_plans(fftw_plan *plans) {
+	for (int i = 0; i < 3; i++) {
+		if (plans[i] != NULL) {
+			fftw_destroy_plan(plans[i]);
+			plans[i] = NULL;
+		}
+	}
+}
+
+//The planning effort is given by plan->fftw_flags (FFTW_ESTIMATE,
+//FFTW_MEASURE or FFTW_PATIENT) and the FFTs use plan->nthreads threads
+void create_fftw_plan(fft_demag_plan *restrict plan) {
+
+	fftw_iodim dim, many[4];
+	int rank;
+	unsigned int flags = plan->fftw_flags;
+
+	fftw_plan_with_nthreads(plan->nthreads);
+
+	//forward transforms along x, y and z
+	rank = pruned_dims(plan, 0, &dim, many);
+	plan->m_plans[0] = fftw_plan_guru_dft_r2c(1, &dim, rank, many,
+			plan->mx, plan->Mx, flags);
+	rank = pruned_dims(plan, 1, &dim, many);
+	plan->m_plans[1] = fftw_plan_guru_dft(1, &dim, rank, many,
+			plan->Mx, plan->Mx, FFTW_FORWARD, flags);
+	//z is not transformed for thin films, m_plans[2] and h_plans[0]
+	//stay NULL
+	if (!plan->thin_film) {
+		rank = pruned_dims(plan, 2, &dim, many);
+		plan->m_plans[2] = fftw_plan_guru_dft(1, &dim, rank, many,
+				plan->Mx, plan->Mx, FFTW_FORWARD, flags);
+		plan->h_plans[0] = fftw_plan_guru_dft(1, &dim, rank, many,
+				plan->Hx, plan->Hx, FFTW_BACKWARD, flags);
+	}
+
+	//backward transforms along z, y and x
+	rank = pruned_dims(plan, 1, &dim, many);
+	plan->h_plans[1] = fftw_plan_guru_dft(1, &dim, rank, many,
+			plan->Hx, plan->Hx, FFTW_BACKWARD, flags);
+	rank = pruned_dims(plan, 0, &dim, many);
+	swap_strides(many, rank);
+	plan->h_plans[2] = fftw_plan_guru_dft_c2r(1, &dim, rank, many,
+			plan->Hx, plan->hx, flags | FFTW_DESTROY_INPUT);
+
+	//the padding of mx is never written afterwards, so it stays zero
+	size_t size1 = 3 * (size_t) plan->replicas * plan->total_length * sizeof(double);
+	memset(plan->mx, 0, size1);
+	memset(plan->hx, 0, size1);
+
+	//If the real space tensors were already freed, the k-space tensors
+	//were set directly (e.g. loaded from the tensor cache)
+	if (plan->tensor_xx == NULL) {
+		return;
+	}
+
+	fftw_plan tensor_plan = tensor_fft_plan(plan, plan->Mx, plan->tensor_xx, 0);
+	int thin_film = plan->thin_film;
+
+	transform_tensor(plan, tensor_plan, plan->tensor_xx, plan->Nxx, 0);
+	transform_tensor(plan, tensor_plan, plan->tensor_yy, plan->Nyy, 0);
+	transform_tensor(plan, tensor_plan, plan->tensor_zz, plan->Nzz, 0);
+	transform_tensor(plan, tensor_plan, plan->tensor_xy, plan->Nxy, 0);
+	transform_tensor(plan, tensor_plan, plan->tensor_xz, plan->Nxz, thin_film);
+	transform_tensor(plan, tensor_plan, plan->tensor_yz, plan->Nyz, thin_film);
+	fftw_destroy_plan(tensor_plan);
+
+	//the real space tensors are not needed anymore
+	free_real_tensors(plan);
+
+}
+
+
+
+
+
+//In the thin film mode z is not transformed: for every in-plane wave
+//vector, the field in the layer k is the sum over the layers k' of the
+//tensors for the offset k - k' times the magnetisation. Nxz and Nyz are
+//imaginary and odd with respect to the offset. The K replicas of every
+//entry are contiguous, and share the tensors
+static void convolve_layers(fft_demag_plan *restrict plan) {
+
+	int nz = plan->nz;
+	int leny = plan->leny;
+	int klenx = plan->klenx;
+	int kleny = plan->kleny;
+	int K = plan->replicas;
+
+	double *Nxx = plan->Nxx;
+	double *Nyy = plan->Nyy;
+	double *Nzz = plan->Nzz;
+	double *Nxy = plan->Nxy;
+	double *Nxz = plan->Nxz;
+	double *Nyz = plan->Nyz;
+
+	fftw_complex *Mx = plan->Mx;
+	fftw_complex *My = plan->My;
+	fftw_complex *Mz = plan->Mz;
+	fftw_complex *Hx = plan->Hx;
+	fftw_complex *Hy = plan->Hy;
+	fftw_complex *Hz = plan->Hz;
+
+	#pragma omp parallel for schedule(static)
+	for (int j = 0; j < leny; j++) {
+		int jj = j < kleny ? j : leny - j;
+		double sy = j < kleny ? 1.0 : -1.0;
+		for (int k = 0; k < nz; k++) {
+			fftw_complex *restrict hx = Hx + (k * leny + j) * klenx * K;
+			fftw_complex *restrict hy = Hy + (k * leny + j) * klenx * K;
+			fftw_complex *restrict hz = Hz + (k * leny + j) * klenx * K;
+
+			for (int kp = 0; kp < nz; kp++) {
+				//the first layer initialises the field
+				int add = kp > 0;
+				int dk = k >= kp ? k - kp : kp - k;
+				double sz = k >= kp ? 1.0 : -1.0;
+				int id1 = (kp * leny + j) * klenx * K;
+				int id2 = (dk * kleny + jj) * klenx;
+
+				for (int i = 0; i < klenx; i++) {
+					double nxx = Nxx[id2 + i];
+					double nyy = Nyy[id2 + i];
+					double nzz = Nzz[id2 + i];
+					double nxy = sy * Nxy[id2 + i];
+					double nxz = sz * Nxz[id2 + i];
+					double nyz = sy * sz * Nyz[id2 + i];
+
+					for (int r = i * K; r < (i + 1) * K; r++) {
+						fftw_complex mx = Mx[id1 + r];
+						fftw_complex my = My[id1 + r];
+						fftw_complex mz = Mz[id1 + r];
+						//i * m, to multiply by the imaginary Nxz and Nyz
+						fftw_complex imx = -cimag(mx) + creal(mx) * I;
+						fftw_complex imy = -cimag(my) + creal(my) * I;
+						fftw_complex imz = -cimag(mz) + creal(mz) * I;
+
+						hx[r] = (add ? hx[r] : 0) + nxx * mx + nxy * my + nxz * imz;
+						hy[r] = (add ? hy[r] : 0) + nxy * mx + nyy * my + nyz * imz;
+						hz[r] = (add ? hz[r] : 0) + nxz * imx + nyz * imy + nzz * mz;
+					}
+				}
+			}
+		}
+	}
+}
+
+//Same as convolve_layers, for the single precision buffers
+static void convolve_layers_single(fft_demag_plan *restrict plan) {
+
+	int nz = plan->nz;
+	int leny = plan->leny;
+	int klenx = plan->klenx;
+	int kleny = plan->kleny;
+	int tl = plan->tensor_length;
+	int cl = plan->complex_length;
+
+	float *Nxx = plan->N_f;
+	float *Nyy = Nxx + tl;
+	float *Nzz = Nyy + tl;
+	float *Nxy = Nzz + tl;
+	float *Nxz = Nxy + tl;
+	float *Nyz = Nxz + tl;
+
+	fftwf_complex *Mx = plan->M_f;
+	fftwf_complex *My = Mx + cl;
+	fftwf_complex *Mz = My + cl;
+	fftwf_complex *Hx = plan->H_f;
+	fftwf_complex *Hy = Hx + cl;
+	fftwf_complex *Hz = Hy + cl;
+
+	#pragma omp parallel for schedule(static)
+	for (int j = 0; j < leny; j++) {
+		int jj = j < kleny ? j : leny - j;
+		float sy = j < kleny ? 1.0f : -1.0f;
+		for (int k = 0; k < nz; k++) {
+			fftwf_complex *restrict hx = Hx + (k * leny + j) * klenx;
+			fftwf_complex *restrict hy = Hy + (k * leny + j) * klenx;
+			fftwf_complex *restrict hz = Hz + (k * leny + j) * klenx;
+
+			for (int kp = 0; kp < nz; kp++) {
+				//the first layer initialises the field
+				int add = kp > 0;
+				int dk = k >= kp ? k - kp : kp - k;
+				float sz = k >= kp ? 1.0f : -1.0f;
+				int id1 = (kp * leny + j) * klenx;
+				int id2 = (dk * kleny + jj) * klenx;
+
+				for (int i = 0; i < klenx; i++) {
+					fftwf_complex mx = Mx[id1 + i];
+					fftwf_complex my = My[id1 + i];
+					fftwf_complex mz = Mz[id1 + i];
+					//i * m, to multiply by the imaginary Nxz and Nyz
+					fftwf_complex imx = -cimagf(mx) + crealf(mx) * I;
+					fftwf_complex imy = -cimagf(my) + crealf(my) * I;
+					fftwf_complex imz = -cimagf(mz) + crealf(mz) * I;
+
+					float nxx = Nxx[id2 + i];
+					float nyy = Nyy[id2 + i];
+					float nzz = Nzz[id2 + i];
+					float nxy = sy * Nxy[id2 + i];
+					float nxz = sz * Nxz[id2 + i];
+					float nyz = sy * sz * Nyz[id2 + i];
+
+					hx[i] = (add ? hx[i] : 0) + nxx * mx + nxy * my + nxz * imz;
+					hy[i] = (add ? hy[i] : 0) + nxy * mx + nyy * my + nyz * imz;
+					hz[i] = (add ? hz[i] : 0) + nxz * imx + nyz * imy + nzz * mz;
+				}
+			}
+		}
+	}
+}
+
+//The tensors are only stored for ky, kz >= 0; for negative wave vectors
+//we use the parity of every component (odd components change sign). The
+//K replicas of every entry are contiguous, and share the tensors
+static void convolve(fft_demag_plan *restrict plan) {
+
+	int i, j, k, r, id1, id2;
+
+	int lenz = plan->lenz;
+	int leny = plan->leny;
+	int klenx = plan->klenx;
+	int kleny = plan->kleny;
+	int klenz = plan->klenz;
+	int K = plan->replicas;
+
+	double *Nxx = plan->Nxx;
+	double *Nyy = plan->Nyy;
+	double *Nzz = plan->Nzz;
+	double *Nxy = plan->Nxy;
+	double *Nxz = plan->Nxz;
+	double *Nyz = plan->Nyz;
+
+	fftw_complex *Mx = plan->Mx;
+	fftw_complex *My = plan->My;
+	fftw_complex *Mz = plan->Mz;
+	fftw_complex *Hx = plan->Hx;
+	fftw_complex *Hy = plan->Hy;
+	fftw_complex *Hz = plan->Hz;
+
+	#pragma omp parallel for private(j, i, r, id1, id2) schedule(static)
+	for (k = 0; k < lenz; k++) {
+		int kk = k < klenz ? k : lenz - k;
+		double sz = k < klenz ? 1.0 : -1.0;
+		for (j = 0; j < leny; j++) {
+			int jj = j < kleny ? j : leny - j;
+			double sy = j < kleny ? 1.0 : -1.0;
+			for (i = 0; i < klenx; i++) {
+				id1 = ((k * leny + j) * klenx + i) * K;
+				id2 = (kk * kleny + jj) * klenx + i;
+
+				double nxx = Nxx[id2];
+				double nyy = Nyy[id2];
+				double nzz = Nzz[id2];
+				double nxy = sy * Nxy[id2];
+				double nxz = sz * Nxz[id2];
+				double nyz = sy * sz * Nyz[id2];
+
+				for (r = id1; r < id1 + K; r++) {
+					Hx[r] = nxx * Mx[r] + nxy * My[r] + nxz * Mz[r];
+					Hy[r] = nxy * Mx[r] + nyy * My[r] + nyz * Mz[r];
+					Hz[r] = nxz * Mx[r] + nyz * My[r] + nzz * Mz[r];
+				}
+			}
+		}
+	}
+}
 
 //The computed results doesn't consider the coefficient of \frac{\mu_0}{4 \pi}, the
 //reason is in future we can use the following code directly for continuum case
+//For plans with several replicas (see create_replica_plan), spin and field
+//hold the sites of all the replicas one after the other, and mu_s is
+//the same for all of them
 void compute_fields(fft_demag_plan *restrict plan, double *restrict spin, double *restrict mu_s, double *restrict field) {
 
-	int i, j, k, id1, id2;
+	int i, j, k, r, id1, id2;
 
 	int nx = plan->nx;
 	int ny = plan->ny;
 	int nz = plan->nz;
 	int nxy = nx * ny;
+	int n = nxy * nz;
+	int K = plan->replicas;
 
 	int lenx = plan->lenx;
 	int leny = plan->leny;
 	int lenxy = lenx * leny;
 
-	for (i = 0; i < plan->total_length; i++) {
-		plan->mx[i] = 0;
-		plan->my[i] = 0;
-		plan->mz[i] = 0;
+	double *mx = plan->mx;
+	double *my = plan->my;
+	double *mz = plan->mz;
+	double *hx = plan->hx;
+	double *hy = plan->hy;
+	double *hz = plan->hz;
+
+	//only the physical block of mx is written, the padding is zero
+	#pragma omp parallel for private(j, i, r, id1, id2)
+	for (k = 0; k < nz; k++) {
+		for (j = 0; j < ny; j++) {
+			for (i = 0; i < nx; i++) {
+				id1 = k * nxy + j * nx + i;
+				id2 = (k * lenxy + j * lenx + i) * K;
+
+				for (r = 0; r < K; r++) {
+					double *m = spin + 3 * ((size_t) r * n + id1);
+					mx[id2 + r] = m[0] * mu_s[id1];
+					my[id2 + r] = m[1] * mu_s[id1];
+					mz[id2 + r] = m[2] * mu_s[id1];
+				}
+			}
+		}
+	}
+
+	fftw_execute(plan->m_plans[0]);
+	clear_padding(plan, plan->Mx, sizeof(fftw_complex));
+	fftw_execute(plan->m_plans[1]);
+	if (plan->m_plans[2] != NULL) {
+		fftw_execute(plan->m_plans[2]);
+	}
+
+	if (plan->thin_film) {
+		convolve_layers(plan);
+	} else {
+		convolve(plan);
 	}
 
+	if (plan->h_plans[0] != NULL) {
+		fftw_execute(plan->h_plans[0]);
+	}
+	fftw_execute(plan->h_plans[1]);
+	fftw_execute(plan->h_plans[2]);
 
+	double scale = -1.0  / plan->fft_length;
+	#pragma omp parallel for private(j, i, r, id1, id2) schedule(dynamic, 32)
 	for (k = 0; k < nz; k++) {
 		for (j = 0; j < ny; j++) {
 			for (i = 0; i < nx; i++) {
 				id1 = k * nxy + j * nx + i;
-				id2 = k * lenxy + j * lenx + i;
+				id2 = (k * lenxy + j * lenx + i) * K;
 
-				plan->mx[id2] = spin[3*id1]*mu_s[id1];
-				plan->my[id2] = spin[3*id1+1]*mu_s[id1];
-				plan->mz[id2] = spin[3*id1+2]*mu_s[id1];
+				for (r = 0; r < K; r++) {
+					double *h = field + 3 * ((size_t) r * n + id1);
+					h[0] = hx[id2 + r] * scale;
+					h[1] = hy[id2 + r] * scale;
+					h[2] = hz[id2 + r] * scale;
+				}
 			}
 		}
 	}
 
-	//print_r("plan->mx", plan->mx, plan->total_length);
+}
 
-	fftw_execute_dft_r2c(plan->m_plan, plan->mx, plan->Mx);
-	fftw_execute_dft_r2c(plan->m_plan, plan->my, plan->My);
-	fftw_execute_dft_r2c(plan->m_plan, plan->mz, plan->Mz);
+//Plan for the field of several replicas of the system (e.g. the
+//independent simulations of an ensemble), with the k-space tensors of
+//base. The magnetisation and field of all the replicas are transformed
+//together (see pruned_dims), and the tensors are read once for all of
+//them in the convolution. The plan is always in double precision and is
+//freed with finalize_plan
+fft_demag_plan *create_replica_plan(fft_demag_plan *restrict base, int replicas) {
 
-	//print_c("plan->Mx", plan->Mx, plan->total_length);
+	fft_demag_plan *plan = (fft_demag_plan*) malloc(sizeof(fft_demag_plan));
+	if (plan == NULL) {
+		return NULL;
+	}
 
-	fftw_complex *Nxx = plan->Nxx;
-	fftw_complex *Nyy = plan->Nyy;
-	fftw_complex *Nzz = plan->Nzz;
-	fftw_complex *Nxy = plan->Nxy;
-	fftw_complex *Nxz = plan->Nxz;
-	fftw_complex *Nyz = plan->Nyz;
+	*plan = *base;
+	plan->replicas = replicas;
+
+	plan->tensor_xx = NULL;
+	plan->tensor_yy = NULL;
+	plan->tensor_zz = NULL;
+	plan->tensor_xy = NULL;
+	plan->tensor_xz = NULL;
+	plan->tensor_yz = NULL;
+
+	plan->single = 0;
+	plan->N_f = NULL;
+	plan->m_f = NULL;
+	plan->h_f = NULL;
+	plan->M_f = NULL;
+	plan->H_f = NULL;
+	for (int i = 0; i < 3; i++) {
+		plan->m_plans[i] = NULL;
+		plan->h_plans[i] = NULL;
+		plan->m_plans_f[i] = NULL;
+		plan->h_plans_f[i] = NULL;
+	}
 
-	fftw_complex *Mx = plan->Mx;
-	fftw_complex *My = plan->My;
-	fftw_complex *Mz = plan->Mz;
-	fftw_complex *Hx = plan->Hx;
-	fftw_complex *Hy = plan->Hy;
-	fftw_complex *Hz = plan->Hz;
+	size_t size1 = 3 * (size_t) replicas * plan->total_length * sizeof(double);
+	size_t size2 = 3 * (size_t) replicas * plan->complex_length * sizeof(fftw_complex);
+	size_t size3 = plan->tensor_length * sizeof(double);
+
+	plan->Nxx = (double *) fftw_malloc(size3);
+	plan->Nyy = (double *) fftw_malloc(size3);
+	plan->Nzz = (double *) fftw_malloc(size3);
+	plan->Nxy = (double *) fftw_malloc(size3);
+	plan->Nxz = (double *) fftw_malloc(size3);
+	plan->Nyz = (double *) fftw_malloc(size3);
+	memcpy(plan->Nxx, base->Nxx, size3);
+	memcpy(plan->Nyy, base->Nyy, size3);
+	memcpy(plan->Nzz, base->Nzz, size3);
+	memcpy(plan->Nxy, base->Nxy, size3);
+	memcpy(plan->Nxz, base->Nxz, size3);
+	memcpy(plan->Nyz, base->Nyz, size3);
+
+	size_t T = (size_t) replicas * plan->total_length;
+	size_t C = (size_t) replicas * plan->complex_length;
 
-	//print_c("Mx", Mx, plan->total_length);
+	plan->mx = (double *) fftw_malloc(size1);
+	plan->my = plan->mx + T;
+	plan->mz = plan->my + T;
+	plan->hx = (double *) fftw_malloc(size1);
+	plan->hy = plan->hx + T;
+	plan->hz = plan->hy + T;
 
-	for (i = 0; i < plan->total_length; i++) {
-		Hx[i] = Nxx[i] * Mx[i] + Nxy[i] * My[i] + Nxz[i] * Mz[i];
-		Hy[i] = Nxy[i] * Mx[i] + Nyy[i] * My[i] + Nyz[i] * Mz[i];
-		Hz[i] = Nxz[i] * Mx[i] + Nyz[i] * My[i] + Nzz[i] * Mz[i];
+	plan->Mx = (fftw_complex *) fftw_malloc(size2);
+	plan->My = plan->Mx + C;
+	plan->Mz = plan->My + C;
+	plan->Hx = (fftw_complex *) fftw_malloc(size2);
+	plan->Hy = plan->Hx + C;
+	plan->Hz = plan->Hy + C;
+
+	//the real space tensors are NULL, so only the plans are created
+	create_fftw_plan(plan);
+
+	return plan;
+}
+
+//Switch to the single precision convolution. The k-space tensors are
+//rounded to floats and the magnetisation and field are transformed with
+//fftwf plans (same threads and planning effort as the double plans).
+//The field is still accumulated into a double precision array
+void enable_single_precision(fft_demag_plan *restrict plan) {
+
+	fftw_iodim dim, many[4];
+	int rank;
+	unsigned int flags = plan->fftw_flags;
+	int tl = plan->tensor_length;
+
+	plan->N_f = (float *) fftwf_malloc(6 * tl * sizeof(float));
+	plan->m_f = (float *) fftwf_malloc(3 * plan->total_length * sizeof(float));
+	plan->h_f = (float *) fftwf_malloc(3 * plan->total_length * sizeof(float));
+	plan->M_f = (fftwf_complex *) fftwf_malloc(3 * plan->complex_length * sizeof(fftwf_complex));
+	plan->H_f = (fftwf_complex *) fftwf_malloc(3 * plan->complex_length * sizeof(fftwf_complex));
+
+	for (int i = 0; i < tl; i++) {
+		plan->N_f[i] = (float) plan->Nxx[i];
+		plan->N_f[i + tl] = (float) plan->Nyy[i];
+		plan->N_f[i + 2 * tl] = (float) plan->Nzz[i];
+		plan->N_f[i + 3 * tl] = (float) plan->Nxy[i];
+		plan->N_f[i + 4 * tl] = (float) plan->Nxz[i];
+		plan->N_f[i + 5 * tl] = (float) plan->Nyz[i];
+	}
+
+	fftwf_init_threads();
+	fftwf_plan_with_nthreads(plan->nthreads);
+
+	//the same pruned transforms as in create_fftw_plan (fftw_iodim is
+	//shared by all precisions)
+	rank = pruned_dims(plan, 0, &dim, many);
+	plan->m_plans_f[0] = fftwf_plan_guru_dft_r2c(1, &dim, rank, many,
+			plan->m_f, plan->M_f, flags);
+	rank = pruned_dims(plan, 1, &dim, many);
+	plan->m_plans_f[1] = fftwf_plan_guru_dft(1, &dim, rank, many,
+			plan->M_f, plan->M_f, FFTW_FORWARD, flags);
+	if (!plan->thin_film) {
+		rank = pruned_dims(plan, 2, &dim, many);
+		plan->m_plans_f[2] = fftwf_plan_guru_dft(1, &dim, rank, many,
+				plan->M_f, plan->M_f, FFTW_FORWARD, flags);
+		plan->h_plans_f[0] = fftwf_plan_guru_dft(1, &dim, rank, many,
+				plan->H_f, plan->H_f, FFTW_BACKWARD, flags);
 	}
 
-	//print_c("Hx", Hx, plan->total_length);
+	rank = pruned_dims(plan, 1, &dim, many);
+	plan->h_plans_f[1] = fftwf_plan_guru_dft(1, &dim, rank, many,
+			plan->H_f, plan->H_f, FFTW_BACKWARD, flags);
+	rank = pruned_dims(plan, 0, &dim, many);
+	swap_strides(many, rank);
+	plan->h_plans_f[2] = fftwf_plan_guru_dft_c2r(1, &dim, rank, many,
+			plan->H_f, plan->h_f, flags | FFTW_DESTROY_INPUT);
+
+	//the planner may have overwritten the buffers
+	memset(plan->m_f, 0, 3 * plan->total_length * sizeof(float));
+
+	plan->single = 1;
+}
+
+//Free the double precision work buffers and plans once the single
+//precision mode is used. The double k-space tensors are kept, since
+//exact_compute and the tensor cache use them
+void free_double_buffers(fft_demag_plan *restrict plan) {
+
+	destroy_plans(plan->m_plans);
+	destroy_plans(plan->h_plans);
+
+	fftw_free(plan->Mx);
+	fftw_free(plan->Hx);
+	fftw_free(plan->mx);
+	fftw_free(plan->hx);
+
+	plan->Mx = plan->My = plan->Mz = NULL;
+	plan->Hx = plan->Hy = plan->Hz = NULL;
+	plan->mx = plan->my = plan->mz = NULL;
+	plan->hx = plan->hy = plan->hz = NULL;
+}
 
-	fftw_execute_dft_c2r(plan->h_plan, plan->Hx, plan->hx);
-	fftw_execute_dft_c2r(plan->h_plan, plan->Hy, plan->hy);
-	fftw_execute_dft_c2r(plan->h_plan, plan->Hz, plan->hz);
-	//print_r("hx", plan->hx, plan->total_length);
-	//print_r("hy", plan->hy, plan->total_length);
-	//print_r("hz", plan->hz, plan->total_length);
+//Same as compute_fields, with the FFTs and the tensor products in single
+//precision
+void compute_fields_single(fft_demag_plan *restrict plan, double *restrict spin, double *restrict mu_s, double *restrict field) {
 
-	double scale = -1.0  / plan->total_length;
-        #pragma omp parallel for private(j, i, id1, id2) schedule(dynamic, 32)
+	int i, j, k, id1, id2;
+
+	int nx = plan->nx;
+	int ny = plan->ny;
+	int nz = plan->nz;
+	int nxy = nx * ny;
+
+	int lenx = plan->lenx;
+	int leny = plan->leny;
+	int lenz = plan->lenz;
+	int lenxy = lenx * leny;
+	int total_length = plan->total_length;
+	int complex_length = plan->complex_length;
+	int tl = plan->tensor_length;
+
+	float *m_f = plan->m_f;
+
+	//only the physical block of m_f is written, the padding is zero
+	#pragma omp parallel for private(j, i, id1, id2)
 	for (k = 0; k < nz; k++) {
 		for (j = 0; j < ny; j++) {
 			for (i = 0; i < nx; i++) {
 				id1 = k * nxy + j * nx + i;
+				id2 = k * lenxy + j * lenx + i;
+
+				m_f[id2] = (float) (spin[3*id1] * mu_s[id1]);
+				m_f[id2 + total_length] = (float) (spin[3*id1+1] * mu_s[id1]);
+				m_f[id2 + 2 * total_length] = (float) (spin[3*id1+2] * mu_s[id1]);
+			}
+		}
+	}
+
+	fftwf_execute(plan->m_plans_f[0]);
+	clear_padding(plan, plan->M_f, sizeof(fftwf_complex));
+	fftwf_execute(plan->m_plans_f[1]);
+	if (plan->m_plans_f[2] != NULL) {
+		fftwf_execute(plan->m_plans_f[2]);
+	}
+
+	float *Nxx = plan->N_f;
+	float *Nyy = Nxx + tl;
+	float *Nzz = Nyy + tl;
+	float *Nxy = Nzz + tl;
+	float *Nxz = Nxy + tl;
+	float *Nyz = Nxz + tl;
+
+	fftwf_complex *Mx = plan->M_f;
+	fftwf_complex *My = Mx + complex_length;
+	fftwf_complex *Mz = My + complex_length;
+	fftwf_complex *Hx = plan->H_f;
+	fftwf_complex *Hy = Hx + complex_length;
+	fftwf_complex *Hz = Hy + complex_length;
+
+	int klenx = plan->klenx;
+	int kleny = plan->kleny;
+	int klenz = plan->klenz;
+
+	if (plan->thin_film) {
+		convolve_layers_single(plan);
+	} else {
+		#pragma omp parallel for private(j, i, id1, id2) schedule(static)
+		for (k = 0; k < lenz; k++) {
+			int kk = k < klenz ? k : lenz - k;
+			float sz = k < klenz ? 1.0f : -1.0f;
+			for (j = 0; j < leny; j++) {
+				int jj = j < kleny ? j : leny - j;
+				float sy = j < kleny ? 1.0f : -1.0f;
+				for (i = 0; i < klenx; i++) {
+					id1 = (k * leny + j) * klenx + i;
+					id2 = (kk * kleny + jj) * klenx + i;
+
+					float nxy = sy * Nxy[id2];
+					float nxz = sz * Nxz[id2];
+					float nyz = sy * sz * Nyz[id2];
+
+					Hx[id1] = Nxx[id2] * Mx[id1] + nxy * My[id1] + nxz * Mz[id1];
+					Hy[id1] = nxy * Mx[id1] + Nyy[id2] * My[id1] + nyz * Mz[id1];
+					Hz[id1] = nxz * Mx[id1] + nyz * My[id1] + Nzz[id2] * Mz[id1];
+				}
+			}
+		}
+	}
+
+	if (plan->h_plans_f[0] != NULL) {
+		fftwf_execute(plan->h_plans_f[0]);
+	}
+	fftwf_execute(plan->h_plans_f[1]);
+	fftwf_execute(plan->h_plans_f[2]);
 
+	float *h_f = plan->h_f;
+	double scale = -1.0  / plan->fft_length;
+	#pragma omp parallel for private(j, i, id1, id2) schedule(dynamic, 32)
+	for (k = 0; k < nz; k++) {
+		for (j = 0; j < ny; j++) {
+			for (i = 0; i < nx; i++) {
+				id1 = k * nxy + j * nx + i;
 				id2 = k * lenxy + j * lenx + i;
-				field[3*id1] = plan->hx[id2] * scale;
-				field[3*id1+1]  = plan->hy[id2] * scale;
-				field[3*id1+2]  = plan->hz[id2] * scale;
+
+				field[3*id1] = h_f[id2] * scale;
+				field[3*id1+1] = h_f[id2 + total_length] * scale;
+				field[3*id1+2] = h_f[id2 + 2 * total_length] * scale;
 			}
 		}
 	}
@@ -391,6 +1110,7 @@ void compute_fields(fft_demag_plan *restrict plan, double *restrict spin, double
 void exact_compute(fft_demag_plan *restrict plan, double *restrict spin,  double *restrict mu_s, double *restrict field) {
 	int i, j, k, index;
 	int ip, jp, kp, idf, ids;
+	double sz;
 	int nx = plan->nx;
 	int ny = plan->ny;
 	int nz = plan->nz;
@@ -402,12 +1122,22 @@ void exact_compute(fft_demag_plan *restrict plan, double *restrict spin,  double
     int lenz = plan->lenz;
     int lenxy = lenx * leny;
 
-	double *Nxx = plan->tensor_xx;
-	double *Nyy = plan->tensor_yy;
-	double *Nzz = plan->tensor_zz;
-	double *Nxy = plan->tensor_xy;
-	double *Nxz = plan->tensor_xz;
-	double *Nyz = plan->tensor_yz;
+	//the real space tensors were freed after the setup, so we recover them
+	//from the k-space octant
+	size_t size = plan->total_length * sizeof(double);
+	double *Nxx = (double *) fftw_malloc(size);
+	double *Nyy = (double *) fftw_malloc(size);
+	double *Nzz = (double *) fftw_malloc(size);
+	double *Nxy = (double *) fftw_malloc(size);
+	double *Nxz = (double *) fftw_malloc(size);
+	double *Nyz = (double *) fftw_malloc(size);
+
+	restore_tensor(plan, plan->Nxx, Nxx, 1, 1);
+	restore_tensor(plan, plan->Nyy, Nyy, 1, 1);
+	restore_tensor(plan, plan->Nzz, Nzz, 1, 1);
+	restore_tensor(plan, plan->Nxy, Nxy, -1, 1);
+	restore_tensor(plan, plan->Nxz, Nxz, 1, -1);
+	restore_tensor(plan, plan->Nyz, Nyz, -1, -1);
 
 	
         for (k = 0; k < nz; k++) {
@@ -426,13 +1156,21 @@ void exact_compute(fft_demag_plan *restrict plan, double *restrict spin,  double
                             
                             index = ip-i>=0 ? ip - i: ip - i + lenx;
                             index += jp-j >=0 ? (jp - j)*lenx: (jp - j + leny)*lenx;
-                            index += kp-k >=0 ? (kp - k)*lenxy: (kp - k + lenz)*lenxy;
+                            //for thin films only the offsets kp - k >= 0
+                            //are stored, Nxz and Nyz are odd in z
+                            sz = 1;
+                            if (!plan->thin_film) {
+                                index += kp-k >=0 ? (kp - k)*lenxy: (kp - k + lenz)*lenxy;
+                            } else {
+                                index += kp-k >=0 ? (kp - k)*lenxy: (k - kp)*lenxy;
+                                sz = kp-k >=0 ? 1 : -1;
+                            }
                             
 							field[3*idf] += (Nxx[index] * spin[3*ids] + Nxy[index]
-									* spin[3*ids+1] + Nxz[index] * spin[3*ids+2])*mu_s[ids];
+									* spin[3*ids+1] + sz * Nxz[index] * spin[3*ids+2])*mu_s[ids];
 							field[3*idf+1]  += (Nxy[index] * spin[3*ids] + Nyy[index]
-									* spin[3*ids+1] + Nyz[index] * spin[3*ids+2])*mu_s[ids];
-							field[3*idf+2]  += (Nxz[index] * spin[3*ids] + Nyz[index]
+									* spin[3*ids+1] + sz * Nyz[index] * spin[3*ids+2])*mu_s[ids];
+							field[3*idf+2]  += (sz * Nxz[index] * spin[3*ids] + sz * Nyz[index]
 									* spin[3*ids+1] + Nzz[index] * spin[3*ids+2])*mu_s[ids];
 						}
 					}
@@ -445,6 +1183,13 @@ void exact_compute(fft_demag_plan *restrict plan, double *restrict spin,  double
 		}
 	}
 
+	fftw_free(Nxx);
+	fftw_free(Nyy);
+	fftw_free(Nzz);
+	fftw_free(Nxy);
+	fftw_free(Nxz);
+	fftw_free(Nyz);
+
 }
 
 double compute_demag_energy(fft_demag_plan *restrict plan,
@@ -474,15 +1219,26 @@ double compute_demag_energy(fft_demag_plan *restrict plan,
 
 void finalize_plan(fft_demag_plan *restrict plan) {
 
-	fftw_destroy_plan(plan->m_plan);
-	fftw_destroy_plan(plan->h_plan);
+	destroy_plans(plan->m_plans);
+	destroy_plans(plan->h_plans);
 
-	fftw_free(plan->tensor_xx);
-	fftw_free(plan->tensor_yy);
-	fftw_free(plan->tensor_zz);
-	fftw_free(plan->tensor_xy);
-	fftw_free(plan->tensor_xz);
-	fftw_free(plan->tensor_yz);
+	free_real_tensors(plan);
+
+	if (plan->single) {
+		for (int i = 0; i < 3; i++) {
+			if (plan->m_plans_f[i] != NULL) {
+				fftwf_destroy_plan(plan->m_plans_f[i]);
+			}
+			if (plan->h_plans_f[i] != NULL) {
+				fftwf_destroy_plan(plan->h_plans_f[i]);
+			}
+		}
+		fftwf_free(plan->N_f);
+		fftwf_free(plan->m_f);
+		fftwf_free(plan->h_f);
+		fftwf_free(plan->M_f);
+		fftwf_free(plan->H_f);
+	}
 
 	fftw_free(plan->Nxx);
 	fftw_free(plan->Nyy);
@@ -491,21 +1247,15 @@ void finalize_plan(fft_demag_plan *restrict plan) {
 	fftw_free(plan->Nxz);
 	fftw_free(plan->Nyz);
 
+	//my, mz, etc. point into the same blocks
 	fftw_free(plan->Mx);
-	fftw_free(plan->My);
-	fftw_free(plan->Mz);
 	fftw_free(plan->Hx);
-	fftw_free(plan->Hy);
-	fftw_free(plan->Hz);
 
 	fftw_free(plan->mx);
-	fftw_free(plan->my);
-	fftw_free(plan->mz);
 	fftw_free(plan->hx);
-	fftw_free(plan->hy);
-	fftw_free(plan->hz);
 
-	fftw_cleanup_threads();
+	//we do not call fftw_cleanup_threads here: it would invalidate the
+	//plans of other FFTDemag instances and forget the accumulated wisdom
 
 	free(plan);
 }
@@ -30,7 +30,36 @@ typedef struct {
 
 	int total_length;
 
-    //TODO: free tensors after obtaining NXX to save memory?
+	//In the thin film mode (for a few layers) z is not padded nor
+	//transformed: the layers are coupled in k-space by a direct sum over
+	//the nz layer offsets, so lenz = nz. fft_length is the number of
+	//points of the transforms, which is the normalisation of the
+	//convolution (lenx * leny * lenz, or lenx * leny for thin films)
+	int thin_film;
+	int fft_length;
+
+	//number of copies of the system whose fields are computed together,
+	//1 except for the plans of create_replica_plan. The replica is the
+	//fastest index of the magnetisation and field buffers
+	int replicas;
+
+	//number of threads and planning effort (FFTW_ESTIMATE, FFTW_MEASURE,
+	//FFTW_PATIENT) used by create_fftw_plan
+	int nthreads;
+	unsigned int fftw_flags;
+
+	//length of the r2c transforms, i.e. lenz * leny * (lenx/2 + 1)
+	int complex_length;
+
+	//dimensions and length of the octant kx, ky, kz >= 0 of k-space. For
+	//thin films the third dimension is the layer offset 0 <= dz < nz
+	int klenx;
+	int kleny;
+	int klenz;
+	int tensor_length;
+
+	//real space tensors, they are only allocated until the fftw plans
+	//are created and the tensors are transformed
 	double *tensor_xx;
 	double *tensor_yy;
 	double *tensor_zz;
@@ -38,14 +67,19 @@ typedef struct {
 	double *tensor_xz;
 	double *tensor_yz;
 
-    //TODO: (1)using double, (2)using small size
-	fftw_complex *Nxx; //Nxx, Nxy .. are pure real now.
-	fftw_complex *Nyy;
-	fftw_complex *Nzz;
-	fftw_complex *Nxy;
-	fftw_complex *Nxz;
-	fftw_complex *Nyz;
-
+	//The transformed tensors are purely real. Every component is even or
+	//odd with respect to ky and kz (Nxy is odd in ky, Nxz in kz and Nyz in
+	//both) so we only store the octant kx, ky, kz >= 0
+	//For thin films Nxz and Nyz are purely imaginary (and odd with respect
+	//to the layer offset), and their imaginary part is stored
+	double *Nxx;
+	double *Nyy;
+	double *Nzz;
+	double *Nxy;
+	double *Nxz;
+	double *Nyz;
+
+	//the x, y and z components are contiguous in memory
 	fftw_complex *Mx;
 	fftw_complex *My;
 	fftw_complex *Mz;
@@ -60,25 +94,44 @@ typedef struct {
 	double *hy;
 	double *hz;
 
-	//we need three plans
-	fftw_plan tensor_plan;
-	fftw_plan m_plan;
-	fftw_plan h_plan;
+	//plans for the magnetisation and field transforms, the tensors
+	//are transformed with a temporary plan. The transforms are done axis
+	//by axis (see pruned_dims): m_plans is x, y, z and h_plans z, y, x
+	fftw_plan m_plans[3];
+	fftw_plan h_plans[3];
+
+	//single precision convolution (see enable_single_precision). The
+	//six k-space tensors are stored contiguously in N_f (xx, yy, zz, xy,
+	//xz, yz), and the components of m_f, h_f, M_f and H_f are contiguous
+	//as for the double precision buffers
+	int single;
+	float *N_f;
+	float *m_f;
+	float *h_f;
+	fftwf_complex *M_f;
+	fftwf_complex *H_f;
+	fftwf_plan m_plans_f[3];
+	fftwf_plan h_plans_f[3];
 
 } fft_demag_plan;
 
 fft_demag_plan *create_plan(void);
 void finalize_plan(fft_demag_plan *restrict plan);
+fft_demag_plan *create_replica_plan(fft_demag_plan *restrict base, int replicas);
 void init_plan(fft_demag_plan *plan, double dx, double dy,
-		double dz, int nx, int ny, int nz);
+		double dz, int nx, int ny, int nz, int thin_film);
 void compute_dipolar_tensors(fft_demag_plan *restrict plan); 
 void compute_demag_tensors(fft_demag_plan *restrict plan);
 void create_fftw_plan(fft_demag_plan *restrict plan);
+void free_real_tensors(fft_demag_plan *restrict plan);
+void enable_single_precision(fft_demag_plan *restrict plan);
+void free_double_buffers(fft_demag_plan *restrict plan);
 
 void compute_demag_tensors_2dpbc(fft_demag_plan *restrict plan, double *restrict tensors, double pbc_2d_error, int sample_repeat_nx, int sample_repeat_ny, double dipolar_radius);
 void fill_demag_tensors_c(fft_demag_plan *restrict plan, double *restrict tensors);
 
 void compute_fields(fft_demag_plan *restrict plan, double *restrict spin, double *mu_s, double *restrict field);
+void compute_fields_single(fft_demag_plan *restrict plan, double *restrict spin, double *restrict mu_s, double *restrict field);
 void exact_compute(fft_demag_plan *restrict plan, double *restrict spin, double *mu_s, double *restrict field);
 double compute_demag_energy(fft_demag_plan *restrict plan, double *restrict spin, double *restrict mu_s, double *restrict field, double *restrict energy);
 
@@ -1,9 +1,45 @@
 import numpy as np
 import numpy
 import ctypes
+import os
+import logging
+from fidimag.common.cache import cache_dir, atomic_write, TensorCache
 cimport numpy as np
 np.import_array()
 
+log = logging.getLogger(name="fidimag")
+
+cdef extern from "fftw3.h":
+    enum:
+        FFTW_ESTIMATE
+        FFTW_MEASURE
+        FFTW_PATIENT
+    int fftw_import_wisdom_from_string(const char *input_string)
+    char *fftw_export_wisdom_to_string()
+    void fftw_free(void *p)
+
+# Version of the k-space demag tensors stored in the tensor cache, part of
+# the cache key. It has to be increased whenever their layout (or the way
+# they are computed) changes, so old entries are not loaded
+TENSOR_CACHE_VERSION = 1
+
+# Planning effort for the FFTW plans of the demag field
+FFTW_PLANNING = {'estimate': FFTW_ESTIMATE,
+                 'measure': FFTW_MEASURE,
+                 'patient': FFTW_PATIENT}
+
+
+def wisdom_file(lenx, leny, lenz, nthreads):
+    """
+    Path of the FFTW wisdom file for a padded grid and a number of threads,
+    or None if the cache is disabled
+    """
+    path = cache_dir('fftw_wisdom')
+    if path is None:
+        return None
+    return os.path.join(path, 'wisdom_{}x{}x{}_{}threads.dat'.format(
+        lenx, leny, lenz, nthreads))
+
 cdef extern from "dipolar.h":
     # used for demag
     ctypedef struct fft_demag_plan:
@@ -11,6 +47,13 @@ cdef extern from "dipolar.h":
         double dx, dy, dz
         int lenx, leny, lenz
         int total_length
+        int thin_film
+        int replicas
+        int nthreads
+        unsigned int fftw_flags
+        int complex_length
+        int klenx, kleny, klenz
+        int tensor_length
         double *tensor_xx
         double *tensor_xy
         double *tensor_xz
@@ -23,54 +66,107 @@ cdef extern from "dipolar.h":
         double *mx
         double *my
         double *mz
-        complex *Nxx
-        complex *Nxy
-        complex *Nxz
-        complex *Nyy
-        complex *Nyz
-        complex *Nzz
+        double *Nxx
+        double *Nxy
+        double *Nxz
+        double *Nyy
+        double *Nyz
+        double *Nzz
         complex *Hx
         complex *Hy
         complex *Hz
         complex *Mx
         complex *My
         complex *Mz
+        int single
 
     fft_demag_plan * create_plan()
     void finalize_plan(fft_demag_plan * plan)
-    void init_plan(fft_demag_plan * plan, double dx, double dy, double dz, int nx,int ny, int nz)
+    fft_demag_plan * create_replica_plan(fft_demag_plan * base, int replicas)
+    void init_plan(fft_demag_plan * plan, double dx, double dy, double dz, int nx,int ny, int nz, int thin_film)
     void compute_fields(fft_demag_plan * plan, double *spin, double *mu_s, double *field)
+    void compute_fields_single(fft_demag_plan * plan, double *spin, double *mu_s, double *field)
     void exact_compute(fft_demag_plan * plan, double *spin, double *mu_s, double *field)
     double compute_demag_energy(fft_demag_plan *plan, double *spin, double *mu_s, double *field, double *energy)
     void compute_dipolar_tensors(fft_demag_plan *plan)
     void compute_demag_tensors(fft_demag_plan *plan)
     void create_fftw_plan(fft_demag_plan *plan)
+    void free_real_tensors(fft_demag_plan *plan)
+    void enable_single_precision(fft_demag_plan *plan)
+    void free_double_buffers(fft_demag_plan *plan)
     void compute_demag_tensors_2dpbc(fft_demag_plan *plan, double *tensors, double pbc_2d_error, int sample_repeat_nx, int sample_repeat_ny, double dipolar_radius)
     void fill_demag_tensors_c(fft_demag_plan *plan, double *tensors)
 
 cdef class FFTDemag(object):
     cdef fft_demag_plan *_c_plan
-    cdef public int total_length, lenx, leny, lenz, lenxy
-    cdef np.float64_t[:] tensor_xx_p, tensor_xy_p, tensor_xz_p, tensor_yy_p, \
-                         tensor_yz_p, tensor_zz_p, hx_p, hy_p, hz_p, mx_p, my_p, mz_p
-    cdef np.complex128_t[:] Nxx_p, Nxy_p, Nxz_p, Nyy_p, Nyz_p, Nzz_p, Hx_p, \
-                            Hy_p, Hz_p, Mx_p, My_p, Mz_p
-    cdef public np.ndarray tensor_xx, tensor_xy, tensor_xz, tensor_yy, \
-                         tensor_yz, tensor_zz, Nxx, Nxy, Nxz, Nyy, Nyz, Nzz, \
+    cdef public int total_length, complex_length, tensor_length
+    cdef public int lenx, leny, lenz, lenxy
+    cdef public object wisdom, precision, single_error
+    cdef np.float64_t[:] Nxx_p, Nxy_p, Nxz_p, Nyy_p, Nyz_p, Nzz_p, \
+                         hx_p, hy_p, hz_p, mx_p, my_p, mz_p
+    cdef np.complex128_t[:] Hx_p, Hy_p, Hz_p, Mx_p, My_p, Mz_p
+    # The real space tensors are freed once they are transformed, and the
+    # k-space tensors N** only hold the octant kx, ky, kz >= 0
+    cdef public np.ndarray Nxx, Nxy, Nxz, Nyy, Nyz, Nzz, \
                          Mx, My, Mz, Hx, Hy, Hz, hx, hy, hz, mx, my, mz
     #tensor_type could be 'dipolar', 'demag' or '2d_pbc'
-    def __cinit__(self, dx, dy, dz, nx, ny, nz, tensor_type='dipolar'):
+    #planning is the FFTW planning effort: 'estimate', 'measure' or 'patient'
+    #threads is the number of FFTW threads, by default the OpenMP threads
+    #wisdom enables the per-user cache of FFTW wisdom, so plans are only
+    #measured once for every padded grid size and number of threads
+    #tensor_cache enables the on-disk cache of the k-space demag tensors
+    #precision='single' uses a float32 convolution (see compute_field)
+    #thin_film (experimental) uses 2D FFTs and couples the layers directly
+    #in k-space, so the z direction is not padded. It needs about half the
+    #memory of the 3D convolution, but it is slower, so it is off by default
+    def __cinit__(self, dx, dy, dz, nx, ny, nz, tensor_type='dipolar',
+                  planning='measure', threads=0, wisdom=True,
+                  tensor_cache=True, precision='double', thin_film=False):
+        if planning not in FFTW_PLANNING:
+            raise Exception("Only support planning options 'estimate', "
+                            "'measure' and 'patient'.")
+        if precision not in ('double', 'single'):
+            raise Exception("Only support precision options 'double' "
+                            "and 'single'.")
+        self.precision = precision
+        self.single_error = None
         self._c_plan = create_plan()
         if self._c_plan is NULL:
             raise MemoryError()
-        init_plan(self._c_plan, dx, dy, dz, nx, ny, nz)
+        init_plan(self._c_plan, dx, dy, dz, nx, ny, nz, int(thin_film))
+        self._c_plan.fftw_flags = FFTW_PLANNING[planning]
+        if threads > 0:
+            self._c_plan.nthreads = threads
+
+        # Wisdom is only useful for plans which are actually measured
+        self.wisdom = None
+        if wisdom and planning != 'estimate':
+            self.wisdom = wisdom_file(self._c_plan.lenx, self._c_plan.leny,
+                                      self._c_plan.lenz,
+                                      self._c_plan.nthreads)
 
+        cache = None
         if tensor_type == 'dipolar':
             compute_dipolar_tensors(self._c_plan)
-            create_fftw_plan(self._c_plan)
+            self._create_fftw_plan()
         elif tensor_type == 'demag':
-            compute_demag_tensors(self._c_plan)
-            create_fftw_plan(self._c_plan)
+            if tensor_cache:
+                cache = TensorCache()
+            # The tensors only depend on the mesh and on the radius of the
+            # asymptotic expansion hardcoded in compute_demag_tensors
+            params = {'type': 'demag', 'version': TENSOR_CACHE_VERSION,
+                      'n': (nx, ny, nz),
+                      'd': (repr(dx), repr(dy), repr(dz)),
+                      'asymptotic_radius': 26,
+                      'thin_film': bool(self._c_plan.thin_film)}
+            cached = cache.load(params) if cache is not None else None
+            if cached is not None:
+                # The k-space tensors are copied below, once the arrays
+                # are exposed
+                free_real_tensors(self._c_plan)
+            else:
+                compute_demag_tensors(self._c_plan)
+            self._create_fftw_plan()
         elif tensor_type == '2d_pbc':
             pass
 
@@ -78,38 +174,47 @@ cdef class FFTDemag(object):
             raise Exception("Only support options 'dipolar', 'demag' and '2d_pbc'.")
 
         self.total_length = int(self._c_plan.total_length)
+        self.complex_length = int(self._c_plan.complex_length)
+        self.tensor_length = int(self._c_plan.tensor_length)
         self.lenx = int(self._c_plan.lenx)
         self.leny = int(self._c_plan.leny)
         self.lenz = int(self._c_plan.lenz)
         self.lenxy = self.lenx*self.leny
-        self.tensor_xx_p = <np.float64_t[:self.total_length]> self._c_plan.tensor_xx
-        self.tensor_xx = np.asarray(self.tensor_xx_p)
 
-        self.Nxx_p = <np.complex128_t[:self.total_length]> self._c_plan.Nxx
+        self.Nxx_p = <np.float64_t[:self.tensor_length]> self._c_plan.Nxx
         self.Nxx = np.asarray(self.Nxx_p)
-        self.Nxy_p = <np.complex128_t[:self.total_length]> self._c_plan.Nxy
+        self.Nxy_p = <np.float64_t[:self.tensor_length]> self._c_plan.Nxy
         self.Nxy = np.asarray(self.Nxy_p)
-        self.Nxz_p = <np.complex128_t[:self.total_length]> self._c_plan.Nxz
+        self.Nxz_p = <np.float64_t[:self.tensor_length]> self._c_plan.Nxz
         self.Nxz = np.asarray(self.Nxz_p)
-        self.Nyy_p = <np.complex128_t[:self.total_length]> self._c_plan.Nyy
+        self.Nyy_p = <np.float64_t[:self.tensor_length]> self._c_plan.Nyy
         self.Nyy = np.asarray(self.Nyy_p)
-        self.Nyz_p = <np.complex128_t[:self.total_length]> self._c_plan.Nyz
+        self.Nyz_p = <np.float64_t[:self.tensor_length]> self._c_plan.Nyz
         self.Nyz = np.asarray(self.Nyz_p)
-        self.Nzz_p = <np.complex128_t[:self.total_length]> self._c_plan.Nzz
+        self.Nzz_p = <np.float64_t[:self.tensor_length]> self._c_plan.Nzz
         self.Nzz = np.asarray(self.Nzz_p)
 
-        self.Mx_p = <np.complex128_t[:self.total_length]> self._c_plan.Mx
+        if cache is not None:
+            names = ('Nxx', 'Nxy', 'Nxz', 'Nyy', 'Nyz', 'Nzz')
+            if cached is not None:
+                for name in names:
+                    getattr(self, name)[:] = cached[name]
+            else:
+                cache.save(params, **{name: getattr(self, name)
+                                      for name in names})
+
+        self.Mx_p = <np.complex128_t[:self.complex_length]> self._c_plan.Mx
         self.Mx = np.asarray(self.Mx_p)
-        self.My_p = <np.complex128_t[:self.total_length]> self._c_plan.My
+        self.My_p = <np.complex128_t[:self.complex_length]> self._c_plan.My
         self.My = np.asarray(self.My_p)
-        self.Mz_p = <np.complex128_t[:self.total_length]> self._c_plan.Mz
+        self.Mz_p = <np.complex128_t[:self.complex_length]> self._c_plan.Mz
         self.Mz = np.asarray(self.Mz_p)
 
-        self.Hx_p = <np.complex128_t[:self.total_length]> self._c_plan.Hx
+        self.Hx_p = <np.complex128_t[:self.complex_length]> self._c_plan.Hx
         self.Hx = np.asarray(self.Hx_p)
-        self.Hy_p = <np.complex128_t[:self.total_length]> self._c_plan.Hy
+        self.Hy_p = <np.complex128_t[:self.complex_length]> self._c_plan.Hy
         self.Hy = np.asarray(self.Hy_p)
-        self.Hz_p = <np.complex128_t[:self.total_length]> self._c_plan.Hz
+        self.Hz_p = <np.complex128_t[:self.complex_length]> self._c_plan.Hz
         self.Hz = np.asarray(self.Hz_p)
 
         self.hx_p = <np.float64_t[:self.total_length]> self._c_plan.hx
@@ -126,16 +231,9 @@ cdef class FFTDemag(object):
         self.mz_p = <np.float64_t[:self.total_length]> self._c_plan.mz
         self.mz = np.asarray(self.mz_p)
 
-        self.tensor_xy_p = <np.float64_t[:self.total_length]> self._c_plan.tensor_xy
-        self.tensor_xy = np.asarray(self.tensor_xy_p)
-        self.tensor_xz_p = <np.float64_t[:self.total_length]> self._c_plan.tensor_xz
-        self.tensor_xz = np.asarray(self.tensor_xz_p)
-        self.tensor_yy_p = <np.float64_t[:self.total_length]> self._c_plan.tensor_yy
-        self.tensor_yy = np.asarray(self.tensor_yy_p)
-        self.tensor_yz_p = <np.float64_t[:self.total_length]> self._c_plan.tensor_yz
-        self.tensor_yz = np.asarray(self.tensor_yz_p)
-        self.tensor_zz_p = <np.float64_t[:self.total_length]> self._c_plan.tensor_zz
-        self.tensor_zz = np.asarray(self.tensor_zz_p)
+        # The 2D PBC tensors are only known after fill_demag_tensors
+        if tensor_type != '2d_pbc':
+            self._enable_single_precision()
 
 
     def print_tensor(self):
@@ -161,12 +259,70 @@ cdef class FFTDemag(object):
 
     def fill_demag_tensors(self, np.ndarray[double, ndim=1, mode="c"] tensors):
         fill_demag_tensors_c(self._c_plan, &tensors[0])
+        self._create_fftw_plan()
+        self._enable_single_precision()
+
+    cdef _enable_single_precision(self):
+        if self.precision == 'single' and not self._c_plan.single:
+            enable_single_precision(self._c_plan)
+
+    cdef _create_fftw_plan(self):
+        """
+        Create the FFTW plans, importing the cached wisdom before and
+        storing the updated wisdom afterwards
+        """
+        cdef char *exported
+
+        if self.wisdom is not None and os.path.exists(self.wisdom):
+            with open(self.wisdom, 'rb') as f:
+                fftw_import_wisdom_from_string(f.read())
+
         create_fftw_plan(self._c_plan)
 
+        if self.wisdom is not None:
+            exported = fftw_export_wisdom_to_string()
+            if exported is not NULL:
+                try:
+                    atomic_write(self.wisdom, <bytes> exported)
+                except OSError:
+                    pass
+                finally:
+                    fftw_free(exported)
+
     def compute_field(self,np.ndarray[double, ndim=1, mode="c"] spin,
                         np.ndarray[double, ndim=1, mode="c"] mu_s,
                         np.ndarray[double, ndim=1, mode="c"] field):
-        compute_fields(self._c_plan, &spin[0], &mu_s[0], &field[0])
+        """
+        In single precision mode, the first call also computes the field
+        in double precision and stores the relative error of the single
+        precision field (maximum norm) in self.single_error. The double
+        precision work buffers are freed afterwards
+        """
+        cdef np.ndarray[double, ndim=1, mode="c"] reference
+
+        if not self._c_plan.single:
+            compute_fields(self._c_plan, &spin[0], &mu_s[0], &field[0])
+            return
+
+        compute_fields_single(self._c_plan, &spin[0], &mu_s[0], &field[0])
+
+        if self.single_error is None:
+            reference = np.zeros_like(field)
+            compute_fields(self._c_plan, &spin[0], &mu_s[0], &reference[0])
+            norm = np.max(np.abs(reference))
+            self.single_error = np.max(np.abs(field - reference)) / norm if norm > 0 else 0.0
+            log.info("Single precision demag, relative error with respect "
+                     "to the double precision field: {:.3g}".format(self.single_error))
+
+            free_double_buffers(self._c_plan)
+            self.Mx = self.My = self.Mz = None
+            self.Hx = self.Hy = self.Hz = None
+            self.mx = self.my = self.mz = None
+            self.hx = self.hy = self.hz = None
+            self.Mx_p = self.My_p = self.Mz_p = None
+            self.Hx_p = self.Hy_p = self.Hz_p = None
+            self.mx_p = self.my_p = self.mz_p = None
+            self.hx_p = self.hy_p = self.hz_p = None
 
     def compute_exact(self,
                       np.ndarray[double, ndim=1, mode="c"] spin,
@@ -184,6 +340,42 @@ cdef class FFTDemag(object):
                                     &field[0], &energy[0])
 
 
+cdef class FFTDemagReplicas(object):
+    """
+    Field of several replicas of the system of an FFTDemag (e.g. the
+    simulations of an Ensemble), which share its k-space tensors. The FFTs
+    of all the replicas are done in a single batch. The spins and fields
+    hold the sites of all the replicas one after the other, while mu_s
+    (the same for every replica) has the sites of one. The convolution is
+    in double precision, also for single precision FFTDemag objects
+    """
+    cdef fft_demag_plan *_c_plan
+    cdef public int replicas, n
+
+    def __cinit__(self, FFTDemag demag, int replicas):
+        if replicas < 1:
+            raise ValueError("replicas must be >= 1")
+        self._c_plan = create_replica_plan(demag._c_plan, replicas)
+        if self._c_plan is NULL:
+            raise MemoryError()
+        self.replicas = replicas
+        self.n = self._c_plan.nx * self._c_plan.ny * self._c_plan.nz
+
+    def __dealloc__(self):
+        if self._c_plan is not NULL:
+            finalize_plan(self._c_plan)
+            self._c_plan = NULL
+
+    def compute_field(self, np.ndarray[double, ndim=1, mode="c"] spin,
+                      np.ndarray[double, ndim=1, mode="c"] mu_s,
+                      np.ndarray[double, ndim=1, mode="c"] field):
+        if (spin.shape[0] != 3 * self.n * self.replicas or
+                field.shape[0] != spin.shape[0] or mu_s.shape[0] != self.n):
+            raise ValueError("spin and field must have 3 * n * replicas "
+                             "entries and mu_s n entries")
+        compute_fields(self._c_plan, &spin[0], &mu_s[0], &field[0])
+
+
 cdef extern from "demagcoef.h":
     double CalculateSDA00(double x, double y, double z, double dx,double dy,double dz)
     double DemagNxxAsymptotic(double x, double y, double z, double dx,double dy,double dz)
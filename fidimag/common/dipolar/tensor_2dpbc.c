@@ -178,26 +178,43 @@ void fill_demag_tensors_c(fft_demag_plan *plan, double *tensors){
     int lenz = plan->lenz;
     int len_xy = lenx * leny;
 
-    int x,y,z, id, index;
-                    
+    int x, y, z, id, index;
+    double sx, sy, sz;
+
+    // The tensors are given for non negative displacements, so we fill the
+    // padded arrays using the same wrap around order than
+    // compute_demag_tensors, where the off diagonal components are odd
+    // with respect to the displacement along their two directions
     for (int k = 0; k < lenz; k++) {
         for (int j = 0; j < leny; j++) {
             for (int i = 0; i < lenx; i++) {
                 index = k * len_xy + j * lenx + i;
 
-                x = abs(i - nx + 1);
-                y = abs(j - ny + 1);
-                z = abs(k - nz + 1);
+                if ((lenx%2 == 0 && i == nx) || (leny%2 == 0 && j == ny) || (lenz%2 == 0 && k == nz)) {
+                    plan->tensor_xx[index] = 0.0;
+                    plan->tensor_yy[index] = 0.0;
+                    plan->tensor_zz[index] = 0.0;
+                    plan->tensor_xy[index] = 0.0;
+                    plan->tensor_xz[index] = 0.0;
+                    plan->tensor_yz[index] = 0.0;
+                    continue;
+                }
+
+                x = (i < nx) ? i : lenx - i;
+                y = (j < ny) ? j : leny - j;
+                z = (k < nz) ? k : lenz - k;
+                sx = (i < nx) ? 1.0 : -1.0;
+                sy = (j < ny) ? 1.0 : -1.0;
+                sz = (k < nz) ? 1.0 : -1.0;
 
                 id = z*nxy + y*nx + x;
 
                 plan->tensor_xx[index] = tensors[id];
                 plan->tensor_yy[index] = tensors[id+nxyz];
                 plan->tensor_zz[index] = tensors[id+2*nxyz];
-                plan->tensor_xy[index] = tensors[id+3*nxyz];
-                plan->tensor_xz[index] = tensors[id+4*nxyz];
-                plan->tensor_yz[index] = tensors[id+5*nxyz];
-                //printf("%g  %g  %g  \n", tensors[id], tensors[id+nxyz], tensors[id+2*nxyz]);
+                plan->tensor_xy[index] = sx * sy * tensors[id+3*nxyz];
+                plan->tensor_xz[index] = sx * sz * tensors[id+4*nxyz];
+                plan->tensor_yz[index] = sy * sz * tensors[id+5*nxyz];
             }
         }
     }
@@ -5,8 +5,28 @@ import os
 import numpy as np
 import zipfile
 import fidimag.common.helper as helper
+import fidimag.extensions.common_clib as clib
+from fidimag.common.fileio import SampleBuffer
+from fidimag.common.profiler import Profiler
 from fidimag.common.integrators import CvodeSolver, CvodeSolver_OpenMP, \
-    StepIntegrator, ScipyIntegrator
+    StepIntegrator, ScipyIntegrator, CayleyIntegrator
+
+
+class Event(object):
+    """
+    Zero crossing of fn(t, spin) located by the integrator during the time
+    evolution, see DriverBase.add_event. The times at which it was found
+    are appended to the times list
+    """
+
+    def __init__(self, fn, direction=0, terminal=True):
+        if direction not in (-1, 0, 1):
+            raise ValueError("direction is {}, should be -1, 0 or 1".format(
+                direction))
+        self.fn = fn
+        self.direction = direction
+        self.terminal = terminal
+        self.times = []
 
 
 class DriverBase(object):
@@ -14,6 +34,10 @@ class DriverBase(object):
     Common methods for the micromagnetic and atomistic driver classes
     """
 
+    # Integrators which keep |m| = 1 by themselves, see norm_correction
+    norm_preserving_integrators = ('rk45_sphere', 'rk23_sphere', 'cayley')
+    _integrator_type = None
+
     def __init__(self):
         pass
 
@@ -31,6 +55,26 @@ class DriverBase(object):
         self.integrator_tolerances_set = False
         self.step = 0
 
+        # When True, the interactions sum their fields directly into the
+        # effective field array, skipping the per-interaction field arrays
+        self.fused_field = False
+
+        # Local field Jacobian for the CVODE preconditioner, allocated when
+        # it is first needed
+        self._local_jac = None
+        self._field_jac = None
+
+        # When True, CVODE evaluates the right hand side through the
+        # compiled pipeline of build_native_rhs, without calling sundials_rhs
+        self.native_rhs = False
+
+        # Events located by the integrator (see add_event)
+        self.events = []
+
+        # Profiler of the simulation, see enable_profiling
+        self.profiler = None
+        self._profiling = False
+
     def get_alpha(self):
         """
         Returns the array with the spatially dependent Gilbert damping
@@ -72,6 +116,17 @@ class DriverBase(object):
 
     alpha = property(get_alpha, set_alpha)
 
+    @property
+    def norm_correction(self):
+        """
+        Factor of the term of the equation of motion that pulls |m| back to
+        1, passed to the right hand side kernels: default_c, or 0 with the
+        integrators which keep |m| = 1 by themselves
+        """
+        if self._integrator_type in self.norm_preserving_integrators:
+            return 0
+        return self.default_c
+
     def set_integrator(self, integrator, use_jac):
         # Integrator options --------------------------------------------------
 
@@ -80,9 +135,18 @@ class DriverBase(object):
         # sundials_rhs function from any of the micromagnetic drivers in the
         # micromagnetic folder (LLG, LLG_STT, etc.)
 
+        # With use_jac, drivers that define sundials_psetup also get the
+        # block diagonal preconditioner for the Krylov (SPGMR) solver
+        psetup = getattr(self, 'sundials_psetup', None)
+
+        # default_c is kept, so it applies again if the integrator is
+        # changed back (see norm_correction)
+        self._integrator_type = integrator
+
         if integrator == "sundials" and use_jac:
             self.integrator = CvodeSolver(self.spin, self.sundials_rhs,
-                                          self.sundials_jtimes)
+                                          self.sundials_jtimes,
+                                          psetup_fun=psetup)
         elif integrator == "sundials_diag":
             self.integrator = CvodeSolver(self.spin, self.sundials_rhs,
                                           linear_solver="diag")
@@ -92,10 +156,27 @@ class DriverBase(object):
             self.integrator = StepIntegrator(self.spin, self.step_rhs)
         elif integrator == "scipy":
             self.integrator = ScipyIntegrator(self.spin, self.step_rhs)
+        elif integrator in ["rk45", "rk23", "rk45_sphere", "rk23_sphere"]:
+            # Adaptive explicit Runge-Kutta methods, for non stiff problems.
+            # The _sphere variants project the spins onto the unit sphere
+            # at every step, instead of using the default_c correction
+            normalise = integrator.endswith("_sphere")
+            self.integrator = clib.RKIntegrator(self.spin, self.sundials_rhs,
+                                                integrator[:4], normalise)
+        elif integrator == "cayley":
+            # Fixed step geometric integrator which keeps |m| = 1, see
+            # CayleyIntegrator. The step is set with set_options(stepsize=)
+            axis_fun = getattr(self, 'cayley_axis', None)
+            if axis_fun is None:
+                raise NotImplementedError(
+                    "The cayley integrator is only available for the LLG "
+                    "and SLLG drivers")
+            self.integrator = CayleyIntegrator(self.spin, axis_fun)
 
         elif integrator == "sundials_openmp" and use_jac:
             self.integrator = CvodeSolver_OpenMP(self.spin, self.sundials_rhs,
-                                                 self.sundials_jtimes)
+                                                 self.sundials_jtimes,
+                                                 psetup_fun=psetup)
         elif integrator == "sundials_diag_openmp":
             self.integrator = CvodeSolver_OpenMP(self.spin, self.sundials_rhs,
                                                  linear_solver="diag")
@@ -107,11 +188,111 @@ class DriverBase(object):
         else:
             raise NotImplemented("integrator must be sundials, euler or rk4")
 
+        if self.events:
+            self.set_events()
+
+        if self._profiling:
+            self.profile_integrator()
+
     # ------------------------------------------------------------------------
 
     def stat(self):
         return self.integrator.stat()
 
+    def enable_profiling(self):
+        """
+        Start collecting the number of calls and the wall time of:
+
+            rhs, jtimes, psetup  :: the functions called by the integrator
+                                    (right hand side of the driver
+                                    equation, Jacobian times vector and
+                                    preconditioner setup)
+            field/{name}         :: the field of every interaction
+            data_saver.save      :: the writing of the data table
+            vtk.write, npy.write :: the writing of VTK and NPY files
+
+        The times are inclusive, e.g. the right hand side includes the
+        fields. The interactions added afterwards are not profiled, and
+        with native_rhs only the interactions computed in Python are.
+
+        The counters continue from the previous values if the profiling
+        was enabled before. See profile_report and save_profile
+        """
+        if self._profiling:
+            return
+        if self.profiler is None:
+            self.profiler = Profiler()
+
+        for obj in self.interactions:
+            self.profiler.patch(obj, 'compute_field',
+                                'field/{}'.format(obj.name))
+            self.profiler.patch(obj, 'add_field',
+                                'field/{}'.format(obj.name))
+        self.profiler.patch(self.data_saver, 'save', 'data_saver.save')
+        self.profiler.patch(getattr(self, 'VTK', None), 'write_file',
+                            'vtk.write')
+        self.profiler.patch(self, 'write_npy', 'npy.write')
+
+        self._profiling = True
+        self.profile_integrator()
+
+    def profile_integrator(self):
+        # The integrators store the functions they call, so these are
+        # replaced in the integrator rather than in the driver
+        get_callbacks = getattr(self.integrator, 'get_callbacks', None)
+        if get_callbacks is None:
+            return
+
+        self._callbacks = get_callbacks()
+        self.integrator.set_callbacks(
+            **{name: self.profiler.wrap(fun, name)
+               for name, fun in self._callbacks.items() if callable(fun)})
+
+    def disable_profiling(self):
+        """
+        Stop the profiling and remove its overhead. The counters are kept
+        """
+        if not self._profiling:
+            return
+
+        self.profiler.restore()
+        if getattr(self.integrator, 'get_callbacks', None) is not None:
+            self.integrator.set_callbacks(**self._callbacks)
+        self._profiling = False
+
+    def profile_report(self):
+        """
+        Returns a dictionary with the profiling counters (see
+        enable_profiling) and, in 'integrator', the statistics of the
+        integrator (e.g. for CVODE, the number of steps, nonlinear and
+        linear iterations, error test failures and the method order)
+        """
+        if self.profiler is None:
+            raise ValueError("The profiling has not been enabled, "
+                             "call enable_profiling first")
+
+        report = self.profiler.report()
+        report['integrator'] = self.integrator_counters()
+        return report
+
+    def save_profile(self, filename):
+        """
+        Write the report of profile_report to a JSON file
+        """
+        if self.profiler is None:
+            raise ValueError("The profiling has not been enabled, "
+                             "call enable_profiling first")
+
+        self.profiler.save(filename, integrator=self.integrator_counters())
+
+    def integrator_counters(self):
+        counters = getattr(self.integrator, 'counters', None)
+        if counters is None:
+            return {}
+        data = counters()
+        data['name'] = self.integrator.__class__.__name__
+        return data
+
     def set_default_options(self):
         pass
 
@@ -124,6 +305,11 @@ class DriverBase(object):
         self.t = t  # also reinitialise the simulation time and step
         self.step = 0
 
+        # Fields extrapolated in time do not extrapolate across the reset
+        for obj in self.interactions:
+            if getattr(obj, 'extrapolator', None) is not None:
+                obj.extrapolator.reset()
+
     def set_tols(self, rtol=1e-8, atol=1e-10):
         """
         Set the relative and absolute tolerances for the CVODE integrator
@@ -140,14 +326,165 @@ class DriverBase(object):
 
         self.field[:] = 0
 
+        if self.fused_field:
+            # Interactions with a C kernel accumulate into self.field in a
+            # single pass; the rest fall back to the usual summation
+            for obj in self.interactions:
+                add_field = getattr(obj, 'add_field', None)
+                if add_field is not None:
+                    add_field(self.field, t)
+                else:
+                    self.field += obj.compute_field(t)
+            return
+
         for obj in self.interactions:
             self.field += obj.compute_field(t)
 
+    def compute_local_jacobian(self):
+        """
+        Returns the derivative of the effective field at every site with
+        respect to the spin at the same site (3x3 row major blocks, 9
+        entries per site), summed over the interactions that provide it
+        """
+        if self._local_jac is None:
+            self._local_jac = np.zeros(9 * self.n)
+
+        self._local_jac[:] = 0
+        for obj in self.interactions:
+            add_local_jacobian = getattr(obj, 'add_local_jacobian', None)
+            if add_local_jacobian is not None:
+                add_local_jacobian(self._local_jac)
+
+        return self._local_jac
+
     def compute_effective_field_jac(self, t, spin):
-        self.field[:] = 0
+        """
+        Returns the field of the interactions which are linear in the spin
+        (obj.jac), evaluated at *spin*. It is used for the Jacobian-times-
+        vector product, so it is stored in its own array to keep self.field
+        with the effective field of the current integrator state
+        """
+        if self._field_jac is None:
+            self._field_jac = np.zeros_like(self.field)
+
+        self._field_jac[:] = 0
         for obj in self.interactions:
             if obj.jac:
-                self.field += obj.compute_field(t, spin=spin)
+                self._field_jac += obj.compute_field(t, spin=spin)
+
+        return self._field_jac
+
+    def build_native_rhs(self):
+        """
+        Returns the compiled right hand side of the driver equation, used
+        when native_rhs is True, or None if the driver does not have one
+        """
+        return None
+
+    def native_llg_rhs(self):
+        """
+        Compiled right hand side of the LLG equation. The fields of the
+        interactions with a C entry point (a c_field_term method) are
+        computed in C with the CVODE state; the rest are computed in Python
+        after copying the state into self.spin
+        """
+        terms = []
+        py_interactions = []
+        for obj in self.interactions:
+            c_field_term = getattr(obj, 'c_field_term', None)
+            if c_field_term is not None:
+                terms.append(c_field_term())
+            else:
+                py_interactions.append(obj)
+
+        py_fields = None
+        if py_interactions:
+            def py_fields(t):
+                self.t = t
+                for obj in py_interactions:
+                    self.field += obj.compute_field(t)
+
+        return clib.LLGPipeline(terms, py_fields,
+                                self.spin, self.field,
+                                self._alpha, self._pins,
+                                self.gamma, self.n,
+                                self.do_precession, self.norm_correction)
+
+    def update_native_rhs(self):
+        """
+        Pass the compiled right hand side to the integrator (if it supports
+        it). It is rebuilt on every call, so changes to the interactions or
+        their parameters between runs are taken into account
+        """
+        set_native_rhs = getattr(self.integrator, 'set_native_rhs', None)
+        if set_native_rhs is None:
+            return
+
+        pipeline = None
+        if self.native_rhs:
+            pipeline = self.build_native_rhs()
+        set_native_rhs(pipeline)
+
+    def add_event(self, fn, direction=0, terminal=True):
+        """
+        Locate the times where fn(t, spin) crosses zero during the time
+        integration, e.g. the switching time of the average m_z:
+
+            sim.driver.add_event(lambda t, m: np.mean(m[2::3]), direction=-1)
+
+        CVODE finds the crossings within its own steps, so run_until can be
+        called with long time intervals.
+
+        direction   :: 1 (-1) to only detect crossings where fn increases
+                       (decreases), 0 to detect both
+        terminal    :: If True, run_until stops at the time of the event
+
+        Returns the Event, whose times attribute lists the crossings found
+        """
+        event = Event(fn, direction, terminal)
+        self.events.append(event)
+        self.set_events()
+
+        return event
+
+    def clear_events(self):
+        """
+        Remove all the events added with add_event
+        """
+        self.events = []
+        self.set_events()
+
+    def set_events(self):
+        """
+        Pass the root functions of the events to the integrator
+        """
+        set_root_fun = getattr(self.integrator, 'set_root_fun', None)
+        if set_root_fun is None:
+            if self.events:
+                raise NotImplementedError(
+                    "Events are only supported by the CVODE integrators")
+            return
+
+        set_root_fun(self.events_fun, len(self.events),
+                     [event.direction for event in self.events])
+
+    def events_fun(self, t, spin, gout):
+        for i, event in enumerate(self.events):
+            gout[i] = event.fn(t, spin)
+
+    def process_events(self):
+        """
+        Record the time of the events found by the integrator when it
+        stopped at a root. Returns the first terminal event, or None
+        """
+        terminal = None
+        for event, root in zip(self.events, self.integrator.get_root_info()):
+            if root != 0:
+                event.times.append(self.integrator.t)
+                if event.terminal and terminal is None:
+                    terminal = event
+
+        return terminal
 
     def compute_dmdt(self, dt):
         m0 = self.spin_last
@@ -164,12 +501,15 @@ class DriverBase(object):
         The integrator was specified with the right hand side of the
         driver equation
 
+        If a terminal event (see add_event) is found first, the integration
+        stops at the time of the event, which is returned
         """
 
         if t <= self.t:
             if t == self.t and self.t == 0.0:
                 self.compute_effective_field(t)
                 self.data_saver.save()
+                self.data_saver.flush()
                 return
             else:
                 raise ValueError("t must be >= sim.t")
@@ -178,12 +518,25 @@ class DriverBase(object):
 
         self.spin_last[:] = self.spin[:]
 
-        flag = ode.run_until(t)
+        self.update_native_rhs()
 
-        if flag < 0:
-            raise Exception("Run cython run_until failed!!!")
+        # The integrator returns 1 when it stops at an event
+        event = None
+        while event is None:
+            flag = ode.run_until(t)
+
+            if flag < 0:
+                raise Exception("Run cython run_until failed!!!")
+            elif flag != 1:
+                break
 
-        self.spin[:] = ode.y[:]
+            event = self.process_events()
+        if event is not None:
+            t = ode.t
+
+        # CVODE writes the solution directly into the spin array
+        if ode.y is not self.spin:
+            self.spin[:] = ode.y[:]
 
         self.t = t
         self.step += 1
@@ -191,6 +544,66 @@ class DriverBase(object):
         # Update field before saving data
         self.compute_effective_field(t)
         self.data_saver.save()
+        self.data_saver.flush()
+
+        return event
+
+    def sample(self, times, buffer=None):
+        """
+        Evolve the system up to the last of the (increasing) *times*,
+        storing the spins at every one of them in *buffer*, a SampleBuffer
+        (by default, a new one with space for all the samples), which is
+        returned.
+
+        Unlike calling run_until at every time, the integrator steps are not
+        cut at the sample times: the spins are interpolated from the CVODE
+        steps, so fine time series (e.g. for spectra) do not slow down the
+        integration. As in run_until, a terminal event stops the sampling
+        """
+        times = np.asarray(times, dtype=float)
+        if len(times) == 0:
+            raise ValueError("times must not be empty")
+        if times[0] < self.t:
+            raise ValueError("times must be >= sim.t")
+
+        ode = self.integrator
+        if getattr(ode, 'sample', None) is None:
+            raise NotImplementedError(
+                "Sampling is only supported by the CVODE integrators")
+
+        if buffer is None:
+            buffer = SampleBuffer(len(times), self.n)
+
+        self.spin_last[:] = self.spin[:]
+
+        self.update_native_rhs()
+
+        i = 0
+        event = None
+        while i < len(times) and event is None:
+            # Samples are written in contiguous pieces of the ring buffer
+            start = buffer.count % buffer.size
+            k = min(len(times) - i, buffer.size - start)
+            n = ode.sample(times[i:i + k], buffer.m[start:start + k])
+
+            buffer.t[start:start + n] = times[i:i + n]
+            buffer.count += n
+            i += n
+            if n < k:
+                event = self.process_events()
+
+        if ode.y is not self.spin:
+            self.spin[:] = ode.y[:]
+
+        self.t = ode.t
+        self.step += 1
+
+        self.compute_effective_field(self.t)
+        self.data_saver.save()
+        self.data_saver.flush()
+
+        buffer.flush()
+        return buffer
 
     def relax(self, dt=10e-12, stopping_dmdt=0.01, max_steps=1000,
               save_m_steps=100, save_vtk_steps=100,
@@ -235,6 +648,8 @@ class DriverBase(object):
         if save_vtk_steps is not None:
             self.save_vtk()
 
+        self.data_saver.flush()
+
     # -------------------------------------------------------------------------
     # Save functions ----------------------------------------------------------
     # -------------------------------------------------------------------------
@@ -253,7 +668,7 @@ class DriverBase(object):
         if not os.path.exists('%s_npys' % self.name):
             os.makedirs('%s_npys' % self.name)
         name = '%s_npys/m_%g.npy' % (self.name, self.step)
-        np.save(name, self.spin)
+        self.write_npy(name, self.spin)
         if ZIP:
             with zipfile.ZipFile('%s_m.zip'%self.name, 'a') as myzip:
                 myzip.write(name)
@@ -275,4 +690,7 @@ class DriverBase(object):
         name = '%s_skx_npys/m_%g.npy' % (self.name, self.step)
 
         # The _skx_number array is defined in the SimBase class in Common
-        np.save(name, self._skx_number)
+        self.write_npy(name, self._skx_number)
+
+    def write_npy(self, name, array):
+        np.save(name, array)
@@ -0,0 +1,273 @@
+from __future__ import division
+import numpy as np
+import fidimag.common.helper as helper
+import fidimag.extensions.common_clib as clib
+import fidimag.extensions.clib as atom_clib
+from fidimag.common.integrators import CvodeSolver
+
+
+class Ensemble(object):
+    """
+
+    Independent replicas of a simulation, evolved together with the LLG
+    equation as a single state array, e.g. for hysteresis loops or thermal
+    statistics of small systems, where running a simulation per process
+    (see BatchTasks) is dominated by the setup of every simulation.
+
+    The replicas share the mesh and the interactions of *sim* (a
+    micromagnetic or atomistic Sim with the LLG driver), so demag tensors,
+    FFT plans and neighbour tables are only created once. Every replica has
+    its own spins, applied field (added to the effective field of the
+    interactions), damping and, for atomistic simulations, temperature:
+
+        sim = Sim(mesh)
+        sim.Ms = 8.6e5
+        sim.add(UniformExchange(A=1.3e-11))
+        sim.add(Demag())
+
+        ensemble = Ensemble(sim, 100)
+        ensemble.set_m((1, 0, 0))
+        for k, H in enumerate(np.linspace(-1e5, 1e5, 100)):
+            ensemble.set_field((H, 0, 0), replica=k)
+        ensemble.relax()
+        mx = ensemble.compute_average()[:, 0]
+
+    The fields of the exchange, anisotropy, Zeeman and demag interactions
+    are computed for all the replicas in a single call (see the
+    add_field_replicas method of the interactions), with the material
+    parameters of the interactions at the first evaluation. Other
+    interactions are computed replica by replica, using sim.spin as a work
+    array. Demag computes the field of every replica at every evaluation,
+    without calc_every or extrapolation. The LLG equation is evaluated for
+    all the replicas at once, and integrated
+    with CVODE or, when a temperature is set, with a fixed step
+    stochastic Heun scheme (Cayley updates, as in the SLLG driver).
+
+    ARGUMENTS:
+
+    sim         :: Sim with the LLG driver and the interactions of the
+                   replicas
+    replicas    :: Number of replicas
+
+    OPTIONAL ARGUMENTS:
+
+    rtol, atol  :: Tolerances of CVODE
+    dt          :: Time step for the stochastic integration
+    seed        :: Seed of the random numbers of the thermal field
+
+    The spins of the replicas are in the rows of the array m, and the
+    time in t
+
+    """
+
+    def __init__(self, sim, replicas, rtol=1e-8, atol=1e-10, dt=1e-15,
+                 seed=100):
+        # fidimag.common is imported before the micro and atomistic packages
+        import fidimag.micro.llg as micro_llg
+        import fidimag.atomistic.llg as atomistic_llg
+
+        self.driver = sim.driver
+        if not isinstance(self.driver, (micro_llg.LLG, atomistic_llg.LLG)):
+            raise NotImplementedError(
+                "Ensembles are only available for the LLG driver")
+
+        self.sim = sim
+        self.mesh = sim.mesh
+        self.replicas = replicas
+        self.n = sim.n
+        self.t = 0
+        self.dt = dt
+
+        # Sites of all the replicas
+        n = replicas * self.n
+        self.spin = np.tile(sim.spin, replicas)
+        self.field = np.zeros(3 * n)
+        self.field_applied = np.zeros(3 * n)
+        self.alpha = np.tile(self.driver._alpha, replicas)
+        self.pins = np.tile(self.driver._pins, replicas)
+        self.T = np.zeros(n)
+
+        # Views with a row per replica
+        self.m = self.spin.reshape(replicas, -1)
+        self.fields = self.field.reshape(replicas, -1)
+        self.fields_applied = self.field_applied.reshape(replicas, -1)
+
+        # Arrays of the stochastic integration
+        self.mu_s_inv = np.tile(sim._magnetisation_inv, replicas)
+        self.eta = np.zeros(3 * n)
+        self.field_th = np.zeros(3 * n)
+        self.spin_pred = np.zeros(3 * n)
+        self.w1 = np.zeros(3 * n)
+        self.w2 = np.zeros(3 * n)
+        self.mt19937 = atom_clib.rng_mt19937()
+        self.mt19937.set_seed(seed)
+
+        self.spin_last = np.zeros(3 * n)
+
+        self.integrator = CvodeSolver(self.spin, self.sundials_rhs)
+        self.integrator.set_options(rtol, atol)
+
+    def replica_indexes(self, replica):
+        if replica is None:
+            return range(self.replicas)
+        return [replica]
+
+    def reset_integrator(self):
+        self.integrator.reset(self.spin, self.t)
+
+    def set_m(self, m0, replica=None, normalise=True):
+        """
+        Set the spins of a replica (all of them by default), with any of the
+        values accepted by Sim.set_m
+        """
+        m = helper.init_vector(m0, self.mesh, 3, normalise)
+        # No spins at sites without material
+        m.shape = (-1, 3)
+        m[self.sim._magnetisation == 0] = 0
+        m.shape = (-1,)
+
+        for k in self.replica_indexes(replica):
+            self.m[k] = m
+        self.reset_integrator()
+
+    def set_field(self, H, replica=None):
+        """
+        Set the applied field of a replica (all of them by default), as a
+        uniform vector, a function of the position or an array, in the
+        units of the interaction fields of the simulation
+        """
+        field = helper.init_vector(H, self.mesh, 3)
+        for k in self.replica_indexes(replica):
+            self.fields_applied[k] = field
+        self.reset_integrator()
+
+    def set_alpha(self, alpha, replica=None):
+        """
+        Set the Gilbert damping of a replica (all of them by default)
+        """
+        alpha = helper.init_scalar(alpha, self.mesh)
+        for k in self.replica_indexes(replica):
+            self.alpha[k * self.n:(k + 1) * self.n] = alpha
+        self.reset_integrator()
+
+    def set_T(self, T, replica=None):
+        """
+        Set the temperature of a replica (all of them by default). Only
+        for atomistic simulations
+        """
+        if not hasattr(self.sim, 'mu_s'):
+            raise NotImplementedError(
+                "Temperatures are only available for atomistic simulations")
+
+        T = helper.init_scalar(T, self.mesh)
+        for k in self.replica_indexes(replica):
+            self.T[k * self.n:(k + 1) * self.n] = T
+
+    def compute_effective_field(self, t, spin):
+        """
+        Compute the effective field of every replica, with the spins of all
+        the replicas in the array *spin*
+        """
+        self.field[:] = self.field_applied
+
+        for obj in self.driver.interactions:
+            add_field_replicas = getattr(obj, 'add_field_replicas', None)
+            if add_field_replicas is not None:
+                add_field_replicas(spin, self.field, self.replicas, t)
+                continue
+
+            spin_saved = self.sim.spin.copy()
+            for k, m in enumerate(spin.reshape(self.replicas, -1)):
+                self.sim.spin[:] = m
+                self.fields[k] += obj.compute_field(t)
+            self.sim.spin[:] = spin_saved
+
+    def sundials_rhs(self, t, y, ydot):
+        self.compute_effective_field(t, y)
+
+        clib.compute_llg_rhs(ydot,
+                             y,
+                             self.field,
+                             self.alpha,
+                             self.pins,
+                             self.driver.gamma,
+                             self.replicas * self.n,
+                             self.driver.do_precession,
+                             self.driver.default_c)
+        return 0
+
+    def run_step_thermal(self, dt):
+        n = self.replicas * self.n
+        gamma = self.driver.gamma
+
+        # The same thermal field is used in both stages (Stratonovich)
+        self.mt19937.fill_vector_gaussian(self.eta)
+        atom_clib.compute_thermal_field(self.field_th, self.T, self.alpha,
+                                        self.mu_s_inv, self.eta, self.pins,
+                                        n, gamma, dt)
+
+        self.compute_effective_field(self.t, self.spin)
+        self.field += self.field_th
+        clib.compute_llg_cayley_axis(self.w1, self.spin, self.field,
+                                     self.alpha, self.pins, gamma, n,
+                                     self.driver.do_precession, dt)
+        clib.compute_cayley_update(self.spin_pred, self.spin,
+                                   self.w1, self.w1, n)
+
+        self.compute_effective_field(self.t + dt, self.spin_pred)
+        self.field += self.field_th
+        clib.compute_llg_cayley_axis(self.w2, self.spin_pred, self.field,
+                                     self.alpha, self.pins, gamma, n,
+                                     self.driver.do_precession, dt)
+        clib.compute_cayley_update(self.spin, self.spin,
+                                   self.w1, self.w2, n)
+
+    def run_until(self, t):
+        """
+        Evolve all the replicas until the time t
+        """
+        if t < self.t:
+            raise ValueError("t must be >= ensemble.t")
+
+        if np.any(self.T > 0):
+            while t - self.t > 1e-30:
+                dt = min(self.dt, t - self.t)
+                self.run_step_thermal(dt)
+                self.t += dt
+            self.t = t
+            self.reset_integrator()
+            return
+
+        flag = self.integrator.run_until(t)
+        if flag < 0:
+            raise Exception("Run cython run_until failed!!!")
+        self.t = t
+
+    def compute_average(self):
+        """
+        Returns an array with the average spin (3 components) of every
+        replica
+        """
+        m = self.spin.reshape(self.replicas, -1, 3)
+        return np.sum(m, axis=1) / self.sim.n_nonzero
+
+    def compute_dmdt(self, dt):
+        """
+        Returns the maximum of |dm/dt| of every replica since the last call
+        of relax
+        """
+        dm = (self.spin - self.spin_last).reshape(self.replicas, -1, 3)
+        return np.max(np.sqrt(np.sum(dm ** 2, axis=2)), axis=1) / dt
+
+    def relax(self, dt=10e-12, stopping_dmdt=0.01, max_steps=1000):
+        """
+        Evolve the replicas until dm/dt < stopping_dmdt in all of them,
+        checking every dt, as in the relax method of the driver
+        """
+        for step in range(max_steps):
+            self.spin_last[:] = self.spin
+            self.run_until(self.t + dt)
+
+            dmdt = self.compute_dmdt(dt)
+            if np.max(dmdt) < stopping_dmdt * self.driver._dmdt_factor:
+                break
@@ -0,0 +1,138 @@
+"""
+Multi-rate evaluation of fields which are expensive to compute and change
+slowly, such as the demagnetising field: the field is extrapolated in time
+from its last full evaluations, and only computed again when the estimated
+extrapolation error is too large.
+"""
+import numpy as np
+
+
+def lagrange_weights(nodes, t):
+    """
+    Weights w_i of the values at the nodes, such that sum(w_i f_i) is the
+    polynomial through the points (nodes_i, f_i) evaluated at t
+    """
+    w = np.ones(len(nodes))
+    for i in range(len(nodes)):
+        for j in range(len(nodes)):
+            if i != j:
+                w[i] *= (t - nodes[j]) / (nodes[i] - nodes[j])
+    return w
+
+
+class FieldExtrapolation(object):
+    """
+    Polynomial extrapolation in time of the field computed by
+    compute_fun(m, out), from its last full evaluations.
+
+    order       :: 1 (linear) or 2 (quadratic) extrapolation, from the
+                   last (order + 1) evaluations
+
+    rtol        :: The error of the extrapolation is estimated as its
+                   difference with the extrapolation of one order higher
+                   (which uses one evaluation more). The field is computed
+                   again when this is larger than rtol times the maximum
+                   value of the last evaluated field, or when a component
+                   of the spins m differs more than rtol from the spins
+                   extrapolated (with the same weights) from the spins of
+                   the evaluations
+
+    max_dm      :: The field is also computed again when a spin component
+                   changed more than max_dm since the last evaluation
+
+    Extrapolations farther from the evaluations than the time spanned by
+    them are not done. Since the extrapolated field is a smooth function of
+    time with a controlled error, the adaptive step size of the integrators
+    is not affected, unlike when an old field is reused (calc_every).
+
+    Comparing the spins with their extrapolation bounds the change of m
+    which the extrapolated field does not follow (e.g. in the corrector
+    iterations of CVODE within a step) by rtol, so the error of the field
+    is of the order of rtol relative to its magnitude. Jumps of the spins
+    (set_m, reset_integrator) are not extrapolated: the simulation calls
+    reset() then, which discards the previous evaluations.
+
+    n_calls and n_evals count the requested and computed fields
+    """
+
+    def __init__(self, compute_fun, size, order=2, rtol=1e-3, max_dm=0.05):
+        if order not in (1, 2):
+            raise ValueError("order is {}, should be 1 or 2".format(order))
+
+        self.compute_fun = compute_fun
+        self.order = order
+        self.rtol = rtol
+        self.max_dm = max_dm
+
+        self.fields = np.zeros((order + 2, size))
+        self.ms = np.zeros((order + 2, size))
+        self.times = np.zeros(order + 2)
+        self.m_last = np.zeros(size)
+        self.scale = 0
+
+        self.n_calls = 0
+        self.n_evals = 0
+        self.reset()
+
+    def reset(self):
+        """
+        Discard the previous evaluations
+        """
+        # Rows of fields with evaluations, from the oldest to the newest
+        self.slots = []
+
+    def compute(self, t, m, field):
+        """
+        Write into *field* the field for the spins *m* at time t
+        """
+        self.n_calls += 1
+        if len(self.slots) == len(self.times) and \
+                self.extrapolate(t, m, field):
+            return field
+
+        self.evaluate(t, m, field)
+        return field
+
+    def extrapolate(self, t, m, field):
+        times = self.times[self.slots]
+        span = times.max() - times.min()
+        if t < times.min() - span or t > times.max() + span:
+            return False
+
+        if np.max(np.abs(m - self.m_last)) > self.max_dm:
+            return False
+
+        w_high = lagrange_weights(times, t)
+        w = np.zeros_like(w_high)
+        w[1:] = lagrange_weights(times[1:], t)
+
+        if np.max(np.abs(m - np.dot(w, self.ms[self.slots]))) > self.rtol:
+            return False
+
+        fields = self.fields[self.slots]
+        error = np.max(np.abs(np.dot(w_high - w, fields)))
+        if error > self.rtol * self.scale:
+            return False
+
+        field[:] = np.dot(w, fields)
+        return True
+
+    def evaluate(self, t, m, field):
+        # An evaluation at the time of a previous one replaces it
+        times = list(self.times[self.slots])
+        if t in times:
+            slot = self.slots.pop(times.index(t))
+        elif len(self.slots) == len(self.times):
+            slot = self.slots.pop(0)
+        else:
+            slot = min(set(range(len(self.times))) - set(self.slots))
+
+        self.compute_fun(m, self.fields[slot])
+        self.times[slot] = t
+        self.ms[slot] = m
+        self.slots.append(slot)
+        self.m_last[:] = m
+        self.scale = np.max(np.abs(self.fields[slot]))
+        self.n_evals += 1
+
+        field[:] = self.fields[slot]
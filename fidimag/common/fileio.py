@@ -1,13 +1,146 @@
+import json
 import os
+import weakref
 import numpy as np
 import re  # For cvode RHS output
 
 
+class TextBackend(object):
+    """
+    Writes the data table as a text file: two comment lines with the
+    headers and the units, followed by a line per saved row. This is the
+    default format of DataSaver.
+
+    The rows are kept in memory and written every buffer_rows rows (by
+    default, at every save)
+    """
+
+    extension = '.txt'
+
+    def __init__(self, filename, buffer_rows=1):
+        self.filename = filename
+        self.buffer_rows = max(1, buffer_rows)
+        self.lines = []
+
+    def start(self, saver):
+        self.float_format = saver.float_format
+        self.indent = ' ' * len(saver.comment_symbol)
+        self.lines = []
+        with open(self.filename, 'w') as f:
+            f.write(saver.headers())
+
+    def append(self, values):
+        self.lines.append(self.indent +
+                          "".join(self.float_format % v for v in values) +
+                          '\n')
+        if len(self.lines) >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+        with open(self.filename, 'a') as f:
+            f.write("".join(self.lines))
+        self.lines = []
+
+
+def _npy_header(rows):
+    """
+    Header of a .npy file (format 1.0) with a float64 vector of length
+    rows. It is padded to a fixed size, so the length can be updated in
+    place when rows are appended to the file
+    """
+    header = "{'descr': '<f8', 'fortran_order': False, 'shape': (%d,), }" \
+        % rows
+    header = header.ljust(NpyBackend.header_size - 11) + '\n'
+    return (np.lib.format.MAGIC_PREFIX + b'\x01\x00' +
+            np.uint16(len(header)).astype('<u2').tobytes() +
+            header.encode('latin1'))
+
+
+class NpyBackend(object):
+    """
+    Writes the data table in binary, as a directory with a .npy file
+    (float64) per column and a JSON file, header.json, with the headers
+    and the units of the columns. The rows are kept in memory and
+    appended to the column files every buffer_rows rows, or when flush()
+    is called. The column files can be read with np.load, or with
+    DataReader, which maps them into memory
+    """
+
+    extension = '.table'
+    header_size = 128
+
+    def __init__(self, filename, buffer_rows=100):
+        self.filename = filename
+        self.buffer_rows = max(1, buffer_rows)
+
+    def column_file(self, i):
+        return os.path.join(self.filename, 'col_%d.npy' % i)
+
+    def start(self, saver):
+        self.headers, self.units = saver.columns()
+        ncols = len(self.headers)
+
+        if not os.path.exists(self.filename):
+            os.makedirs(self.filename)
+        for i in range(ncols):
+            with open(self.column_file(i), 'wb') as f:
+                f.write(_npy_header(0))
+        with open(os.path.join(self.filename, 'header.json'), 'w') as f:
+            json.dump({'headers': self.headers, 'units': self.units}, f,
+                      indent=2)
+
+        # Rows in the columns of buffer
+        self.buffer = np.zeros((ncols, self.buffer_rows))
+        self.count = 0
+        self.rows = 0
+
+    def append(self, values):
+        if len(values) != len(self.buffer):
+            raise ValueError("The table has {} columns, got {} values. "
+                             "Entities cannot be added after the first "
+                             "save".format(len(self.buffer), len(values)))
+        self.buffer[:, self.count] = values
+        self.count += 1
+        if self.count == self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        if not getattr(self, 'count', 0):
+            return
+        # The data is written before the header, so an interrupted flush
+        # leaves the files with the previous rows
+        header = _npy_header(self.rows + self.count)
+        for i, column in enumerate(self.buffer):
+            with open(self.column_file(i), 'r+b') as f:
+                f.seek(0, 2)
+                f.write(column[:self.count].astype('<f8').tobytes())
+                f.seek(0)
+                f.write(header)
+        self.rows += self.count
+        self.count = 0
+
+
 class DataSaver(object):
+    """
+    Saves a row with the values of the entities (time, average spin,
+    energies...) of a simulation at every call of save().
+
+    The format of the table is given by backend: 'txt' (TextBackend, the
+    default), 'npy' (NpyBackend), or an instance of a class with the
+    methods start(saver), append(values) and flush(). Rows can be kept in
+    memory and written every buffer_rows saves; flush() writes them
+    immediately, which is also done when the DataSaver is deleted or the
+    interpreter exits. See set_backend
+    """
 
     comment_symbol = '# '
 
-    def __init__(self, sim, filename, entities=None):
+    backends = {'txt': TextBackend, 'npy': NpyBackend}
+
+    def __init__(self, sim, filename, entities=None, backend='txt',
+                 buffer_rows=None):
 
         self.sim = sim
         self.filename = filename
@@ -35,6 +168,42 @@ class DataSaver(object):
         self.save_head = False
         self.entity_order = self.default_entity_order()
 
+        self._finalizer = None
+        self.set_backend(backend, filename, buffer_rows)
+
+    def set_backend(self, backend, filename=None, buffer_rows=None):
+        """
+        Choose the format of the table, before the first save. backend is
+        'txt', 'npy' or a backend instance (then filename and buffer_rows
+        are not used). By default, filename is the current file name with
+        the extension of the backend, e.g. sim.txt -> sim.table for 'npy'
+
+        buffer_rows is the number of rows kept in memory before writing
+        them (by default, 1 for 'txt' and 100 for 'npy')
+        """
+        if self.save_head:
+            raise ValueError("The format cannot be changed after the "
+                             "first save")
+
+        if isinstance(backend, str):
+            if backend not in self.backends:
+                raise ValueError("backend is '{}', should be one of "
+                                 "{}".format(backend, sorted(self.backends)))
+            cls = self.backends[backend]
+            if filename is None:
+                filename = os.path.splitext(self.filename)[0] + cls.extension
+            if buffer_rows is None:
+                backend = cls(filename)
+            else:
+                backend = cls(filename, buffer_rows)
+
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        self.backend = backend
+        self.filename = getattr(backend, 'filename', self.filename)
+        # The buffered rows are written when the saver is deleted or at exit
+        self._finalizer = weakref.finalize(self, backend.flush)
+
     def default_entity_order(self):
         keys = set(self.entities.keys())
         # time needs to go first
@@ -50,10 +219,12 @@ class DataSaver(object):
     def update_entity_order(self):
         self.entity_order = self.default_entity_order()
 
-    def headers(self):
-        """return line one and two of ndt data file as string"""
-        line1 = [self.comment_symbol]
-        line2 = [self.comment_symbol]
+    def columns(self):
+        """
+        Returns the lists with the header and the unit of every column
+        """
+        headers = []
+        units = []
         for entityname in self.entity_order:
             colheaders = self.entities[entityname]['header']
             # colheaders can be a 3-tuple ('mx','my','mz'), say
@@ -61,46 +232,61 @@ class DataSaver(object):
             if isinstance(colheaders, str):
                 colheaders = [colheaders]
             for colhead in colheaders:
-                line1.append(self.string_format % colhead)
-                line2.append(self.string_format %
-                             self.entities[entityname]['unit'])
+                headers.append(colhead)
+                units.append(self.entities[entityname]['unit'])
+        return headers, units
+
+    def headers(self):
+        """return line one and two of ndt data file as string"""
+        headers, units = self.columns()
+        line1 = [self.comment_symbol] + [self.string_format % h
+                                         for h in headers]
+        line2 = [self.comment_symbol] + [self.string_format % u
+                                         for u in units]
         return "".join(line1) + "\n" + "".join(line2) + "\n"
 
+    def values(self):
+        """
+        Returns the list with the values of the columns, for the current
+        configuration (nan for entities which are None)
+        """
+        values = []
+        for entityname in self.entity_order:
+            value = self.entities[entityname]['get'](self.sim)
+            if isinstance(value, np.ndarray):
+                values.extend(value)
+            elif isinstance(value, float) or isinstance(value, int):
+                values.append(value)
+            elif value is None:
+                values.append(np.nan)
+            else:
+                msg = "Can only deal with numpy arrays, float and int " + \
+                    "so far, but type is %s" % type(value)
+                raise NotImplementedError(msg)
+        return values
+
     def save(self):
         """Append data (spatial averages of fields) for current configuration"""
 
         if not self.save_head:
-            f = open(self.filename, 'w')
-            # Write header
-            f.write(self.headers())
-            f.close()
+            self.backend.start(self)
             self.save_head = True
 
-        # open file
-        with open(self.filename, 'a') as f:
-            f.write(' ' * len(self.comment_symbol))  # account for comment
+        self.backend.append(self.values())
 
-            for entityname in self.entity_order:
-                value = self.entities[entityname]['get'](self.sim)
-                if isinstance(value, np.ndarray):
-
-                    for v in value:
-                        f.write(self.float_format % v)
-
-                elif isinstance(value, float) or isinstance(value, int):
-                    f.write(self.float_format % value)
-                elif value is None:
-                    #f.write(self.string_format % value)
-                    f.write(self.string_format % "nan")
-                else:
-                    msg = "Can only deal with numpy arrays, float and int " + \
-                        "so far, but type is %s" % type(value)
-                    raise NotImplementedError(msg)
-
-            f.write('\n')
+    def flush(self):
+        """
+        Write the rows kept in memory
+        """
+        self.backend.flush()
 
 
 class DataReader(object):
+    """
+    Reads a table written by DataSaver. Text files are loaded at once,
+    while the columns of binary tables (directories written with the 'npy'
+    backend) are mapped into memory when they are first accessed
+    """
 
     # open ndt file
     def __init__(self, filename):
@@ -114,6 +300,10 @@ class DataReader(object):
     def reload(self):
         """Read Table data file"""
 
+        if os.path.isdir(self.filename):
+            self.reload_npy()
+            return
+
         try:
             self.f = open(self.filename, 'r')
         except IOError:
@@ -149,10 +339,42 @@ class DataReader(object):
             datadic[entity] = self.data[:, i]
 
         self.datadic = datadic
+        self.headers = headers[1:]
+        self.units = units[1:]
+
+    def reload_npy(self):
+        try:
+            with open(os.path.join(self.filename, 'header.json')) as f:
+                meta = json.load(f)
+        except IOError:
+            raise RuntimeError("Cannot see the header of the table "
+                               "'%s'" % self.filename)
+
+        self.headers = meta['headers']
+        self.units = meta['units']
+        # Columns are loaded by column()
+        self.datadic = {}
+
+    def column(self, entity):
+        """
+        Returns the data of the column entity. Columns of binary tables
+        are read-only arrays mapped into memory
+        """
+        if entity not in self.datadic:
+            if entity not in self.headers:
+                raise KeyError(entity)
+            i = self.headers.index(entity)
+            name = os.path.join(self.filename, 'col_%d.npy' % i)
+            if os.path.getsize(name) > NpyBackend.header_size:
+                self.datadic[entity] = np.load(name, mmap_mode='r')
+            else:
+                # Empty files cannot be mapped
+                self.datadic[entity] = np.load(name)
+        return self.datadic[entity]
 
     def entities(self):
         """Returns list of available entities"""
-        return self.datadic.keys()
+        return list(self.headers)
 
     def __getitem__(self, entity):
         """
@@ -162,10 +384,53 @@ class DataReader(object):
         the data for the entities.
         """
         if isinstance(entity, str):
-            res = self.datadic[entity]
+            res = self.column(entity)
         elif isinstance(entity, tuple):
-            res = [self.datadic[e] for e in entity]
+            res = [self.column(e) for e in entity]
         else:
             raise TypeError("'entity' must be a string or a tuple. "
                             "Got: {0} ({1})".format(entity, type(entity)))
         return res
+
+
+class SampleBuffer(object):
+    """
+    Ring buffer for the spins sampled with sim.driver.sample, which keeps
+    the last *size* samples. Every row of the data array holds the time
+    followed by the spins, which are also accessible as the views t and m.
+
+    With a filename, data is a .npy file mapped into memory, so the
+    integrator writes the samples directly into the file. It can be read
+    back with np.load
+    """
+
+    def __init__(self, size, n_spins, filename=None):
+        self.size = size
+        shape = (size, 1 + 3 * n_spins)
+        if filename is None:
+            self.data = np.zeros(shape)
+        else:
+            self.data = np.lib.format.open_memmap(filename, mode='w+',
+                                                  dtype=np.float64,
+                                                  shape=shape)
+        self.t = self.data[:, 0]
+        self.m = self.data[:, 1:]
+
+        # Total number of samples written
+        self.count = 0
+
+    def samples(self):
+        """
+        Returns the times and the spins of the stored samples, from the
+        oldest to the most recent
+        """
+        n = min(self.count, self.size)
+        index = (np.arange(n) + self.count - n) % self.size
+        return self.t[index], self.m[index]
+
+    def flush(self):
+        """
+        Write the samples to the file, if there is one
+        """
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
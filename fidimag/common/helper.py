@@ -6,6 +6,25 @@ import fidimag.extensions.clib as clib
 import numpy as np
 
 
+def vectorised(fun):
+    """
+    Mark a function of the position, used to set a scalar or vector field
+    (e.g. with Sim.set_m, Sim.set_Ms or Zeeman), as taking the (n, 3) array
+    with the coordinates of all the mesh sites, instead of a single
+    position. The function is then called once, and it must return an
+    array with the n values (or an (n, 3) array for vector fields), e.g.
+
+        @vectorised
+        def m_init(r):
+            x, y, z = r.T
+            return np.column_stack((np.sin(x), np.cos(x), np.zeros_like(x)))
+
+        sim.set_m(m_init)
+    """
+    fun.vectorised = True
+    return fun
+
+
 def extract_data(mesh, npys, pos, comp='x'):
     """
     extract data of special positions for given npy data
@@ -46,3 +65,16 @@ def compute_RxRy(mesh, spin, nx_start=0, nx_stop=-1, ny_start=0, ny_stop=-1):
     res = clib.compute_RxRy(spin, mesh.nx, mesh.ny,
                             mesh.nz, nx_start, nx_stop, ny_start, ny_stop)
     return res
+
+
+def tile_neighbours(ngbs, replicas):
+    """
+    Neighbours array of *replicas* copies of a mesh with the neighbours
+    array ngbs, whose sites are numbered one copy after the other (as in
+    Ensemble). Missing neighbours (-1) are kept
+    """
+    n = len(ngbs)
+    tiled = np.tile(ngbs, (replicas, 1))
+    offsets = np.repeat(np.arange(replicas, dtype=ngbs.dtype) * n, n)
+    return np.where(tiled >= 0, tiled + offsets[:, np.newaxis],
+                    -1).astype(ngbs.dtype)
@@ -2,8 +2,10 @@
 Implement the time integrators used in the simulation of magnetisation dynamics.
 
 """
+import numpy as np
 from scipy.integrate import ode
 from fidimag.extensions.cvode import CvodeSolver, CvodeSolver_OpenMP
+import fidimag.extensions.common_clib as clib
 import warnings
 
 EPSILON = 1e-16
@@ -29,6 +31,22 @@ class BaseIntegrator(object):
     def rhs_evals(self):
         return self.rhs_evals_nb
 
+    def counters(self):
+        return {'rhs_evals': self.rhs_evals_nb, 't': self.t}
+
+    def get_callbacks(self):
+        """
+        Returns a dictionary with the functions called by the integrator
+        """
+        return {'rhs': self.rhs}
+
+    def set_callbacks(self, rhs=None):
+        """
+        Replace the functions called by the integrator (e.g. to time them)
+        """
+        if rhs is not None:
+            self.rhs = rhs
+
 
 class StepIntegrator(BaseIntegrator):
     def __init__(self, spins, rhs_fun, step="euler", stepsize=1e-15):
@@ -56,17 +74,89 @@ class StepIntegrator(BaseIntegrator):
         self._step = step_choices[step]
 
 
+class CayleyIntegrator(BaseIntegrator):
+    """
+    Fixed step geometric integrator for the LLG equation, written as the
+    rotation dm/dt = w x m of every spin. A step is the Heun predictor-
+    corrector with the rotation vectors w1 = w(m_n, t) and
+    w2 = w(m*, t + h) at the predicted spins m*, where every update is a
+    Cayley transform (see llg.c):
+
+        m* = cay(h w1) m_n,    m_{n+1} = cay(h (w1 + w2) / 2) m_n
+
+    The updates are exact rotations, so |m| is preserved without the
+    default_c correction or renormalisation, and precession is stable for
+    large steps. The method is second order.
+
+    axis_fun(t, y, w, dt) writes dt * w, evaluated with the spins y, into w
+    """
+
+    def __init__(self, spins, axis_fun, stepsize=1e-13):
+        super(CayleyIntegrator, self).__init__(spins, axis_fun)
+        # The state is kept apart from the spins array, which is used by
+        # axis_fun to evaluate the field at the predicted spins
+        self.y = spins.copy()
+        self.n = spins.size // 3
+        self.stepsize = stepsize
+
+        self.y_pred = np.zeros_like(spins)
+        self.w1 = np.zeros_like(spins)
+        self.w2 = np.zeros_like(spins)
+
+    def reset(self, spin, t):
+        self.set_initial_value(spin, t)
+
+    def set_initial_value(self, spins, t):
+        self.y[:] = spins
+        self.t = t
+
+    def set_options(self, rtol=1e-8, atol=1e-8, stepsize=None):
+        """
+        Set the fixed step. The tolerances are accepted so the drivers can
+        call set_tols, but they are not used
+        """
+        if stepsize is not None:
+            self.stepsize = stepsize
+
+    def get_current_step(self):
+        return self.stepsize
+
+    def run_until(self, t):
+        while t - self.t > EPSILON:
+            h = min(self.stepsize, t - self.t)
+
+            self.rhs(self.t, self.y, self.w1, h)
+            clib.compute_cayley_update(self.y_pred, self.y,
+                                       self.w1, self.w1, self.n)
+            self.rhs(self.t + h, self.y_pred, self.w2, h)
+            clib.compute_cayley_update(self.y, self.y,
+                                       self.w1, self.w2, self.n)
+
+            self.t = t if h == t - self.t else self.t + h
+            self.rhs_evals_nb += 2
+        return 0
+
+
 class ScipyIntegrator(BaseIntegrator):
     def __init__(self, spins, rhs_fun):
         super(ScipyIntegrator, self).__init__(spins, rhs_fun)
         self.integrator_created = False
         self.internal_timesteps = [0]
 
+        self.rhs_fun = rhs_fun
+
         def rhs_wrap(y, t):
             self.rhs_evals_nb += 1
-            return rhs_fun(y, t)
+            return self.rhs_fun(y, t)
         self.rhs = rhs_wrap  # overwriting rhs to count evals
 
+    def get_callbacks(self):
+        return {'rhs': self.rhs_fun}
+
+    def set_callbacks(self, rhs=None):
+        if rhs is not None:
+            self.rhs_fun = rhs
+
     def solout(self, t, y):
         self.internal_timesteps.append(t)
         return 0  # all ok signal for scipy
@@ -51,6 +51,17 @@ void llg_rhs_jtimes(double *restrict jtn, double *restrict m, double *restrict h
                     double *restrict alpha, int *restrict pins, double gamma, int n,
                     int do_precession, double default_c);
 
+void llg_local_jac(double *restrict jac, double *restrict m, double *restrict h,
+                   double *restrict local_jac, double *restrict alpha, int *restrict pins,
+                   double gamma, int n, int do_precession, double default_c);
+
+void llg_cayley_axis(double *restrict w, double *restrict m, double *restrict h,
+                     double *restrict alpha, int *restrict pins,
+                     double gamma, int n, int do_precession, double dt);
+
+void cayley_update(double *m_new, double *m, double *restrict w1,
+                   double *restrict w2, int n);
+
 // ----------------------------------------------------------------------------
 // From: stt.c
 
@@ -75,5 +86,38 @@ void sd_compute_step (double *spin, double *spin_last, double *magnetisation, do
                       double *mxH, double *mxmxH, double *mxmxH_last, double tau,
                       int *pins, int n, int counter, double tmin, double tmax);
 
+// ----------------------------------------------------------------------------
+// From rk.c
+
+#define RK45 0
+#define RK23 1
+
+#define RK_STEP_TOO_SMALL -10
+#define RK_MIN_FACTOR 0.2
+#define RK_MAX_FACTOR 5.0
+
+/* Right hand side of dy/dt = f(t, y); a non zero value aborts the
+ * integration and is returned by rk_run_until */
+typedef int (*rk_rhs_fn)(double t, double *y, double *ydot, void *data);
+
+typedef struct {
+    int n, method, stages, order;
+    int normalise;
+    double rtol, atol;
+    double t, h, h_max;
+    double *y, *ytmp, *k[7];
+    int fsal;  // k[0] holds the derivative at (t, y)
+    long nsteps, nfevals, nrejected;
+    rk_rhs_fn rhs;
+    void *data;
+} rk_integrator;
+
+rk_integrator *rk_create(int n, int method);
+
+void rk_free(rk_integrator *rk);
+
+void rk_set_initial_value(rk_integrator *rk, double *y, double t);
+
+int rk_run_until(rk_integrator *rk, double t_final);
 
 #endif
@@ -1,9 +1,13 @@
 cimport numpy as np
 import numpy as np
+np.import_array()
+from libc.string cimport memcpy, memset
+
+include "native_rhs.pxi"
 
 # -----------------------------------------------------------------------------
 
-cdef extern from "common_clib.h":
+cdef extern from "common_clib.h" nogil:
 
     # From: llg.c
     void llg_rhs(double * dm_dt, double * spin,
@@ -16,6 +20,16 @@ cdef extern from "common_clib.h":
                         double gamma, int n,
                         int do_precession, double default_c)
 
+    void llg_local_jac(double *jac, double *m, double *h,
+                       double *local_jac, double *alpha, int *pins,
+                       double gamma, int n, int do_precession, double default_c)
+
+    void llg_cayley_axis(double *w, double *m, double *h,
+                         double *alpha, int *pins,
+                         double gamma, int n, int do_precession, double dt)
+
+    void cayley_update(double *m_new, double *m, double *w1, double *w2, int n)
+
     void compute_stt_field_c(double *spin, double *field,
                              double *jx, double *jy, double *jz,
                              double dx, double dy, double dz, int *ngbs, int n)
@@ -40,6 +54,28 @@ cdef extern from "common_clib.h":
                           double *mxH, double *mxmxH, double *mxmxH_last, double tau,
                           int *pins, int n, int counter, double tmin, double tmax)
 
+    # -------------------------------------------------------------------------
+    # From rk.c
+
+    int RK45, RK23, RK_STEP_TOO_SMALL
+
+    ctypedef int (*rk_rhs_fn)(double t, double *y, double *ydot, void *data)
+
+    ctypedef struct rk_integrator:
+        int n
+        int normalise
+        double rtol, atol
+        double t, h, h_max
+        double *y
+        long nsteps, nfevals, nrejected
+        rk_rhs_fn rhs
+        void *data
+
+    rk_integrator *rk_create(int n, int method)
+    void rk_free(rk_integrator *rk)
+    void rk_set_initial_value(rk_integrator *rk, double *y, double t)
+    int rk_run_until(rk_integrator *rk, double t_final)
+
 # -----------------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 
@@ -64,6 +100,296 @@ def compute_llg_jtimes(double [:] jtn,
     llg_rhs_jtimes(&jtn[0], &m[0], &field[0], &mp[0], &field_p[0],
                    &alpha[0], &pins[0], gamma, n, do_precession, default_c)
 
+
+def compute_llg_local_jac(double [:] jac,
+                          double [:] m,
+                          double [:] field,
+                          double [:] local_jac,
+                          double [:] alpha,
+                          int [:] pins,
+                          gamma, n, do_precession, default_c):
+    llg_local_jac(&jac[0], &m[0], &field[0], &local_jac[0],
+                  &alpha[0], &pins[0], gamma, n, do_precession, default_c)
+
+
+def compute_llg_cayley_axis(double [:] w,
+                            double [:] m,
+                            double [:] field,
+                            double [:] alpha,
+                            int [:] pins,
+                            gamma, n, do_precession, dt):
+    llg_cayley_axis(&w[0], &m[0], &field[0], &alpha[0], &pins[0],
+                    gamma, n, do_precession, dt)
+
+
+def compute_cayley_update(double [:] m_new,
+                          double [:] m,
+                          double [:] w1,
+                          double [:] w2,
+                          n):
+    cayley_update(&m_new[0], &m[0], &w1[0], &w2[0], n)
+
+# -----------------------------------------------------------------------------
+# Compiled right hand side of the LLG equation
+
+cdef struct const_field_params:
+    double *h
+    int n
+
+cdef void const_field_term(void *params, double *m, double *field,
+                           double t) nogil:
+    cdef const_field_params *p = <const_field_params *> params
+    cdef int i
+    for i in range(p.n):
+        field[i] += p.h[i]
+
+def constant_field_term(double [:] field):
+    """
+    C entry point for a static field (e.g. the Zeeman field) stored in the
+    *field* array
+    """
+    cdef const_field_params *p = <const_field_params *> malloc(
+        sizeof(const_field_params))
+    p.h = &field[0]
+    p.n = field.shape[0]
+    return field_term_capsule(const_field_term, p)
+
+
+cdef struct llg_pipeline:
+    field_term *terms
+    int n_terms
+    double *spin
+    double *field
+    double *alpha
+    int *pins
+    double gamma
+    int n
+    int do_precession
+    double default_c
+    void *py_fields
+
+
+cdef int llg_pipeline_rhs(double t, double *y, double *ydot,
+                          void *data) nogil except -1:
+    cdef llg_pipeline *p = <llg_pipeline *> data
+    cdef int i
+
+    memset(p.field, 0, 3 * p.n * sizeof(double))
+    for i in range(p.n_terms):
+        p.terms[i].compute(p.terms[i].params, y, p.field, t)
+
+    # Interactions without a C entry point read the spins from the
+    # simulation array
+    if p.py_fields != NULL:
+        with gil:
+            if p.spin != y:
+                memcpy(p.spin, y, 3 * p.n * sizeof(double))
+            (<object> p.py_fields)(t)
+
+    llg_rhs(ydot, y, p.field, p.alpha, p.pins,
+            p.gamma, p.n, p.do_precession, p.default_c)
+    return 0
+
+
+cdef class LLGPipeline(object):
+    """
+    Right hand side of the LLG equation evaluated in C: the fields of the
+    interactions are summed into *field* by calling their C entry points
+    (*terms*, capsules from the c_field_term methods) directly with the
+    CVODE state, and then the LLG equation is computed, so CVODE does not
+    need the Python interpreter (nor the GIL) to evaluate it.
+
+    *py_fields(t)*, if given, adds to *field* the fields of the interactions
+    without a C entry point; the state is copied into *spin* before calling
+    it. The capsule attribute is passed to CvodeSolver.set_native_rhs
+    """
+    cdef llg_pipeline pipeline
+    cdef native_rhs rhs
+    cdef object terms, py_fields, arrays
+    cdef public object capsule
+
+    def __cinit__(self, terms, py_fields,
+                  double [:] spin,
+                  double [:] field,
+                  double [:] alpha,
+                  int [:] pins,
+                  gamma, n, do_precession, default_c):
+        cdef int i
+
+        # The capsules own the parameters of the C entry points
+        self.terms = list(terms)
+        self.pipeline.n_terms = len(self.terms)
+        self.pipeline.terms = <field_term *> malloc(
+            max(1, len(self.terms)) * sizeof(field_term))
+        for i in range(len(self.terms)):
+            self.pipeline.terms[i] = (<field_term *> PyCapsule_GetPointer(
+                self.terms[i], "fidimag.field_term"))[0]
+
+        self.py_fields = py_fields
+        self.pipeline.py_fields = NULL
+        if py_fields is not None:
+            self.pipeline.py_fields = <void *> py_fields
+
+        self.arrays = (spin, field, alpha, pins)
+        self.pipeline.spin = &spin[0]
+        self.pipeline.field = &field[0]
+        self.pipeline.alpha = &alpha[0]
+        self.pipeline.pins = &pins[0]
+        self.pipeline.gamma = gamma
+        self.pipeline.n = n
+        self.pipeline.do_precession = do_precession
+        self.pipeline.default_c = default_c
+
+        self.rhs.rhs = <int (*)(double, double *, double *, void *) nogil> llg_pipeline_rhs
+        self.rhs.data = &self.pipeline
+        self.capsule = PyCapsule_New(&self.rhs, "fidimag.native_rhs", NULL)
+
+    def __call__(self, t, double [:] y, double [:] ydot):
+        """
+        Evaluate the right hand side, e.g. for testing
+        """
+        llg_pipeline_rhs(t, &y[0], &ydot[0], &self.pipeline)
+
+    def __dealloc__(self):
+        free(self.pipeline.terms)
+
+# -----------------------------------------------------------------------------
+
+cdef class RKIntegrator(object):
+    """
+    Adaptive explicit Runge-Kutta integrator (rk.c), with the interface of
+    CvodeSolver. The method is 'rk45' (Dormand-Prince) or 'rk23'
+    (Bogacki-Shampine); both reuse the last stage of a step as the first
+    one of the next (FSAL). rhs_fun(t, y, ydot) is called like the
+    sundials_rhs methods of the drivers: the state is copied into *spins*
+    and ydot is filled in place.
+
+    With normalise, the spins are projected onto the unit sphere at every
+    step, so the drivers drop the default_c correction
+    """
+    cdef rk_integrator *rk
+    cdef public np.ndarray y
+    cdef object rhs_fun, native_pipeline, error
+
+    def __cinit__(self, spins, rhs_fun, method="rk45", normalise=False,
+                  rtol=1e-8, atol=1e-8):
+        if method == "rk45":
+            self.rk = rk_create(spins.size, RK45)
+        elif method == "rk23":
+            self.rk = rk_create(spins.size, RK23)
+        else:
+            raise ValueError(
+                "method is {}, should be rk45 or rk23".format(method))
+
+        # The solution is copied into the spins array after every run
+        self.y = spins
+        self.rhs_fun = rhs_fun
+        self.error = None
+        self.rk.normalise = normalise
+        self.set_native_rhs(None)
+
+        self.set_initial_value(spins, 0)
+        self.set_options(rtol, atol)
+
+    property t:
+        def __get__(self):
+            return self.rk.t
+
+    def set_options(self, rtol, atol, max_step=0):
+        self.rk.rtol = rtol
+        self.rk.atol = atol
+        self.rk.h_max = max_step
+
+    def set_initial_value(self, double[:] spin, t):
+        rk_set_initial_value(self.rk, &spin[0], t)
+        self.y[:] = spin
+
+    def reset(self, double[:] spin, t):
+        self.set_initial_value(spin, t)
+
+    def set_native_rhs(self, pipeline):
+        """
+        Evaluate the right hand side with a compiled pipeline (see
+        LLGPipeline) instead of rhs_fun; None restores rhs_fun
+        """
+        cdef native_rhs *native
+
+        self.native_pipeline = pipeline
+        if pipeline is None:
+            self.rk.rhs = <rk_rhs_fn> rk_python_rhs
+            self.rk.data = <void *> self
+        else:
+            native = <native_rhs *> PyCapsule_GetPointer(
+                pipeline.capsule, "fidimag.native_rhs")
+            self.rk.rhs = <rk_rhs_fn> native.rhs
+            self.rk.data = native.data
+
+    def run_until(self, double t_final):
+        cdef int flag
+
+        with nogil:
+            flag = rk_run_until(self.rk, t_final)
+
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        elif flag == RK_STEP_TOO_SMALL:
+            raise RuntimeError(
+                "RK step size too small at t = {}".format(self.rk.t))
+        elif flag != 0:
+            raise RuntimeError("RK right hand side evaluation failed")
+
+        memcpy(<double *> self.y.data, self.rk.y,
+               self.rk.n * sizeof(double))
+        return 0
+
+    def rhs_evals(self):
+        return self.rk.nfevals
+
+    def stat(self):
+        return self.rk.nsteps, self.rk.nfevals, self.rk.nrejected
+
+    def counters(self):
+        return {'steps': self.rk.nsteps,
+                'rhs_evals': self.rk.nfevals,
+                'rejected_steps': self.rk.nrejected,
+                'current_step': self.rk.h,
+                't': self.rk.t}
+
+    def get_callbacks(self):
+        return {'rhs': self.rhs_fun}
+
+    def set_callbacks(self, rhs=None):
+        if rhs is not None:
+            self.rhs_fun = rhs
+
+    def get_current_step(self):
+        return self.rk.h
+
+    def __repr__(self):
+        return "nsteps = {}, nfevals = {}, nrejected = {}".format(
+            *self.stat())
+
+    def __dealloc__(self):
+        if self.rk != NULL:
+            rk_free(self.rk)
+
+
+cdef int rk_python_rhs(double t, double *y, double *ydot, void *data) with gil:
+    cdef RKIntegrator integrator = <RKIntegrator> data
+    cdef np.npy_intp n = integrator.rk.n
+
+    try:
+        if y != <double *> integrator.y.data:
+            memcpy(<double *> integrator.y.data, y, n * sizeof(double))
+        integrator.rhs_fun(t, integrator.y,
+                           np.PyArray_SimpleNewFromData(1, &n, np.NPY_DOUBLE, ydot))
+    except BaseException as e:
+        # Raised again by run_until, after the C loop returns
+        integrator.error = e
+        return -1
+    return 0
+
 # -----------------------------------------------------------------------------
 
 def compute_stt_field(double [:] spin,
@@ -149,7 +475,20 @@ def normalise(a):
     a[:, 2] /= b
     a.shape = (-1,)
 
+cdef object vectorised_coordinates(mesh):
+    # Read-only view of the coordinates, passed to vectorised functions
+    coordinates = mesh.coordinates.view()
+    coordinates.flags.writeable = False
+    return coordinates
+
 def init_scalar(value, mesh, *args):
+    """
+    Returns an array with the value at every mesh site. value can be a
+    number, an array with n values or a function of the position. Functions
+    marked with helper.vectorised are called once, with the (n, 3) array of
+    coordinates, and must return n values. Other functions are called for
+    every site
+    """
 
     n = mesh.n
 
@@ -157,9 +496,16 @@ def init_scalar(value, mesh, *args):
 
     if isinstance(value, (int, float)):
         mesh_v[:] = value
+    elif getattr(value, 'vectorised', False):
+        v = np.asarray(value(vectorised_coordinates(mesh), *args))
+        if v.shape != (n,):
+            raise ValueError("The vectorised function returned an array "
+                             "of shape {}, should be ({},)".format(v.shape, n))
+        mesh_v[:] = v
     elif hasattr(value, '__call__'):
+        coordinates = mesh.coordinates
         for i in range(n):
-            mesh_v[i] = value(mesh.coordinates[i], *args)
+            mesh_v[i] = value(coordinates[i], *args)
 
     elif isinstance(value, np.ndarray):
         if value.shape == mesh_v.shape:
@@ -170,18 +516,34 @@ def init_scalar(value, mesh, *args):
     return mesh_v
 
 def init_vector(m0, mesh, dim=3, norm=False, *args):
+    """
+    Returns an array with the (dim components) vector at every mesh site,
+    as [v0_x, v0_y, v0_z, v1_x, ...]. m0 can be a vector, an array with
+    the n vectors or a function of the position. Functions marked with
+    helper.vectorised are called once, with the (n, 3) array of
+    coordinates, and must return an (n, dim) array. Other functions are
+    called for every site
+    """
     n = mesh.n
     spin = np.zeros((n, dim))
     if isinstance(m0, list) or isinstance(m0, tuple):
         spin[:, :] = m0
         spin = np.reshape(spin, dim * n, order='C')
+    elif getattr(m0, 'vectorised', False):
+        v = np.asarray(m0(vectorised_coordinates(mesh), *args))
+        if v.shape != (n, dim):
+            raise ValueError("The vectorised function returned an array "
+                             "of shape {}, should be ({}, {})".format(
+                                 v.shape, n, dim))
+        spin[:, :] = v
     elif hasattr(m0, '__call__'):
-        v = m0(mesh.coordinates[0], *args)
+        coordinates = mesh.coordinates
+        v = m0(coordinates[0], *args)
         if len(v) != dim:
             raise Exception(
                 'The length of the value in init_vector method must be {}.'.format(dim))
         for i in range(n):
-            spin[i, :] = m0(mesh.coordinates[i], *args)
+            spin[i, :] = m0(coordinates[i], *args)
         spin = np.reshape(spin, dim * n, order='C')
     elif isinstance(m0, np.ndarray):
         if m0.shape == (dim, ):
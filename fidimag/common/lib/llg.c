@@ -166,50 +166,192 @@ void llg_rhs(double *restrict dm_dt, double *restrict m, double *restrict h, dou
 }
 
 
+/* Product of the Jacobian of the LLG right hand side at the id-th site with
+ * the vector mp (3 components), where hp is the corresponding variation of
+ * the effective field. The result is stored in jtn (3 components) */
+static inline void llg_jtimes_site(double *restrict jtn, double *restrict m,
+                                   double *restrict h, double *restrict mp,
+                                   double *restrict hp, double alpha, double gamma,
+                                   int do_precession, double default_c) {
+
+    double coeff = -gamma / (1.0 + alpha * alpha);
+
+    double mm = m[0] * m[0] + m[1] * m[1] + m[2] * m[2];
+    double mh = m[0] * h[0] + m[1] * h[1] + m[2] * h[2];
+    double mhp = m[0] * hp[0] + m[1] * hp[1] + m[2] * hp[2];
+    double mph = mp[0] * h[0] + mp[1] * h[1] + mp[2] * h[2];
+    double mmp = m[0] * mp[0] + m[1] * mp[1] + m[2] * mp[2];
+
+    // Precession term: m x H_perp = (m * m) m x H_eff
+    if (do_precession) {
+        jtn[0] = coeff * (mm * (cross_x(mp[0], mp[1], mp[2], h[0], h[1], h[2]) +
+                                cross_x(m[0], m[1], m[2], hp[0], hp[1], hp[2])) +
+                          2 * mmp * cross_x(m[0], m[1], m[2], h[0], h[1], h[2]));
+        jtn[1] = coeff * (mm * (cross_y(mp[0], mp[1], mp[2], h[0], h[1], h[2]) +
+                                cross_y(m[0], m[1], m[2], hp[0], hp[1], hp[2])) +
+                          2 * mmp * cross_y(m[0], m[1], m[2], h[0], h[1], h[2]));
+        jtn[2] = coeff * (mm * (cross_z(mp[0], mp[1], mp[2], h[0], h[1], h[2]) +
+                                cross_z(m[0], m[1], m[2], hp[0], hp[1], hp[2])) +
+                          2 * mmp * cross_z(m[0], m[1], m[2], h[0], h[1], h[2]));
+    } else {
+        jtn[0] = 0;
+        jtn[1] = 0;
+        jtn[2] = 0;
+    }
+
+    for (int a = 0; a < 3; a++) {
+        jtn[a] += alpha * coeff * ((mph + mhp) * m[a] + mh * mp[a]
+                                   - 2 * mmp * h[a] - mm * hp[a]);
+        if (default_c > 0) {
+            jtn[a] += default_c * ((1 - mm) * mp[a] - 2 * mmp * m[a]);
+        }
+    }
+}
+
+
 void llg_rhs_jtimes(double *restrict jtn, double *restrict m, double *restrict h, double *restrict mp, double *restrict hp, double *restrict alpha, int *restrict pins,
         double gamma, int n, int do_precession, double default_c) {
 
-    //#pragma omp parallel for private(i,j,k,coeff,mm, mh, c, hpi,hpj,hpk)
+    #pragma omp parallel for
     for (int id = 0; id < n; id++) {
         int i = 3 * id;
-        int j = i + 1;
-        int k = i + 2;
 
+        if (pins[id] > 0) {
+            jtn[i] = 0;
+            jtn[i + 1] = 0;
+            jtn[i + 2] = 0;
+            continue;
+        }
+
+        llg_jtimes_site(&jtn[i], &m[i], &h[i], &mp[i], &hp[i], alpha[id],
+                        gamma, do_precession, default_c);
+    }
+
+}
+
+
+/* The 3x3 blocks of the Jacobian of the LLG right hand side which couple
+ * the three components of the spin at the same site, used by the block
+ * diagonal preconditioner of the CVODE Krylov solver.
+ *
+ * local_jac  :: Derivative of the effective field at every site with respect
+ *               to the spin at the same site, i.e. the local part of the
+ *               field (exchange self term, anisotropy), as 3x3 row major
+ *               blocks:  local_jac[9 * id + 3 * a + b] = d h_a / d m_b
+ *
+ * jac        :: Output array with the 3x3 row major blocks of the LLG
+ *               Jacobian, d (dm_a/dt) / d m_b. Pinned sites get a zero block
+ *
+ * The columns are obtained applying the Jacobian-times-vector product to the
+ * unit vectors, so the neighbours contributions to the field are neglected.
+ * As in llg_rhs_jtimes, the derivative of the adaptive correction factor
+ * (default_c < 0) is not included.
+ */
+void llg_local_jac(double *restrict jac, double *restrict m, double *restrict h,
+                   double *restrict local_jac, double *restrict alpha, int *restrict pins,
+                   double gamma, int n, int do_precession, double default_c) {
+
+    #pragma omp parallel for
+    for (int id = 0; id < n; id++) {
+        int i = 3 * id;
+        double mp[3], hp[3], col[3];
 
-        if (pins[i]>0){
-             continue;
+        if (pins[id] > 0) {
+            for (int a = 0; a < 9; a++) jac[9 * id + a] = 0;
+            continue;
         }
 
-        double coeff = -gamma/(1.0+alpha[i]*alpha[i]);
+        for (int b = 0; b < 3; b++) {
+            for (int a = 0; a < 3; a++) {
+                mp[a] = (a == b) ? 1 : 0;
+                hp[a] = local_jac[9 * id + 3 * a + b];
+            }
 
-        if (do_precession){
-            jtn[i] = coeff*(cross_x(mp[i],mp[j],mp[k],h[i],h[j],h[k])+cross_x(m[i],m[j],m[k],hp[i],hp[j],hp[k]));
-            jtn[j] = coeff*(cross_y(mp[i],mp[j],mp[k],h[i],h[j],h[k])+cross_y(m[i],m[j],m[k],hp[i],hp[j],hp[k]));
-            jtn[k] = coeff*(cross_z(mp[i],mp[j],mp[k],h[i],h[j],h[k])+cross_z(m[i],m[j],m[k],hp[i],hp[j],hp[k]));
-        }else{
-            jtn[i] = 0;
-            jtn[j] = 0;
-            jtn[k] = 0;
+            llg_jtimes_site(col, &m[i], &h[i], mp, hp, alpha[id],
+                            gamma, do_precession, default_c);
+
+            for (int a = 0; a < 3; a++) {
+                jac[9 * id + 3 * a + b] = col[a];
+            }
         }
+    }
+
+}
+
+
+/* Geometric (Cayley transform) integration of the LLG equation.
+ *
+ * Without the correction term, the LLG equation can be written as a
+ * rotation of every spin:
+ *
+ *      dm/dt = w x m    with    w = gamma / (1 + alpha^2) (H + alpha m x H)
+ *
+ * llg_cayley_axis computes the rotation vector w * dt (dt times the field,
+ * so the integrated thermal field of the SLLG equation can be included).
+ * Pinned sites get w = 0. With do_precession = 0 only the damping term
+ * alpha m x H is kept.
+ */
+void llg_cayley_axis(double *restrict w, double *restrict m, double *restrict h,
+                     double *restrict alpha, int *restrict pins,
+                     double gamma, int n, int do_precession, double dt) {
+
+    #pragma omp parallel for
+    for (int id = 0; id < n; id++) {
+        int i = 3 * id;
 
-        double mm = m[i]*m[i] + m[j]*m[j] + m[k]*m[k];
-        double mh = m[i]*h[i] + m[j]*h[j] + m[k]*h[k];
-        double mhp = m[i]*hp[i] + m[j]*hp[j] + m[k]*hp[k];
-        double mph = mp[i]*h[i] + mp[j]*h[j] + mp[k]*h[k];
-        double mmp = m[i]*mp[i] + m[j]*mp[j] + m[k]*mp[k];
-
-        jtn[i] += alpha[i]*coeff*((mph+mhp)*m[i]+mh*mp[i]-2*mmp*h[i]-mm*hp[i]);
-        jtn[j] += alpha[i]*coeff*((mph+mhp)*m[j]+mh*mp[j]-2*mmp*h[j]-mm*hp[j]);
-        jtn[k] += alpha[i]*coeff*((mph+mhp)*m[k]+mh*mp[k]-2*mmp*h[k]-mm*hp[k]);
-
-        
-        if (default_c>0){
-            jtn[i] += default_c *((1-mm)*mp[i]-2*mmp*m[i]);
-            jtn[j] += default_c *((1-mm)*mp[j]-2*mmp*m[j]);
-            jtn[k] += default_c *((1-mm)*mp[k]-2*mmp*m[k]);
+        if (pins[id] > 0) {
+            w[i] = 0;
+            w[i + 1] = 0;
+            w[i + 2] = 0;
+            continue;
         }
 
-    }
+        double coeff = gamma * dt / (1.0 + alpha[id] * alpha[id]);
+        double p = do_precession ? 1 : 0;
+
+        double mxh0 = cross_x(m[i], m[i + 1], m[i + 2], h[i], h[i + 1], h[i + 2]);
+        double mxh1 = cross_y(m[i], m[i + 1], m[i + 2], h[i], h[i + 1], h[i + 2]);
+        double mxh2 = cross_z(m[i], m[i + 1], m[i + 2], h[i], h[i + 1], h[i + 2]);
 
+        w[i] = coeff * (p * h[i] + alpha[id] * mxh0);
+        w[i + 1] = coeff * (p * h[i + 1] + alpha[id] * mxh1);
+        w[i + 2] = coeff * (p * h[i + 2] + alpha[id] * mxh2);
+    }
 }
 
+/* Rotate the spins with the Cayley transform of the mean rotation vector
+ * w = (w1 + w2) / 2 (pass w1 twice for a single vector):
+ *
+ *      m_new = m + 2 / (1 + |a|^2) (a x m + a x (a x m)),   a = w / 2
+ *
+ * which is the implicit midpoint rule m_new = m + w x (m + m_new) / 2 for
+ * a constant w. It is an exact rotation, so |m| is preserved for any step
+ * size. m_new can be the same array as m.
+ */
+void cayley_update(double *m_new, double *m, double *restrict w1,
+                   double *restrict w2, int n) {
+
+    #pragma omp parallel for
+    for (int id = 0; id < n; id++) {
+        int i = 3 * id;
+        double a[3], m0[3], axm[3], axaxm[3];
+
+        for (int j = 0; j < 3; j++) {
+            a[j] = 0.25 * (w1[i + j] + w2[i + j]);
+            m0[j] = m[i + j];
+        }
+        double aa = a[0] * a[0] + a[1] * a[1] + a[2] * a[2];
+
+        axm[0] = cross_x(a[0], a[1], a[2], m0[0], m0[1], m0[2]);
+        axm[1] = cross_y(a[0], a[1], a[2], m0[0], m0[1], m0[2]);
+        axm[2] = cross_z(a[0], a[1], a[2], m0[0], m0[1], m0[2]);
+
+        axaxm[0] = cross_x(a[0], a[1], a[2], axm[0], axm[1], axm[2]);
+        axaxm[1] = cross_y(a[0], a[1], a[2], axm[0], axm[1], axm[2]);
+        axaxm[2] = cross_z(a[0], a[1], a[2], axm[0], axm[1], axm[2]);
+
+        for (int j = 0; j < 3; j++) {
+            m_new[i + j] = m0[j] + 2.0 / (1.0 + aa) * (axm[j] + axaxm[j]);
+        }
+    }
+}
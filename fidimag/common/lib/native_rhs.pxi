@@ -0,0 +1,38 @@
+# Structures for the compiled right hand side of the LLG equation (see
+# LLGPipeline in common_clib.pyx). They are passed between the extension
+# modules inside PyCapsules, so every module that creates or uses them
+# includes this file.
+
+from libc.stdlib cimport malloc, free
+from cpython.pycapsule cimport PyCapsule_New, PyCapsule_GetPointer
+
+# C entry point of an interaction: compute adds the field of the interaction,
+# evaluated with the spins m at time t, to the field array. params points to
+# the parameters of the interaction (the arrays are owned by the interaction)
+cdef struct field_term:
+    void (*compute)(void *params, double *m, double *field, double t) nogil
+    void *params
+
+# Right hand side that CVODE can call directly, without the Python driver
+cdef struct native_rhs:
+    int (*rhs)(double t, double *y, double *ydot, void *data) nogil
+    void *data
+
+
+cdef void _free_field_term(object capsule):
+    cdef field_term *term = <field_term *> PyCapsule_GetPointer(
+        capsule, "fidimag.field_term")
+    free(term.params)
+    free(term)
+
+
+cdef object field_term_capsule(void (*compute)(void *, double *, double *, double) nogil,
+                               void *params):
+    """
+    Wrap the compute function and its (malloc'ed) params in a capsule, which
+    frees them when it is garbage collected
+    """
+    cdef field_term *term = <field_term *> malloc(sizeof(field_term))
+    term.compute = compute
+    term.params = params
+    return PyCapsule_New(term, "fidimag.field_term", _free_field_term)
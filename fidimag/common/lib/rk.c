@@ -0,0 +1,258 @@
+#include "common_clib.h"
+#include <stdlib.h>
+#include <string.h>
+
+/* Adaptive embedded Runge-Kutta methods with the First Same As Last (FSAL)
+ * property:
+ *
+ *      RK45 :: Dormand-Prince 5(4), 7 stages (6 evaluations per step)
+ *      RK23 :: Bogacki-Shampine 3(2), 4 stages (3 evaluations per step)
+ *
+ * The last stage of a step is evaluated at the new solution, so it is the
+ * first stage of the next step. The local error is estimated with the
+ * embedded lower order solution, and the step size is adapted to keep its
+ * weighted RMS norm (with the rtol and atol tolerances) below 1.
+ *
+ * With normalise, the spins (groups of 3 components) are projected onto
+ * the unit sphere before the last stage, so the LLG equation does not need
+ * the default_c correction to keep |m| = 1. As in MuMax3, the last stage
+ * is computed with the projected spins, which keeps the FSAL reuse.
+ */
+
+/* Dormand-Prince tableau (c, a, b = last row of a, and e = b - b*) */
+static const double dp_c[7] = {0, 1. / 5, 3. / 10, 4. / 5, 8. / 9, 1, 1};
+static const double dp_a[7][6] = {
+    {0},
+    {1. / 5},
+    {3. / 40, 9. / 40},
+    {44. / 45, -56. / 15, 32. / 9},
+    {19372. / 6561, -25360. / 2187, 64448. / 6561, -212. / 729},
+    {9017. / 3168, -355. / 33, 46732. / 5247, 49. / 176, -5103. / 18656},
+    {35. / 384, 0, 500. / 1113, 125. / 192, -2187. / 6784, 11. / 84}};
+static const double dp_e[7] = {71. / 57600, 0, -71. / 16695, 71. / 1920,
+                               -17253. / 339200, 22. / 525, -1. / 40};
+
+/* Bogacki-Shampine tableau */
+static const double bs_c[4] = {0, 1. / 2, 3. / 4, 1};
+static const double bs_a[4][6] = {
+    {0},
+    {1. / 2},
+    {0, 3. / 4},
+    {2. / 9, 1. / 3, 4. / 9}};
+static const double bs_e[4] = {-5. / 72, 1. / 12, 1. / 9, -1. / 8};
+
+rk_integrator *rk_create(int n, int method) {
+
+    rk_integrator *rk = (rk_integrator *) malloc(sizeof(rk_integrator));
+
+    rk->n = n;
+    rk->method = method;
+    if (method == RK45) {
+        rk->stages = 7;
+        rk->order = 4;
+    } else {
+        rk->stages = 4;
+        rk->order = 2;
+    }
+
+    rk->normalise = 0;
+    rk->rtol = 1e-6;
+    rk->atol = 1e-6;
+    rk->t = 0;
+    rk->h = 0;
+    rk->h_max = 0;
+    rk->fsal = 0;
+    rk->nsteps = 0;
+    rk->nfevals = 0;
+    rk->nrejected = 0;
+    rk->rhs = NULL;
+    rk->data = NULL;
+
+    /* Preallocated buffers: state, trial state and the stages */
+    rk->y = (double *) malloc(n * sizeof(double));
+    rk->ytmp = (double *) malloc(n * sizeof(double));
+    for (int i = 0; i < rk->stages; i++) {
+        rk->k[i] = (double *) malloc(n * sizeof(double));
+    }
+
+    return rk;
+}
+
+void rk_free(rk_integrator *rk) {
+    free(rk->y);
+    free(rk->ytmp);
+    for (int i = 0; i < rk->stages; i++) {
+        free(rk->k[i]);
+    }
+    free(rk);
+}
+
+void rk_set_initial_value(rk_integrator *rk, double *y, double t) {
+    memcpy(rk->y, y, rk->n * sizeof(double));
+    rk->t = t;
+    /* The stored derivative and step size are no longer valid */
+    rk->fsal = 0;
+    rk->h = 0;
+}
+
+static void project_spins(double *m, int n) {
+    #pragma omp parallel for
+    for (int i = 0; i < n / 3; i++) {
+        double mm = sqrt(m[3 * i] * m[3 * i] + m[3 * i + 1] * m[3 * i + 1] +
+                         m[3 * i + 2] * m[3 * i + 2]);
+        if (mm > 0) {
+            m[3 * i] /= mm;
+            m[3 * i + 1] /= mm;
+            m[3 * i + 2] /= mm;
+        }
+    }
+}
+
+/* Weighted RMS norm of v, using the tolerances with the magnitudes in y0
+ * and y1 (y1 can be NULL) */
+static double rk_norm(rk_integrator *rk, double *v, double *y0, double *y1) {
+    double sum = 0;
+    int n = rk->n;
+
+    #pragma omp parallel for reduction(+:sum)
+    for (int i = 0; i < n; i++) {
+        double y = fabs(y0[i]);
+        if (y1 != NULL && fabs(y1[i]) > y) {
+            y = fabs(y1[i]);
+        }
+        double w = v[i] / (rk->atol + rk->rtol * y);
+        sum += w * w;
+    }
+
+    return sqrt(sum / n);
+}
+
+/* Initial step size from the derivative at the initial state, after
+ * Hairer, Norsett and Wanner, Solving ODEs I, Sec. II.4 */
+static double rk_initial_step(rk_integrator *rk) {
+    double d0 = rk_norm(rk, rk->y, rk->y, NULL);
+    double d1 = rk_norm(rk, rk->k[0], rk->y, NULL);
+
+    if (d0 < 1e-5 || d1 < 1e-5) {
+        return 1e-6;
+    }
+    return 0.01 * d0 / d1;
+}
+
+int rk_run_until(rk_integrator *rk, double t_final) {
+
+    const double *c, *e;
+    const double (*a)[6];
+    int n = rk->n;
+    int s = rk->stages;
+    int flag;
+
+    if (rk->method == RK45) {
+        c = dp_c;
+        a = dp_a;
+        e = dp_e;
+    } else {
+        c = bs_c;
+        a = bs_a;
+        e = bs_e;
+    }
+
+    if (!rk->fsal) {
+        flag = rk->rhs(rk->t, rk->y, rk->k[0], rk->data);
+        rk->nfevals++;
+        if (flag != 0) {
+            return flag;
+        }
+        rk->fsal = 1;
+    }
+
+    if (rk->h <= 0) {
+        rk->h = rk_initial_step(rk);
+    }
+
+    while (rk->t < t_final) {
+        double h = rk->h;
+        int last = 0;
+
+        if (rk->h_max > 0 && h > rk->h_max) {
+            h = rk->h_max;
+        }
+        /* Do not step beyond t_final; the step size is kept for the
+         * next call */
+        if (rk->t + h >= t_final) {
+            h = t_final - rk->t;
+            last = 1;
+        }
+        if (rk->t + h == rk->t) {
+            return RK_STEP_TOO_SMALL;
+        }
+
+        /* The last stage is evaluated at the new solution, in ytmp */
+        for (int i = 1; i < s; i++) {
+            #pragma omp parallel for
+            for (int j = 0; j < n; j++) {
+                double sum = 0;
+                for (int l = 0; l < i; l++) {
+                    sum += a[i][l] * rk->k[l][j];
+                }
+                rk->ytmp[j] = rk->y[j] + h * sum;
+            }
+
+            if (i == s - 1 && rk->normalise) {
+                project_spins(rk->ytmp, n);
+            }
+
+            flag = rk->rhs(rk->t + c[i] * h, rk->ytmp, rk->k[i], rk->data);
+            rk->nfevals++;
+            if (flag != 0) {
+                return flag;
+            }
+        }
+
+        /* Error estimate, stored in the buffer of the second stage, which
+         * is not needed anymore (the first one is kept in case the step is
+         * rejected) */
+        double *err = rk->k[1];
+        #pragma omp parallel for
+        for (int j = 0; j < n; j++) {
+            double sum = 0;
+            for (int l = 0; l < s; l++) {
+                sum += e[l] * rk->k[l][j];
+            }
+            err[j] = h * sum;
+        }
+        double err_norm = rk_norm(rk, err, rk->y, rk->ytmp);
+
+        /* Step size controller with a safety factor */
+        double factor;
+        if (err_norm == 0) {
+            factor = RK_MAX_FACTOR;
+        } else {
+            factor = 0.9 * pow(err_norm, -1.0 / (rk->order + 1));
+            factor = fmin(RK_MAX_FACTOR, fmax(RK_MIN_FACTOR, factor));
+        }
+
+        if (err_norm <= 1) {
+            /* Accept: the new solution and its derivative (FSAL) become
+             * the current ones */
+            double *tmp = rk->y;
+            rk->y = rk->ytmp;
+            rk->ytmp = tmp;
+
+            tmp = rk->k[0];
+            rk->k[0] = rk->k[s - 1];
+            rk->k[s - 1] = tmp;
+
+            rk->t = last ? t_final : rk->t + h;
+            rk->nsteps++;
+            if (!last || h * factor > rk->h) {
+                rk->h = h * factor;
+            }
+        } else {
+            rk->nrejected++;
+            rk->h = h * fmin(1.0, factor);
+        }
+    }
+
+    return 0;
+}
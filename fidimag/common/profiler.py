@@ -0,0 +1,113 @@
+"""
+Wall time and number of calls of the functions called during a simulation
+(interaction fields, right hand side of the driver equation, file output),
+see DriverBase.enable_profiling.
+
+The functions are timed by replacing them with wrappers, which are removed
+when the profiling is disabled, so there is no overhead when it is not used.
+"""
+import json
+import time
+from collections import OrderedDict
+
+
+class Profiler(object):
+    """
+    Collects the number of calls and the (inclusive) wall time of the
+    functions wrapped with wrap() or patch(), grouped by name.
+
+    Times are inclusive: e.g. the time of the right hand side includes the
+    time of the interaction fields computed in it. Nested calls of functions
+    with the same name (e.g. add_field calling compute_field) are counted
+    once
+    """
+
+    def __init__(self):
+        self.timers = OrderedDict()
+        self._patched = []
+        self.reset()
+
+    def reset(self):
+        """
+        Set the counters and the wall time to zero
+        """
+        for timer in self.timers.values():
+            timer[0] = 0
+            timer[1] = 0.0
+        self.start = time.perf_counter()
+
+    def wrap(self, fun, name):
+        """
+        Returns a function that calls fun, adding the number of calls and
+        the time spent in it to the timer called name
+        """
+        # Number of calls, time and depth of the running calls
+        timer = self.timers.setdefault(name, [0, 0.0, 0])
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            if timer[2] > 0:
+                return fun(*args, **kwargs)
+
+            timer[2] = 1
+            start = clock()
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                timer[0] += 1
+                timer[1] += clock() - start
+                timer[2] = 0
+
+        timed.__wrapped__ = fun
+        return timed
+
+    def patch(self, obj, attr, name):
+        """
+        Replace the method (or function attribute) attr of obj with a
+        timed wrapper, which is removed by restore(). Nothing is done if
+        obj does not have attr
+        """
+        fun = getattr(obj, attr, None)
+        if fun is None:
+            return
+
+        # Methods are looked up in the class, so they are restored by
+        # deleting the wrapper from the instance
+        original = fun if attr in getattr(obj, '__dict__', {}) else None
+        setattr(obj, attr, self.wrap(fun, name))
+        self._patched.append((obj, attr, original))
+
+    def restore(self):
+        """
+        Remove the wrappers added with patch()
+        """
+        for obj, attr, original in reversed(self._patched):
+            if original is None:
+                delattr(obj, attr)
+            else:
+                setattr(obj, attr, original)
+        self._patched = []
+
+    def report(self):
+        """
+        Returns a dictionary with the wall time since the profiler was
+        created (or reset) and, for every timer, the number of calls and
+        the total and mean time per call (in seconds)
+        """
+        timers = OrderedDict()
+        for name, (calls, total, _) in self.timers.items():
+            timers[name] = {'calls': calls,
+                            'time': total,
+                            'time_per_call': total / calls if calls else 0.0}
+
+        return {'wall_time': time.perf_counter() - self.start,
+                'timers': timers}
+
+    def save(self, filename, **extra):
+        """
+        Write the report, with the entries in extra, to a JSON file
+        """
+        data = self.report()
+        data.update(extra)
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
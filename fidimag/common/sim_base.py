@@ -76,6 +76,17 @@ class SimBase(object):
                             else:
                                 return (0, 0, -1)
 
+                   * A function marked with fidimag.common.vectorised is
+                   called only once, with the (n, 3) array of the mesh
+                   coordinates, and must return an (n, 3) array, which is
+                   much faster for large meshes:
+
+                        @vectorised
+                        def m_profile(r):
+                            m = np.zeros_like(r)
+                            m[:, 2] = np.where(r[:, 0] > 2, 1, -1)
+                            return m
+
                    * You can also manually specify an array with (3 * n)
                    elements with the spins directions in the following order:
 
@@ -99,11 +110,14 @@ class SimBase(object):
         # with no material, i.e. M_s = 0 or mu_s = 0
         # TODO: Check for atomistic and micromagnetic cases
         self.spin.shape = (-1, 3)
-        for i in range(self.spin.shape[0]):
-            if self._magnetisation[i] == 0:
-                self.spin[i, :] = 0
+        self.spin[self._magnetisation == 0] = 0
         self.spin.shape = (-1,)
 
+        # Fields extrapolated in time do not extrapolate across the new spins
+        for interaction in self.interactions:
+            if getattr(interaction, 'extrapolator', None) is not None:
+                interaction.extrapolator.reset()
+
         # Set the initial state for the Sundials integrator using the
         # spins array
         # Minimiser methods do not have integrator
@@ -150,9 +164,7 @@ class SimBase(object):
 
         # Sites with no material, i.e. Mu_s or mu_s equal to zero,
         # will be pinned
-        for i in range(len(self._magnetisation)):
-            if self._magnetisation[i] == 0.0:
-                self._pins[i] = 1
+        self._pins[self._magnetisation == 0.0] = 1
 
     pins = property(get_pins, set_pins)
 
@@ -342,6 +354,10 @@ class SimBase(object):
         returns a numpy array containing the Demag field.
         """
         field = self.get_interaction(interaction)
+        # With a fused effective field the interaction array is not updated
+        # during the time integration, so we compute it here
+        if getattr(self.driver, 'fused_field', False):
+            field.compute_field(self.driver.t)
         # Copy here to avoid destroying the field accidentally
         # e.g. through reshaping
         f = field.field.copy()
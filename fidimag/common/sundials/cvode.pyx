@@ -6,6 +6,8 @@ np.import_array()  # don't remove or you'll segfault
 from libc.string cimport memcpy
 import sys
 
+include "../lib/native_rhs.pxi"
+
 
 cdef extern from "sundials/sundials_types.h":
     ctypedef double realtype
@@ -142,6 +144,10 @@ cdef extern from "cvode/cvode.h":
     int CVDlsGetNumJacEvals(void *cvode_mem, long int *njevals)
     int CVDlsGetNumRhsEvals(void *cvode_mem, long int *nrevalsLS)
     int CVSpilsGetNumJtimesEvals(void *cvode_mem, long int *njevals)
+    int CVSpilsGetNumLinIters(void *cvode_mem, long int *nliters)
+    int CVSpilsGetNumConvFails(void *cvode_mem, long int *nlcfails)
+    int CVSpilsGetNumPrecEvals(void *cvode_mem, long int *npevals)
+    int CVSpilsGetNumPrecSolves(void *cvode_mem, long int *npsolves)
     
 
 cdef extern from "cvode/cvode_spgmr.h":
@@ -177,117 +183,205 @@ cdef extern from "sundials/sundials_iterative.h":
 cdef extern from "../../atomistic/lib/clib.h":
     void normalise(double * m, int nxyz)
 
+cdef extern from "precond.h":
+    void block_precond_setup(double *pinv, double *jac, double gamma, int n)
+    void block_precond_solve(double *z, double *r, double *pinv, int n)
+
 
 cdef struct cv_userdata:
     void * rhs_fun
-    void * y
-    void * dm_dt
+    void * y  # array with the state seen by the Python callbacks
     void * jvn_fun
-    void * v  # is the vector by which the Jacobian must be multiplied
-    void * jv  # the value of Jacobian times v
+    void * pset_fun
+    void * jac  # 3x3 diagonal blocks of the Jacobian
+    void * pinv  # inverted blocks of the preconditioner I - gamma * J
+    native_rhs * native  # compiled right hand side, NULL to call rhs_fun
+    void * root_fun
+    int nroots
+
+# The N_Vectors are exchanged with the Python callbacks as NumPy arrays which
+# alias their data, so no copies are made. The arrays do not own the memory
+# and are only valid during the callback.
+
+cdef inline np.ndarray nv_array(N_Vector v):
+    cdef np.npy_intp n = (< N_VectorContent_Serial > v.content).length
+    return np.PyArray_SimpleNewFromData(1, &n, np.NPY_DOUBLE,
+                                        (< N_VectorContent_Serial > v.content).data)
+
+cdef inline np.ndarray nv_array_openmp(N_Vector v):
+    cdef np.npy_intp n = (< N_VectorContent_OpenMP > v.content).length
+    return np.PyArray_SimpleNewFromData(1, &n, np.NPY_DOUBLE,
+                                        (< N_VectorContent_OpenMP > v.content).data)
+
 
 cdef inline int copy_arr2nv(double[:] np_x, N_Vector v):
     cdef long int n = (< N_VectorContent_Serial > v.content).length
     cdef void * data_ptr = &np_x[0]
-    memcpy((< N_VectorContent_Serial > v.content).data, data_ptr, n*sizeof(double))
+    if data_ptr != (< N_VectorContent_Serial > v.content).data:
+        memcpy((< N_VectorContent_Serial > v.content).data, data_ptr, n*sizeof(double))
     return 0
 
 cdef inline copy_arr2nv_openmp(double[:] np_x, N_Vector v):
     cdef long int n = (< N_VectorContent_OpenMP > v.content).length
     cdef void * data_ptr = &np_x[0]
-    memcpy((< N_VectorContent_OpenMP > v.content).data, data_ptr, n*sizeof(double))
+    if data_ptr != (< N_VectorContent_OpenMP > v.content).data:
+        memcpy((< N_VectorContent_OpenMP > v.content).data, data_ptr, n*sizeof(double))
     return 0
 
 
+# The interactions read the spins from the simulation array (ud.y), so the
+# state is copied there, unless CVODE is already evaluating the right hand
+# side on it (the output vector aliases the spins, see CvodeSolver)
 cdef inline copy_nv2arr(N_Vector v, double[:] np_x):
     cdef long int n = (< N_VectorContent_Serial > v.content).length
     cdef double * v_data = ( < N_VectorContent_Serial > v.content).data
-    memcpy(&np_x[0], v_data, n*sizeof(double))
+    if v_data != &np_x[0]:
+        memcpy(&np_x[0], v_data, n*sizeof(double))
     return 0
 
 cdef inline copy_nv2arr_openmp(N_Vector v, double[:] np_x):
     cdef long int n = (< N_VectorContent_OpenMP > v.content).length
     cdef double * v_data = ( < N_VectorContent_OpenMP > v.content).data
-    memcpy(&np_x[0], v_data, n*sizeof(double))
-    return 0
-
-
-cdef copy_nv2nv(N_Vector v_dest, N_Vector v_src):
-    cdef size_t n = (< N_VectorContent_Serial > v_dest.content).length
-    cdef double * v_dest_data = ( < N_VectorContent_Serial > v_dest.content).data
-    cdef double * v_src_data = ( < N_VectorContent_Serial > v_src.content).data
-    memcpy(v_dest_data, v_src_data, n * sizeof(double))
-    return 0
-
-cdef copy_nv2nv_openmp(N_Vector v_dest, N_Vector v_src):
-    cdef size_t n = (< N_VectorContent_OpenMP > v_dest.content).length
-    cdef double * v_dest_data = ( < N_VectorContent_OpenMP > v_dest.content).data
-    cdef double * v_src_data = ( < N_VectorContent_OpenMP > v_src.content).data
-    memcpy(v_dest_data, v_src_data, n * sizeof(double))
+    if v_data != &np_x[0]:
+        memcpy(&np_x[0], v_data, n*sizeof(double))
     return 0
 
 
 cdef int cv_rhs(double t, N_Vector yv, N_Vector yvdot, void * user_data) except -1:
     cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef int flag
+
+    if ud.native != NULL:
+        with nogil:
+            flag = ud.native.rhs(t, (< N_VectorContent_Serial > yv.content).data,
+                                 (< N_VectorContent_Serial > yvdot.content).data,
+                                 ud.native.data)
+        return flag
+
     cdef np.ndarray[double, ndim = 1, mode = 'c'] y_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
-    cdef np.ndarray ydot_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.dm_dt
 
     copy_nv2arr(yv, y_arr)
-    (< object > ud.rhs_fun)(t, y_arr, ydot_arr)
-    copy_arr2nv(ydot_arr, yvdot)
+    # The right hand side is written in place into the CVODE vector
+    (< object > ud.rhs_fun)(t, y_arr, nv_array(yvdot))
     return 0
 
 cdef int cv_rhs_openmp(double t, N_Vector yv, N_Vector yvdot, void * user_data) except -1:
     cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef int flag
+
+    if ud.native != NULL:
+        with nogil:
+            flag = ud.native.rhs(t, (< N_VectorContent_OpenMP > yv.content).data,
+                                 (< N_VectorContent_OpenMP > yvdot.content).data,
+                                 ud.native.data)
+        return flag
+
     cdef np.ndarray[double, ndim = 1, mode = 'c'] y_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
-    cdef np.ndarray ydot_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.dm_dt
 
     copy_nv2arr_openmp(yv, y_arr)
-    (< object > ud.rhs_fun)(t, y_arr, ydot_arr)
-    copy_arr2nv_openmp(ydot_arr, yvdot)
+    (< object > ud.rhs_fun)(t, y_arr, nv_array_openmp(yvdot))
     return 0
 
 
 cdef int cv_jtimes(N_Vector v, N_Vector Jv, double t, N_Vector y, N_Vector fy, void * user_data, N_Vector tmp) except -1:
     cdef cv_userdata * ud = <cv_userdata * >user_data
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] m_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] mp_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.v
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] ydot_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.dm_dt
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] jv_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.jv
-
-    copy_nv2arr(y, m_arr)
-    copy_nv2arr(v, mp_arr)
-    copy_nv2arr(fy, ydot_arr)
-    (< object > ud.jvn_fun)(mp_arr, jv_arr, t, m_arr, ydot_arr)
-    copy_arr2nv(jv_arr, Jv)
+
+    (< object > ud.jvn_fun)(nv_array(v), nv_array(Jv), t,
+                            nv_array(y), nv_array(fy))
     return 0
 
 cdef int cv_jtimes_openmp(N_Vector v, N_Vector Jv, double t, N_Vector y, N_Vector fy, void * user_data, N_Vector tmp) except -1:
     cdef cv_userdata * ud = <cv_userdata * >user_data
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] m_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] mp_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.v
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] ydot_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.dm_dt
-    cdef np.ndarray[double, ndim = 1, mode = 'c'] jv_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.jv
-
-    copy_nv2arr_openmp(y, m_arr)
-    copy_nv2arr_openmp(v, mp_arr)
-    copy_nv2arr_openmp(fy, ydot_arr)
-    (< object > ud.jvn_fun)(mp_arr, jv_arr, t, m_arr, ydot_arr)
-    copy_arr2nv_openmp(jv_arr, Jv)
+
+    (< object > ud.jvn_fun)(nv_array_openmp(v), nv_array_openmp(Jv), t,
+                            nv_array_openmp(y), nv_array_openmp(fy))
+    return 0
+
+
+cdef int cv_psetup(double t, N_Vector y, N_Vector fy,
+                   booleantype jok, booleantype * jcurPtr, double gamma,
+                   void * user_data, N_Vector tmp1, N_Vector tmp2,
+                   N_Vector tmp3) except -1:
+    cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] y_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] jac = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.jac
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] pinv = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.pinv
+
+    # The Jacobian blocks are only recomputed when CVODE considers the
+    # saved ones out of date; otherwise only gamma changes
+    if jok:
+        jcurPtr[0] = False
+    else:
+        copy_nv2arr(y, y_arr)
+        (< object > ud.pset_fun)(t, y_arr, jac)
+        jcurPtr[0] = True
+
+    block_precond_setup(&pinv[0], &jac[0], gamma, y_arr.size // 3)
+    return 0
+
+cdef int cv_psetup_openmp(double t, N_Vector y, N_Vector fy,
+                          booleantype jok, booleantype * jcurPtr, double gamma,
+                          void * user_data, N_Vector tmp1, N_Vector tmp2,
+                          N_Vector tmp3) except -1:
+    cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] y_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] jac = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.jac
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] pinv = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.pinv
+
+    if jok:
+        jcurPtr[0] = False
+    else:
+        copy_nv2arr_openmp(y, y_arr)
+        (< object > ud.pset_fun)(t, y_arr, jac)
+        jcurPtr[0] = True
+
+    block_precond_setup(&pinv[0], &jac[0], gamma, y_arr.size // 3)
     return 0
 
 
 cdef int psolve(double t, N_Vector y, N_Vector fy,
                 N_Vector r, N_Vector z, double gamma, double delta, int lr,
                 void * user_data, N_Vector tmp):
-    copy_nv2nv(z, r)
+    cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef long int n = (< N_VectorContent_Serial > r.content).length
+    block_precond_solve((< N_VectorContent_Serial > z.content).data,
+                        (< N_VectorContent_Serial > r.content).data,
+                        <double *> np.PyArray_DATA(<np.ndarray> ud.pinv), n // 3)
     return 0
 
 cdef int psolve_openmp(double t, N_Vector y, N_Vector fy,
                        N_Vector r, N_Vector z, double gamma,
                        double delta, int lr,
                        void * user_data, N_Vector tmp):
-    copy_nv2nv_openmp(z, r)
+    cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef long int n = (< N_VectorContent_OpenMP > r.content).length
+    block_precond_solve((< N_VectorContent_OpenMP > z.content).data,
+                        (< N_VectorContent_OpenMP > r.content).data,
+                        <double *> np.PyArray_DATA(<np.ndarray> ud.pinv), n // 3)
+    return 0
+
+
+# Root (event) functions: root_fun(t, y, gout) fills gout with the nroots
+# values whose zero crossings CVODE locates, c.f. Sec 4.5.5 in CVODE manual
+
+cdef int cv_root(double t, N_Vector yv, double *gout, void * user_data) except -1:
+    cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] y_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
+    cdef np.npy_intp n = ud.nroots
+
+    copy_nv2arr(yv, y_arr)
+    (< object > ud.root_fun)(t, y_arr,
+                             np.PyArray_SimpleNewFromData(1, &n, np.NPY_DOUBLE, gout))
+    return 0
+
+cdef int cv_root_openmp(double t, N_Vector yv, double *gout, void * user_data) except -1:
+    cdef cv_userdata * ud = <cv_userdata * >user_data
+    cdef np.ndarray[double, ndim = 1, mode = 'c'] y_arr = <np.ndarray[double, ndim = 1, mode = 'c'] > ud.y
+    cdef np.npy_intp n = ud.nroots
+
+    copy_nv2arr_openmp(yv, y_arr)
+    (< object > ud.root_fun)(t, y_arr,
+                             np.PyArray_SimpleNewFromData(1, &n, np.NPY_DOUBLE, gout))
     return 0
 
 
@@ -297,28 +391,31 @@ cdef class CvodeSolver(object):
     cdef double rtol, atol
     cdef int cvode_already_initialised
     cdef np.ndarray y0
-    cdef np.ndarray dm_dt
-    cdef np.ndarray mp
-    cdef np.ndarray Jmp
+    cdef np.ndarray jac
+    cdef np.ndarray pinv
     cdef N_Vector u_y
     cdef void * cvode_mem
     cdef void * rhs_fun
     cdef void * jvn_fun
     cdef callback_fun
     cdef jtimes_fun
+    cdef psetup_fun
+    cdef native_pipeline
+    cdef root_fun
     cdef cv_userdata user_data
     cdef long int nsteps, nfevals, njevals
     cdef int max_num_steps
     cdef int has_jtimes
+    cdef int has_precond
     cdef str linear_solver
     cdef str parellel_solver
-    def __cinit__(self, spins, rhs_fun, jtimes_fun=None, linear_solver="spgmr", rtol=1e-8, atol=1e-8):
+    def __cinit__(self, spins, rhs_fun, jtimes_fun=None, linear_solver="spgmr", rtol=1e-8, atol=1e-8,
+                  psetup_fun=None):
         self.t = 0
         self.y0 = spins
-        self.dm_dt = np.copy(spins)
-        self.y = np.copy(spins)
-        self.mp = np.copy(spins)
-        self.Jmp = np.copy(spins)
+        # The output vector of CVODE aliases the spins array, so the solution
+        # is written directly into it
+        self.y = spins
 
         self.callback_fun = rhs_fun
         self.jtimes_fun = jtimes_fun
@@ -336,10 +433,21 @@ cdef class CvodeSolver(object):
         if jtimes_fun is not None:
             self.has_jtimes = 1
 
+        # Block diagonal preconditioner: psetup_fun(t, y, jac) fills the
+        # 3x3 diagonal blocks of the Jacobian (9 entries per spin)
+        self.psetup_fun = psetup_fun
+        self.has_precond = 0
+        self.jac = np.zeros(3 * spins.size)
+        self.pinv = np.zeros(3 * spins.size)
+        if psetup_fun is not None:
+            self.has_precond = 1
+
         self.user_data = cv_userdata(< void*>self.callback_fun,
-                                      < void * >self.y0, < void * >self.dm_dt,
+                                      < void * >self.y0,
                                       < void * >self.jtimes_fun,
-                                      < void * >self.mp, < void * >self.Jmp)
+                                      < void * >self.psetup_fun,
+                                      < void * >self.jac, < void * >self.pinv,
+                                      NULL, NULL, 0)
 
         self.cvode_mem = CVodeCreate(CV_BDF, CV_NEWTON)
 
@@ -376,29 +484,90 @@ cdef class CvodeSolver(object):
             flag = CVDiag(self.cvode_mem)
             self.check_flag(flag, "CVDiag")
         elif self.linear_solver == "spgmr":
-            if self.has_jtimes:
-                # CVSpgmr(cvode_mem, pretype, maxl) p. 27 of CVODE 2.7 manual
+            # CVSpgmr(cvode_mem, pretype, maxl) p. 27 of CVODE 2.7 manual
+            if self.has_precond:
                 flag = CVSpgmr(self.cvode_mem, PREC_LEFT, 300)
                 self.check_flag(flag, "CVSpgmr")
-                # functions below in p. 37 CVODE 2.7 manual
-                flag = CVSpilsSetJacTimesVecFn(self.cvode_mem, < CVSpilsJacTimesVecFn > self.jvn_fun)
-                self.check_flag(flag, "CVSpilsSetJacTimesVecFn")
-                flag = CVSpilsSetPreconditioner(self.cvode_mem, < CVSpilsPrecSetupFn > self.psetup, < CVSpilsPrecSolveFn > psolve)
+                # The preconditioner solves (I - gamma * J) z = r with the
+                # local 3x3 blocks of J, c.f. Sec 4.6.9 in CVODE manual
+                flag = CVSpilsSetPreconditioner(self.cvode_mem, < CVSpilsPrecSetupFn > cv_psetup, < CVSpilsPrecSolveFn > psolve)
                 self.check_flag(flag, "CVSpilsSetPreconditioner")
             else:
-                # this will use the SPGMR without preconditioner and without
-                # our computation of the product J * m'. Instead, it uses
-                # a difference quotient approximation of the product.
-                # c.f. Sec 4.6.7 in CVODE manual
-                # Actually, it's the same Jacobian approximation as used
-                # in CVDiag (only difference is CVDiag is a direct linear
-                # solver).
                 flag = CVSpgmr(self.cvode_mem, PREC_NONE, 300)
                 self.check_flag(flag, "CVSpgmr")
+
+            if self.has_jtimes:
+                # functions below in p. 37 CVODE 2.7 manual
+                flag = CVSpilsSetJacTimesVecFn(self.cvode_mem, < CVSpilsJacTimesVecFn > self.jvn_fun)
+                self.check_flag(flag, "CVSpilsSetJacTimesVecFn")
+            # Otherwise SPGMR does not use our computation of the product
+            # J * m'. Instead, it uses a difference quotient approximation of
+            # the product. c.f. Sec 4.6.7 in CVODE manual
+            # Actually, it's the same Jacobian approximation as used
+            # in CVDiag (only difference is CVDiag is a direct linear
+            # solver).
         else:
             raise RuntimeError(
                 "linear_solver is {}, should be spgmr or diag".format(self.linear_solver))
 
+    def set_native_rhs(self, pipeline):
+        """
+        Evaluate the right hand side with a compiled pipeline (an object
+        with a "fidimag.native_rhs" capsule attribute, such as
+        common_clib.LLGPipeline) instead of the Python rhs_fun. Passing
+        None restores rhs_fun
+        """
+        self.native_pipeline = pipeline
+        if pipeline is None:
+            self.user_data.native = NULL
+        else:
+            self.user_data.native = <native_rhs *> PyCapsule_GetPointer(
+                pipeline.capsule, "fidimag.native_rhs")
+
+    def set_root_fun(self, root_fun, nroots, directions=None):
+        """
+        Locate the zero crossings of nroots functions of the state during
+        the integration. root_fun(t, y, gout) writes their values into the
+        array gout. directions (one per function) restricts the crossings
+        to increasing (1) or decreasing (-1) values; 0 detects both.
+        With nroots = 0 the root finding is disabled
+        """
+        cdef np.ndarray[int, ndim=1, mode="c"] rootdir
+
+        self.root_fun = root_fun
+        self.user_data.root_fun = < void * >self.root_fun
+        self.user_data.nroots = nroots
+
+        if nroots == 0:
+            flag = CVodeRootInit(self.cvode_mem, 0, NULL)
+            self.check_flag(flag, "CVodeRootInit")
+            return
+
+        flag = CVodeRootInit(self.cvode_mem, nroots, < CVRootFn > cv_root)
+        self.check_flag(flag, "CVodeRootInit")
+
+        if directions is not None:
+            rootdir = np.array(directions, dtype=np.intc)
+            flag = CVodeSetRootDirection(self.cvode_mem, & rootdir[0])
+            self.check_flag(flag, "CVodeSetRootDirection")
+
+        # Functions which are zero at the initial time are expected
+        # (e.g. when restarting from an event)
+        flag = CVodeSetNoInactiveRootWarn(self.cvode_mem)
+        self.check_flag(flag, "CVodeSetNoInactiveRootWarn")
+
+    def get_root_info(self):
+        """
+        Returns an array with, for every root function, 1 (-1) if it
+        crossed zero increasing (decreasing) in the last run_until that
+        stopped at a root, and 0 otherwise
+        """
+        cdef np.ndarray[int, ndim=1, mode="c"] roots = np.zeros(
+            max(1, self.user_data.nroots), dtype=np.intc)
+        flag = CVodeGetRootInfo(self.cvode_mem, & roots[0])
+        self.check_flag(flag, "CVodeGetRootInfo")
+        return roots[:self.user_data.nroots]
+
     def set_options(self, rtol, atol, max_num_steps=100000, max_ord=None):
         self.rtol = rtol
         self.atol = atol
@@ -423,20 +592,74 @@ cdef class CvodeSolver(object):
         self.check_flag(flag, "CVodeReInit")
 
     cpdef int run_until(self, double t_final) except -1:
+        """
+        Integrate up to t_final. Returns 1 if the integration stopped
+        earlier, at a root of the root functions (see set_root_fun), with
+        self.t the time of the root, and 0 otherwise
+        """
         cdef int flag
         cdef double t_returned
         flag = CVodeStep(self.cvode_mem, t_final, self.u_y, & t_returned, CV_NORMAL)
-        self.check_flag(flag, "CVodeStep")
         self.t = t_returned
+        if flag == CV_ROOT_RETURN:
+            return 1
+        self.check_flag(flag, "CVodeStep")
         return 0
 
-    cdef int psetup(self, double t, N_Vector y, N_Vector fy,
-                    booleantype jok, booleantype * jcurPtr, double gamma,
-                    void * user_data, N_Vector tmp1, N_Vector tmp2, N_Vector tmp3):
-        if not jok:
-            copy_nv2arr(y, self.y)
+    cdef int interpolate(self, double t, double * data) except -1:
+        # State at time t, interpolated from the last step, written to data
+        cdef N_Vector v = N_VMake_Serial(self.y.size, data)
+        flag = CVodeGetDky(self.cvode_mem, t, 0, v)
+        N_VDestroy_Serial(v)
+        self.check_flag(flag, "CVodeGetDky")
         return 0
 
+    cpdef int sample(self, double[:] times, double[:, :] out) except -1:
+        """
+        Integrate up to times[-1] with the internal steps of CVODE
+        (CV_ONE_STEP mode), writing into every row out[i] the state
+        interpolated at times[i] (increasing, not earlier than self.t), so
+        the output times do not limit the step size.
+
+        Returns the number of samples written, which is smaller than
+        len(times) if CVODE stops at a root (see set_root_fun). Then
+        self.t and y are the time and state of the root; otherwise they
+        correspond to the last sample
+        """
+        cdef int flag
+        cdef int i = 0
+        cdef int n_times = times.shape[0]
+        cdef double t_reached
+
+        if n_times == 0:
+            return 0
+        if (out.shape[0] < n_times or out.shape[1] != self.y.size or
+                out.strides[1] != sizeof(double)):
+            raise ValueError("out must have a contiguous row of size {} "
+                             "for every time".format(self.y.size))
+
+        # CVODE may have already integrated beyond self.t
+        CVodeGetCurrentTime(self.cvode_mem, & t_reached)
+        while i < n_times:
+            if times[i] <= t_reached:
+                self.interpolate(times[i], & out[i, 0])
+                i += 1
+                continue
+
+            flag = CVodeStep(self.cvode_mem, times[n_times - 1], self.u_y,
+                             & t_reached, CV_ONE_STEP)
+            if flag == CV_ROOT_RETURN:
+                while i < n_times and times[i] <= t_reached:
+                    self.interpolate(times[i], & out[i, 0])
+                    i += 1
+                self.t = t_reached
+                return i
+            self.check_flag(flag, "CVodeStep")
+
+        self.interpolate(times[n_times - 1], <double *> self.y.data)
+        self.t = times[n_times - 1]
+        return n_times
+
     def check_flag(self, flag, fun_name):
         if flag != 0:
             raise RuntimeError("CVODE function {} failed!".format(fun_name))
@@ -451,6 +674,82 @@ cdef class CvodeSolver(object):
         CVSpilsGetNumJtimesEvals(self.cvode_mem, & self.njevals)
         return self.nsteps, self.nfevals, self.njevals
 
+    def counters(self):
+        """
+        Returns a dictionary with the CVODE statistics: steps, right hand
+        side evaluations, nonlinear and linear (SPGMR) iterations,
+        convergence and error test failures, the method order and the
+        step sizes
+        """
+        cdef long int nsteps, nfevals, nlinsetups, netfails
+        cdef long int nniters, nncfails
+        cdef long int nliters = 0, nlcfails = 0, njevals = 0
+        cdef long int npevals = 0, npsolves = 0
+        cdef int qlast, qcur
+        cdef double hinused, hlast, hcur, tcur
+
+        flag = CVodeGetIntegratorStats(self.cvode_mem, & nsteps, & nfevals,
+                                       & nlinsetups, & netfails, & qlast,
+                                       & qcur, & hinused, & hlast, & hcur,
+                                       & tcur)
+        self.check_flag(flag, "CVodeGetIntegratorStats")
+        flag = CVodeGetNonlinSolvStats(self.cvode_mem, & nniters, & nncfails)
+        self.check_flag(flag, "CVodeGetNonlinSolvStats")
+
+        if self.linear_solver == "spgmr":
+            CVSpilsGetNumLinIters(self.cvode_mem, & nliters)
+            CVSpilsGetNumConvFails(self.cvode_mem, & nlcfails)
+            CVSpilsGetNumJtimesEvals(self.cvode_mem, & njevals)
+            CVSpilsGetNumPrecEvals(self.cvode_mem, & npevals)
+            CVSpilsGetNumPrecSolves(self.cvode_mem, & npsolves)
+
+        return {'steps': nsteps,
+                'rhs_evals': nfevals,
+                'lin_solv_setups': nlinsetups,
+                'err_test_fails': netfails,
+                'nonlin_iters': nniters,
+                'nonlin_conv_fails': nncfails,
+                'lin_iters': nliters,
+                'lin_conv_fails': nlcfails,
+                'jtimes_evals': njevals,
+                'prec_evals': npevals,
+                'prec_solves': npsolves,
+                'last_order': qlast,
+                'current_order': qcur,
+                'initial_step': hinused,
+                'last_step': hlast,
+                'current_step': hcur,
+                't': tcur}
+
+    def get_callbacks(self):
+        """
+        Returns a dictionary with the Python functions called by CVODE:
+        'rhs', and 'jtimes' and 'psetup' when they are used
+        """
+        callbacks = {'rhs': self.callback_fun}
+        if self.jtimes_fun is not None:
+            callbacks['jtimes'] = self.jtimes_fun
+        if self.psetup_fun is not None:
+            callbacks['psetup'] = self.psetup_fun
+        return callbacks
+
+    def set_callbacks(self, rhs=None, jtimes=None, psetup=None):
+        """
+        Replace the Python functions called by CVODE (e.g. to time them),
+        with the same signatures as the original ones. The functions which
+        are None are kept; jtimes and psetup can only be replaced if they
+        were given when the solver was created
+        """
+        if rhs is not None:
+            self.callback_fun = rhs
+            self.user_data.rhs_fun = < void * >self.callback_fun
+        if jtimes is not None and self.jtimes_fun is not None:
+            self.jtimes_fun = jtimes
+            self.user_data.jvn_fun = < void * >self.jtimes_fun
+        if psetup is not None and self.psetup_fun is not None:
+            self.psetup_fun = psetup
+            self.user_data.pset_fun = < void * >self.psetup_fun
+
     def get_current_step(self):
         cdef double step
         CVodeGetCurrentStep(self.cvode_mem, & step)
@@ -468,9 +767,11 @@ cdef class CvodeSolver(object):
         self.user_data.rhs_fun = NULL
         self.user_data.y = NULL
         self.user_data.jvn_fun = NULL
-        self.user_data.dm_dt = NULL
-        self.user_data.v = NULL
-        self.user_data.jv = NULL
+        self.user_data.pset_fun = NULL
+        self.user_data.jac = NULL
+        self.user_data.pinv = NULL
+        self.user_data.native = NULL
+        self.user_data.root_fun = NULL
         N_VDestroy_Serial(self.u_y)
         CVodeFree(& self.cvode_mem)
 
@@ -480,32 +781,35 @@ cdef class CvodeSolver_OpenMP(object):
     cdef double rtol, atol
     cdef int cvode_already_initialised
     cdef np.ndarray y0
-    cdef np.ndarray dm_dt
-    cdef np.ndarray mp
-    cdef np.ndarray Jmp
+    cdef np.ndarray jac
+    cdef np.ndarray pinv
     cdef N_Vector u_y
     cdef void * cvode_mem
     cdef void * rhs_fun
     cdef void * jvn_fun
     cdef callback_fun
     cdef jtimes_fun
+    cdef psetup_fun
+    cdef native_pipeline
+    cdef root_fun
     cdef cv_userdata user_data
     cdef long int nsteps, nfevals, njevals
     cdef int max_num_steps
     cdef int has_jtimes
+    cdef int has_precond
     cdef str linear_solver
     cdef str parellel_solver
     cdef int num_threads
 
-    def __cinit__(self, spins, rhs_fun, jtimes_fun=None, linear_solver="spgmr", rtol=1e-8, atol=1e-8):
+    def __cinit__(self, spins, rhs_fun, jtimes_fun=None, linear_solver="spgmr", rtol=1e-8, atol=1e-8,
+                  psetup_fun=None):
         self.num_threads = openmp.omp_get_max_threads()
         print("Number of threads (CVODE) = {}".format(self.num_threads))
         self.t = 0
         self.y0 = spins
-        self.dm_dt = np.copy(spins)
-        self.y = np.copy(spins)
-        self.mp = np.copy(spins)
-        self.Jmp = np.copy(spins)
+        # The output vector of CVODE aliases the spins array, so the solution
+        # is written directly into it
+        self.y = spins
 
         self.callback_fun = rhs_fun
         self.jtimes_fun = jtimes_fun
@@ -523,10 +827,21 @@ cdef class CvodeSolver_OpenMP(object):
         if jtimes_fun is not None:
             self.has_jtimes = 1
 
+        # Block diagonal preconditioner: psetup_fun(t, y, jac) fills the
+        # 3x3 diagonal blocks of the Jacobian (9 entries per spin)
+        self.psetup_fun = psetup_fun
+        self.has_precond = 0
+        self.jac = np.zeros(3 * spins.size)
+        self.pinv = np.zeros(3 * spins.size)
+        if psetup_fun is not None:
+            self.has_precond = 1
+
         self.user_data = cv_userdata(< void*>self.callback_fun,
-                                      < void * >self.y0, < void * >self.dm_dt,
+                                      < void * >self.y0,
                                       < void * >self.jtimes_fun,
-                                      < void * >self.mp, < void * >self.Jmp)
+                                      < void * >self.psetup_fun,
+                                      < void * >self.jac, < void * >self.pinv,
+                                      NULL, NULL, 0)
 
         self.cvode_mem = CVodeCreate(CV_BDF, CV_NEWTON)
 
@@ -563,29 +878,90 @@ cdef class CvodeSolver_OpenMP(object):
             flag = CVDiag(self.cvode_mem)
             self.check_flag(flag, "CVDiag")
         elif self.linear_solver == "spgmr":
-            if self.has_jtimes:
-                # CVSpgmr(cvode_mem, pretype, maxl) p. 27 of CVODE 2.7 manual
+            # CVSpgmr(cvode_mem, pretype, maxl) p. 27 of CVODE 2.7 manual
+            if self.has_precond:
                 flag = CVSpgmr(self.cvode_mem, PREC_LEFT, 300)
                 self.check_flag(flag, "CVSpgmr")
-                # functions below in p. 37 CVODE 2.7 manual
-                flag = CVSpilsSetJacTimesVecFn(self.cvode_mem, < CVSpilsJacTimesVecFn > self.jvn_fun)
-                self.check_flag(flag, "CVSpilsSetJacTimesVecFn")
-                flag = CVSpilsSetPreconditioner(self.cvode_mem, < CVSpilsPrecSetupFn > self.psetup, < CVSpilsPrecSolveFn > psolve_openmp)
+                # The preconditioner solves (I - gamma * J) z = r with the
+                # local 3x3 blocks of J, c.f. Sec 4.6.9 in CVODE manual
+                flag = CVSpilsSetPreconditioner(self.cvode_mem, < CVSpilsPrecSetupFn > cv_psetup_openmp, < CVSpilsPrecSolveFn > psolve_openmp)
                 self.check_flag(flag, "CVSpilsSetPreconditioner")
             else:
-                # this will use the SPGMR without preconditioner and without
-                # our computation of the product J * m'. Instead, it uses
-                # a difference quotient approximation of the product.
-                # c.f. Sec 4.6.7 in CVODE manual
-                # Actually, it's the same Jacobian approximation as used
-                # in CVDiag (only difference is CVDiag is a direct linear
-                # solver).
                 flag = CVSpgmr(self.cvode_mem, PREC_NONE, 300)
                 self.check_flag(flag, "CVSpgmr")
+
+            if self.has_jtimes:
+                # functions below in p. 37 CVODE 2.7 manual
+                flag = CVSpilsSetJacTimesVecFn(self.cvode_mem, < CVSpilsJacTimesVecFn > self.jvn_fun)
+                self.check_flag(flag, "CVSpilsSetJacTimesVecFn")
+            # Otherwise SPGMR does not use our computation of the product
+            # J * m'. Instead, it uses a difference quotient approximation of
+            # the product. c.f. Sec 4.6.7 in CVODE manual
+            # Actually, it's the same Jacobian approximation as used
+            # in CVDiag (only difference is CVDiag is a direct linear
+            # solver).
         else:
             raise RuntimeError(
                 "linear_solver is {}, should be spgmr or diag".format(self.linear_solver))
 
+    def set_native_rhs(self, pipeline):
+        """
+        Evaluate the right hand side with a compiled pipeline (an object
+        with a "fidimag.native_rhs" capsule attribute, such as
+        common_clib.LLGPipeline) instead of the Python rhs_fun. Passing
+        None restores rhs_fun
+        """
+        self.native_pipeline = pipeline
+        if pipeline is None:
+            self.user_data.native = NULL
+        else:
+            self.user_data.native = <native_rhs *> PyCapsule_GetPointer(
+                pipeline.capsule, "fidimag.native_rhs")
+
+    def set_root_fun(self, root_fun, nroots, directions=None):
+        """
+        Locate the zero crossings of nroots functions of the state during
+        the integration. root_fun(t, y, gout) writes their values into the
+        array gout. directions (one per function) restricts the crossings
+        to increasing (1) or decreasing (-1) values; 0 detects both.
+        With nroots = 0 the root finding is disabled
+        """
+        cdef np.ndarray[int, ndim=1, mode="c"] rootdir
+
+        self.root_fun = root_fun
+        self.user_data.root_fun = < void * >self.root_fun
+        self.user_data.nroots = nroots
+
+        if nroots == 0:
+            flag = CVodeRootInit(self.cvode_mem, 0, NULL)
+            self.check_flag(flag, "CVodeRootInit")
+            return
+
+        flag = CVodeRootInit(self.cvode_mem, nroots, < CVRootFn > cv_root_openmp)
+        self.check_flag(flag, "CVodeRootInit")
+
+        if directions is not None:
+            rootdir = np.array(directions, dtype=np.intc)
+            flag = CVodeSetRootDirection(self.cvode_mem, & rootdir[0])
+            self.check_flag(flag, "CVodeSetRootDirection")
+
+        # Functions which are zero at the initial time are expected
+        # (e.g. when restarting from an event)
+        flag = CVodeSetNoInactiveRootWarn(self.cvode_mem)
+        self.check_flag(flag, "CVodeSetNoInactiveRootWarn")
+
+    def get_root_info(self):
+        """
+        Returns an array with, for every root function, 1 (-1) if it
+        crossed zero increasing (decreasing) in the last run_until that
+        stopped at a root, and 0 otherwise
+        """
+        cdef np.ndarray[int, ndim=1, mode="c"] roots = np.zeros(
+            max(1, self.user_data.nroots), dtype=np.intc)
+        flag = CVodeGetRootInfo(self.cvode_mem, & roots[0])
+        self.check_flag(flag, "CVodeGetRootInfo")
+        return roots[:self.user_data.nroots]
+
     def set_options(self, rtol, atol, max_num_steps=100000, max_ord=None):
         self.rtol = rtol
         self.atol = atol
@@ -610,20 +986,74 @@ cdef class CvodeSolver_OpenMP(object):
         self.check_flag(flag, "CVodeReInit")
 
     cpdef int run_until(self, double t_final) except -1:
+        """
+        Integrate up to t_final. Returns 1 if the integration stopped
+        earlier, at a root of the root functions (see set_root_fun), with
+        self.t the time of the root, and 0 otherwise
+        """
         cdef int flag
         cdef double t_returned
         flag = CVodeStep(self.cvode_mem, t_final, self.u_y, & t_returned, CV_NORMAL)
-        self.check_flag(flag, "CVodeStep")
         self.t = t_returned
+        if flag == CV_ROOT_RETURN:
+            return 1
+        self.check_flag(flag, "CVodeStep")
         return 0
 
-    cdef int psetup(self, double t, N_Vector y, N_Vector fy,
-                    booleantype jok, booleantype * jcurPtr, double gamma,
-                    void * user_data, N_Vector tmp1, N_Vector tmp2, N_Vector tmp3):
-        if not jok:
-            copy_nv2arr_openmp(y, self.y)
+    cdef int interpolate(self, double t, double * data) except -1:
+        # State at time t, interpolated from the last step, written to data
+        cdef N_Vector v = N_VMake_OpenMP(self.y.size, data, self.num_threads)
+        flag = CVodeGetDky(self.cvode_mem, t, 0, v)
+        N_VDestroy_OpenMP(v)
+        self.check_flag(flag, "CVodeGetDky")
         return 0
 
+    cpdef int sample(self, double[:] times, double[:, :] out) except -1:
+        """
+        Integrate up to times[-1] with the internal steps of CVODE
+        (CV_ONE_STEP mode), writing into every row out[i] the state
+        interpolated at times[i] (increasing, not earlier than self.t), so
+        the output times do not limit the step size.
+
+        Returns the number of samples written, which is smaller than
+        len(times) if CVODE stops at a root (see set_root_fun). Then
+        self.t and y are the time and state of the root; otherwise they
+        correspond to the last sample
+        """
+        cdef int flag
+        cdef int i = 0
+        cdef int n_times = times.shape[0]
+        cdef double t_reached
+
+        if n_times == 0:
+            return 0
+        if (out.shape[0] < n_times or out.shape[1] != self.y.size or
+                out.strides[1] != sizeof(double)):
+            raise ValueError("out must have a contiguous row of size {} "
+                             "for every time".format(self.y.size))
+
+        # CVODE may have already integrated beyond self.t
+        CVodeGetCurrentTime(self.cvode_mem, & t_reached)
+        while i < n_times:
+            if times[i] <= t_reached:
+                self.interpolate(times[i], & out[i, 0])
+                i += 1
+                continue
+
+            flag = CVodeStep(self.cvode_mem, times[n_times - 1], self.u_y,
+                             & t_reached, CV_ONE_STEP)
+            if flag == CV_ROOT_RETURN:
+                while i < n_times and times[i] <= t_reached:
+                    self.interpolate(times[i], & out[i, 0])
+                    i += 1
+                self.t = t_reached
+                return i
+            self.check_flag(flag, "CVodeStep")
+
+        self.interpolate(times[n_times - 1], <double *> self.y.data)
+        self.t = times[n_times - 1]
+        return n_times
+
     def check_flag(self, flag, fun_name):
         if flag != 0:
             raise RuntimeError("CVODE function {} failed!".format(fun_name))
@@ -638,6 +1068,82 @@ cdef class CvodeSolver_OpenMP(object):
         CVSpilsGetNumJtimesEvals(self.cvode_mem, & self.njevals)
         return self.nsteps, self.nfevals, self.njevals
 
+    def counters(self):
+        """
+        Returns a dictionary with the CVODE statistics: steps, right hand
+        side evaluations, nonlinear and linear (SPGMR) iterations,
+        convergence and error test failures, the method order and the
+        step sizes
+        """
+        cdef long int nsteps, nfevals, nlinsetups, netfails
+        cdef long int nniters, nncfails
+        cdef long int nliters = 0, nlcfails = 0, njevals = 0
+        cdef long int npevals = 0, npsolves = 0
+        cdef int qlast, qcur
+        cdef double hinused, hlast, hcur, tcur
+
+        flag = CVodeGetIntegratorStats(self.cvode_mem, & nsteps, & nfevals,
+                                       & nlinsetups, & netfails, & qlast,
+                                       & qcur, & hinused, & hlast, & hcur,
+                                       & tcur)
+        self.check_flag(flag, "CVodeGetIntegratorStats")
+        flag = CVodeGetNonlinSolvStats(self.cvode_mem, & nniters, & nncfails)
+        self.check_flag(flag, "CVodeGetNonlinSolvStats")
+
+        if self.linear_solver == "spgmr":
+            CVSpilsGetNumLinIters(self.cvode_mem, & nliters)
+            CVSpilsGetNumConvFails(self.cvode_mem, & nlcfails)
+            CVSpilsGetNumJtimesEvals(self.cvode_mem, & njevals)
+            CVSpilsGetNumPrecEvals(self.cvode_mem, & npevals)
+            CVSpilsGetNumPrecSolves(self.cvode_mem, & npsolves)
+
+        return {'steps': nsteps,
+                'rhs_evals': nfevals,
+                'lin_solv_setups': nlinsetups,
+                'err_test_fails': netfails,
+                'nonlin_iters': nniters,
+                'nonlin_conv_fails': nncfails,
+                'lin_iters': nliters,
+                'lin_conv_fails': nlcfails,
+                'jtimes_evals': njevals,
+                'prec_evals': npevals,
+                'prec_solves': npsolves,
+                'last_order': qlast,
+                'current_order': qcur,
+                'initial_step': hinused,
+                'last_step': hlast,
+                'current_step': hcur,
+                't': tcur}
+
+    def get_callbacks(self):
+        """
+        Returns a dictionary with the Python functions called by CVODE:
+        'rhs', and 'jtimes' and 'psetup' when they are used
+        """
+        callbacks = {'rhs': self.callback_fun}
+        if self.jtimes_fun is not None:
+            callbacks['jtimes'] = self.jtimes_fun
+        if self.psetup_fun is not None:
+            callbacks['psetup'] = self.psetup_fun
+        return callbacks
+
+    def set_callbacks(self, rhs=None, jtimes=None, psetup=None):
+        """
+        Replace the Python functions called by CVODE (e.g. to time them),
+        with the same signatures as the original ones. The functions which
+        are None are kept; jtimes and psetup can only be replaced if they
+        were given when the solver was created
+        """
+        if rhs is not None:
+            self.callback_fun = rhs
+            self.user_data.rhs_fun = < void * >self.callback_fun
+        if jtimes is not None and self.jtimes_fun is not None:
+            self.jtimes_fun = jtimes
+            self.user_data.jvn_fun = < void * >self.jtimes_fun
+        if psetup is not None and self.psetup_fun is not None:
+            self.psetup_fun = psetup
+            self.user_data.pset_fun = < void * >self.psetup_fun
+
     def get_current_step(self):
         cdef double step
         CVodeGetCurrentStep(self.cvode_mem, & step)
@@ -655,8 +1161,10 @@ cdef class CvodeSolver_OpenMP(object):
         self.user_data.rhs_fun = NULL
         self.user_data.y = NULL
         self.user_data.jvn_fun = NULL
-        self.user_data.dm_dt = NULL
-        self.user_data.v = NULL
-        self.user_data.jv = NULL
+        self.user_data.pset_fun = NULL
+        self.user_data.jac = NULL
+        self.user_data.pinv = NULL
+        self.user_data.native = NULL
+        self.user_data.root_fun = NULL
         N_VDestroy_OpenMP(self.u_y)
         CVodeFree(& self.cvode_mem)
@@ -0,0 +1,73 @@
+#include <math.h>
+#include "precond.h"
+
+/* Block diagonal preconditioner for the Newton iteration of CVODE.
+ *
+ * The linear systems solved by SPGMR have the matrix  P = I - gamma * J,
+ * where J is the Jacobian of the right hand side. Here J is approximated by
+ * its 3x3 diagonal blocks (the coupling between the three components of the
+ * spin at every site), so P is inverted block by block.
+ *
+ * jac  :: 3x3 row major blocks of the Jacobian, 9 entries per site
+ *
+ * pinv :: Output array with the inverse of the blocks of P
+ *
+ * Blocks which are (numerically) singular are replaced by the identity, i.e.
+ * no preconditioning at that site.
+ */
+void block_precond_setup(double *restrict pinv, double *restrict jac,
+                         double gamma, int n) {
+
+    #pragma omp parallel for
+    for (int i = 0; i < n; i++) {
+        double *a = &jac[9 * i];
+        double *b = &pinv[9 * i];
+        double p[9];
+
+        for (int k = 0; k < 9; k++) {
+            p[k] = -gamma * a[k];
+        }
+        p[0] += 1;
+        p[4] += 1;
+        p[8] += 1;
+
+        /* Inverse from the adjugate matrix */
+        double c0 = p[4] * p[8] - p[5] * p[7];
+        double c1 = p[5] * p[6] - p[3] * p[8];
+        double c2 = p[3] * p[7] - p[4] * p[6];
+        double det = p[0] * c0 + p[1] * c1 + p[2] * c2;
+
+        if (fabs(det) < 1e-14) {
+            for (int k = 0; k < 9; k++) {
+                b[k] = (k % 4 == 0) ? 1 : 0;
+            }
+            continue;
+        }
+
+        double inv = 1 / det;
+        b[0] = c0 * inv;
+        b[1] = (p[2] * p[7] - p[1] * p[8]) * inv;
+        b[2] = (p[1] * p[5] - p[2] * p[4]) * inv;
+        b[3] = c1 * inv;
+        b[4] = (p[0] * p[8] - p[2] * p[6]) * inv;
+        b[5] = (p[2] * p[3] - p[0] * p[5]) * inv;
+        b[6] = c2 * inv;
+        b[7] = (p[1] * p[6] - p[0] * p[7]) * inv;
+        b[8] = (p[0] * p[4] - p[1] * p[3]) * inv;
+    }
+}
+
+/* Solve P z = r with the inverted blocks from block_precond_setup */
+void block_precond_solve(double *restrict z, double *restrict r,
+                         double *restrict pinv, int n) {
+
+    #pragma omp parallel for
+    for (int i = 0; i < n; i++) {
+        double *b = &pinv[9 * i];
+        double r0 = r[3 * i], r1 = r[3 * i + 1], r2 = r[3 * i + 2];
+
+        z[3 * i]     = b[0] * r0 + b[1] * r1 + b[2] * r2;
+        z[3 * i + 1] = b[3] * r0 + b[4] * r1 + b[5] * r2;
+        z[3 * i + 2] = b[6] * r0 + b[7] * r1 + b[8] * r2;
+    }
+}
@@ -0,0 +1,10 @@
+#ifndef __PRECOND__
+#define __PRECOND__
+
+void block_precond_setup(double *restrict pinv, double *restrict jac,
+                         double gamma, int n);
+
+void block_precond_solve(double *restrict z, double *restrict r,
+                         double *restrict pinv, int n);
+
+#endif
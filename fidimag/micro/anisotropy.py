@@ -28,16 +28,54 @@ class UniaxialAnisotropy(Energy):
             m = spin
         else:
             m = self.spin
+
+        self._compute(m, self.field, None, 0)
+
+        return self.field
+
+    def add_field(self, field, t=0):
+        self._compute(self.spin, field, None, 1)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        # The kernel is local, so the copies are a mesh of replicas * n
+        # cells
+        micro_clib.compute_anisotropy_micro(
+            spin, field, None, self.replica_array('Ms_inv', replicas),
+            self.replica_array('_Ku', replicas),
+            self.replica_array('_axis', replicas),
+            replicas * self.n, 1, 1, 1)
+
+    def c_field_term(self):
+        return micro_clib.anisotropy_field_term_micro(self.Ms_inv,
+                                                      self._Ku,
+                                                      self._axis,
+                                                      self.nx,
+                                                      self.ny,
+                                                      self.nz)
+
+    def add_local_jacobian(self, jac):
+        micro_clib.compute_anisotropy_local_jac_micro(jac,
+                                                      self.Ms_inv,
+                                                      self._Ku,
+                                                      self._axis,
+                                                      self.n)
+
+    def compute_field_and_energy(self, t=0):
+        self._compute(self.spin, self.field, self.energy, 0)
+
+        return self.field
+
+    def _compute(self, m, field, energy, add):
         micro_clib.compute_anisotropy_micro(m,
-                                            self.field,
-                                            self.energy,
+                                            field,
+                                            energy,
                                             self.Ms_inv,
                                             self._Ku,
                                             self._axis,
                                             self.nx,
                                             self.ny,
-                                            self.nz)
-        return self.field
+                                            self.nz,
+                                            add)
 
 
 class UniaxialAnisotropy4(Energy):
@@ -65,20 +103,28 @@ class UniaxialAnisotropy4(Energy):
             m = spin
         else:
             m = self.spin
-        micro_clib.compute_anisotropy4_micro(m,
-                                             self.field,
-                                             self.energy,
-                                             self.Ms_inv,
-                                             self._K1,
-                                             self._K2,
-                                             self._axis,
-                                             self.nx,
-                                             self.ny,
-                                             self.nz)
 
+        self._compute(m, self.field, None, 0)
 
+        return self.field
 
+    def add_field(self, field, t=0):
+        self._compute(self.spin, field, None, 1)
 
+    def compute_field_and_energy(self, t=0):
+        self._compute(self.spin, self.field, self.energy, 0)
 
         return self.field
 
+    def _compute(self, m, field, energy, add):
+        micro_clib.compute_anisotropy4_micro(m,
+                                             field,
+                                             energy,
+                                             self.Ms_inv,
+                                             self._K1,
+                                             self._K2,
+                                             self._axis,
+                                             self.nx,
+                                             self.ny,
+                                             self.nz,
+                                             add)
@@ -120,7 +120,7 @@ class LLBar(MicroDriver):
                                                 self.gamma,
                                                 self.n,
                                                 self.do_precession,
-                                                self.default_c)
+                                                self.norm_correction)
 
         #ydot[:] = self.dm_dt[:]
 
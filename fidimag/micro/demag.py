@@ -2,43 +2,69 @@ import fidimag.extensions.dipolar as clib
 import numpy as np
 import os
 from .energy import Energy
+from fidimag.common.cache import TensorCache
+from fidimag.common.field_extrapolation import FieldExtrapolation
+from fidimag.common.demag_replicas import DemagReplicas
 
 mu_0 = 4 * np.pi * 1e-7
 
+# Version of the 2D PBC tensors (real space, as computed by
+# compute_tensors_2dpbc) stored in the tensor cache, part of the cache key.
+# It has to be increased whenever their layout changes
+PBC_TENSOR_CACHE_VERSION = 1
+
 
 default_options={
-    'pbc_2d_error': 1e-10,
+    'relative_tensor_error': 1e-10,
     'sample_repeat_nx': -1,
     'sample_repeat_ny': -1,
-    'tensor_file_name': '2dpbc_tensors',
 }
 
 
 class Demag(Energy):
 
     def __init__(self, name='Demag', pbc_2d=False,
-                 pbc_options=default_options, calc_every=0):
+                 pbc_options=default_options, calc_every=0,
+                 planning='measure', tensor_cache=True,
+                 precision='double', extrapolation=None,
+                 extrapolation_tol=1e-3, extrapolation_max_dm=0.05,
+                 thin_film=False):
         self.name = name
         self.oommf = True
         self.pbc_2d = pbc_2d
         self.pbc_options = pbc_options
         self.jac = False
         self.calc_every = calc_every
+        # FFTW planning effort: 'estimate', 'measure' or 'patient'
+        self.planning = planning
+        # 'single' computes the convolution in single precision, which is
+        # enough for relaxations or thermal runs and halves the demag memory
+        self.precision = precision
+        # Reuse the demag tensors stored in the per-user cache
+        self.tensor_cache = tensor_cache
+        # 'linear' or 'quadratic' extrapolation of the field in time between
+        # its evaluations, see FieldExtrapolation
+        self.extrapolation = extrapolation
+        self.extrapolation_tol = extrapolation_tol
+        self.extrapolation_max_dm = extrapolation_max_dm
+        # Experimental convolution without padding in z: it needs less
+        # memory but it is slower than the 3D one (see FFTDemag)
+        self.thin_film = thin_film
 
     def setup(self, mesh, spin, Ms, Ms_inv):
         super(Demag, self).setup(mesh, spin, Ms, Ms_inv)
 
         if self.pbc_2d is True:
             self.demag = clib.FFTDemag(self.dx, self.dy, self.dz,
-                                       self.nx, self.ny, self.nz, tensor_type='2d_pbc')
+                                       self.nx, self.ny, self.nz, tensor_type='2d_pbc',
+                                       planning=self.planning,
+                                       precision=self.precision)
             nxyz = self.nx*self.ny*self.nz
             tensors = np.zeros(6*nxyz, dtype=np.float)
             pbc_2d_error = 1e-10
             sample_repeat_nx = -1
             sample_repeat_ny = -1
-            asymptotic_radius = 32.0
             dipolar_radius = 10000.0
-            tensor_file_name = None
             options = self.pbc_options
 
             if 'sample_repeat_nx' in options:
@@ -46,29 +72,25 @@ class Demag(Energy):
                 sample_repeat_ny = options['sample_repeat_ny']
             if 'relative_tensor_error' in options:
                 pbc_2d_error = options['relative_tensor_error']
-            if 'asymptotic_radius' in options:
-                asymptotic_radius = options['asymptotic_radius']
             if 'dipolar_radius' in options:
                 dipolar_radius = options['dipolar_radius']
-            #if 'tensor_file_name' in options:
-            #    tensor_file_name = options['tensor_file_name']
-
-            #if tensor_file_name:
-                #if not (os.path.exists(tensor_file_name+'.npz')):
-                #    self.demag.compute_tensors_2dpbc(tensors, pbc_2d_error, sample_repeat_nx, sample_repeat_ny, dipolar_radius)
-                #else:
-                #    npzfile = np.load(tensor_file_name+'.npz')
-                #    geo_info = npzfile['geo']
-                #    geo_arr = np.array([self.nx,self.ny, self.nz, self.dx, self.dy, self.dz], dtype=np.float)
-                #    #print 'info', geo_info
-                #    if not np.allclose(geo_arr, geo_info):
-                #        self.demag.compute_tensors_2dpbc(tensors, pbc_2d_error, sample_repeat_nx, sample_repeat_ny, dipolar_radius)
-                #    else:
-                #        tensors = npzfile['tensors']
-                #geo_arr = np.array([self.nx, self.ny, self.nz, self.dx, self.dy, self.dz], dtype=np.float)
-                #np.savez(tensor_file_name+'.npz', geo=geo_arr, tensors=tensors)
-
-            self.demag.compute_tensors_2dpbc(tensors, pbc_2d_error, sample_repeat_nx, sample_repeat_ny, dipolar_radius)
+            # The 2D PBC tensors need sums over many sample images, so they
+            # are stored in the on-disk tensor cache
+            cache = TensorCache() if self.tensor_cache else None
+            params = {'type': '2d_pbc', 'version': PBC_TENSOR_CACHE_VERSION,
+                      'n': (self.nx, self.ny, self.nz),
+                      'd': (repr(self.dx), repr(self.dy), repr(self.dz)),
+                      'pbc_2d_error': repr(pbc_2d_error),
+                      'sample_repeat': (sample_repeat_nx, sample_repeat_ny),
+                      'dipolar_radius': repr(dipolar_radius)}
+            cached = cache.load(params) if cache is not None else None
+
+            if cached is not None:
+                tensors = cached['tensors']
+            else:
+                self.demag.compute_tensors_2dpbc(tensors, pbc_2d_error, sample_repeat_nx, sample_repeat_ny, dipolar_radius)
+                if cache is not None:
+                    cache.save(params, tensors=tensors)
 
             #print tensors
             self.demag.fill_demag_tensors(tensors)
@@ -85,8 +107,26 @@ class Demag(Energy):
 
             self.demag = clib.FFTDemag(self.dx, self.dy, self.dz,
                                        self.nx, self.ny, self.nz,
-                                       tensor_type='demag')
-        if not self.calc_every:
+                                       tensor_type='demag',
+                                       planning=self.planning,
+                                       tensor_cache=self.tensor_cache,
+                                       precision=self.precision,
+                                       thin_film=self.thin_film)
+        self.demag_replicas = None
+        if self.extrapolation is not None:
+            orders = {'linear': 1, 'quadratic': 2}
+            if self.extrapolation not in orders:
+                raise ValueError("extrapolation is {}, should be 'linear' "
+                                 "or 'quadratic'".format(self.extrapolation))
+            if self.calc_every:
+                raise ValueError("calc_every and extrapolation cannot be "
+                                 "used together")
+            self.extrapolator = FieldExtrapolation(
+                lambda m, field: self.demag.compute_field(m, self.Ms, field),
+                3 * self.n, orders[self.extrapolation],
+                self.extrapolation_tol, self.extrapolation_max_dm)
+            self.compute_field = self.compute_field_extrapolated
+        elif not self.calc_every:
             self.compute_field = self.compute_field_every
         else:
             self.count = 0
@@ -114,6 +154,19 @@ class Demag(Energy):
             self.demag.compute_field(m, self.Ms, self.field)
             return self.field
 
+    def compute_field_extrapolated(self, t=0, spin=None):
+        if spin is not None:
+            return self.compute_field_every(t, spin)
+
+        return self.extrapolator.compute(t, self.spin, self.field)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        # The field of every copy is computed at every call, also with
+        # calc_every or extrapolation, which keep the state of one system
+        if self.demag_replicas is None:
+            self.demag_replicas = DemagReplicas(self.demag, self.n)
+        self.demag_replicas.add_field(spin, self.Ms, field, replicas)
+
     def compute_exact(self):
         field = np.zeros(3 * self.mesh.n)
         self.demag.compute_exact(self.spin, self.Ms, field)
@@ -121,7 +174,12 @@ class Demag(Energy):
 
     def compute_energy(self):
 
-        self.compute_field()
+        # The energy uses the exact field, which is not stored as an
+        # evaluation for the extrapolation (the time is not known here)
+        if self.extrapolation is not None:
+            self.compute_field_every()
+        else:
+            self.compute_field()
         energy = self.demag.compute_energy(self.spin, self.Ms,
                                            self.field, self.energy)
 
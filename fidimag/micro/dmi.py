@@ -270,9 +270,34 @@ class DMI(Energy):
         else:
             m = self.spin
 
+        self._compute(m, self.field, None, 0)
+
+        return self.field
+
+    def add_field(self, field, t=0):
+        self._compute(self.spin, field, None, 1)
+
+    def c_field_term(self):
+        return micro_clib.dmi_field_term_micro(self.Ms_inv,
+                                               self.Ds,
+                                               self.n_dmis,
+                                               self.dmi_vector,
+                                               self.dx,
+                                               self.dy,
+                                               self.dz,
+                                               self.n,
+                                               self.neighbours
+                                               )
+
+    def compute_field_and_energy(self, t=0):
+        self._compute(self.spin, self.field, self.energy, 0)
+
+        return self.field
+
+    def _compute(self, m, field, energy, add):
         micro_clib.compute_dmi_field(m,
-                                     self.field,
-                                     self.energy,
+                                     field,
+                                     energy,
                                      self.Ms_inv,
                                      self.Ds,
                                      self.n_dmis,
@@ -281,7 +306,6 @@ class DMI(Energy):
                                      self.dy,
                                      self.dz,
                                      self.n,
-                                     self.neighbours
+                                     self.neighbours,
+                                     add
                                      )
-
-        return self.field
@@ -1,4 +1,5 @@
 import numpy as np
+import fidimag.common.helper as helper
 
 
 class Energy(object):
@@ -7,6 +8,8 @@ class Energy(object):
     An abstract class to implement the basic functions such as setup in micromagnetics.
     """
 
+    _replica_arrays = None
+
     def setup(self, mesh, spin, Ms, Ms_inv):
         self.mesh = mesh
         self.dx = mesh.dx * mesh.unit_length
@@ -16,6 +19,7 @@ class Energy(object):
         self.ny = mesh.ny
         self.nz = mesh.nz
         self.spin = spin
+        self._replica_arrays = None
         self.n = mesh.n
 
         self.field = np.zeros(3 * mesh.n)
@@ -27,17 +31,82 @@ class Energy(object):
         # For old code compatibility
         self.xperiodic, self.yperiodic, self.zperiodic = mesh.periodicity
 
-        self.neighbours = mesh.neighbours
+    @property
+    def neighbours(self):
+        # The mesh creates the neighbours array when it is first used
+        return self.mesh.neighbours
 
     def compute_field(self, t=0):
 
         return 0
 
+    def add_field(self, field, t=0):
+        """
+        Accumulate the field of this interaction into the *field* array.
+        Interactions backed by a C kernel override this method so the field
+        is summed in place, without going through self.field
+        """
+        field += self.compute_field(t)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        """
+        Accumulate into *field* the field of this interaction for
+        *replicas* copies of the system, whose spins are stored one copy
+        after the other in *spin* (see Ensemble). By default the field is
+        computed copy by copy, using self.spin as a work array; interactions
+        with a C kernel override this method to compute all the copies in
+        a single call
+        """
+        spin_saved = self.spin.copy()
+        fields = field.reshape(replicas, -1)
+        for k, m in enumerate(spin.reshape(replicas, -1)):
+            self.spin[:] = m
+            fields[k] += self.compute_field(t)
+        self.spin[:] = spin_saved
+
+    def replica_array(self, name, replicas):
+        """
+        Returns the array attribute *name* (e.g. 'Ms_inv') repeated for
+        *replicas* copies of the system or, for 'neighbours', the
+        neighbours array of the copies (see helper.tile_neighbours). The
+        arrays are created at the first call, so the parameters of the
+        interaction should not be changed afterwards
+        """
+        if self._replica_arrays is None:
+            self._replica_arrays = {}
+
+        key = (name, replicas)
+        if key not in self._replica_arrays:
+            if name == 'neighbours':
+                array = helper.tile_neighbours(self.neighbours, replicas)
+            else:
+                array = np.tile(getattr(self, name), replicas)
+            self._replica_arrays[key] = array
+        return self._replica_arrays[key]
+
+    def add_local_jacobian(self, jac):
+        """
+        Accumulate into *jac* (3x3 row major blocks, 9 entries per mesh site)
+        the derivative of the field at every site with respect to the
+        magnetisation at the same site. It is used to build the block
+        diagonal preconditioner of the CVODE solver; interactions without a
+        local part (or without a C kernel for it) leave *jac* unchanged
+        """
+        pass
+
+    def compute_field_and_energy(self, t=0):
+        """
+        Compute the field together with the energy density array. The C
+        kernels skip the energy density in compute_field, since it is only
+        needed when the energy is requested
+        """
+        return self.compute_field(t)
+
     def compute_energy(self):
 
         # since we are not always calling this function, so it's okay to call
         # compute_field again
-        self.compute_field()
+        self.compute_field_and_energy()
 
         self.total_energy = np.sum(self.energy) * (self.mesh.dx *
                                                    self.mesh.dy *
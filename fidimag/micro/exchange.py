@@ -14,6 +14,11 @@ class UniformExchange(Energy):
         A: float
             A is the exchange stiffness constant measured in 
             Joules / Meter (J / M)
+
+    With a mesh created with implicit_stencil=True, the neighbours of
+    every cell are computed in the kernel from its position in the mesh,
+    instead of being read from the neighbours array of the mesh. The
+    local Jacobian for the preconditioner still uses the array.
     
     """
 
@@ -28,16 +33,70 @@ class UniformExchange(Energy):
         else:
             m = self.spin
 
+        self._compute(m, self.field, None, 0)
+
+        return self.field
+
+    def add_field(self, field, t=0):
+        self._compute(self.spin, field, None, 1)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        # The copies are a mesh with replicas * n cells, with the neighbours
+        # array of the copies (also for meshes with implicit_stencil)
+        micro_clib.compute_exchange_field_micro(
+            spin, field, None, self.replica_array('Ms_inv', replicas),
+            self.A, self.dx, self.dy, self.dz, replicas * self.n,
+            self.replica_array('neighbours', replicas), 1)
+
+    def c_field_term(self):
+        if self.mesh.implicit_stencil:
+            return micro_clib.exchange_field_term_micro_implicit(
+                self.Ms_inv, self.A, self.dx, self.dy, self.dz,
+                self.nx, self.ny, self.nz,
+                self.xperiodic, self.yperiodic, self.zperiodic)
+
+        return micro_clib.exchange_field_term_micro(self.Ms_inv,
+                                                    self.A,
+                                                    self.dx,
+                                                    self.dy,
+                                                    self.dz,
+                                                    self.n,
+                                                    self.neighbours
+                                                    )
+
+    def add_local_jacobian(self, jac):
+        micro_clib.compute_exchange_local_jac_micro(jac,
+                                                    self.Ms_inv,
+                                                    self.A,
+                                                    self.dx,
+                                                    self.dy,
+                                                    self.dz,
+                                                    self.n,
+                                                    self.neighbours
+                                                    )
+
+    def compute_field_and_energy(self, t=0):
+        self._compute(self.spin, self.field, self.energy, 0)
+
+        return self.field
+
+    def _compute(self, m, field, energy, add):
+        if self.mesh.implicit_stencil:
+            micro_clib.compute_exchange_field_micro_implicit(
+                m, field, energy, self.Ms_inv, self.A,
+                self.dx, self.dy, self.dz, self.nx, self.ny, self.nz,
+                self.xperiodic, self.yperiodic, self.zperiodic, add)
+            return
+
         micro_clib.compute_exchange_field_micro(m,
-                                                self.field,
-                                                self.energy,
+                                                field,
+                                                energy,
                                                 self.Ms_inv,
                                                 self.A,
                                                 self.dx,
                                                 self.dy,
                                                 self.dz,
                                                 self.n,
-                                                self.neighbours
+                                                self.neighbours,
+                                                add
                                                 )
-
-        return self.field
@@ -2,7 +2,7 @@
 
 
 void compute_uniaxial_anis(double *restrict m, double *restrict field, double *restrict energy, double *restrict Ms_inv, 
-	double *restrict Ku, double *restrict axis, int nx, int ny, int nz) {
+	double *restrict Ku, double *restrict axis, int nx, int ny, int nz, int add) {
 	
 	int n = nx * ny * nz;
 
@@ -11,28 +11,58 @@ void compute_uniaxial_anis(double *restrict m, double *restrict field, double *r
 		int j = 3 * i;
 
 		if (Ms_inv[i] == 0.0){
-			field[j] = 0;
-            field[j + 1] = 0;
-            field[j + 2] = 0;
-            energy[i] = 0;
+            store_field(field, i, 0, 0, 0, add);
+            if (energy != NULL) {
+                energy[i] = 0;
+            }
             continue;
         }
 
         double m_u = m[j] * axis[j] + m[j + 1] * axis[j + 1] + m[j + 2] * axis[j + 2];
 
-		field[j]     = 2 * Ku[i] * m_u * Ms_inv[i] * MU0_INV * axis[j];
-		field[j + 1] = 2 * Ku[i] * m_u * Ms_inv[i] * MU0_INV * axis[j + 1];
-		field[j + 2] = 2 * Ku[i] * m_u * Ms_inv[i] * MU0_INV * axis[j + 2];
+		store_field(field, i,
+		            2 * Ku[i] * m_u * Ms_inv[i] * MU0_INV * axis[j],
+		            2 * Ku[i] * m_u * Ms_inv[i] * MU0_INV * axis[j + 1],
+		            2 * Ku[i] * m_u * Ms_inv[i] * MU0_INV * axis[j + 2],
+		            add);
 
-		energy[i] = Ku[i] * (1 - m_u * m_u);
+		if (energy != NULL) {
+		    energy[i] = Ku[i] * (1 - m_u * m_u);
+		}
 
 	}
 
 }
 
 
+void uniaxial_anis_local_jac(double *restrict jac, double *restrict Ms_inv,
+                             double *restrict Ku, double *restrict axis, int n) {
+
+    /* Accumulate into jac (3x3 row major blocks per mesh node) the derivative
+     * of the uniaxial anisotropy field with respect to the magnetisation at
+     * the same node: 2 Ku / (mu0 Ms) u u^T
+     */
+    #pragma omp parallel for
+    for (int i = 0; i < n; i++) {
+        int j = 3 * i;
+
+        if (Ms_inv[i] == 0.0) {
+            continue;
+        }
+
+        double c = 2 * Ku[i] * Ms_inv[i] * MU0_INV;
+        for (int a = 0; a < 3; a++) {
+            for (int b = 0; b < 3; b++) {
+                jac[9 * i + 3 * a + b] += c * axis[j + a] * axis[j + b];
+            }
+        }
+    }
+
+}
+
+
 void compute_uniaxial4_anis(double *restrict m, double *restrict field, double *restrict energy, double *restrict Ms_inv, 
-    double *restrict K1, double *restrict K2, double *restrict axis, int nx, int ny, int nz) {
+    double *restrict K1, double *restrict K2, double *restrict axis, int nx, int ny, int nz, int add) {
     
     int n = nx * ny * nz;
 
@@ -44,10 +74,10 @@ void compute_uniaxial4_anis(double *restrict m, double *restrict field, double *
         int j = 3 * i;
 
         if (Ms_inv[i] == 0.0) {
-            field[j] = 0;
-            field[j + 1] = 0;
-            field[j + 2] = 0;
-            energy[i] = 0;
+            store_field(field, i, 0, 0, 0, add);
+            if (energy != NULL) {
+                energy[i] = 0;
+            }
             continue;
         }
 
@@ -59,10 +89,14 @@ void compute_uniaxial4_anis(double *restrict m, double *restrict field, double *
         double m_dot_u = m[j] * axis[j] + m[j + 1] * axis[j + 1] + m[j + 2] * axis[j + 2];
 
         if (k1 <= 0) {
-            field[j + 0] = (field_mult1*m_dot_u) * axis[j + 0] + (field_mult2 * m_dot_u*m_dot_u*m_dot_u) * axis[j + 0];
-            field[j + 1] = (field_mult1*m_dot_u) * axis[j + 1] + (field_mult2 * m_dot_u*m_dot_u*m_dot_u) * axis[j + 1];
-            field[j + 2] = (field_mult1*m_dot_u) * axis[j + 2] + (field_mult2 * m_dot_u*m_dot_u*m_dot_u) * axis[j + 2];
-            energy[i] = -k1*m_dot_u*m_dot_u - k2*m_dot_u*m_dot_u*m_dot_u*m_dot_u;
+            store_field(field, i,
+                        (field_mult1*m_dot_u) * axis[j + 0] + (field_mult2 * m_dot_u*m_dot_u*m_dot_u) * axis[j + 0],
+                        (field_mult1*m_dot_u) * axis[j + 1] + (field_mult2 * m_dot_u*m_dot_u*m_dot_u) * axis[j + 1],
+                        (field_mult1*m_dot_u) * axis[j + 2] + (field_mult2 * m_dot_u*m_dot_u*m_dot_u) * axis[j + 2],
+                        add);
+            if (energy != NULL) {
+                energy[i] = -k1*m_dot_u*m_dot_u - k2*m_dot_u*m_dot_u*m_dot_u*m_dot_u;
+            }
         }
 
         else {
@@ -71,10 +105,14 @@ void compute_uniaxial4_anis(double *restrict m, double *restrict field, double *
             u_x_m[1] = cross_y(axis[j], axis[j+1], axis[j+2], m[j], m[j+1], m[j+2]);
             u_x_m[2] = cross_z(axis[j], axis[j+1], axis[j+2], m[j], m[j+1], m[j+2]);
             double u_x_m_mag2 = u_x_m[1]*u_x_m[1] + u_x_m[1]*u_x_m[1] + u_x_m[2]*u_x_m[2];
-            field[j + 0] = (field_mult1*m_dot_u) * axis[j + 0] + (field_mult2*m_dot_u*m_dot_u*m_dot_u) * axis[j + 0];
-            field[j + 1] = (field_mult1*m_dot_u) * axis[j + 1] + (field_mult2*m_dot_u*m_dot_u*m_dot_u) * axis[j + 1];
-            field[j + 2] = (field_mult1*m_dot_u) * axis[j + 2] + (field_mult2*m_dot_u*m_dot_u*m_dot_u) * axis[j + 2];
-            energy[i] = (k1 + 2*k2)*u_x_m_mag2 - k2*u_x_m_mag2*u_x_m_mag2;
+            store_field(field, i,
+                        (field_mult1*m_dot_u) * axis[j + 0] + (field_mult2*m_dot_u*m_dot_u*m_dot_u) * axis[j + 0],
+                        (field_mult1*m_dot_u) * axis[j + 1] + (field_mult2*m_dot_u*m_dot_u*m_dot_u) * axis[j + 1],
+                        (field_mult1*m_dot_u) * axis[j + 2] + (field_mult2*m_dot_u*m_dot_u*m_dot_u) * axis[j + 2],
+                        add);
+            if (energy != NULL) {
+                energy[i] = (k1 + 2*k2)*u_x_m_mag2 - k2*u_x_m_mag2*u_x_m_mag2;
+            }
         }
     }
 
@@ -271,7 +271,7 @@ void dmi_field(double *restrict m, double *restrict field,
                double *restrict D, int n_dmis, 
                double *dmi_vector,
                double dx, double dy, double dz,
-               int n, int *restrict ngbs) {
+               int n, int *restrict ngbs, int add) {
 
     /* These are for the DMI prefactor or coefficient */
     double dxs[6] = {dx, dx, dy, dy, dz, dz};
@@ -284,10 +284,10 @@ void dmi_field(double *restrict m, double *restrict field,
         int idn = 6 * i; // index for the neighbours
         /* Set a zero field for sites without magnetic material */
         if (Ms_inv[i] == 0.0){
-            field[3 * i] = 0;
-            field[3 * i + 1] = 0;
-            field[3 * i + 2] = 0;
-            energy[i] = 0;
+            store_field(field, i, 0, 0, 0, add);
+            if (energy != NULL) {
+                energy[i] = 0;
+            }
             continue;
         }
 
@@ -354,12 +354,16 @@ void dmi_field(double *restrict m, double *restrict field,
         }  // Close for loop through neighbours per mesh site
 
         /* Energy as: (-mu0 * Ms / 2) * [ H_dmi * m ]   */
-        energy[i] = -0.5 * (fx * m[3 * i] + fy * m[3 * i + 1]
-        		+ fz * m[3 * i + 2]);
+        if (energy != NULL) {
+            energy[i] = -0.5 * (fx * m[3 * i] + fy * m[3 * i + 1]
+            		+ fz * m[3 * i + 2]);
+        }
 
         /* Update the field H_dmi which has the same structure than *m */
-        field[3 * i]     = fx * Ms_inv[i] * MU0_INV;
-        field[3 * i + 1] = fy * Ms_inv[i] * MU0_INV;
-        field[3 * i + 2] = fz * Ms_inv[i] * MU0_INV;
+        store_field(field, i,
+                    fx * Ms_inv[i] * MU0_INV,
+                    fy * Ms_inv[i] * MU0_INV,
+                    fz * Ms_inv[i] * MU0_INV,
+                    add);
     }
 }
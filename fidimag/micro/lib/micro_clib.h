@@ -1,4 +1,5 @@
 #include<math.h>
+#include<stddef.h>
 
 #include<omp.h>
 
@@ -13,23 +14,71 @@ inline double cross_y(double a0, double a1, double a2,
 inline double cross_z(double a0, double a1, double a2,
                       double b0, double b1, double b2) { return a0*b1 - a1*b0; }
 
+/* Store the field vector (fx, fy, fz) of the i-th mesh site. When add is
+ * non zero the vector is accumulated into the field array instead, which
+ * lets several interactions sum directly into the effective field */
+inline void store_field(double *restrict field, int i,
+                        double fx, double fy, double fz, int add) {
+    if (add) {
+        field[3 * i]     += fx;
+        field[3 * i + 1] += fy;
+        field[3 * i + 2] += fz;
+    } else {
+        field[3 * i]     = fx;
+        field[3 * i + 1] = fy;
+        field[3 * i + 2] = fz;
+    }
+}
+
+/* Indexes of the neighbours, in the order -x, +x, -y, +y, -z, +z, of the
+ * i-th cell of a cuboid mesh of nx * ny * nz cells (x index running
+ * fastest), as in CuboidMesh.neighbours: -1 for neighbours outside the mesh,
+ * which wraps around the periodic directions */
+inline void cuboid_neighbours(int i, int nx, int ny, int nz,
+                              int xperiodic, int yperiodic, int zperiodic,
+                              int *restrict ngbs) {
+    int nxy = nx * ny;
+    int x = i % nx, y = (i / nx) % ny, z = i / nxy;
+
+    ngbs[0] = x > 0 ? i - 1 : (xperiodic ? i + nx - 1 : -1);
+    ngbs[1] = x < nx - 1 ? i + 1 : (xperiodic ? i - nx + 1 : -1);
+    ngbs[2] = y > 0 ? i - nx : (yperiodic ? i + nxy - nx : -1);
+    ngbs[3] = y < ny - 1 ? i + nx : (yperiodic ? i - nxy + nx : -1);
+    ngbs[4] = z > 0 ? i - nxy : (zperiodic ? i + (nz - 1) * nxy : -1);
+    ngbs[5] = z < nz - 1 ? i + nxy : (zperiodic ? i - (nz - 1) * nxy : -1);
+}
+
 void compute_exch_field_micro(double *restrict m, double *restrict field, double *restrict energy, double *restrict Ms_inv,
-                         double A, double dx, double dy, double dz, int n, int *ngbs);
+                         double A, double dx, double dy, double dz, int n, int *ngbs, int add);
+
+void compute_exch_field_micro_implicit(double *restrict m, double *restrict field,
+                                       double *restrict energy, double *restrict Ms_inv,
+                                       double A, double dx, double dy, double dz,
+                                       int nx, int ny, int nz,
+                                       int xperiodic, int yperiodic, int zperiodic,
+                                       int add);
+
+void exch_local_jac_micro(double *restrict jac, double *restrict Ms_inv,
+                          double A, double dx, double dy, double dz,
+                          int n, int *restrict ngbs);
 
 void dmi_field(double *restrict m, double *restrict field,
                double *restrict energy, double *restrict Ms_inv,
                double *restrict D, int n_DMIs,
                double *dmi_vector,
-               double dx, double dy, double dz, int n, int *ngbs);
+               double dx, double dy, double dz, int n, int *ngbs, int add);
 
 void compute_exch_field_rkky_micro(double *m, double *field, double *energy, double *Ms_inv,
                          double sigma, int nx, double ny, double nz, int z_bottom, int z_top);
 
 void compute_uniaxial_anis(double *restrict m, double *restrict field, double *restrict energy, double *restrict Ms_inv,
-	double *restrict Ku, double *restrict axis, int nx, int ny, int nz);
+	double *restrict Ku, double *restrict axis, int nx, int ny, int nz, int add);
+
+void uniaxial_anis_local_jac(double *restrict jac, double *restrict Ms_inv,
+                             double *restrict Ku, double *restrict axis, int n);
 
 void compute_uniaxial4_anis(double *restrict m, double *restrict field, double *restrict energy, double *restrict Ms_inv, 
-    double *restrict K1, double *restrict K2, double *restrict axis, int nx, int ny, int nz);
+    double *restrict K1, double *restrict K2, double *restrict axis, int nx, int ny, int nz, int add);
 
 double skyrmion_number(double *restrict spin, double *restrict charge,
                        int nx, int ny, int nz, int *restrict ngbs);
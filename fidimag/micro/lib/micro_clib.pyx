@@ -1,11 +1,22 @@
 import numpy as np
 cimport numpy as np
 
-cdef extern from "micro_clib.h":
+include "../../common/lib/native_rhs.pxi"
+
+cdef extern from "micro_clib.h" nogil:
     void compute_exch_field_micro(double *m, double *field,
                                   double *energy, double *Ms_inv,
                                   double A, double dx, double dy, double dz,
-                                  int n, int *ngbs)
+                                  int n, int *ngbs, int add)
+    void compute_exch_field_micro_implicit(double *m, double *field,
+                                           double *energy, double *Ms_inv,
+                                           double A, double dx, double dy,
+                                           double dz, int nx, int ny, int nz,
+                                           int xperiodic, int yperiodic,
+                                           int zperiodic, int add)
+    void exch_local_jac_micro(double *jac, double *Ms_inv,
+                              double A, double dx, double dy, double dz,
+                              int n, int *ngbs)
     void compute_exch_field_rkky_micro(double *m, double *field, double *energy,
                                   double *Ms_inv, double sigma, int nx, double ny,
                                   double nz, int z_bottom, int z_top)
@@ -14,19 +25,21 @@ cdef extern from "micro_clib.h":
                    double *D, int n_dmis,
                    double *dmi_vector,
                    double dx, double dy, double dz,
-                   int n, int *ngbs)
+                   int n, int *ngbs, int add)
 
     void compute_uniaxial_anis(double *m, double *field,
                                double *energy, double *Ms_inv,
                                double *Ku, double *axis,
-                               int nx, int ny, int nz)
+                               int nx, int ny, int nz, int add)
 
+    void uniaxial_anis_local_jac(double *jac, double *Ms_inv,
+                                 double *Ku, double *axis, int n)
 
     void compute_uniaxial4_anis(double *m, double *field,
                                double *energy, double *Ms_inv,
                                double *K1, double *K2,
                                double *axis,
-                               int nx, int ny, int nz)
+                               int nx, int ny, int nz, int add)
 
 
     double skyrmion_number(double *m, double *charge,
@@ -35,15 +48,45 @@ cdef extern from "micro_clib.h":
 
 
 
+cdef inline double *energy_ptr(double [:] energy):
+    # A None energy array skips the energy density computation in the
+    # kernels, which only compute the field in that case
+    if energy is None:
+        return NULL
+    return &energy[0]
+
+
 def compute_exchange_field_micro(double [:] m,
                                  double [:] field,
                                  double [:] energy,
                                  double [:] Ms_inv,
                                  A, dx, dy, dz, n,
-                                 int [:, :] ngbs):
+                                 int [:, :] ngbs,
+                                 add=0):
+
+    compute_exch_field_micro(&m[0], &field[0], energy_ptr(energy), &Ms_inv[0], A,
+                             dx, dy, dz, n, &ngbs[0, 0], add)
+
+
+def compute_exchange_field_micro_implicit(double [:] m,
+                                          double [:] field,
+                                          double [:] energy,
+                                          double [:] Ms_inv,
+                                          A, dx, dy, dz, nx, ny, nz,
+                                          xperiodic, yperiodic, zperiodic,
+                                          add=0):
+
+    compute_exch_field_micro_implicit(&m[0], &field[0], energy_ptr(energy),
+                                      &Ms_inv[0], A, dx, dy, dz, nx, ny, nz,
+                                      xperiodic, yperiodic, zperiodic, add)
+
 
-    compute_exch_field_micro(&m[0], &field[0], &energy[0], &Ms_inv[0], A,
-                             dx, dy, dz, n, &ngbs[0, 0])
+def compute_exchange_local_jac_micro(double [:] jac,
+                                     double [:] Ms_inv,
+                                     A, dx, dy, dz, n,
+                                     int [:, :] ngbs):
+
+    exch_local_jac_micro(&jac[0], &Ms_inv[0], A, dx, dy, dz, n, &ngbs[0, 0])
 
 
 def compute_exchange_field_micro_rkky(double [:] m,
@@ -65,12 +108,13 @@ def compute_dmi_field(double [:] m,
                       double [:] dmi_vector,
                       dx, dy, dz,
                       n,
-                      int [:, :] ngbs
+                      int [:, :] ngbs,
+                      add=0
                       ):
 
-    dmi_field(&m[0], &field[0], &energy[0], &Ms_inv[0],
+    dmi_field(&m[0], &field[0], energy_ptr(energy), &Ms_inv[0],
               &D[0], n_dmis, &dmi_vector[0],
-              dx, dy, dz, n, &ngbs[0, 0])
+              dx, dy, dz, n, &ngbs[0, 0], add)
 
 
 def compute_anisotropy_micro(double [:] m,
@@ -79,10 +123,19 @@ def compute_anisotropy_micro(double [:] m,
                              double [:] Ms_inv,
                              double [:] Ku,
                              double [:] axis,
-                             nx, ny, nz):
+                             nx, ny, nz, add=0):
+
+    compute_uniaxial_anis(&m[0], &field[0], energy_ptr(energy), &Ms_inv[0],
+                          &Ku[0], &axis[0], nx, ny, nz, add)
+
+
+def compute_anisotropy_local_jac_micro(double [:] jac,
+                                       double [:] Ms_inv,
+                                       double [:] Ku,
+                                       double [:] axis,
+                                       n):
 
-    compute_uniaxial_anis(&m[0], &field[0], &energy[0], &Ms_inv[0],
-                          &Ku[0], &axis[0], nx, ny, nz)
+    uniaxial_anis_local_jac(&jac[0], &Ms_inv[0], &Ku[0], &axis[0], n)
 
 
 def compute_anisotropy4_micro(double [:] m,
@@ -92,10 +145,10 @@ def compute_anisotropy4_micro(double [:] m,
                              double [:] K1,
                              double [:] K2,
                              double [:] axis,
-                             nx, ny, nz):
+                             nx, ny, nz, add=0):
 
-    compute_uniaxial4_anis(&m[0], &field[0], &energy[0], &Ms_inv[0],
-                          &K1[0], &K2[0], &axis[0], nx, ny, nz)
+    compute_uniaxial4_anis(&m[0], &field[0], energy_ptr(energy), &Ms_inv[0],
+                          &K1[0], &K2[0], &axis[0], nx, ny, nz, add)
 
 
 def compute_skyrmion_number(double [:] m,
@@ -104,3 +157,106 @@ def compute_skyrmion_number(double [:] m,
                             int [:, :] ngbs):
 
     return skyrmion_number(&m[0], &charge[0], nx, ny, nz, &ngbs[0, 0])
+
+
+# -----------------------------------------------------------------------------
+# C entry points of the interactions for the compiled right hand side. The
+# field is added to the effective field array and the energy is not computed
+
+cdef struct exch_params:
+    double *Ms_inv
+    double A, dx, dy, dz
+    int n
+    int *ngbs
+
+cdef void exch_field_term(void *params, double *m, double *field,
+                          double t) nogil:
+    cdef exch_params *p = <exch_params *> params
+    compute_exch_field_micro(m, field, NULL, p.Ms_inv, p.A,
+                             p.dx, p.dy, p.dz, p.n, p.ngbs, 1)
+
+def exchange_field_term_micro(double [:] Ms_inv, A, dx, dy, dz, n,
+                              int [:, :] ngbs):
+    cdef exch_params *p = <exch_params *> malloc(sizeof(exch_params))
+    p.Ms_inv = &Ms_inv[0]
+    p.A, p.dx, p.dy, p.dz = A, dx, dy, dz
+    p.n = n
+    p.ngbs = &ngbs[0, 0]
+    return field_term_capsule(exch_field_term, p)
+
+
+cdef struct exch_implicit_params:
+    double *Ms_inv
+    double A, dx, dy, dz
+    int nx, ny, nz
+    int xperiodic, yperiodic, zperiodic
+
+cdef void exch_implicit_field_term(void *params, double *m, double *field,
+                                   double t) nogil:
+    cdef exch_implicit_params *p = <exch_implicit_params *> params
+    compute_exch_field_micro_implicit(m, field, NULL, p.Ms_inv, p.A,
+                                      p.dx, p.dy, p.dz, p.nx, p.ny, p.nz,
+                                      p.xperiodic, p.yperiodic, p.zperiodic,
+                                      1)
+
+def exchange_field_term_micro_implicit(double [:] Ms_inv, A, dx, dy, dz,
+                                       nx, ny, nz,
+                                       xperiodic, yperiodic, zperiodic):
+    cdef exch_implicit_params *p = <exch_implicit_params *> malloc(
+        sizeof(exch_implicit_params))
+    p.Ms_inv = &Ms_inv[0]
+    p.A, p.dx, p.dy, p.dz = A, dx, dy, dz
+    p.nx, p.ny, p.nz = nx, ny, nz
+    p.xperiodic, p.yperiodic, p.zperiodic = xperiodic, yperiodic, zperiodic
+    return field_term_capsule(exch_implicit_field_term, p)
+
+
+cdef struct dmi_params:
+    double *Ms_inv
+    double *D
+    int n_dmis
+    double *dmi_vector
+    double dx, dy, dz
+    int n
+    int *ngbs
+
+cdef void dmi_field_term(void *params, double *m, double *field,
+                         double t) nogil:
+    cdef dmi_params *p = <dmi_params *> params
+    dmi_field(m, field, NULL, p.Ms_inv, p.D, p.n_dmis, p.dmi_vector,
+              p.dx, p.dy, p.dz, p.n, p.ngbs, 1)
+
+def dmi_field_term_micro(double [:] Ms_inv, double [:] D, n_dmis,
+                         double [:] dmi_vector, dx, dy, dz, n,
+                         int [:, :] ngbs):
+    cdef dmi_params *p = <dmi_params *> malloc(sizeof(dmi_params))
+    p.Ms_inv = &Ms_inv[0]
+    p.D = &D[0]
+    p.n_dmis = n_dmis
+    p.dmi_vector = &dmi_vector[0]
+    p.dx, p.dy, p.dz = dx, dy, dz
+    p.n = n
+    p.ngbs = &ngbs[0, 0]
+    return field_term_capsule(dmi_field_term, p)
+
+
+cdef struct anis_params:
+    double *Ms_inv
+    double *Ku
+    double *axis
+    int nx, ny, nz
+
+cdef void anis_field_term(void *params, double *m, double *field,
+                          double t) nogil:
+    cdef anis_params *p = <anis_params *> params
+    compute_uniaxial_anis(m, field, NULL, p.Ms_inv, p.Ku, p.axis,
+                          p.nx, p.ny, p.nz, 1)
+
+def anisotropy_field_term_micro(double [:] Ms_inv, double [:] Ku,
+                                double [:] axis, nx, ny, nz):
+    cdef anis_params *p = <anis_params *> malloc(sizeof(anis_params))
+    p.Ms_inv = &Ms_inv[0]
+    p.Ku = &Ku[0]
+    p.axis = &axis[0]
+    p.nx, p.ny, p.nz = nx, ny, nz
+    return field_term_capsule(anis_field_term, p)
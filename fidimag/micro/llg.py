@@ -64,29 +64,75 @@ class LLG(MicroDriver):
                              self.gamma,
                              self.mesh.n,
                              self.do_precession,
-                             self.default_c
+                             self.norm_correction
                              )
 
         # ydot[:] = self.dm_dt[:]
 
         return 0
 
+    def build_native_rhs(self):
+        return self.native_llg_rhs()
+
+    def cayley_axis(self, t, y, w, dt):
+        """
+        Rotation vector of the LLG equation for the Cayley integrator
+        """
+        self.spin[:] = y
+        self.t = t
+
+        self.compute_effective_field(t)
+
+        clib.compute_llg_cayley_axis(w,
+                                     self.spin,
+                                     self.field,
+                                     self._alpha,
+                                     self._pins,
+                                     self.gamma,
+                                     self.n,
+                                     self.do_precession,
+                                     dt)
+
     def sundials_jtimes(self, mp, Jmp, t, m, fy):
-        # From the micro_driver class:
-        self.compute_effective_field_jac(t, mp)
+        # CVODE evaluates the right hand side at m before solving the linear
+        # system, so self.field holds the effective field at m
+        field_p = self.compute_effective_field_jac(t, mp)
 
         clib.compute_llg_jtimes(Jmp,
-                                m, fy,
-                                mp, self.field,
+                                m, self.field,
+                                mp, field_p,
                                 self.alpha,
                                 self._pins,
                                 self.gamma,
                                 self.n,
                                 self.do_precession,
-                                self.default_c
+                                self.norm_correction
                                 )
         return 0
 
+    def sundials_psetup(self, t, m, jac):
+        """
+        Fill jac with the 3x3 blocks of the LLG Jacobian that couple the
+        magnetisation components at every mesh site. CVODE inverts
+        (I - gamma * J) with these blocks to precondition the SPGMR solver.
+        Only the local part of the field (exchange self term, anisotropy)
+        is included in the derivative, the rest enters through H_eff
+        """
+        # As in sundials_jtimes, CVODE evaluates the right hand side at m
+        # before the setup, so self.field holds the effective field at m
+        clib.compute_llg_local_jac(jac,
+                                   m,
+                                   self.field,
+                                   self.compute_local_jacobian(),
+                                   self._alpha,
+                                   self._pins,
+                                   self.gamma,
+                                   self.n,
+                                   self.do_precession,
+                                   self.norm_correction
+                                   )
+        return 0
+
     def step_rhs(self, t, y):
         self.spin[:] = y[:]
         self.t = t
@@ -102,7 +148,7 @@ class LLG(MicroDriver):
                              self.gamma,
                              self.n,
                              self.do_precession,
-                             self.default_c
+                             self.norm_correction
                              )
         return self.dm_dt
 
@@ -57,6 +57,21 @@ class LLG_STT(MicroDriver):
 
     Note that if not set, then *no current will be applied in that direction*.
 
+    The functions are evaluated at every mesh site every time the right
+    hand side of the equation is computed. If the current density is a
+    spatial profile times a function of time, use instead:
+
+        def time_fun(t, T):
+            return np.sin(t / T)
+
+        sim.driver.add_current((1e12, 0, 0), time_fun, extra_args=[1e-9])
+
+    so the profile is only computed once. The profile can be any of the
+    values accepted by Sim.set_m (e.g. a function of the position), and
+    several currents can be added, e.g. to decompose a current in a few
+    basis profiles with their own time dependence. These currents are
+    added to the (constant) current given by jx, jy and jz.
+
     This class inherits common methods to evolve the system using CVODE, from
     the micro_driver.MicroDriver class. Arrays with the system information
     are taken as references from the main micromagnetic Simulation class
@@ -91,6 +106,12 @@ class LLG_STT(MicroDriver):
         self.jy_function = None
         self.jz_function = None
 
+        # Time dependent currents: (3, n) arrays with the jx, jy and jz
+        # profiles, the time functions and their arguments
+        self._currents = []
+        self._j = np.zeros((3, self.n))
+        self._j_term = np.zeros((3, self.n))
+
         # FIXME: change the u0 to spatial
         self.u0 = const.g_e * const.mu_B / (2 * const.c_e)
 
@@ -118,11 +139,27 @@ class LLG_STT(MicroDriver):
 
     jz = property(get_jz, set_jz)
 
-    def sundials_rhs(self, t, y, ydot):
-        self.t = t
-        # already synchronized when call this funciton
-        # self.spin[:]=y[:]
-        self.compute_effective_field(t)
+    def add_current(self, j, time_fun, extra_args=[]):
+        """
+        Add the current density j(r) * time_fun(t, *extra_args), in A / m^2.
+
+        j can be a vector (jx, jy, jz), a function of the position or an
+        array, as in Sim.set_m, and time_fun returns a number
+        """
+        profile = helper.init_vector(j, self.mesh, 3)
+        self._currents.append((profile.reshape(-1, 3).T.copy(),
+                               time_fun, extra_args))
+
+    def reset_currents(self):
+        """
+        Remove the currents added with add_current
+        """
+        self._currents = []
+
+    def compute_current(self, t):
+        """
+        Returns the arrays jx, jy and jz of the current density at time t
+        """
         if self.jx_function:
             self.set_jx(self.jx_function, t)
         if self.jy_function:
@@ -130,11 +167,30 @@ class LLG_STT(MicroDriver):
         if self.jz_function:
             self.set_jz(self.jz_function, t)
 
+        if not self._currents:
+            return self._jx, self._jy, self._jz
+
+        self._j[0] = self._jx
+        self._j[1] = self._jy
+        self._j[2] = self._jz
+        for profile, time_fun, extra_args in self._currents:
+            np.multiply(profile, time_fun(t, *extra_args), out=self._j_term)
+            self._j += self._j_term
+
+        return self._j
+
+    def sundials_rhs(self, t, y, ydot):
+        self.t = t
+        # already synchronized when call this funciton
+        # self.spin[:]=y[:]
+        self.compute_effective_field(t)
+        jx, jy, jz = self.compute_current(t)
+
         clib.compute_stt_field(self.spin,
                                self.field_stt,
-                               self._jx,
-                               self._jy,
-                               self._jz,
+                               jx,
+                               jy,
+                               jz,
                                self.mesh.dx * self.mesh.unit_length,
                                self.mesh.dy * self.mesh.unit_length,
                                self.mesh.dz * self.mesh.unit_length,
@@ -151,21 +151,18 @@ class Sim(SimBase):
         """
 
         self._Ms[:] = helper.init_scalar(value, self.mesh)
-        nonzero = 0
-        for i in range(self.n):
-            if self._Ms[i] > 0.0:
-                self._Ms_inv[i] = 1.0 / self._Ms[i]
-                nonzero += 1
+        material = self._Ms > 0.0
+        self._Ms_inv[material] = 1.0 / self._Ms[material]
+        nonzero = np.count_nonzero(material)
 
         # We moved this variable to the micro_driver class
         self.driver.n_nonzero = nonzero
 
-        for i in range(len(self._Ms)):
-            if self._Ms[i] == 0.0:
-                self._pins[i] = 1
+        empty = self._Ms == 0.0
+        self._pins[empty] = 1
 
-                # Set the neighbour index to -1 for sites with Ms = 0
-                self.mesh.neighbours[self.mesh.neighbours == i] = -1
+        # Set the neighbour index to -1 for sites with Ms = 0
+        self.mesh.mask_neighbours(empty)
 
         # TODO: Check if this is necessary here, it is only defined
         # for the LLG STT in the drivers
@@ -1,6 +1,7 @@
 import numpy as np
 from fidimag.common.constant import mu_0
 import fidimag.common.helper as helper
+import fidimag.extensions.common_clib as clib
 import inspect
 
 
@@ -85,6 +86,16 @@ class Zeeman(object):
     def compute_field(self, t=0, spin=None):
         return self.field
 
+    def add_field(self, field, t=0):
+        field += self.compute_field(t)
+
+    def add_field_replicas(self, spin, field, replicas, t=0):
+        # The applied field does not depend on the spins
+        field.reshape(replicas, -1)[:] += self.compute_field(t)
+
+    def c_field_term(self):
+        return clib.constant_field_term(self.field)
+
     def average_field(self):
         # Remember that fields are: [fx0, fy0, fz0, fx1, fy1, fz1, fx2, ...]
         # So we jump in steps of 3 starting from the 0, 1 and 2nd elements
@@ -111,6 +122,9 @@ class TimeZeeman(Zeeman):
     The time dependent external field, also can vary with space
     """
 
+    # The field is computed in Python, see DriverBase.native_llg_rhs
+    c_field_term = None
+
     def __init__(self, H0, time_fun, extra_args=[], name='TimeZeeman'):
         self.H0 = H0
         self.time_fun = time_fun
@@ -97,7 +97,7 @@ fmm_sources += glob_cfiles(FMMLIB_DIR, excludes=[], extension="*.c")
 
 
 
-com_libs = ['m', 'fftw3_omp', 'fftw3', 'sundials_cvodes',
+com_libs = ['m', 'fftw3_omp', 'fftw3', 'fftw3f_omp', 'fftw3f', 'sundials_cvodes',
             'sundials_nvecserial', 'sundials_nvecopenmp', 'blas', 'lapack']
 
 
@@ -6,3 +6,16 @@ import tempfile
 def config():
     tmpdir = tempfile.mkdtemp(suffix='fidimag-tests')
     os.chdir(tmpdir)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cache_dir():
+    # The FFTW wisdom and demag tensors of the tests are not written into
+    # the per-user cache (tests which check the cache set their own)
+    old = os.environ.get('FIDIMAG_CACHE_DIR')
+    os.environ['FIDIMAG_CACHE_DIR'] = tempfile.mkdtemp(suffix='fidimag-cache')
+    yield
+    if old is None:
+        del os.environ['FIDIMAG_CACHE_DIR']
+    else:
+        os.environ['FIDIMAG_CACHE_DIR'] = old
@@ -214,6 +214,39 @@ def test_neighbours_multiple():
                                         {4, 2, 7}, {5, 6, 3}]  # for cells 6, 7
 
 
+def test_neighbours_vectorised():
+    """
+    The neighbours arrays are the ones given by the index method, which
+    wraps the periodic directions
+    """
+    for periodicity in [(False, False, False), (True, False, True),
+                        (False, True, False), (True, True, True)]:
+        mesh = CuboidMesh(nx=4, ny=1, nz=3, periodicity=periodicity)
+        for d, ngbs in ((1, mesh.neighbours), (2, mesh.next_neighbours)):
+            for c in mesh.cells():
+                i = c % mesh.nx
+                j = (c // mesh.nx) % mesh.ny
+                k = c // mesh.nxy
+                expected = [mesh.index(i - d, j, k), mesh.index(i + d, j, k),
+                            mesh.index(i, j - d, k), mesh.index(i, j + d, k),
+                            mesh.index(i, j, k - d), mesh.index(i, j, k + d)]
+                assert list(ngbs[c]) == expected
+
+
+def test_lazy_arrays():
+    mesh = CuboidMesh(1, 1, 1, 3, 2, 1)
+    assert mesh._coordinates is None and mesh._neighbours is None
+
+    # Sites masked before the array is created
+    empty = np.zeros(mesh.n, dtype=bool)
+    empty[1] = True
+    mesh.mask_neighbours(empty)
+    assert mesh._neighbours is None
+    assert allclose(mesh.neighbours[0], [-1, -1, -1, 3, -1, -1])
+    assert allclose(mesh.neighbours[2], [-1, -1, -1, 5, -1, -1])
+    assert allclose(mesh.coordinates[4], [1.5, 1.5, 0.5])
+
+
 def test_iterate_over_cells():
     mesh = CuboidMesh(1, 1, 1, 2, 2, 2)
     for c_i in mesh.cells():
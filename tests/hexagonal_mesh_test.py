@@ -327,6 +327,30 @@ def test_neighbours_9shells_square_even_row():
             ).all()
 
 
+def test_neighbours_9shells_periodic():
+    """
+    The neighbours of every site, computed for all the sites at once, are
+    the ones given by the index method (_index for the north-west and
+    south-east neighbours of the shells with 6 neighbours)
+    """
+    from fidimag.atomistic.hexagonal_mesh import _DIAGONAL_SHELLS
+
+    mesh = HexagonalMesh(1, 7, 6, periodicity=(True, True), shells=9)
+    for c in mesh.cells():
+        i, j = c % mesh.nx, c // mesh.nx
+        expected = []
+        for sh in range(1, 10):
+            offsets = _DIAGONAL_SHELLS[sh]
+            for k, (di, dj) in enumerate(offsets):
+                if len(offsets) == 6 and k >= 4:
+                    ngb = mesh._index(i + di, j + dj)
+                else:
+                    ngb = mesh.index(i + di, j + dj)
+                expected.append(ngb if ngb != c else -1)
+
+        assert list(mesh.neighbours[c]) == expected
+
+
 def test_iterate_over_cells():
     mesh = HexagonalMesh(1, 2, 2)
     for c_i in mesh.cells():
@@ -344,6 +368,8 @@ def test_iterate_over_cells_and_neighbours():
 @pytest.mark.xfail(reason="Skipping because this is not supported")
 def test_hexagonal_mesh_creation_periodic_x():
     mesh = HexagonalMesh(1, 2, 2, alignment='square', periodicity=(True, False, False))
+    # The grid of hexagons is only created when it is used
+    mesh.vertices
 
 
 @pytest.mark.xfail(reason="Skipping because this is not supported")
@@ -82,6 +82,32 @@ def test_scipy_integrator():
     return y_true, ts, ys, od.internal_timesteps
 
 
+@pytest.mark.parametrize("method,rtol", [
+    ("rk45", 1e-6),
+    ("rk45", 1e-9),
+    ("rk23", 1e-6)])
+def test_rk_integrator(method, rtol):
+    from fidimag.extensions.common_clib import RKIntegrator
+
+    def f(t, y, ydot):
+        ydot[0] = y[1]
+        ydot[1] = -y[0]
+
+    y = np.array([1.0, 0.0])
+    od = RKIntegrator(y, f, method)
+    od.set_options(rtol=rtol, atol=rtol)
+    for t in np.linspace(1, 10, 10):
+        od.run_until(t)
+        assert od.t == t
+
+    # The solution is written into y
+    assert np.allclose(y, [np.cos(10), -np.sin(10)], atol=1000 * rtol)
+    # The last stage of every step is reused as the first of the next one
+    nsteps, nfevals, nrejected = od.stat()
+    stages = 6 if method == "rk45" else 3
+    assert nfevals == stages * (nsteps + nrejected) + 1
+
+
 if __name__ == "__main__":
     import matplotlib.pyplot as plt
 
@@ -0,0 +1,75 @@
+import numpy as np
+from fidimag.common.batch_task import BatchTasks, WorkQueues, task_key
+
+
+def write_task(p1, p2, data):
+    with open('res.txt', 'w') as f:
+        f.write('{} {} {}'.format(p1, p2, data.sum()))
+    if p1 == 'c' and p2 == 2:
+        raise ValueError('failed task')
+
+
+def test_work_queues():
+    queues = WorkQueues(10, 3)
+    assert queues.pop(1) == 3
+
+    # A worker takes the tasks of the others when it runs out of tasks
+    tasks = []
+    while True:
+        i = queues.pop(0)
+        if i is None:
+            break
+        tasks.append(i)
+    assert sorted(tasks) == [0, 1, 2] + list(range(4, 10))
+    assert queues.pop(2) is None
+
+
+def test_batch_tasks(tmpdir):
+    tmpdir.chdir()
+    tasks = BatchTasks(write_task, processes=3)
+    tasks.add_parameters('p1', ['a', 'b', 'c'])
+    tasks.add_parameters('p2', [1, 2])
+    tasks.add_shared('data', np.arange(10.0))
+    tasks.start()
+
+    with open('p1_b/p2_2/res.txt') as f:
+        assert f.read() == 'b 2 45.0'
+
+    entries = {task_key(t): e for t, e in tasks.report()}
+    assert len(entries) == 6
+    assert entries['p1_c_p2_2']['state'] == 'Failed'
+    assert 'failed task' in entries['p1_c_p2_2']['error']
+    assert entries['p1_a_p2_1']['state'] == 'Done'
+    assert entries['p1_a_p2_1']['wall_time'] > 0
+
+    # Resuming only runs the tasks which are not done
+    with tasks:
+        tasks.start()
+    assert tasks.shared == {}
+    new_entries = {task_key(t): e for t, e in tasks.report()}
+    assert new_entries['p1_a_p2_1'] == entries['p1_a_p2_1']
+    assert new_entries['p1_c_p2_2']['time'] > entries['p1_c_p2_2']['time']
+
+
+def test_batch_tasks_spawn(tmpdir):
+    tmpdir.chdir()
+    with BatchTasks(write_task, processes=2, start_method='spawn') as tasks:
+        tasks.add_parameters('p1', ['a', 'b'])
+        tasks.add_parameters('p2', [1])
+        tasks.add_shared('data', np.ones(4))
+        tasks.start()
+        tasks.start()
+
+    with open('p1_b/p2_1/res.txt') as f:
+        assert f.read() == 'b 1 4.0'
+    assert all(e['state'] == 'Done' for t, e in tasks.report())
+
+
+def test_batch_tasks_old_state_file(tmpdir):
+    tmpdir.chdir()
+    with open('task.txt', 'w') as f:
+        f.write('p1_a : Done!\np1_b : Started!\n')
+
+    tasks = BatchTasks(write_task, processes=1)
+    tasks.add_parameters('p1', ['a', 'b'])
+    assert tasks.journal.states() == {'p1_a': 'Done'}
@@ -0,0 +1,106 @@
+import os
+import numpy as np
+from fidimag.common.cache import cache_dir, atomic_write
+
+
+def test_cache_dir(tmpdir, monkeypatch):
+    monkeypatch.setenv('FIDIMAG_CACHE_DIR', str(tmpdir))
+    path = cache_dir('fftw_wisdom')
+    assert path == os.path.join(str(tmpdir), 'fftw_wisdom')
+    assert os.path.isdir(path)
+
+    # An empty variable disables the cache
+    monkeypatch.setenv('FIDIMAG_CACHE_DIR', '')
+    assert cache_dir('fftw_wisdom') is None
+
+
+def test_atomic_write(tmpdir):
+    path = os.path.join(str(tmpdir), 'data.bin')
+    atomic_write(path, b'abc')
+    atomic_write(path, b'defg')
+
+    with open(path, 'rb') as f:
+        assert f.read() == b'defg'
+    # No temporary files are left behind
+    assert os.listdir(str(tmpdir)) == ['data.bin']
+
+
+def test_demag_wisdom(tmpdir, monkeypatch):
+    from fidimag.common import CuboidMesh
+    from fidimag.atomistic import Sim, Demag
+
+    monkeypatch.setenv('FIDIMAG_CACHE_DIR', str(tmpdir))
+    mesh = CuboidMesh(nx=4, ny=3, nz=2, unit_length=1e-9)
+    sim = Sim(mesh)
+    demag = Demag()
+    sim.add(demag)
+
+    assert os.path.exists(demag.demag.wisdom)
+    assert os.path.getsize(demag.demag.wisdom) > 0
+
+
+def test_tensor_cache(tmpdir, monkeypatch):
+    from fidimag.common.cache import TensorCache
+
+    monkeypatch.setenv('FIDIMAG_CACHE_DIR', str(tmpdir))
+    cache = TensorCache()
+    params = {'type': 'demag', 'n': (4, 3, 2)}
+    assert cache.load(params) is None
+
+    cache.save(params, Nxx=np.arange(5.0))
+    assert np.array_equal(cache.load(params)['Nxx'], np.arange(5.0))
+    assert cache.load({'type': 'demag', 'n': (4, 3, 1)}) is None
+
+
+def test_tensor_cache_eviction(tmpdir, monkeypatch):
+    from fidimag.common.cache import TensorCache
+
+    monkeypatch.setenv('FIDIMAG_CACHE_DIR', str(tmpdir))
+    cache = TensorCache(max_size=3500)
+    for i in range(3):
+        cache.save({'n': i}, data=np.zeros(100))
+        os.utime(cache.filename({'n': i}), (i, i))
+    # Loading the oldest entry marks it as recently used
+    assert cache.load({'n': 0}) is not None
+
+    cache.save({'n': 3}, data=np.zeros(100))
+    assert len(os.listdir(cache.path)) == 3
+    assert cache.load({'n': 1}) is None
+    assert cache.load({'n': 0}) is not None
+
+
+def test_demag_tensor_cache(tmpdir, monkeypatch):
+    from fidimag.common import CuboidMesh
+    import fidimag.micro as micro
+
+    monkeypatch.setenv('FIDIMAG_CACHE_DIR', str(tmpdir))
+    mesh = CuboidMesh(nx=5, ny=4, nz=3, dx=2, dy=2, dz=2, unit_length=1e-9)
+
+    fields = []
+    for i in range(2):
+        sim = micro.Sim(mesh)
+        sim.Ms = 8.6e5
+        sim.set_m((1, 0.5, 0.2))
+        demag = micro.Demag()
+        sim.add(demag)
+        fields.append(demag.compute_field().copy())
+
+    assert len(os.listdir(os.path.join(str(tmpdir), 'demag_tensors'))) == 1
+    assert np.allclose(fields[0], fields[1], rtol=1e-14)
+
+
+def test_demag_tensor_cache_version(tmpdir, monkeypatch):
+    import fidimag.extensions.dipolar as dipolar
+
+    monkeypatch.setenv('FIDIMAG_CACHE_DIR', str(tmpdir))
+    path = os.path.join(str(tmpdir), 'demag_tensors')
+
+    dipolar.FFTDemag(1.0, 1.0, 1.0, 4, 3, 2, tensor_type='demag',
+                     planning='estimate')
+    assert len(os.listdir(path)) == 1
+
+    # Entries of another version of the tensors are not loaded
+    monkeypatch.setattr(dipolar, 'TENSOR_CACHE_VERSION', 2)
+    dipolar.FFTDemag(1.0, 1.0, 1.0, 4, 3, 2, tensor_type='demag',
+                     planning='estimate')
+    assert len(os.listdir(path)) == 2
@@ -51,6 +51,86 @@ def test_demag_fft_exact_oommf():
 
 
 
+def test_demag_fft_exact_large():
+    # Meshes with more than 8 sites along a direction use an even padding,
+    # which checks the symmetry reduced tensors at the Nyquist frequencies
+    mesh = CuboidMesh(nx=10, ny=9, nz=3, unit_length=1e-9)
+    sim = Sim(mesh)
+    demag = Demag()
+    sim.add(demag)
+
+    np.random.seed(1)
+    sim.set_m(lambda pos: np.random.uniform(-1, 1, 3))
+    fft = demag.compute_field()
+    exact = demag.compute_exact()
+    np.testing.assert_allclose(fft, exact, rtol=1e-8, atol=1e-20)
+
+    # Only the octant kx, ky, kz >= 0 of the tensors is stored
+    assert demag.demag.tensor_length == 11 * 10 * 3
+
+
+def test_demag_planning_effort():
+    mesh = CuboidMesh(nx=6, ny=4, nz=3, unit_length=1e-9)
+    fields = []
+    for planning in ['estimate', 'measure']:
+        sim = Sim(mesh)
+        demag = Demag(planning=planning)
+        sim.add(demag)
+        sim.set_m((0.6, 0, 0.8))
+        fields.append(demag.compute_field().copy())
+
+    np.testing.assert_allclose(fields[0], fields[1], rtol=1e-10, atol=1e-20)
+
+
+def test_demag_single_precision():
+    mesh = CuboidMesh(nx=10, ny=6, nz=3, unit_length=1e-9)
+    np.random.seed(1)
+    m0 = np.random.uniform(-1, 1, 3 * mesh.n)
+
+    fields = []
+    for precision in ['double', 'single']:
+        sim = Sim(mesh)
+        demag = Demag(precision=precision)
+        sim.add(demag)
+        sim.set_m(m0)
+        fields.append(demag.compute_field().copy())
+
+    # The error against the double precision field is computed on the
+    # first call, after which the double precision buffers are freed
+    assert demag.demag.single_error < 1e-5
+    assert demag.demag.mx is None
+    norm = np.max(np.abs(fields[0]))
+    np.testing.assert_allclose(fields[1], fields[0], rtol=0, atol=1e-5 * norm)
+
+    sim.set_m((0.6, 0, 0.8))
+    assert np.all(np.isfinite(demag.compute_field()))
+
+
+def test_demag_thin_film():
+    from fidimag.extensions.dipolar import FFTDemag
+
+    nx, ny, nz = 12, 10, 3
+    np.random.seed(1)
+    m = np.random.uniform(-1, 1, 3 * nx * ny * nz)
+    mu_s = np.ones(nx * ny * nz)
+
+    fields = []
+    for thin_film in [False, True]:
+        demag = FFTDemag(1.0, 2.0, 3.0, nx, ny, nz, tensor_type='demag',
+                         planning='estimate', thin_film=thin_film)
+        field = np.zeros_like(m)
+        demag.compute_field(m, mu_s, field)
+        fields.append(field)
+
+    # The layers are not padded in the thin film mode, which is off by
+    # default
+    assert demag.total_length == 24 * 20 * 3
+    default = FFTDemag(1.0, 2.0, 3.0, nx, ny, nz, tensor_type='demag',
+                       planning='estimate')
+    assert default.total_length == 24 * 20 * 5
+    np.testing.assert_allclose(fields[1], fields[0], rtol=1e-10, atol=1e-14)
+
+
 def test_demag_two_spin_xx():
     mesh = CuboidMesh(nx=2, ny=1, nz=1)
     sim = Sim(mesh)
@@ -63,6 +143,38 @@ def test_demag_two_spin_xx():
     assert(field[3] == 2e-7)
 
 
+def test_demag_extrapolation():
+    mesh = CuboidMesh(nx=6, ny=4, nz=2, unit_length=1e-9)
+
+    spins = []
+    for extrapolation in [None, 'quadratic']:
+        sim = Sim(mesh)
+        sim.mu_s = 1e-21
+        sim.driver.alpha = 0.1
+        sim.set_m((1, 0.5, 0.2))
+        demag = Demag(extrapolation=extrapolation, extrapolation_tol=1e-6)
+        sim.add(demag)
+        sim.driver.run_until(2e-11)
+        spins.append(sim.spin.copy())
+
+    # The field is computed at a fraction of the right hand side calls
+    assert demag.extrapolator.n_evals < demag.extrapolator.n_calls
+    assert np.max(np.abs(spins[0] - spins[1])) < 1e-5
+
+    # The energy is computed with the exact field
+    exact = Sim(mesh)
+    exact.mu_s = 1e-21
+    exact.set_m(sim.spin.copy(), normalise=False)
+    exact_demag = Demag()
+    exact.add(exact_demag)
+    assert np.isclose(demag.compute_energy(), exact_demag.compute_energy(),
+                      rtol=1e-12)
+
+    # New spins are not extrapolated from the previous evaluations
+    sim.set_m((0, 0, 1))
+    assert demag.extrapolator.slots == []
+
+
 if __name__ == '__main__':
     test_demag_fft_exact()
     test_demag_two_spin_xx()
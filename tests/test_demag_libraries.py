@@ -242,12 +242,12 @@ def test_demag_2d_pbc():
     sim.add(demag)
     sim.compute_effective_field(0)
 
-    assert not np.isnan(demag.demag.tensor_xx).any()
-    assert not np.isnan(demag.demag.tensor_xy).any()
-    assert not np.isnan(demag.demag.tensor_xz).any()
-    assert not np.isnan(demag.demag.tensor_yy).any()
-    assert not np.isnan(demag.demag.tensor_yz).any()
-    assert not np.isnan(demag.demag.tensor_zz).any()
+    assert not np.isnan(demag.demag.Nxx).any()
+    assert not np.isnan(demag.demag.Nxy).any()
+    assert not np.isnan(demag.demag.Nxz).any()
+    assert not np.isnan(demag.demag.Nyy).any()
+    assert not np.isnan(demag.demag.Nyz).any()
+    assert not np.isnan(demag.demag.Nzz).any()
     assert not np.isnan(sim.field).any(), "NaN in demag array"
 
 if __name__ == '__main__':
@@ -0,0 +1,61 @@
+import numpy as np
+from fidimag.common import CuboidMesh, Ensemble
+from fidimag.micro import Sim, Demag, DMI, UniaxialAnisotropy
+from fidimag.micro import UniformExchange, Zeeman
+
+
+def test_ensemble():
+    mesh = CuboidMesh(nx=4, ny=3, nz=1, dx=2, dy=2, dz=2, unit_length=1e-9)
+    fields = [(0, 0, 1e5), (1e5, 0, 0), (0, 2e5, 1e4)]
+
+    def make_sim():
+        sim = Sim(mesh)
+        sim.Ms = 8.6e5
+        sim.driver.alpha = 0.1
+        sim.set_m((1, 0.5, 0.2))
+        sim.add(UniformExchange(A=1.3e-11))
+        return sim
+
+    ensemble = Ensemble(make_sim(), len(fields))
+    ensemble.set_m((1, 0.5, 0.2))
+    for k, H in enumerate(fields):
+        ensemble.set_field(H, replica=k)
+    ensemble.run_until(5e-11)
+    assert ensemble.compute_average().shape == (len(fields), 3)
+
+    # Every replica follows its own simulation
+    for k, H in enumerate(fields):
+        sim = make_sim()
+        sim.add(Zeeman(H))
+        sim.driver.run_until(5e-11)
+        assert np.allclose(ensemble.m[k], sim.spin, atol=1e-6)
+
+
+def test_ensemble_field():
+    mesh = CuboidMesh(nx=4, ny=3, nz=2, dx=2, dy=2, dz=2, unit_length=1e-9)
+    sim = Sim(mesh)
+    sim.Ms = 8.6e5
+    sim.set_m((1, 0.5, 0.2))
+    sim.add(UniformExchange(A=1.3e-11))
+    sim.add(UniaxialAnisotropy(Ku=1e5, axis=(0, 0, 1)))
+    sim.add(Demag())
+    sim.add(Zeeman((0, 0, 1e5)))
+    # Computed replica by replica
+    sim.add(DMI(D=1e-3))
+
+    replicas = 5
+    ensemble = Ensemble(sim, replicas)
+    np.random.seed(1)
+    for k in range(replicas):
+        ensemble.set_m(lambda pos: np.random.random(3) - 0.5, replica=k)
+        ensemble.set_field((1e4 * k, 0, 0), replica=k)
+    spin0 = sim.spin.copy()
+
+    ensemble.compute_effective_field(0, ensemble.spin)
+    assert np.array_equal(sim.spin, spin0)
+
+    for k in range(replicas):
+        sim.spin[:] = ensemble.m[k]
+        sim.driver.compute_effective_field(0)
+        field = sim.driver.field + ensemble.fields_applied[k]
+        assert np.allclose(ensemble.fields[k], field)
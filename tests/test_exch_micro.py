@@ -119,6 +119,34 @@ def test_exch_1d(do_plot=False):
         plt.legend()
         plt.savefig("exchange_field.pdf")
 
+def test_exch_implicit_stencil():
+    """
+    The exchange field with the neighbours computed in the kernel is the
+    same as with the neighbours array, also with periodic boundaries and
+    sites without material, and the array is not created
+    """
+    fields = []
+    for implicit in (False, True):
+        mesh = CuboidMesh(nx=6, ny=5, nz=3, dx=2, dy=3, dz=1,
+                          periodicity=(True, False, True),
+                          implicit_stencil=implicit)
+        sim = Sim(mesh)
+        sim.Ms = lambda r: 0 if r[0] < 2 and r[1] < 6 else 8.6e5
+        sim.set_m(lambda r: (np.sin(r[0]), np.cos(r[1]), r[2]))
+
+        exch = UniformExchange(1.3e-11)
+        sim.add(exch)
+        fields.append(exch.compute_field().copy())
+        exch.compute_energy()
+
+        sim.driver.compute_effective_field(0)
+        fields.append(sim.driver.field.copy())
+
+    assert mesh._neighbours is None
+    assert np.max(np.abs(fields[0] - fields[2])) == 0
+    assert np.max(np.abs(fields[1] - fields[3])) == 0
+
+
 if __name__ == '__main__':
     test_init()
     test_exch_1d(do_plot=True)
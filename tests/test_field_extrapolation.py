@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from fidimag.common.field_extrapolation import FieldExtrapolation
+
+
+def rotating_spins(t):
+    return np.cos(0.1 * np.arange(30) + 1e10 * t)
+
+
+@pytest.mark.parametrize("order", [1, 2])
+def test_field_extrapolation(order):
+    np.random.seed(1)
+    N = np.random.rand(30, 30)
+    extrapolation = FieldExtrapolation(lambda m, out: np.dot(N, m, out=out),
+                                       30, order=order, rtol=1e-3)
+
+    field = np.zeros(30)
+    for t in np.linspace(0, 1e-9, 1000):
+        m = rotating_spins(t)
+        extrapolation.compute(t, m, field)
+        exact = np.dot(N, m)
+        assert np.max(np.abs(field - exact)) < 5e-3 * np.max(np.abs(exact))
+
+    assert extrapolation.n_calls == 1000
+    assert extrapolation.n_evals < 500
+
+
+def test_field_extrapolation_jump():
+    N = np.eye(30)
+    extrapolation = FieldExtrapolation(lambda m, out: np.dot(N, m, out=out),
+                                       30, order=1)
+    field = np.zeros(30)
+    for t in np.linspace(0, 1e-11, 10):
+        extrapolation.compute(t, rotating_spins(t), field)
+
+    # Spins which do not follow the extrapolated spins are evaluated
+    m = rotating_spins(1e-11) + 0.5
+    extrapolation.compute(1.1e-11, m, field)
+    assert np.array_equal(field, m)
+
+    # A change of the spins with set_m discards the previous evaluations
+    extrapolation.reset()
+    extrapolation.compute(1.2e-11, rotating_spins(0), field)
+    assert np.array_equal(field, rotating_spins(0))
+    assert len(extrapolation.slots) == 1
+
+
+def test_field_extrapolation_small_changes():
+    # Changes of m below max_dm off the extrapolated spins are not ignored
+    N = np.eye(30)
+    extrapolation = FieldExtrapolation(lambda m, out: np.dot(N, m, out=out),
+                                       30, order=1, rtol=1e-3)
+    field = np.zeros(30)
+    for t in np.linspace(0, 1e-11, 10):
+        extrapolation.compute(t, rotating_spins(t), field)
+
+    m = rotating_spins(1e-11) + 0.01
+    extrapolation.compute(1e-11, m, field)
+    assert np.max(np.abs(field - m)) < 1e-3
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from fidimag.common.fileio import DataSaver, DataReader
+
+
+class Driver(object):
+    step = 0
+    t = 0.0
+
+
+class DummySim(object):
+    def __init__(self):
+        self.driver = Driver()
+
+    def compute_average(self):
+        return np.array([np.cos(self.driver.t), np.sin(self.driver.t), 0])
+
+
+def save_rows(savers, sim, rows):
+    for i in range(rows):
+        sim.driver.step = i
+        sim.driver.t = 1e-12 * i
+        for saver in savers:
+            saver.save()
+
+
+def test_npy_table(tmpdir):
+    sim = DummySim()
+    text = DataSaver(sim, str(tmpdir.join('sim.txt')))
+    table = DataSaver(sim, str(tmpdir.join('sim.txt')))
+    table.set_backend('npy', buffer_rows=7)
+    assert table.filename == str(tmpdir.join('sim.table'))
+
+    for saver in (text, table):
+        saver.entities['E'] = {'unit': '<J>',
+                               'get': lambda sim: None,
+                               'header': 'E'}
+        saver.update_entity_order()
+
+    save_rows([text, table], sim, 20)
+
+    # Only the full buffers were written
+    data = DataReader(table.filename)
+    assert len(data['time']) == 14
+
+    table.flush()
+    data.reload()
+    assert isinstance(data['m_x'], np.memmap)
+    assert data.entities() == ['time', 'E', 'm_x', 'm_y', 'm_z', 'step']
+    assert data.units[0] == '<s>'
+
+    data_text = DataReader(text.filename)
+    for entity in data_text.entities():
+        assert np.allclose(data[entity], data_text[entity], rtol=1e-11,
+                           equal_nan=True)
+    assert np.all(np.isnan(data['E']))
+
+    # The columns are plain .npy files
+    time = np.load(os.path.join(table.filename, 'col_0.npy'))
+    assert np.array_equal(time, 1e-12 * np.arange(20))
+
+    with pytest.raises(ValueError):
+        table.set_backend('txt')
@@ -0,0 +1,75 @@
+import numpy as np
+
+from fidimag.common import CuboidMesh
+import fidimag.micro as micro
+import fidimag.atomistic as atomistic
+
+
+def random_m(pos):
+    return np.random.uniform(-1, 1, 3)
+
+
+def test_fused_field_micro():
+    np.random.seed(42)
+    mesh = CuboidMesh(nx=6, ny=4, nz=2, dx=2, dy=2, dz=2, unit_length=1e-9)
+    sim = micro.Sim(mesh)
+    sim.Ms = 8.6e5
+    sim.set_m(random_m)
+
+    sim.add(micro.UniformExchange(A=1.3e-11))
+    sim.add(micro.DMI(D=1e-3, dmi_type='interfacial'))
+    sim.add(micro.UniaxialAnisotropy(Ku=1e5, axis=(0, 0, 1)))
+    sim.add(micro.Zeeman((0, 0, 1e5)))
+
+    sim.compute_effective_field(0)
+    field = sim.driver.field.copy()
+
+    sim.driver.fused_field = True
+    sim.compute_effective_field(0)
+
+    assert np.allclose(sim.driver.field, field, rtol=1e-12, atol=1e-8)
+    assert np.allclose(sim.get_field_array('UniformExchange') +
+                       sim.get_field_array('DMI') +
+                       sim.get_field_array('Anisotropy') +
+                       sim.get_field_array('Zeeman'), field)
+
+
+def test_fused_field_atomistic():
+    np.random.seed(42)
+    mesh = CuboidMesh(nx=6, ny=4, nz=1)
+    sim = atomistic.Sim(mesh)
+    sim.mu_s = 1
+    sim.set_m(random_m)
+
+    sim.add(atomistic.UniformExchange(J=1))
+    sim.add(atomistic.DMI(D=0.1, dmi_type='bulk'))
+    sim.add(atomistic.Anisotropy(Ku=0.05, axis=(0, 0, 1)))
+    sim.add(atomistic.CubicAnisotropy(Kc=0.01))
+    sim.add(atomistic.Zeeman((0, 0, 0.1)))
+
+    sim.compute_effective_field(0)
+    field = sim.driver.field.copy()
+
+    sim.driver.fused_field = True
+    sim.compute_effective_field(0)
+
+    assert np.allclose(sim.driver.field, field, rtol=1e-12, atol=1e-12)
+
+
+def test_energy_only_on_request():
+    np.random.seed(42)
+    mesh = CuboidMesh(nx=6, ny=4, nz=2, dx=2, dy=2, dz=2, unit_length=1e-9)
+    sim = micro.Sim(mesh)
+    sim.Ms = 8.6e5
+    sim.set_m(random_m)
+
+    exch = micro.UniformExchange(A=1.3e-11)
+    sim.add(exch)
+
+    # The field evaluation does not fill the energy density
+    exch.compute_field()
+    assert np.all(exch.energy == 0)
+
+    energy = exch.compute_energy()
+    assert energy > 0
+    assert np.any(exch.energy != 0)
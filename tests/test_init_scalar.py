@@ -20,3 +20,18 @@ def test_init_scalar_function():
     assert test_vec[0] == 0.0
     test_vec[:] = init_scalar(m_init, mesh, np.pi/2.0)
     assert test_vec[0] == 1.0
+
+
+def test_init_scalar_vectorised():
+    from fidimag.common import vectorised
+
+    mesh = fidimag.common.CuboidMesh(nx=4, ny=3, nz=2, dx=1, dy=1, dz=1)
+
+    @vectorised
+    def Ms_all(pos, Ms):
+        return np.where(pos[:, 0] < 2, 0, Ms)
+
+    Ms = init_scalar(Ms_all, mesh, 8.6e5)
+    assert np.array_equal(Ms, init_scalar(lambda r, Ms: 0 if r[0] < 2 else Ms,
+                                          mesh, 8.6e5))
+    assert np.count_nonzero(Ms) == 12
@@ -2,6 +2,7 @@ import fidimag
 from fidimag.common import init_vector
 import numpy as np
 import unittest
+import pytest
 
 def m_init(pos, t):
     x, y, z = pos
@@ -22,3 +23,26 @@ def test_init_vector_function():
     test_vec[:] = init_vector(m_init, mesh, 3, False, np.pi/2.0)
     assert test_vec[0] - 1.0 < 1e-15
     assert test_vec[1] < 1e-15
+
+
+def test_init_vector_vectorised():
+    from fidimag.common import vectorised
+
+    mesh = fidimag.common.CuboidMesh(nx=4, ny=3, nz=2, dx=1, dy=1, dz=1)
+
+    def m_site(pos, a):
+        x, y, z = pos
+        return (np.sin(a * x), np.cos(y), z)
+
+    @vectorised
+    def m_all(pos, a):
+        x, y, z = pos.T
+        return np.column_stack((np.sin(a * x), np.cos(y), z))
+
+    expected = init_vector(m_site, mesh, 3, True, 0.3)
+    assert np.max(np.abs(init_vector(m_all, mesh, 3, True, 0.3)
+                         - expected)) < 1e-15
+
+    # The function must return a vector for every site
+    with pytest.raises(ValueError):
+        init_vector(vectorised(lambda pos: (1, 0, 0)), mesh, 3)
@@ -7,6 +7,7 @@ from fidimag.common import CuboidMesh
 from fidimag.micro import Sim
 from fidimag.micro import Zeeman
 from fidimag.micro import UniaxialAnisotropy
+from fidimag.micro import UniformExchange
 import numpy as np
 
 
@@ -146,5 +147,225 @@ def test_sim_single_spin(do_plot=False):
     assert np.max(np.abs(mz - a_mz)) < 5e-7
 
 
+def test_cvode_state_aliases_spin():
+    mesh = CuboidMesh(nx=3, ny=1, nz=1)
+    sim = Sim(mesh)
+    sim.set_m((1, 0, 0))
+    sim.add(Zeeman((0, 0, 1e5)))
+
+    # CVODE writes the solution straight into the spin array
+    assert sim.driver.integrator.y is sim.spin
+    sim.driver.run_until(1e-11)
+    assert sim.driver.integrator.y is sim.spin
+    assert sim.spin[2] > 0
+
+
+def test_llg_local_jacobian():
+    np.random.seed(1)
+    mesh = CuboidMesh(nx=4, ny=3, nz=1)
+    sim = Sim(mesh, use_jac=True)
+    sim.Ms = 8.6e5
+    sim.set_m(lambda pos: np.random.uniform(-1, 1, 3))
+    sim.add(UniaxialAnisotropy(Ku=1e5, axis=(0, 0, 1)))
+    sim.add(Zeeman((0, 0, 1e5)))
+
+    jac = np.zeros(9 * mesh.n)
+    sim.driver.sundials_psetup(0, sim.spin, jac)
+
+    # Without neighbour couplings the Jacobian is block diagonal
+    mp = np.random.uniform(-1, 1, 3 * mesh.n)
+    Jmp = np.zeros(3 * mesh.n)
+    sim.driver.sundials_jtimes(mp, Jmp, 0, sim.spin, None)
+    Jmp_blocks = np.einsum('iab,ib->ia', jac.reshape(-1, 3, 3),
+                           mp.reshape(-1, 3))
+    assert np.allclose(Jmp_blocks.ravel(), Jmp)
+
+
+def test_llg_preconditioner():
+    mesh = CuboidMesh(nx=20, ny=1, nz=1, unit_length=1e-9)
+
+    spins = []
+    for use_jac in (False, True):
+        sim = Sim(mesh, use_jac=use_jac)
+        sim.Ms = 8.6e5
+        sim.alpha = 0.5
+        sim.set_m(lambda pos: (np.cos(pos[0] / 5.), np.sin(pos[0] / 5.), 0.2))
+        sim.add(UniformExchange(A=1.3e-11))
+        sim.add(UniaxialAnisotropy(Ku=1e5, axis=(0, 0, 1)))
+        sim.add(Zeeman((0, 0, 1e5)))
+        sim.driver.run_until(2e-11)
+        spins.append(sim.spin.copy())
+
+    assert np.allclose(spins[0], spins[1], atol=1e-5)
+
+
+def test_llg_native_rhs():
+    from fidimag.micro import DMI, TimeZeeman
+
+    mesh = CuboidMesh(nx=6, ny=4, nz=2, dx=2, dy=2, dz=2, unit_length=1e-9)
+    spins = []
+    for native_rhs in [False, True]:
+        np.random.seed(3)
+        sim = Sim(mesh)
+        sim.Ms = 8.6e5
+        sim.set_m(lambda pos: np.random.uniform(-1, 1, 3))
+        sim.add(UniformExchange(A=1.3e-11))
+        sim.add(DMI(D=1e-3))
+        sim.add(UniaxialAnisotropy(Ku=1e5, axis=(0, 0, 1)))
+        sim.add(Zeeman((0, 0, 1e5)))
+        # Evaluated in Python, through the fallback of the pipeline
+        sim.add(TimeZeeman((1e4, 0, 0), lambda t: np.cos(1e10 * t)))
+
+        sim.driver.native_rhs = native_rhs
+        sim.driver.run_until(5e-11)
+        spins.append(sim.spin.copy())
+
+    assert np.allclose(spins[0], spins[1], rtol=1e-8, atol=1e-8)
+
+
+def test_llg_events():
+    mesh = CuboidMesh(nx=1, ny=1, nz=1)
+    sim = Sim(mesh)
+    sim.Ms = 8.6e5
+    sim.driver.alpha = 0.5
+    sim.set_m((0.1, 0, -1))
+    sim.add(Zeeman((0, 0, 1e5)))
+
+    # m_x oscillates with the precession, while m_z switches only once
+    precession = sim.driver.add_event(lambda t, m: m[0], terminal=False)
+    switching = sim.driver.add_event(lambda t, m: m[2], direction=1)
+
+    event = sim.driver.run_until(2e-9)
+    assert event is switching
+    assert len(switching.times) == 1
+    assert sim.driver.t == switching.times[0] < 2e-9
+    assert abs(sim.spin[2]) < 1e-6
+    assert len(precession.times) > 1
+    assert max(precession.times) <= sim.driver.t
+
+    # Continue after the event
+    sim.driver.clear_events()
+    assert sim.driver.run_until(2e-9) is None
+    assert sim.spin[2] > 0.9
+
+
+def test_llg_sample(tmpdir):
+    from fidimag.common import SampleBuffer
+
+    mesh = CuboidMesh(nx=1, ny=1, nz=1)
+    times = np.linspace(2e-12, 2e-10, 100)
+
+    sims = []
+    for i in range(3):
+        sim = Sim(mesh)
+        sim.Ms = 8.6e5
+        sim.driver.alpha = 0.05
+        sim.set_m((1, 0, 0.1))
+        sim.add(Zeeman((0, 0, 1e5)))
+        sims.append(sim)
+
+    buffer = sims[0].driver.sample(times)
+    assert buffer.count == len(times)
+    assert sims[0].driver.t == times[-1]
+    assert np.allclose(buffer.m[-1], sims[0].spin)
+
+    # Same trajectory as stopping the integrator at the sample times
+    for t, m in zip(times[::10], buffer.m[::10]):
+        sims[1].driver.run_until(t)
+        assert np.allclose(sims[1].spin, m, atol=1e-6)
+
+    # A ring buffer in a file keeps the last samples
+    filename = str(tmpdir.join('samples.npy'))
+    ring = sims[2].driver.sample(times, SampleBuffer(8, mesh.n, filename))
+    t, m = ring.samples()
+    assert np.array_equal(t, times[-8:])
+    assert np.allclose(m, buffer.m[-8:], atol=1e-6)
+    assert np.load(filename).shape == (8, 4)
+
+
+def test_llg_npy_table(tmpdir):
+    from fidimag.common import DataReader
+
+    mesh = CuboidMesh(nx=1, ny=1, nz=1)
+    sim = Sim(mesh, name=str(tmpdir.join('table')))
+    sim.Ms = 8.6e5
+    sim.set_m((1, 0, 0.1))
+    sim.add(Zeeman((0, 0, 1e5)))
+    sim.data_saver.set_backend('npy')
+
+    # The buffered rows are written at the end of run_until and sample
+    sim.driver.run_until(1e-12)
+    sim.driver.run_until(2e-12)
+    data = DataReader(sim.data_saver.filename)
+    assert np.allclose(data['time'], [1e-12, 2e-12])
+
+    sim.driver.sample(np.linspace(3e-12, 5e-12, 3))
+    data.reload()
+    assert np.allclose(data['time'], [1e-12, 2e-12, 5e-12])
+
+
+def test_llg_rk_integrators():
+    mesh = CuboidMesh(nx=4, ny=3, nz=1, dx=2, dy=2, dz=2, unit_length=1e-9)
+    spins = []
+    for integrator in ["sundials", "rk45", "rk45_sphere", "rk23_sphere"]:
+        np.random.seed(2)
+        sim = Sim(mesh, integrator=integrator)
+        sim.Ms = 8.6e5
+        sim.set_m(lambda pos: np.random.uniform(-1, 1, 3))
+        sim.add(UniformExchange(A=1.3e-11))
+        sim.add(Zeeman((0, 0, 1e5)))
+        sim.driver.set_tols(rtol=1e-8, atol=1e-8)
+        sim.driver.run_until(1e-10)
+        spins.append(sim.spin.copy())
+
+    for m in spins[1:]:
+        assert np.allclose(m, spins[0], atol=1e-5)
+    # The projection keeps |m| = 1 without the correction term
+    assert np.allclose(np.linalg.norm(spins[2].reshape(-1, 3), axis=1), 1)
+    assert sim.driver.norm_correction == 0
+
+    # default_c applies again with an integrator without projection
+    assert sim.driver.default_c == 1e11
+    sim.driver.set_integrator("rk45", False)
+    assert sim.driver.norm_correction == 1e11
+
+
+def test_sim_single_spin_cayley():
+    import warnings
+
+    mesh = CuboidMesh(nx=1, ny=1, nz=1)
+    # The tolerances set by the driver are ignored without warnings
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        sim = Sim(mesh, name='spin', integrator='cayley')
+        sim.driver.set_tols(rtol=1e-8, atol=1e-8)
+    assert not [w for w in caught if 'CayleyIntegrator' in str(w.message)]
+
+    alpha = 0.1
+    gamma = 2.21e5
+    sim.driver.alpha = alpha
+    sim.driver.gamma = gamma
+    sim.driver.integrator.set_options(stepsize=1e-13)
+    sim.Ms = 8.6e5
+    sim.set_m((1, 0, 0))
+
+    H0 = 1e5
+    sim.add(Zeeman((0, 0, H0)))
+
+    ts = np.linspace(0, 1e-9, 101)
+    m = []
+    for t in ts:
+        sim.driver.run_until(t)
+        m.append(sim.spin.copy())
+        # The Cayley update is a rotation, so |m| = 1 without default_c
+        assert abs(np.linalg.norm(sim.spin) - 1) < 1e-12
+
+    m = np.array(m)
+    a_mx, a_my, a_mz = single_spin(alpha, gamma, H0, ts)
+    assert np.max(np.abs(m[:, 0] - a_mx)) < 1e-5
+    assert np.max(np.abs(m[:, 1] - a_my)) < 1e-5
+    assert np.max(np.abs(m[:, 2] - a_mz)) < 1e-5
+
+
 if __name__ == '__main__':
     test_sim_single_spin(do_plot=True)
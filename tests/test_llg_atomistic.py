@@ -255,6 +255,86 @@ def test_sim_single_spin_sllg(do_plot=False):
     assert np.max(np.abs(mz - a_mz)) < 1e-8
 
 
+def test_sim_single_spin_cayley():
+
+    mesh = CuboidMesh(nx=1, ny=1, nz=1)
+    sim = Sim(mesh, name='spin', integrator='cayley')
+
+    alpha = 0.1
+    gamma = 2.21e5
+    sim.driver.alpha = alpha
+    sim.driver.gamma = gamma
+    sim.driver.integrator.set_options(stepsize=1e-13)
+    sim.mu_s = 1.0
+    sim.set_m((1, 0, 0))
+
+    H0 = 1e5
+    sim.add(Zeeman((0, 0, H0)))
+
+    ts = np.linspace(0, 1e-9, 101)
+    mz = []
+    for t in ts:
+        sim.driver.run_until(t)
+        mz.append(sim.spin[2])
+        # The Cayley update is a rotation, so |m| = 1 without default_c
+        assert abs(sim.spin_length()[0] - 1) < 1e-12
+
+    a_mx, a_my, a_mz = single_spin(alpha, gamma, H0, ts)
+    assert np.max(np.abs(np.array(mz) - a_mz)) < 1e-5
+
+
+def test_sim_single_spin_sllg_cayley():
+
+    mesh = CuboidMesh(nx=1, ny=1, nz=1)
+    sim = Sim(mesh, name='spin', driver='sllg', integrator='cayley')
+
+    alpha = 0.1
+    gamma = 2.21e5
+    sim.driver.set_options(dt=5e-15, gamma=gamma)
+    sim.driver.alpha = alpha
+    sim.mu_s = 1.0
+    sim.set_m((1, 0, 0))
+
+    H0 = 1e5
+    sim.add(Zeeman((0, 0, H0)))
+
+    ts = np.linspace(0, 1e-10, 101)
+    mz = []
+    for t in ts:
+        sim.driver.run_until(t)
+        mz.append(sim.spin[2])
+        assert abs(sim.spin_length()[0] - 1) < 1e-12
+
+    a_mx, a_my, a_mz = single_spin(alpha, gamma, H0, ts)
+    assert np.max(np.abs(np.array(mz) - a_mz)) < 1e-8
+
+
+def test_ensemble_thermal():
+    from fidimag.common import Ensemble
+
+    mesh = CuboidMesh(nx=2, ny=1, nz=1)
+    sim = Sim(mesh)
+    sim.mu_s = 9.274e-24
+    sim.driver.alpha = 0.1
+    sim.driver.gamma = 2.21e5
+
+    ensemble = Ensemble(sim, 3, dt=5e-15)
+    ensemble.set_m((1, 0, 0))
+    ensemble.set_field((0, 0, 1e5))
+    ensemble.set_T(1, replica=1)
+    ensemble.set_T(1, replica=2)
+    ensemble.run_until(1e-11)
+
+    # The replica at zero temperature follows the deterministic dynamics
+    a_mx, a_my, a_mz = single_spin(0.1, 2.21e5, 1e5, 1e-11)
+    assert np.max(np.abs(ensemble.m[0, 2::3] - a_mz)) < 1e-8
+
+    # Every replica has its own thermal noise
+    assert not np.allclose(ensemble.m[1], ensemble.m[2])
+    lengths = np.sqrt(np.sum(ensemble.spin.reshape(-1, 3) ** 2, axis=1))
+    assert np.max(np.abs(lengths - 1)) < 1e-12
+
+
 def disable_test_sim_single_spin_llg_stt(do_plot=False):
     ni = Nickel()
     mesh = CuboidMesh(nx=1, ny=1, nz=1)
@@ -0,0 +1,37 @@
+import json
+from fidimag.common import CuboidMesh
+from fidimag.micro import Sim, UniformExchange, Zeeman
+
+
+def test_llg_profiling(tmpdir):
+    tmpdir.chdir()
+    mesh = CuboidMesh(nx=4, ny=3, nz=1, dx=2, dy=2, dz=2, unit_length=1e-9)
+    sim = Sim(mesh, name='profile')
+    sim.Ms = 8.6e5
+    sim.set_m((1, 0.2, 0.1))
+    exch = UniformExchange(A=1.3e-11)
+    sim.add(exch)
+    sim.add(Zeeman((0, 0, 1e5)))
+
+    sim.driver.enable_profiling()
+    sim.driver.run_until(1e-11)
+    sim.save_m()
+
+    report = sim.driver.profile_report()
+    timers = report['timers']
+    assert timers['rhs']['calls'] >= report['integrator']['rhs_evals'] > 0
+    assert timers['field/UniformExchange']['calls'] >= timers['rhs']['calls']
+    assert timers['data_saver.save']['calls'] == 1
+    assert timers['npy.write']['calls'] == 1
+    assert report['integrator']['steps'] > 0
+    assert report['integrator']['name'] == 'CvodeSolver'
+
+    sim.driver.save_profile('profile.json')
+    with open('profile.json') as f:
+        assert json.load(f)['timers']['rhs']['calls'] == timers['rhs']['calls']
+
+    # The wrappers are removed and the counters kept
+    sim.driver.disable_profiling()
+    assert 'compute_field' not in exch.__dict__
+    sim.driver.run_until(2e-11)
+    assert sim.driver.profile_report()['timers']['rhs'] == timers['rhs']
@@ -129,5 +129,35 @@ def test_sst_field_1d():
     assert field[3 * 3] == -1
 
 
+def test_stt_separable_current():
+    """
+    A current added as a profile times a function of time is the same
+    as the current given by jx_function, evaluated at every site
+    """
+    from fidimag.common import CuboidMesh
+    from fidimag.micro import Sim
+
+    mesh = CuboidMesh(nx=10, ny=2, nz=1, dx=2, dy=2, dz=2)
+    T = 1e-9
+
+    def time_fun(t, T):
+        return np.sin(t / T)
+
+    def jx_func(pos, t):
+        return (1e12 + 1e11 * pos[0]) * np.sin(t / T)
+
+    sims = [Sim(mesh, driver='llg_stt') for i in range(2)]
+    sims[0].driver.jx_function = jx_func
+    sims[1].driver.jy = 5e11
+    sims[1].driver.add_current(lambda pos: (1e12 + 1e11 * pos[0], 0, 0),
+                               time_fun, extra_args=[T])
+
+    for t in [0, 0.3e-9, 2e-9]:
+        j0 = sims[0].driver.compute_current(t)
+        j1 = sims[1].driver.compute_current(t)
+        assert np.allclose(j0[0], j1[0], rtol=1e-14, atol=0)
+        assert np.all(j1[1] == 5e11) and np.all(j1[2] == 0)
+
+
 if __name__ == '__main__':
     test_sst_field_1d()